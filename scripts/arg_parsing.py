@@ -15,6 +15,28 @@ def positive_int(value):
 	return ivalue
 
 
+def positive_float(value):
+	'''
+	Custom argparse type for checking positive floats.
+	'''
+	fvalue = float(value)
+	if fvalue < 0:
+		raise argparse.ArgumentTypeError(f"{value} is an invalid positive float value.")
+
+	return fvalue
+
+
+def probability(value):
+	'''
+	Custom argparse type for checking floats between 0 and 1.
+	'''
+	fvalue = float(value)
+	if not 0 <= fvalue <= 1:
+		raise argparse.ArgumentTypeError(f"{value} is an invalid probability value.")
+
+	return fvalue
+
+
 def non_empty_string(value):
 	'''
 	Custom argparse type for checking non-empty strings.
@@ -36,6 +58,75 @@ def parse_arguments():
 	parser.add_argument('--num-rounds', type=positive_int, default=5, help="Number of processing rounds.")
 	parser.add_argument('--num-problems', type=positive_int, default=2, help="Number of problems to process each round.")
 	parser.add_argument('--topk-problems', type=positive_int, default=2, help="Number of top problems retained per round.")
-	parser.add_argument('--mutate-on-start', type=non_empty_string, default='Y', choices=['Y', 'N'], help="Whether to mutate at the beginning of execution. Select from 'Y' or 'N'.")	
+	parser.add_argument('--population-size', type=positive_int, default=0, help="Number of children the top problems of a round spawn for the next generation, 0 to use --num-problems.")
+	parser.add_argument('--mutate-on-start', type=non_empty_string, default='Y', choices=['Y', 'N'], help="Whether to mutate at the beginning of execution. Select from 'Y' or 'N'.")
+	parser.add_argument('--checkpoint-dir', type=non_empty_string, default='checkpoints/', help="Directory where the checkpoint of the current round and its journal are saved.")
+	parser.add_argument('--resume', type=non_empty_string, default='N', choices=['Y', 'N'], help="Whether to resume from the last checkpoint. Select from 'Y' or 'N'.")
+	parser.add_argument('--round-mode', type=non_empty_string, default='sequential', choices=['sequential', 'async', 'pipeline', 'batch', 'packed', 'sharded'], help="How requests of a round are sent. Select from 'sequential', 'async', 'pipeline', 'batch', 'packed' or 'sharded'.")
+	parser.add_argument('--concurrency', type=positive_int, default=8, help="Maximum number of requests in flight in 'async' and 'pipeline' round modes.")
+	parser.add_argument('--pack-size', type=positive_int, default=8, help="Maximum number of problems mutated or scored in a single request in 'packed' round mode.")
+	parser.add_argument('--batch-dir', type=non_empty_string, default='batches/', help="Directory where batch input and output files are written in 'batch' round mode.")
+	parser.add_argument('--batch-poll-interval', type=positive_int, default=30, help="Seconds between batch status checks in 'batch' round mode.")
+	parser.add_argument('--leaderboard-backend', type=non_empty_string, default='sqlite', choices=['sqlite', 'yaml'], help="Leaderboard storage. 'sqlite' appends each evaluated problem, 'yaml' rewrites logs/leaderboard.yml every round.")
+	parser.add_argument('--leaderboard-path', type=non_empty_string, default='logs/leaderboard.sqlite', help="File path to the append-only leaderboard database.")
+	parser.add_argument('--lineage-path', type=non_empty_string, default='logs/lineage.sqlite', help="File path to the database holding the mutation history of every problem.")
+	parser.add_argument('--rpm-limit', type=positive_int, default=0, help="Requests per minute quota shared by mutation and evaluation clients, 0 for unlimited.")
+	parser.add_argument('--tpm-limit', type=positive_int, default=0, help="Tokens per minute quota shared by mutation and evaluation clients, 0 for unlimited.")
+	parser.add_argument('--max-retries', type=positive_int, default=5, help="Maximum number of retries of a throttled or failed request.")
+	parser.add_argument('--cache', type=non_empty_string, default='off', choices=['off', 'on', 'read-only'], help="Whether to serve repeated requests from the response cache. Select from 'off', 'on' or 'read-only'.")
+	parser.add_argument('--cache-path', type=non_empty_string, default='cache/responses.sqlite', help="File path to the response cache database.")
+	parser.add_argument('--cache-max-entries', type=positive_int, default=100000, help="Maximum number of cached responses, 0 for unlimited.")
+	parser.add_argument('--cache-max-mb', type=positive_int, default=0, help="Maximum size of cached responses in megabytes, 0 for unlimited.")
+	parser.add_argument('--scheduler', type=non_empty_string, default='uniform', choices=['uniform', 'ucb', 'thompson'], help="How mutation strategies are allocated. 'uniform' draws at random, 'ucb' and 'thompson' favour strategies with the best score gain per token and second.")
+	parser.add_argument('--scheduler-state', type=non_empty_string, default='logs/strategy_scheduler.json', help="File path where the scheduler keeps what it learned about each strategy across runs.")
+	parser.add_argument('--dedup', type=non_empty_string, default='N', choices=['Y', 'N'], help="Whether mutated statements that duplicate an evaluated one reuse its score instead of being evaluated. Select from 'Y' or 'N'.")
+	parser.add_argument('--dedup-threshold', type=probability, default=0.9, help="Estimated Jaccard similarity from which two mutated statements are duplicates.")
+	parser.add_argument('--evaluation-format', type=non_empty_string, default='text', choices=['text', 'json'], help="Format of evaluation responses. 'json' requests a structured output holding the score, 'text' a plain answer.")
+	parser.add_argument('--evaluation-max-tokens', type=positive_int, default=16, help="Maximum number of completion tokens of an evaluation.")
+	parser.add_argument('--evaluation-retries', type=positive_int, default=1, help="Number of times an evaluation whose response holds no score is requested again.")
+	parser.add_argument('--stream', type=non_empty_string, default='N', choices=['Y', 'N'], help="Whether mutations are streamed, stopping each one as soon as its statement is complete. Select from 'Y' or 'N'.")
+	parser.add_argument('--stream-max-growth', type=positive_float, default=3.0, help="Ratio of the tokens of a streamed mutation to the tokens of its statement at which it is stopped at its last complete sentence, 0 for no limit.")
+	parser.add_argument('--stream-stop-pattern', type=str, default=None, help="Regular expression of the commentary a streamed mutation is stopped before, matched case-sensitively, defaults to paragraphs speaking about the rewrite such as 'Note: I ...' or 'Explanation of changes'.")
+	parser.add_argument('--context-tokens', type=positive_int, default=128000, help="Context window of the model, mutation prompts that do not fit are trimmed or rejected.")
+	parser.add_argument('--max-completion-tokens', type=positive_int, default=4096, help="Largest completion of a mutation, whose completion tokens are otherwise sized from its statement and strategy.")
+	parser.add_argument('--context-overflow', type=non_empty_string, default='trim', choices=['trim', 'reject'], help="What happens to statements too long for the context window. 'trim' cuts their end, 'reject' fails their mutation.")
+	parser.add_argument('--token-budget', type=positive_int, default=0, help="Maximum number of tokens of a run, stopping before a round that would exceed it, 0 for unlimited.")
+	parser.add_argument('--cost-budget', type=positive_float, default=0, help="Maximum cost of a run, stopping before a round that would exceed it, 0 for unlimited.")
+	parser.add_argument('--prompt-price', type=positive_float, default=0.0025, help="Price of a thousand prompt tokens, used by the forecast and --cost-budget.")
+	parser.add_argument('--completion-price', type=positive_float, default=0.01, help="Price of a thousand completion tokens, used by the forecast and --cost-budget.")
+	parser.add_argument('--ensemble', type=non_empty_string, default='N', choices=['Y', 'N'], help="Whether problems near the top k cutoff are scored again by further judges until their rank is clear. Select from 'Y' or 'N'.")
+	parser.add_argument('--judge-models', type=str, default='', help="Comma-separated model deployments judging in the ensemble with each template of prompts/judges/, empty to only use --agent.")
+	parser.add_argument('--judge-confidence', type=probability, default=0.9, help="Confidence level of the score intervals deciding whether a problem is clearly inside or outside the top k.")
+	parser.add_argument('--queue-size', type=positive_int, default=16, help="Maximum number of problems waiting between stages in 'pipeline' round mode.")
+	parser.add_argument('--shard-dir', type=non_empty_string, default='shards/', help="Directory shared by the coordinator and the workers in 'sharded' round mode.")
+	parser.add_argument('--num-shards', type=positive_int, default=4, help="Number of shards each round is split into in 'sharded' round mode.")
+	parser.add_argument('--workers', type=positive_int, default=4, help="Number of local worker processes in 'sharded' round mode, 0 to wait for workers started with scripts/shard_worker.py.")
+	parser.add_argument('--shard-timeout', type=positive_float, default=300.0, help="Seconds without a heartbeat after which the shard of an external worker is given back to the other workers in 'sharded' round mode.")
+	parser.add_argument('--round-timeout', type=positive_float, default=86400.0, help="Seconds after which a round fails if some of its shards are unfinished in 'sharded' round mode.")
+	parser.add_argument('--deployments-config', type=str, default='config.ini', help="Config file whose [deployment:<name>] sections declare the deployments of the mutation and evaluation pools.")
+	parser.add_argument('--mutation-pool', type=non_empty_string, default='mutation', help="Pool of deployments serving mutation requests, the single configured endpoint if the config file declares none.")
+	parser.add_argument('--evaluation-pool', type=non_empty_string, default='evaluation', help="Pool of deployments serving evaluation requests, the single configured endpoint if the config file declares none.")
+	parser.add_argument('--routing', type=non_empty_string, default='weighted', choices=['weighted', 'least-latency'], help="How requests are routed among the deployments of a pool. 'weighted' draws them by weight, 'least-latency' picks the fastest given its load.")
+	parser.add_argument('--failover-threshold', type=positive_int, default=3, help="Consecutive failures taking a deployment out of its pool, 0 to never take deployments out.")
+	parser.add_argument('--failover-cooldown', type=positive_float, default=30.0, help="Seconds before a deployment taken out of its pool is tried again.")
+	parser.add_argument('--max-connections', type=positive_int, default=1000, help="Maximum number of open connections of the HTTP pool shared by every client of the process.")
+	parser.add_argument('--max-keepalive-connections', type=positive_int, default=100, help="Maximum number of idle connections the shared HTTP pool keeps alive for reuse.")
+	parser.add_argument('--keepalive-expiry', type=positive_float, default=5.0, help="Seconds an idle connection of the shared HTTP pool is kept alive.")
+	parser.add_argument('--connect-timeout', type=positive_float, default=5.0, help="Seconds allowed to open a connection to the endpoint.")
+	parser.add_argument('--read-timeout', type=positive_float, default=600.0, help="Seconds allowed between two reads of a response from the endpoint.")
+	parser.add_argument('--http2', type=non_empty_string, default='N', choices=['Y', 'N'], help="Whether the shared HTTP pool negotiates HTTP/2, which needs the h2 package. Select from 'Y' or 'N'.")
+	parser.add_argument('--backend', type=non_empty_string, default='azure', choices=['azure', 'mock'], help="LLM backend. 'mock' serves deterministic chat completions from a local stand-in instead of Azure OpenAI.")
+	parser.add_argument('--mock-latency-ms', type=positive_int, default=0, help="Mean latency of a request to the mock backend in milliseconds.")
+	parser.add_argument('--mock-latency-jitter-ms', type=positive_int, default=0, help="Spread of the latency of the mock backend in milliseconds.")
+	parser.add_argument('--mock-latency-distribution', type=non_empty_string, default='constant', choices=['constant', 'uniform', 'exponential', 'lognormal'], help="Distribution of the latency of the mock backend.")
+	parser.add_argument('--mock-error-rate', type=probability, default=0, help="Fraction of requests the mock backend answers with a 500 error.")
+	parser.add_argument('--mock-commentary-rate', type=probability, default=0, help="Fraction of mutation answers of the mock backend drifting into commentary after the statement.")
+	parser.add_argument('--mock-throttle-rate', type=probability, default=0, help="Fraction of requests the mock backend answers with a 429 error.")
+	parser.add_argument('--metrics-path', type=str, default='', help="File path where metrics are written in the Prometheus text format after every round, empty to disable.")
+	parser.add_argument('--metrics-summary', type=str, default='logs/metrics.json', help="File path to the JSON summary of the metrics of the run, empty to disable.")
+	parser.add_argument('--metrics-port', type=positive_int, default=0, help="Port serving metrics in the Prometheus text format on /metrics, 0 to disable.")
+	parser.add_argument('--log-file', type=non_empty_string, default='logs/app.log', help="File path to the application log, rotated by size.")
+	parser.add_argument('--log-format', type=non_empty_string, default='text', choices=['text', 'json'], help="Format of the log file. 'json' writes one JSON object per record with its structured fields.")
+	parser.add_argument('--log-max-mb', type=positive_int, default=10, help="Size in megabytes at which the log file is rotated, 0 to never rotate.")
 
 	return parser.parse_args()
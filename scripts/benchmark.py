@@ -0,0 +1,380 @@
+"""
+Benchmarks whole rounds against the local mock backend and reports throughput, latency, stage times, memory and tokens.
+
+Each population size runs in a fresh process so peak RSS is measured per size. Results are written as JSON and can be
+compared against a previous results file to catch regressions:
+
+	python scripts/benchmark.py --sizes 10,1000,100000 --latency-ms 800 --round-mode pipeline --concurrency 64
+	python scripts/benchmark.py --sizes 10,1000 --baseline benchmarks/baseline.json
+"""
+
+import os
+import sys
+sys.path.append('.')
+
+import json
+import time
+import shutil
+import random
+import asyncio
+import argparse
+import datetime
+import platform
+import resource
+import tempfile
+import multiprocessing
+from typing import Callable, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from src.Metrics import metrics
+from src.MockLLMServer import MockLLMServer
+from src.LeaderboardStore import LeaderboardStore
+from src.HttpTransport import transport
+from src.AzureOpenAIClient import AzureOpenAIClient
+from src.AsyncAzureOpenAIClient import AsyncAzureOpenAIClient
+from scripts.main import run_round
+from scripts.rounds import TopKSelector, select_strategies, spawn_generation
+from scripts.data_handling import load_problems, load_prompt_templates, load_evaluation_template, update_leaderboard, save_mutated_problem
+
+
+ROUND_MODES = ['sequential', 'async', 'pipeline', 'packed']
+
+
+class TimedClient:
+	'''
+	Client wrapper recording the latency of every call.
+	'''
+	def __init__(self, client, latencies: List[float]):
+		self.client = client
+		self.model = client.model
+		self.latencies = latencies
+
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: Optional[dict]=None) -> str:
+		start = time.perf_counter()
+		try:
+			return self.client.generate_response(user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens, response_format=response_format)
+
+		finally:
+			self.latencies.append(time.perf_counter() - start)
+
+
+	def stream_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, stop_at: Optional[Callable[[str], Optional[int]]]=None) -> str:
+		start = time.perf_counter()
+		try:
+			return self.client.stream_response(user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens, stop_at=stop_at)
+
+		finally:
+			self.latencies.append(time.perf_counter() - start)
+
+
+class AsyncTimedClient(TimedClient):
+	'''
+	Asynchronous client wrapper recording the latency of every call.
+	'''
+	async def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: Optional[dict]=None) -> str:
+		start = time.perf_counter()
+		try:
+			return await self.client.generate_response(user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens, response_format=response_format)
+
+		finally:
+			self.latencies.append(time.perf_counter() - start)
+
+
+	async def stream_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, stop_at: Optional[Callable[[str], Optional[int]]]=None) -> str:
+		start = time.perf_counter()
+		try:
+			return await self.client.stream_response(user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens, stop_at=stop_at)
+
+		finally:
+			self.latencies.append(time.perf_counter() - start)
+
+
+	async def close(self) -> None:
+		await self.client.close()
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+	'''
+	Returns the nearest-rank percentile of a list of values.
+
+	:param values: list, values to summarise.
+	:param q: float, percentile between 0 and 100.
+	:return: float, percentile, None for an empty list.
+	'''
+	if not values:
+		return None
+
+	ordered = sorted(values)
+	rank = max(1, -(-len(ordered) * q // 100))
+
+	return ordered[int(rank) - 1]
+
+
+def latency_summary(latencies: List[float]) -> dict:
+	'''
+	Summarises call latencies in milliseconds.
+
+	:param latencies: list, latencies in seconds.
+	:return: dict, number of calls and p50, p95 and p99 latencies in milliseconds.
+	'''
+	summary = {'calls': len(latencies)}
+	for q in (50, 95, 99):
+		value = percentile(latencies, q)
+		summary[f'p{q}_ms'] = round(value * 1000, 3) if value is not None else None
+
+	return summary
+
+
+def write_problems(filepath: str, size: int, seed: int=42) -> None:
+	'''
+	Writes a synthetic problems file with one statement per line.
+
+	:param filepath: str, problems file path.
+	:param size: int, number of problems.
+	:param seed: int, seed of the synthetic statements, defaults to 42.
+	'''
+	rng = random.Random(seed)
+	words = ['array', 'graph', 'string', 'integer', 'query', 'tree', 'matrix', 'interval', 'path', 'subsequence']
+	with open(filepath, 'w') as file:
+		for i in range(size):
+			subject = ' '.join(rng.choice(words) for _ in range(6))
+			file.write(f"Problem {i}: given a {subject}, compute the minimum cost to answer every query.\n")
+
+
+def run_benchmark(size: int, round_mode: str='sequential', num_rounds: int=1, topk_problems: int=2, concurrency: int=8, queue_size: int=16, pack_size: int=8, latency_ms: float=0, latency_jitter_ms: float=0, latency_distribution: str='constant', leaderboard_backend: str='sqlite', seed: int=42) -> dict:
+	'''
+	Runs whole rounds against the mock backend and measures them.
+
+	:param size: int, population size.
+	:param round_mode: str, 'sequential', 'async', 'pipeline' or 'packed', defaults to 'sequential'.
+	:param num_rounds: int, number of rounds, defaults to 1.
+	:param topk_problems: int, number of problems saved every round, defaults to 2.
+	:param concurrency: int, maximum number of requests in flight in 'async' and 'pipeline' modes, defaults to 8.
+	:param queue_size: int, maximum number of problems waiting between stages in 'pipeline' mode, defaults to 16.
+	:param pack_size: int, maximum number of problems in a single request in 'packed' mode, defaults to 8.
+	:param latency_ms: float, mean latency of the mock backend in milliseconds, defaults to 0.
+	:param latency_jitter_ms: float, spread of the latency of the mock backend in milliseconds, defaults to 0.
+	:param latency_distribution: str, distribution of the latency of the mock backend, defaults to 'constant'.
+	:param leaderboard_backend: str, 'sqlite' or 'yaml', defaults to 'sqlite'.
+	:param seed: int, seed of the run, defaults to 42.
+	:return: dict, measurements of the run.
+	'''
+	if round_mode not in ROUND_MODES:
+		raise ValueError(f"Error: Round mode '{round_mode}' cannot be benchmarked. Select from {ROUND_MODES}.")
+
+	random.seed(seed)
+	transport.reset()
+	work_dir = tempfile.mkdtemp(prefix='benchmark-')
+	problems_path = os.path.join(work_dir, 'problems.txt')
+	write_problems(problems_path, size, seed)
+
+	stage_seconds = {'load': 0.0, 'round': 0.0, 'mutation': 0.0, 'evaluation': 0.0, 'leaderboard': 0.0, 'save': 0.0}
+	mutation_latencies, evaluation_latencies, tokens_per_round = [], [], []
+	asynchronous = round_mode in ('async', 'pipeline')
+	args = argparse.Namespace(round_mode=round_mode, concurrency=concurrency, queue_size=queue_size, pack_size=pack_size)
+
+	with MockLLMServer(latency_ms=latency_ms, latency_jitter_ms=latency_jitter_ms, latency_distribution=latency_distribution, seed=seed) as server:
+		client_class, timed_class = (AsyncAzureOpenAIClient, AsyncTimedClient) if asynchronous else (AzureOpenAIClient, TimedClient)
+		http_client = transport.async_client() if asynchronous else transport.client()
+		mutation_client = timed_class(client_class(endpoint=server.endpoint, api_key='mock', model='gpt-4o', http_client=http_client), mutation_latencies)
+		evaluation_client = timed_class(client_class(endpoint=server.endpoint, api_key='mock', model='gpt-4o', http_client=http_client), evaluation_latencies)
+		loop = asyncio.new_event_loop() if asynchronous else None
+		leaderboard = LeaderboardStore(path=os.path.join(work_dir, 'leaderboard.sqlite')) if leaderboard_backend == 'sqlite' else None
+
+		start = time.perf_counter()
+		problems = load_problems(filename=problems_path)
+		stage_seconds['load'] = time.perf_counter() - start
+
+		prompt_templates = load_prompt_templates()
+		packing_templates = load_prompt_templates(strategies_dir='prompts/packing/') if round_mode == 'packed' else {}
+		evaluation_template = load_evaluation_template()
+
+		loop_start = time.perf_counter()
+		survivors = []
+		for n_round in range(num_rounds):
+			tokens_before = server.stats['prompt_tokens'] + server.stats['completion_tokens']
+			stage_before = {stage: metrics.combined_total(f'{stage}_seconds') for stage in ('mutation', 'evaluation')}
+
+			# Spawning the next generation from the survivors of the previous round, as a run does
+			if survivors:
+				problems = spawn_generation(survivors=survivors, population_size=size)
+			else:
+				problems = random.sample(problems, len(problems))
+			strategies = select_strategies(problems=problems, prompt_templates=prompt_templates)
+			selector = TopKSelector(k=topk_problems)
+			evaluated_problems = []
+
+			def on_result(index, problem):
+				selector.push(index=index, problem=problem)
+				evaluated_problems.append(problem)
+
+			start = time.perf_counter()
+			run_round(
+				args=args,
+				loop=loop,
+				mutation_client=mutation_client,
+				evaluation_client=evaluation_client,
+				problems=problems,
+				strategies=strategies,
+				prompt_templates=prompt_templates,
+				evaluation_template=evaluation_template,
+				packing_templates=packing_templates,
+				on_mutated=None,
+				on_result=on_result
+			)
+			stage_seconds['round'] += time.perf_counter() - start
+			# Splitting the round into the time its problems spent being mutated and evaluated, summed over concurrent requests
+			for stage, seconds in stage_before.items():
+				stage_seconds[stage] += metrics.combined_total(f'{stage}_seconds') - seconds
+
+			start = time.perf_counter()
+			if leaderboard is not None:
+				for problem in evaluated_problems:
+					leaderboard.append(problem=problem, n_round=n_round)
+			else:
+				update_leaderboard(problems=evaluated_problems, filepath=os.path.join(work_dir, 'leaderboard.yml'))
+			stage_seconds['leaderboard'] += time.perf_counter() - start
+
+			start = time.perf_counter()
+			survivors = selector.result()
+			for problem in survivors:
+				save_mutated_problem(problem=problem, output_dir=os.path.join(work_dir, 'output'))
+			stage_seconds['save'] += time.perf_counter() - start
+
+			tokens_per_round.append(server.stats['prompt_tokens'] + server.stats['completion_tokens'] - tokens_before)
+
+		elapsed = time.perf_counter() - loop_start
+
+		transport_stats = transport.stats()
+		if loop is not None:
+			loop.run_until_complete(mutation_client.close())
+			loop.run_until_complete(evaluation_client.close())
+			loop.run_until_complete(transport.aclose())
+			loop.close()
+		transport.close()
+		if leaderboard is not None:
+			leaderboard.close()
+		server_stats = dict(server.stats)
+
+	shutil.rmtree(work_dir, ignore_errors=True)
+
+	return {
+		'size': size,
+		'round_mode': round_mode,
+		'num_rounds': num_rounds,
+		'elapsed_seconds': round(elapsed, 6),
+		'problems_per_second': round(size * num_rounds / elapsed, 3) if elapsed > 0 else None,
+		'stage_seconds': {stage: round(seconds, 6) for stage, seconds in stage_seconds.items()},
+		'latency': {
+			'mutation': latency_summary(mutation_latencies),
+			'evaluation': latency_summary(evaluation_latencies),
+			'all': latency_summary(mutation_latencies + evaluation_latencies)
+		},
+		'tokens_per_round': tokens_per_round,
+		'requests': server_stats['requests'],
+		'connections_opened': transport_stats['connections_opened'],
+		# ru_maxrss is reported in kilobytes on Linux
+		'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 3)
+	}
+
+
+def compare_results(results: List[dict], baseline: List[dict], tolerance: float=0.1) -> List[str]:
+	'''
+	Compares results against a baseline run of the same sizes and round modes.
+
+	:param results: list, results of the current run.
+	:param baseline: list, results of the baseline run.
+	:param tolerance: float, relative change tolerated before reporting a regression, defaults to 0.1.
+	:return: list, description of each regression, empty if there is none.
+	'''
+	regressions = []
+	previous = {(entry['size'], entry['round_mode']): entry for entry in baseline}
+	for entry in results:
+		reference = previous.get((entry['size'], entry['round_mode']))
+		if reference is None:
+			continue
+
+		label = f"size {entry['size']} ({entry['round_mode']})"
+		checks = [
+			('problems/sec', entry['problems_per_second'], reference['problems_per_second'], False),
+			('p95 latency ms', entry['latency']['all']['p95_ms'], reference['latency']['all']['p95_ms'], True),
+			('peak RSS MB', entry['peak_rss_mb'], reference['peak_rss_mb'], True),
+			('tokens per round', max(entry['tokens_per_round']), max(reference['tokens_per_round']), True)
+		]
+		for name, value, expected, higher_is_worse in checks:
+			if value is None or not expected:
+				continue
+			change = (value - expected) / expected
+			if (change > tolerance) if higher_is_worse else (change < -tolerance):
+				regressions.append(f"{label}: {name} went from {expected} to {value} ({change:+.1%})")
+
+	return regressions
+
+
+def parse_arguments():
+	'''
+	Parses command-line arguments for the benchmark.
+	'''
+	parser = argparse.ArgumentParser(description="Benchmark whole rounds against the local mock backend.")
+	parser.add_argument('--sizes', default='10,100,1000', help="Comma separated population sizes.")
+	parser.add_argument('--round-mode', default='sequential', choices=ROUND_MODES, help="Round mode to benchmark.")
+	parser.add_argument('--num-rounds', type=int, default=1, help="Number of rounds per size.")
+	parser.add_argument('--topk-problems', type=int, default=2, help="Number of problems saved every round.")
+	parser.add_argument('--concurrency', type=int, default=8, help="Maximum number of requests in flight in 'async' and 'pipeline' round modes.")
+	parser.add_argument('--queue-size', type=int, default=16, help="Maximum number of problems waiting between stages in 'pipeline' round mode.")
+	parser.add_argument('--pack-size', type=int, default=8, help="Maximum number of problems in a single request in 'packed' round mode.")
+	parser.add_argument('--latency-ms', type=float, default=0, help="Mean latency of the mock backend in milliseconds.")
+	parser.add_argument('--latency-jitter-ms', type=float, default=0, help="Spread of the latency of the mock backend in milliseconds.")
+	parser.add_argument('--latency-distribution', default='constant', choices=['constant', 'uniform', 'exponential', 'lognormal'], help="Distribution of the latency of the mock backend.")
+	parser.add_argument('--leaderboard-backend', default='sqlite', choices=['sqlite', 'yaml'], help="Leaderboard storage.")
+	parser.add_argument('--seed', type=int, default=42, help="Seed of the runs.")
+	parser.add_argument('--output', default='benchmarks/results.json', help="File path to the JSON results.")
+	parser.add_argument('--baseline', default=None, help="File path to previous JSON results to compare against.")
+	parser.add_argument('--tolerance', type=float, default=0.1, help="Relative change tolerated before reporting a regression.")
+
+	return parser.parse_args()
+
+
+def main():
+	args = parse_arguments()
+	options = {key: value for key, value in vars(args).items() if key not in ('sizes', 'output', 'baseline', 'tolerance')}
+
+	# Running each size in a fresh process so peak RSS is not carried over between sizes
+	results = []
+	for size in [int(size) for size in args.sizes.split(',')]:
+		with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+			result = executor.submit(run_benchmark, size, **options).result()
+		results.append(result)
+		print(
+			f"size={result['size']:>7} problems/s={result['problems_per_second']:>10} "
+			f"p50/p95/p99 ms={result['latency']['all']['p50_ms']}/{result['latency']['all']['p95_ms']}/{result['latency']['all']['p99_ms']} "
+			f"peak RSS MB={result['peak_rss_mb']} tokens/round={result['tokens_per_round']}"
+		)
+
+	# Creating output folder if it does not exist
+	if os.path.dirname(args.output):
+		os.makedirs(os.path.dirname(args.output), exist_ok=True)
+
+	with open(args.output, 'w') as file:
+		json.dump({
+			'timestamp': str(datetime.datetime.now()),
+			'python': platform.python_version(),
+			'platform': platform.platform(),
+			'options': options,
+			'results': results
+		}, file, indent=2)
+	print(f"Results written to {args.output}")
+
+	# Comparing against the baseline
+	if args.baseline:
+		with open(args.baseline, 'r') as file:
+			regressions = compare_results(results, json.load(file)['results'], tolerance=args.tolerance)
+		for regression in regressions:
+			print(f"Regression: {regression}")
+		if regressions:
+			sys.exit(1)
+		print("No regressions against the baseline.")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,173 @@
+"""
+File to checkpoint and resume evolutionary runs.
+
+A checkpoint is written once the problems and strategies of a round are drawn. It holds the problems of the round,
+their strategies, the scores of their parents, the round number, the random state right after the draws, the tokens
+spent so far, the growth of the strategies the round is planned from and the statements of the dedup index. Every
+mutation and evaluation completed afterwards is appended to the journal of the round with the spend after it, so
+resuming replays them instead of paying for them again and keeps counting the spend of the run towards its budget.
+"""
+
+import os
+import json
+import random
+from typing import List, Optional, Set, Tuple
+from scripts.data_handling import Problem
+
+
+def problem_to_dict(problem: Problem) -> dict:
+	'''
+	Converts a problem into a JSON serialisable dictionary. The mutation history stays in the lineage store.
+
+	:param problem: Problem class to convert.
+	:return: dict, dictionary with every field of the problem.
+	'''
+	return problem.to_dict()
+
+
+def problem_from_dict(data: dict) -> Problem:
+	'''
+	Rebuilds a problem from a dictionary created by problem_to_dict.
+
+	:param data: dict, dictionary with the fields of the problem.
+	:return: Problem class.
+	'''
+	return Problem(**{name: value for name, value in data.items() if name in Problem.FIELDS})
+
+
+def _journal_path(checkpoint_dir: str, n_round: int) -> str:
+	'''
+	Returns the path of the journal of a round.
+	'''
+	return os.path.join(checkpoint_dir, f'journal-{n_round}.jsonl')
+
+
+def save_checkpoint(checkpoint_dir: str, n_round: int, problems: List[Problem], strategies: List[Optional[str]], run_id: Optional[str]=None, completed: bool=False, spent: Optional[dict]=None, parent_scores: Optional[dict]=None, growth: Optional[dict]=None, dedup: Optional[dict]=None) -> None:
+	'''
+	Atomically writes the checkpoint of a round before any of its calls and discards older journals.
+
+	:param checkpoint_dir: str, directory path where checkpoints are saved.
+	:param n_round: int, round number.
+	:param problems: list, list of Problem classes of the round.
+	:param strategies: list, strategy for each problem, None to skip its mutation.
+	:param run_id: str, optional identifier of the run, kept so a resumed run appends to the same leaderboard run.
+	:param completed: bool, whether the whole run is completed, defaults to False.
+	:param spent: dict, optional prompt and completion tokens spent by the run so far.
+	:param parent_scores: dict, optional scores of the survivors the problems of the round were spawned from, by id.
+	:param growth: dict, optional growth of each strategy learned by the token budget before the round.
+	:param dedup: dict, optional evaluated statements of the dedup index before the round, as converted by DedupIndex.to_dict.
+	'''
+	os.makedirs(checkpoint_dir, exist_ok=True)
+
+	state = random.getstate()
+	checkpoint = {
+		'n_round': n_round,
+		'completed': completed,
+		'run_id': run_id,
+		'rng_state': [state[0], list(state[1]), state[2]],
+		'problems': [problem_to_dict(problem) for problem in problems],
+		'strategies': strategies,
+		'spent': spent,
+		'parent_scores': parent_scores or {},
+		'growth': growth,
+		'dedup': dedup
+	}
+
+	# Writing to a temporary file first so a crash never leaves a partial checkpoint
+	filepath = os.path.join(checkpoint_dir, 'checkpoint.json')
+	with open(f'{filepath}.tmp', 'w') as file:
+		json.dump(checkpoint, file)
+		file.flush()
+		os.fsync(file.fileno())
+	os.replace(f'{filepath}.tmp', filepath)
+
+	for filename in os.listdir(checkpoint_dir):
+		if filename.startswith('journal-'):
+			os.remove(os.path.join(checkpoint_dir, filename))
+
+
+def load_checkpoint(checkpoint_dir: str) -> Optional[dict]:
+	'''
+	Loads the last checkpoint and restores the random state it was taken with.
+
+	:param checkpoint_dir: str, directory path where checkpoints are saved.
+	:return: dict, checkpoint with its problems rebuilt as Problem classes and the spend of the last journaled call, None if there is no checkpoint.
+	'''
+	filepath = os.path.join(checkpoint_dir, 'checkpoint.json')
+	if not os.path.exists(filepath):
+		return None
+
+	with open(filepath, 'r') as file:
+		checkpoint = json.load(file)
+
+	state = checkpoint['rng_state']
+	random.setstate((state[0], tuple(state[1]), state[2]))
+	checkpoint['problems'] = [problem_from_dict(data) for data in checkpoint['problems']]
+
+	# Taking the spend of the run from the last call of the round completed before the interruption
+	checkpoint.setdefault('spent', None)
+	checkpoint.setdefault('growth', None)
+	checkpoint.setdefault('dedup', None)
+	filepath = _journal_path(checkpoint_dir, checkpoint['n_round'])
+	if os.path.exists(filepath):
+		with open(filepath, 'r') as file:
+			for line in file:
+				try:
+					checkpoint['spent'] = json.loads(line).get('spent') or checkpoint['spent']
+
+				except json.JSONDecodeError:
+					continue
+
+	return checkpoint
+
+
+def append_journal(checkpoint_dir: str, n_round: int, stage: str, problem: Problem, spent: Optional[dict]=None) -> None:
+	'''
+	Appends the state of a problem after a completed mutation or evaluation to the journal of the round.
+
+	:param checkpoint_dir: str, directory path where checkpoints are saved.
+	:param n_round: int, round number.
+	:param stage: str, completed stage, 'mutation' or 'evaluation'.
+	:param problem: Problem class after the stage.
+	:param spent: dict, optional prompt and completion tokens spent by the run after the stage.
+	'''
+	with open(_journal_path(checkpoint_dir, n_round), 'a') as file:
+		file.write(json.dumps({'stage': stage, 'problem': problem_to_dict(problem), 'spent': spent}) + '\n')
+		file.flush()
+
+
+def replay_journal(checkpoint_dir: str, n_round: int, problems: List[Problem]) -> Tuple[Set[str], Set[str]]:
+	'''
+	Applies the journal of a round to its problems.
+
+	:param checkpoint_dir: str, directory path where checkpoints are saved.
+	:param n_round: int, round number.
+	:param problems: list, list of Problem classes of the round, updated in place.
+	:return: tuple, ids of the problems already mutated and ids of the problems already evaluated.
+	'''
+	mutated, evaluated = set(), set()
+	filepath = _journal_path(checkpoint_dir, n_round)
+	if not os.path.exists(filepath):
+		return mutated, evaluated
+
+	by_id = {problem.id: problem for problem in problems}
+	with open(filepath, 'r') as file:
+		for line in file:
+			try:
+				entry = json.loads(line)
+
+			except json.JSONDecodeError:
+				# Ignoring a line cut short by a crash
+				continue
+
+			problem = by_id.get(entry['problem']['id'])
+			if problem is None:
+				continue
+
+			restored = problem_from_dict(entry['problem'])
+			for name in Problem.FIELDS:
+				setattr(problem, name, getattr(restored, name))
+
+			(mutated if entry['stage'] == 'mutation' else evaluated).add(problem.id)
+
+	return mutated, evaluated
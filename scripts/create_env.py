@@ -5,6 +5,7 @@ File to set environment variables.
 import os
 import sys
 import configparser
+from typing import Dict, List
 
 sys.path.append('.')
 
@@ -32,3 +33,46 @@ def run_env() -> None:
 	#---------------------------
 	os.environ['OPENAI_API_KEY'] = config.get('OpenAI', 'OPENAI_API_KEY')
 	os.environ['OPENAI_API_ENDPOINT'] = config.get('OpenAI', 'OPENAI_API_ENDPOINT')
+
+
+def load_deployments(config_path: str='./config.ini') -> Dict[str, List[dict]]:
+	'''
+	Reads the deployments declared in [deployment:<name>] sections of the config file, grouped by the pools they serve.
+
+	Each section holds the endpoint, api_key and model of a deployment, and optionally its weight, its requests and
+	tokens per minute quota (rpm_limit, tpm_limit), the retries of its requests before they fail over (max_retries)
+	and a comma-separated list of pools, defaults to mutation and evaluation.
+
+	:param config_path: str, config file path, defaults to ./config.ini.
+	:return: dict, deployments of each pool, empty if the file declares none.
+	:raises ValueError: if a deployment misses a setting or has an invalid one.
+	'''
+	config = configparser.ConfigParser()
+	config.read(config_path)
+
+	pools = {}
+	for section in config.sections():
+		if not section.startswith('deployment:'):
+			continue
+
+		name = section[len('deployment:'):].strip()
+		try:
+			deployment = {
+				'name': name,
+				'endpoint': config.get(section, 'endpoint'),
+				'api_key': config.get(section, 'api_key'),
+				'model': config.get(section, 'model'),
+				'weight': config.getfloat(section, 'weight', fallback=1.0),
+				'rpm_limit': config.getfloat(section, 'rpm_limit', fallback=None),
+				'tpm_limit': config.getfloat(section, 'tpm_limit', fallback=None),
+				'max_retries': config.getint(section, 'max_retries', fallback=None)
+			}
+
+		except (configparser.Error, ValueError) as e:
+			raise ValueError(f"Error: Invalid deployment '{name}' in {config_path}: {str(e)}")
+
+		for pool in config.get(section, 'pools', fallback='mutation, evaluation').split(','):
+			if pool.strip():
+				pools.setdefault(pool.strip(), []).append(deployment)
+
+	return pools
@@ -6,46 +6,145 @@ import os
 import yaml
 import uuid
 import datetime
-from typing import List
-from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+from src.LineageStore import lineage
+from scripts.templates import EVALUATION_PLACEHOLDERS, compile_template
+
+# Number of most recent messages kept in the error and warning logs of a problem
+MAX_LOG_MESSAGES = 20
+
+
+class MessageLog(list):
+	'''
+	List of log messages that only keeps the most recent MAX_LOG_MESSAGES messages.
+	'''
+	def append(self, message: str) -> None:
+		super().append(message)
+		if len(self) > MAX_LOG_MESSAGES:
+			del self[0]
 
 
-@dataclass
 class Problem:
 	'''
-	Data class for representing a problem.
+	Class for representing a problem.
+
+	Slots keep the footprint of each problem small and fixed. The mutation history is not held by the problem,
+	it is recorded in the lineage store and loaded when mutation_log is read, and the error and warning logs only
+	keep their most recent messages, so the memory of a problem does not grow with the number of rounds.
 	'''
-	id: str = field(default_factory=lambda: str(uuid.uuid4()))
-	original_description: str = ""
-	mutated_description: str = ""
-	mutated: bool = False
-	score: float = 0.0
-	mutation_log: list = field(default_factory=list)
-	error_logs: list = field(default_factory=list)
-	warnings_log: list = field(default_factory=list)
+	__slots__ = ('id', 'original_description', 'mutated_description', 'mutated', 'score', 'parent_id', 'generation', '_error_logs', '_warnings_log')
+
+	# Fields of a problem, in the order they are serialised
+	FIELDS = ('id', 'original_description', 'mutated_description', 'mutated', 'score', 'parent_id', 'generation', 'error_logs', 'warnings_log')
+
+	def __init__(self, id: Optional[str]=None, original_description: str="", mutated_description: str="", mutated: bool=False, score: float=0.0, parent_id: Optional[str]=None, generation: int=0, error_logs: Optional[list]=None, warnings_log: Optional[list]=None):
+		self.id = id if id is not None else str(uuid.uuid4())
+		self.original_description = original_description
+		self.mutated_description = mutated_description
+		self.mutated = mutated
+		self.score = score
+		self.parent_id = parent_id
+		self.generation = generation
+		self.error_logs = error_logs or []
+		self.warnings_log = warnings_log or []
+
+
+	@property
+	def error_logs(self) -> MessageLog:
+		return self._error_logs
+
+
+	@error_logs.setter
+	def error_logs(self, messages: list) -> None:
+		self._error_logs = MessageLog(messages[-MAX_LOG_MESSAGES:])
+
+
+	@property
+	def warnings_log(self) -> MessageLog:
+		return self._warnings_log
+
+
+	@warnings_log.setter
+	def warnings_log(self, messages: list) -> None:
+		self._warnings_log = MessageLog(messages[-MAX_LOG_MESSAGES:])
+
+
+	@property
+	def statement(self) -> str:
+		'''
+		Statement mutations start from, the mutated description inherited from the parent for children of a generation
+		and the original description for problems drawn from the corpus.
+		'''
+		return self.mutated_description if self.parent_id is not None else self.original_description
+
+
+	def spawn(self) -> 'Problem':
+		'''
+		Creates a child of the problem for the next generation, starting from its mutated description.
+
+		:return: Problem class, unmutated child keeping the original description of its ancestors.
+		'''
+		return Problem(
+			original_description=self.original_description,
+			mutated_description=self.mutated_description,
+			parent_id=self.id,
+			generation=self.generation + 1
+		)
+
+
+	@property
+	def mutation_log(self) -> List[dict]:
+		'''
+		Mutation history of the problem, loaded from the lineage store on each access.
+		'''
+		return lineage.history(self.id)
+
 
+	def to_dict(self) -> dict:
+		'''
+		Converts the problem into a JSON serialisable dictionary, without its mutation history.
 
-def load_prompt_templates(strategies_dir: str='prompts/mutations/') -> dict:
+		:return: dict, dictionary with every field of the problem.
+		'''
+		data = {name: getattr(self, name) for name in self.FIELDS}
+		data['error_logs'], data['warnings_log'] = list(self.error_logs), list(self.warnings_log)
+
+		return data
+
+
+	def __eq__(self, other) -> bool:
+		if other.__class__ is not self.__class__:
+			return NotImplemented
+
+		return self.to_dict() == other.to_dict()
+
+
+	def __repr__(self) -> str:
+		return f"Problem({', '.join(f'{name}={getattr(self, name)!r}' for name in self.FIELDS)})"
+
+
+def load_prompt_templates(strategies_dir: str='prompts/mutations/', placeholders: Optional[Iterable[str]]=None) -> dict:
 	'''
-	Loads prompt templates for available mutation strategies.
+	Loads and compiles prompt templates for available mutation strategies.
 
 	:param strategies_dir: str, directory path where strategies are saved, defaults to prompts/mutations/
+	:param placeholders: iterable, placeholders every template must hold, defaults to the ones each template holds.
 	:return: dict, dictionary where keys are the mutation strategies and values are the templates.
 	'''
 	
 	prompt_templates = {}
 
-	# Loading prompt templates in strategies_dir
-	for strategy in os.listdir(strategies_dir):
+	# Loading prompt templates in strategies_dir, sorted so strategy selection is reproducible across filesystems
+	for strategy in sorted(os.listdir(strategies_dir)):
 		with open(os.path.join(strategies_dir, strategy), 'r') as file:
-			prompt_templates[strategy] = file.read().strip()
+			prompt_templates[strategy] = compile_template(template=file.read(), placeholders=placeholders, name=strategy)
 
 	return prompt_templates
 
 
 def load_evaluation_template(evaluation_dir: str='prompts/evaluations/', evaluation_filepath: str='evaluate.txt') -> dict:
 	'''
-	Loads evaluation template.
+	Loads and compiles the evaluation template.
 
 	:param evaluation_dir: str, directory path where evaluation is saved, defaults to prompts/evaluations/
 	:param evaluation_filepath: str, evaluation file name, defaults to evaluate.txt.
@@ -59,7 +158,7 @@ def load_evaluation_template(evaluation_dir: str='prompts/evaluations/', evaluat
 	# Loading evaluation template
 	evaluation_template = ""
 	with open(os.path.join(evaluation_dir, evaluation_filepath), 'r') as file:
-		evaluation_template = file.read().strip()
+		evaluation_template = compile_template(template=file.read(), placeholders=EVALUATION_PLACEHOLDERS, name=evaluation_filepath)
 
 	return evaluation_template
 
@@ -128,8 +227,8 @@ def update_leaderboard(problems: List[Problem], filepath: str='logs/leaderboard.
 		'mutated': problem.mutated,
 		'score': problem.score,
 		'mutation_log': problem.mutation_log,
-		'error_logs': problem.error_logs,
-		'warnings_log': problem.warnings_log
+		'error_logs': list(problem.error_logs),
+		'warnings_log': list(problem.warnings_log)
 	} for problem in problems]
 
 	try:
@@ -138,3 +237,25 @@ def update_leaderboard(problems: List[Problem], filepath: str='logs/leaderboard.
 
 	except Exception as e:
 		raise Exception(f"Error writing leaderboard: {str(e)}") from e
+
+
+def export_leaderboard(store, filepath: str='logs/leaderboard.yml', n_round: int=None, run_id: str=None) -> None:
+	'''
+	Exports a round of an append-only leaderboard store to the leaderboard YAML format.
+
+	:param store: LeaderboardStore object to export.
+	:param filepath: str, leaderboard filepath, defaults to logs/leaderboard.yml
+	:param n_round: int, optional round to export, defaults to the last round of the run.
+	:param run_id: str, optional run identifier, defaults to the run of the store.
+	'''
+	# Creating logs folder if it does not exist
+	os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+	leaderboard_content = store.entries(n_round=n_round, run_id=run_id)
+
+	try:
+		with open(filepath, 'w') as file:
+			yaml.dump(leaderboard_content, file)
+
+	except Exception as e:
+		raise Exception(f"Error writing leaderboard: {str(e)}") from e
@@ -0,0 +1,42 @@
+"""
+Exports a round of the append-only leaderboard to the leaderboard YAML format.
+"""
+
+import sys
+sys.path.append('.')
+
+import sqlite3
+import argparse
+from src.LineageStore import LineageStore
+from src.LeaderboardStore import LeaderboardStore
+from scripts.data_handling import export_leaderboard
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Export the append-only leaderboard to YAML.")
+	parser.add_argument('--leaderboard-path', default='logs/leaderboard.sqlite', help="File path to the leaderboard database.")
+	parser.add_argument('--lineage-path', default='logs/lineage.sqlite', help="File path to the database holding the mutation history.")
+	parser.add_argument('--output', default='logs/leaderboard.yml', help="File path to the exported YAML leaderboard.")
+	parser.add_argument('--run-id', default=None, help="Run to export, defaults to the most recent run.")
+	parser.add_argument('--round', type=int, default=None, help="Round to export, defaults to the last round of the run.")
+	args = parser.parse_args()
+
+	# Finding the most recent run when none is given
+	run_id = args.run_id
+	if run_id is None:
+		connection = sqlite3.connect(args.leaderboard_path)
+		row = connection.execute('SELECT run_id FROM leaderboard ORDER BY seq DESC LIMIT 1').fetchone()
+		connection.close()
+		if row is None:
+			raise ValueError(f"Error: The leaderboard {args.leaderboard_path} is empty.")
+		run_id = row[0]
+
+	lineage_store = LineageStore(path=args.lineage_path)
+	store = LeaderboardStore(path=args.leaderboard_path, run_id=run_id, lineage_store=lineage_store)
+	export_leaderboard(store=store, filepath=args.output, n_round=args.round)
+	store.close()
+	lineage_store.close()
+
+
+if __name__ == '__main__':
+	main()
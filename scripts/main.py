@@ -6,118 +6,674 @@ import os
 import sys
 sys.path.append('.')
 
+import time
 import random
+import asyncio
 import logging
+import functools
 from src.Logger import Logger
-from scripts.create_env import run_env
+from src.Metrics import metrics
+from scripts.create_env import run_env, load_deployments
 from scripts.arg_parsing import parse_arguments
+from scripts.checkpoint import save_checkpoint, load_checkpoint, append_journal, replay_journal
+from scripts.sharding import create_client, run_round_sharded
+from src.RateLimiter import RateLimiter
+from src.DeploymentPool import Deployment, DeploymentPool, AsyncDeploymentPool
+from src.ResponseCache import ResponseCache
+from src.DedupIndex import DedupIndex
+from src.StrategyScheduler import StrategyScheduler
+from src.JudgeEnsemble import JudgeEnsemble
+from src.TokenBudget import budget, count_tokens
+from src.HttpTransport import transport
+from src.ProblemCorpus import ProblemCorpus
+from src.LineageStore import lineage
+from src.LeaderboardStore import LeaderboardStore
+from src.MockLLMServer import MockLLMServer
+from src.BatchClient import AzureBatchClient, LocalBatchClient
 from src.AzureOpenAIClient import AzureOpenAIClient
-from scripts.mutation import mutate_problem, evaluate_problem
-from scripts.data_handling import load_problems, load_prompt_templates, load_evaluation_template, update_leaderboard, save_mutated_problem
+from src.AsyncAzureOpenAIClient import AsyncAzureOpenAIClient
+from scripts.mutation import MUTATION_SYSTEM_MESSAGE, STOP_PATTERN, configure_evaluation, configure_streaming, index_evaluation
+from scripts.templates import MUTATION_PLACEHOLDERS, EVALUATION_PLACEHOLDERS, PACKING_PLACEHOLDERS
+from scripts.rounds import TopKSelector, select_strategies, spawn_generation, run_round_sequential, run_round_async, run_round_pipelined, run_round_batch, run_round_packed
+from scripts.data_handling import load_prompt_templates, load_evaluation_template, update_leaderboard, save_mutated_problem
 
 
-def main():
-	# Initialize the custom Logger
-	logger = Logger(level=logging.INFO)
-	logger.info("Starting the main processing loop.")
+def share_quota(args, deployments: list) -> dict:
+	'''
+	Splits the quota of the command line between the deployments without a quota of their own, as it is split between local workers.
+
+	:param args: parsed command-line arguments.
+	:param deployments: list, settings of every deployment requests are sent to, as read by load_deployments.
+	:return: dict, requests and tokens per minute of each deployment without its own 'rpm_limit' and 'tpm_limit'.
+	'''
+	deployments = {deployment['name']: deployment for deployment in deployments}.values()
+
+	return {
+		'rpm_limit': args.rpm_limit / max(sum(1 for deployment in deployments if deployment['rpm_limit'] is None), 1),
+		'tpm_limit': args.tpm_limit / max(sum(1 for deployment in deployments if deployment['tpm_limit'] is None), 1)
+	}
+
+
+def create_pool(args, name: str, deployments: list, client_class, rate_limiters: dict, quota: dict, cache=None, http_client=None):
+	'''
+	Creates a pool of deployments, each with its own client and the rate limiter of its quota.
+
+	:param args: parsed command-line arguments.
+	:param name: str, name of the pool.
+	:param deployments: list, settings of each deployment of the pool, as read by load_deployments.
+	:param client_class: AzureOpenAIClient or AsyncAzureOpenAIClient.
+	:param rate_limiters: dict, rate limiter of each deployment by name, shared by the pools a deployment serves.
+	:param quota: dict, share of the quota of the command line given to deployments without their own, as returned by share_quota.
+	:param cache: ResponseCache object shared by every client, defaults to None.
+	:param http_client: HTTP client holding the shared connection pool, defaults to None.
+	:return: DeploymentPool or AsyncDeploymentPool object.
+	'''
+	pool = []
+	for deployment in deployments:
+		if deployment['name'] not in rate_limiters:
+			rate_limiters[deployment['name']] = RateLimiter(
+				requests_per_minute=deployment['rpm_limit'] if deployment['rpm_limit'] is not None else quota['rpm_limit'],
+				tokens_per_minute=deployment['tpm_limit'] if deployment['tpm_limit'] is not None else quota['tpm_limit'],
+				max_retries=deployment['max_retries'] if deployment['max_retries'] is not None else args.max_retries
+			)
+
+		client = client_class(
+			endpoint=deployment['endpoint'],
+			api_key=deployment['api_key'],
+			model=deployment['model'],
+			cache=cache,
+			rate_limiter=rate_limiters[deployment['name']],
+			http_client=http_client
+		)
+		pool.append(Deployment(name=deployment['name'], client=client, weight=deployment['weight'], failure_threshold=args.failover_threshold, cooldown=args.failover_cooldown))
+
+	pool_class = AsyncDeploymentPool if client_class is AsyncAzureOpenAIClient else DeploymentPool
+
+	return pool_class(deployments=pool, name=name, routing=args.routing)
+
 
-	# Setting environment variables
-	run_env()
+def run_round(args, loop, mutation_client, evaluation_client, problems, strategies, prompt_templates, evaluation_template, packing_templates, on_mutated, on_result, n_round=0, client_factory=None, dedup_index=None):
+	'''
+	Mutates and evaluates the problems of a round with the round mode selected in the arguments.
 
+	:param args: parsed command-line arguments.
+	:param loop: event loop running asynchronous round modes, None otherwise.
+	:param mutation_client: client used for mutation requests.
+	:param evaluation_client: client used for evaluation requests.
+	:param problems: list, list of Problem classes to mutate and evaluate.
+	:param strategies: list, strategy for each problem, None to skip its mutation.
+	:param prompt_templates: dict, dictionary where keys are the mutation strategies and values are the templates.
+	:param evaluation_template: str, evaluation template.
+	:param packing_templates: dict, templates wrapping several problems in a single request.
+	:param on_mutated: callable, called with the position of the problem and the mutated Problem class.
+	:param on_result: callable, called with the position of the problem and the evaluated Problem class.
+	:param n_round: int, round number, defaults to 0.
+	:param client_factory: callable, creates the client of each local worker in 'sharded' round mode, defaults to None.
+	:param dedup_index: DedupIndex object reusing the score of evaluated duplicates, not used by workers in 'sharded' round mode, defaults to None.
+	'''
+	common = {
+		'prompt_templates': prompt_templates,
+		'evaluation_template': evaluation_template,
+		'on_mutated': on_mutated,
+		'on_result': on_result
+	}
+
+	if args.round_mode == 'pipeline':
+		loop.run_until_complete(run_round_pipelined(
+			mutation_client=mutation_client,
+			evaluation_client=evaluation_client,
+			items=zip(problems, strategies),
+			concurrency=args.concurrency,
+			queue_size=args.queue_size,
+			dedup_index=dedup_index,
+			**common
+		))
+
+	elif args.round_mode == 'async':
+		loop.run_until_complete(run_round_async(
+			mutation_client=mutation_client,
+			evaluation_client=evaluation_client,
+			problems=problems,
+			strategies=strategies,
+			concurrency=args.concurrency,
+			dedup_index=dedup_index,
+			**common
+		))
+
+	elif args.round_mode == 'batch':
+		run_round_batch(
+			mutation_batch_client=mutation_client,
+			evaluation_batch_client=evaluation_client,
+			problems=problems,
+			strategies=strategies,
+			dedup_index=dedup_index,
+			**common
+		)
+
+	elif args.round_mode == 'packed':
+		run_round_packed(
+			mutation_client=mutation_client,
+			evaluation_client=evaluation_client,
+			problems=problems,
+			strategies=strategies,
+			packing_templates=packing_templates,
+			pack_size=args.pack_size,
+			dedup_index=dedup_index,
+			**common
+		)
+
+	elif args.round_mode == 'sharded':
+		run_round_sharded(
+			problems=problems,
+			strategies=strategies,
+			n_round=n_round,
+			shard_dir=args.shard_dir,
+			num_shards=args.num_shards,
+			client_factory=client_factory if args.workers > 0 else None,
+			workers=args.workers,
+			shard_timeout=args.shard_timeout,
+			round_timeout=args.round_timeout,
+			**common
+		)
+
+	else:
+		run_round_sequential(
+			mutation_client=mutation_client,
+			evaluation_client=evaluation_client,
+			problems=problems,
+			strategies=strategies,
+			dedup_index=dedup_index,
+			**common
+		)
+
+
+def main():
 	# Parsing arguments
-	logger.info("Parsing command-line arguments.")
 	args = parse_arguments()
 	random.seed(args.seed)
 
-	# Creating OpenAI client for mutation
+	# Initialize the custom Logger
+	logger = Logger(log_file=args.log_file, level=logging.INFO, log_format=args.log_format, max_bytes=args.log_max_mb * 1024 * 1024)
+	logger.info("Starting the main processing loop.", round_mode=args.round_mode, seed=args.seed)
+
+	# Serving metrics while the run is in progress
+	if args.metrics_port:
+		logger.info(f"Serving metrics on port {metrics.serve(port=args.metrics_port)}.")
+
+	# Setting environment variables, pointing the clients to a local stand-in with the mock backend
+	mock_server = None
+	if args.backend == 'mock':
+		mock_server = MockLLMServer(
+			latency_ms=args.mock_latency_ms,
+			latency_jitter_ms=args.mock_latency_jitter_ms,
+			latency_distribution=args.mock_latency_distribution,
+			error_rate=args.mock_error_rate,
+			throttle_rate=args.mock_throttle_rate,
+			commentary_rate=args.mock_commentary_rate,
+			seed=args.seed
+		).start()
+		os.environ['OPENAI_API_ENDPOINT'] = mock_server.endpoint
+		os.environ['OPENAI_API_KEY'] = 'mock'
+		logger.info(f"Serving mock chat completions on {mock_server.endpoint}")
+	else:
+		run_env()
+
+	# Opening the response cache shared by both clients
+	cache = None
+	if args.cache != 'off':
+		logger.info(f"Opening {args.cache} response cache: {args.cache_path}")
+		cache = ResponseCache(
+			path=args.cache_path,
+			max_entries=args.cache_max_entries,
+			max_bytes=args.cache_max_mb * 1024 * 1024,
+			read_only=args.cache == 'read-only'
+		)
+
+	# Creating the index of evaluated statements whose duplicates reuse their score
+	dedup_index = DedupIndex(threshold=args.dedup_threshold) if args.dedup.lower() == 'y' else None
+
+	# Bounding evaluation requests to the few tokens of a score, asking again only for responses without one
+	configure_evaluation(response_format=args.evaluation_format, max_tokens=args.evaluation_max_tokens, retries=args.evaluation_retries)
+
+	# Streaming mutations, stopping each one before any commentary or once it grows too long
+	configure_streaming(
+		enabled=args.stream == 'Y',
+		max_growth=args.stream_max_growth,
+		stop_pattern=args.stream_stop_pattern if args.stream_stop_pattern is not None else STOP_PATTERN
+	)
+
+	# Sizing mutation completions from their statements and capping the spend of the run
+	budget.configure(
+		context_tokens=args.context_tokens,
+		max_completion_tokens=args.max_completion_tokens,
+		overflow=args.context_overflow,
+		token_cap=args.token_budget,
+		cost_cap=args.cost_budget,
+		prompt_price=args.prompt_price,
+		completion_price=args.completion_price
+	)
+	budget.reset()
+
+	# Creating the rate limiter shared by both clients, since they draw from the same deployment quota
+	rate_limiter = RateLimiter(
+		requests_per_minute=args.rpm_limit,
+		tokens_per_minute=args.tpm_limit,
+		max_retries=args.max_retries
+	)
+
+	# Sharing one pool of keep-alive connections between every client of the process
+	transport.configure(
+		max_connections=args.max_connections,
+		max_keepalive_connections=args.max_keepalive_connections,
+		keepalive_expiry=args.keepalive_expiry,
+		connect_timeout=args.connect_timeout,
+		read_timeout=args.read_timeout,
+		http2=args.http2 == 'Y'
+	)
+	transport.reset()
+
+	# Creating OpenAI clients for mutation and evaluation
 	logger.info("Initializing Azure OpenAI clients for mutation and evaluation.")
-	mutation_client = AzureOpenAIClient(
+	asynchronous = args.round_mode in ('async', 'pipeline')
+	client_class = AsyncAzureOpenAIClient if asynchronous else AzureOpenAIClient
+	http_client = transport.async_client() if asynchronous else transport.client()
+	mutation_client = client_class(
 		endpoint=os.getenv('OPENAI_API_ENDPOINT'),
 		api_key=os.getenv('OPENAI_API_KEY'),
-		model=args.agent
+		model=args.agent,
+		cache=cache,
+		rate_limiter=rate_limiter,
+		http_client=http_client
 	)
 
 	# Creating OpenAI client for evluation
-	evaluation_client = AzureOpenAIClient(
+	evaluation_client = client_class(
 		endpoint=os.getenv('OPENAI_API_ENDPOINT'),
 		api_key=os.getenv('OPENAI_API_KEY'),
-		model=args.agent
+		model=args.agent,
+		cache=cache,
+		rate_limiter=rate_limiter,
+		http_client=http_client
 	)
 
-	# Loading initial problem statements
-	logger.info(f"Loading problems from file: {args.filepath}")
-	try:
-		problems = load_problems(filename=args.filepath)
+	# Spreading mutation and evaluation requests over the pools of deployments declared in the config file
+	deployment_pools = load_deployments(config_path=args.deployments_config)
+	pools, rate_limiters = {}, {}
+	# Splitting the quota of the command line between the deployments of the pools in use without a quota of their own
+	quota = share_quota(args=args, deployments=[
+		deployment for name in {args.mutation_pool, args.evaluation_pool} if args.round_mode not in ('batch', 'sharded')
+		for deployment in deployment_pools.get(name, [])
+	])
+	for role, name in (('mutation', args.mutation_pool), ('evaluation', args.evaluation_pool)):
+		if name not in deployment_pools:
+			continue
+		if args.round_mode in ('batch', 'sharded'):
+			logger.warning(f"Deployment pool '{name}' is not used in {args.round_mode} round mode, sending {role} requests to {os.getenv('OPENAI_API_ENDPOINT')}.")
+			continue
 
-	except FileNotFoundError as e:
-		log_message = f"Error while loading problems: {str(e)}"
-		logger.error(log_message)
-		raise FileNotFoundError(log_message)
+		if name not in pools:
+			pools[name] = create_pool(args=args, name=name, deployments=deployment_pools[name], client_class=client_class, rate_limiters=rate_limiters, quota=quota, cache=cache, http_client=http_client)
+			logger.info(f"Routing requests of pool '{name}' over {len(deployment_pools[name])} deployments with {args.routing} routing.")
+		if role == 'mutation':
+			mutation_client = pools[name]
+		else:
+			evaluation_client = pools[name]
 
-	except Exception as e:
-		log_message = f"Error while loading problems: {str(e)}"
-		logger.error(log_message)
-		raise Exception(log_message)
+	# Creating each sharded worker's own client, splitting the quota between the local workers
+	client_factory = functools.partial(
+		create_client,
+		endpoint=os.getenv('OPENAI_API_ENDPOINT'),
+		api_key=os.getenv('OPENAI_API_KEY'),
+		model=args.agent,
+		requests_per_minute=args.rpm_limit / max(args.workers, 1),
+		tokens_per_minute=args.tpm_limit / max(args.workers, 1),
+		max_retries=args.max_retries,
+		cache_path=args.cache_path,
+		cache_mode=args.cache,
+		cache_max_entries=args.cache_max_entries,
+		cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+		transport_settings=transport.settings
+	)
+
+	# Wrapping clients to submit whole rounds as batch jobs, processed locally with the mock backend which has no batch API
+	if args.round_mode == 'batch':
+		batch_class = LocalBatchClient if args.backend == 'mock' else AzureBatchClient
+		mutation_client = batch_class(client=mutation_client, work_dir=args.batch_dir, poll_interval=args.batch_poll_interval)
+		evaluation_client = batch_class(client=evaluation_client, work_dir=args.batch_dir, poll_interval=args.batch_poll_interval)
+
+	# Reusing a single event loop across rounds so asynchronous clients keep their connections
+	loop = asyncio.new_event_loop() if asynchronous else None
+
+	# Loading the last checkpoint when resuming
+	checkpoint = None
+	if args.resume == 'Y':
+		checkpoint = load_checkpoint(checkpoint_dir=args.checkpoint_dir)
+		if checkpoint is None:
+			logger.warning(f"No checkpoint found in {args.checkpoint_dir}, starting a new run.")
+		elif checkpoint['completed']:
+			logger.info("The checkpointed run is already completed.")
+			return
+		else:
+			logger.info(f"Resuming from round {checkpoint['n_round'] + 1}/{args.num_rounds}.")
+			# Counting the tokens spent before the interruption towards the budget of the run
+			budget.reset(spent=checkpoint['spent'])
+			# Restoring the statements evaluated before the round so their duplicates keep reusing their scores
+			if dedup_index is not None and checkpoint['dedup'] is not None:
+				dedup_index.load(checkpoint['dedup'])
+
+	# Indexing initial problem statements, which are only read once sampled
+	if checkpoint is None:
+		logger.info(f"Loading problems from file: {args.filepath}")
+		try:
+			problems = ProblemCorpus(filepath=args.filepath)
+			if not problems.compressed:
+				logger.info(f"Indexed {len(problems)} problems.")
+
+		except FileNotFoundError as e:
+			log_message = f"Error while loading problems: {str(e)}"
+			logger.error(log_message)
+			raise FileNotFoundError(log_message)
+
+		except Exception as e:
+			log_message = f"Error while loading problems: {str(e)}"
+			logger.error(log_message)
+			raise Exception(log_message)
+
+	# Recording the mutation history outside the problems
+	lineage.connect(args.lineage_path)
+	logger.info(f"Recording mutation history to {args.lineage_path}")
+
+	# Opening the append-only leaderboard
+	leaderboard = None
+	if args.leaderboard_backend == 'sqlite':
+		leaderboard = LeaderboardStore(path=args.leaderboard_path, run_id=checkpoint['run_id'] if checkpoint else None)
+		logger.info(f"Appending leaderboard entries of run {leaderboard.run_id} to {args.leaderboard_path}")
+
+	run_id = leaderboard.run_id if leaderboard is not None else None
 
 	# Loading prompt templates for each strategy
-	prompt_templates = load_prompt_templates()
+	prompt_templates = load_prompt_templates(placeholders=MUTATION_PLACEHOLDERS)
+
+	# Creating the scheduler allocating mutations among strategies, resuming what it learned in previous runs
+	scheduler = StrategyScheduler(strategies=list(prompt_templates.keys()), mode=args.scheduler, state_path=args.scheduler_state)
+	logger.info(f"Allocating mutations with the {args.scheduler} strategy scheduler.")
+
+	# Creating the ensemble of judges rescoring the problems near the top k cutoff, each model judging with each template
+	ensemble = None
+	if args.ensemble.lower() == 'y':
+		judge_templates = {'evaluate.txt': load_evaluation_template(), **load_prompt_templates(strategies_dir='prompts/judges/', placeholders=EVALUATION_PLACEHOLDERS)}
+		judge_models = [model.strip() for model in args.judge_models.split(',') if model.strip()] or [args.agent]
+		judge_clients = {
+			model: AzureOpenAIClient(endpoint=os.getenv('OPENAI_API_ENDPOINT'), api_key=os.getenv('OPENAI_API_KEY'), model=model, cache=cache, rate_limiter=rate_limiter, http_client=transport.client())
+			for model in [args.agent] + judge_models
+		}
+		judges = [(f'{args.agent}/evaluate.txt', judge_clients[args.agent], judge_templates['evaluate.txt'])]
+		for name, template in judge_templates.items():
+			for model in judge_models:
+				if (model, name) != (args.agent, 'evaluate.txt'):
+					judges.append((f'{model}/{name}', judge_clients[model], template))
+		ensemble = JudgeEnsemble(judges=judges, k=args.topk_problems, confidence=args.judge_confidence, concurrency=args.concurrency, dedup_index=dedup_index)
+		logger.info(f"Rescoring problems near the top {args.topk_problems} cutoff with {len(judges)} judges.")
 
-	# Looping while num_rounds
-	for n_round in range(args.num_rounds):
+	# Loading templates wrapping several problems in a single request
+	packing_templates = load_prompt_templates(strategies_dir='prompts/packing/', placeholders=PACKING_PLACEHOLDERS) if args.round_mode == 'packed' else {}
+
+	# Looping while num_rounds, each round after the first evolving the survivors of the previous one
+	survivors, forecast, stopped = [], None, None
+	for n_round in range(checkpoint['n_round'] if checkpoint else 0, args.num_rounds):
 		logger.debug(f"Processing round {n_round + 1}/{args.num_rounds}")
+		parent_scores = {problem.id: problem.score for problem in survivors}
 
-		# Selecting a random subset of problems
-		problems = random.sample(problems, min(args.num_problems, len(problems)))
+		if checkpoint is not None and checkpoint['n_round'] == n_round:
+			# Restoring the round from the checkpoint and replaying the calls completed before the interruption
+			problems, strategies, parent_scores = checkpoint['problems'], checkpoint['strategies'], checkpoint.get('parent_scores', {})
+			statement_tokens = {problem.id: count_tokens(problem.statement) for problem in problems}
+			mutated_ids, evaluated_ids = replay_journal(checkpoint_dir=args.checkpoint_dir, n_round=n_round, problems=problems)
+			logger.info(f"Replayed {len(mutated_ids)} mutations and {len(evaluated_ids)} evaluations from the checkpoint.")
+			# Indexing the statements evaluated before the interruption, as the round would have
+			for problem in problems:
+				if problem.id in evaluated_ids and problem.score is not None:
+					index_evaluation(problem=problem, dedup_index=dedup_index)
+
+			# Planning the round from the growth it was planned from before the interruption, which learns the replayed mutations once it ends
+			budget.begin_round(growth=checkpoint['growth'])
+			for index, problem in enumerate(problems):
+				if problem.id in mutated_ids and strategies[index] is not None:
+					budget.record(strategy=strategies[index], statement_tokens=statement_tokens[problem.id], completion_tokens=count_tokens(problem.mutated_description))
 
-		# Determining initial mutation based on --mutated_on_start argument
-		if n_round == 0 and args.mutate_on_start.lower() == 'y':
-			mutation_prob = True
-		elif n_round == 0 and args.mutate_on_start.lower() == 'n':
-			continue
 		else:
-			# 50% chance to mutate
-			# mutation_prob = random.choice([True, False])
-			mutation_prob = True
-		
-		# Applying mutations to create new variants using random strategies
-		for problem in problems:
-			logger.info(f"Processing problem with ID: {problem.id}")
-
-			# If time to mutate
+			if survivors:
+				# Spawning the next generation from the mutated descriptions of the survivors of the previous round
+				problems = spawn_generation(survivors=survivors, population_size=args.population_size or args.num_problems)
+				logger.info(f"Spawned generation {problems[0].generation} of {len(problems)} problems from {len(survivors)} survivors.", round=n_round)
+
+			# Selecting a random subset of problems, reading only the sampled ones from the corpus
+			elif isinstance(problems, ProblemCorpus):
+				corpus, problems = problems, problems.sample(k=args.num_problems)
+				corpus.close()
+			else:
+				problems = random.sample(problems, min(args.num_problems, len(problems)))
+
+			# Determining initial mutation based on --mutated_on_start argument
+			if n_round == 0 and args.mutate_on_start.lower() == 'y':
+				mutation_prob = True
+			elif n_round == 0 and args.mutate_on_start.lower() == 'n':
+				continue
+			else:
+				# 50% chance to mutate
+				# mutation_prob = random.choice([True, False])
+				mutation_prob = True
+
+			# Selecting a random strategy for each problem when it is time to mutate
 			if mutation_prob:
-				# Selecting random strategy
-				strategy = random.choice(list(prompt_templates.keys()))
+				strategies = select_strategies(problems=problems, prompt_templates=prompt_templates, scheduler=scheduler)
+			else:
+				strategies = [None] * len(problems)
+
+			# Checkpointing the round once its random draws are done
+			save_checkpoint(checkpoint_dir=args.checkpoint_dir, n_round=n_round, problems=problems, strategies=strategies, run_id=run_id, spent=budget.spent(), parent_scores=parent_scores, growth=budget.growth, dedup=dedup_index.to_dict() if dedup_index is not None else None)
+			mutated_ids, evaluated_ids = set(), set()
 
-				# Selecting prompt template
-				prompt_template = prompt_templates[strategy]
+			# Planning every request of the round from the growth learned by the previous rounds
+			budget.begin_round()
 
-				# Mutating problem
-				mutated_description = mutate_problem(client=mutation_client, problem=problem, prompt_template=prompt_template)
-				problem.description = mutated_description
-	
 		# Loading evaluation prompt template
 		logger.info("Loading evaluation template.")
 		evaluation_template = load_evaluation_template()
 
-		# Evaluating the results
-		for problem in problems:
-			logger.info(f"Evaluating problem with ID: {problem.id}")
-			evaluate_problem(client=evaluation_client, problem=problem, evaluation_template=evaluation_template)
-		
-		# Updating leaderboard
-		logger.info("Updating leaderboard.")
-		update_leaderboard(problems=problems)
+		# Consuming results for the leaderboard and the top k selection as soon as they are evaluated
+		selector = TopKSelector(k=args.topk_problems)
+		evaluated_problems, outcomes = [], []
+
+		# Skipping calls completed before an interruption, whose outcomes still reward their strategies
+		pending = [index for index, problem in enumerate(problems) if problem.id not in evaluated_ids]
+		for index, problem in enumerate(problems):
+			if problem.id in evaluated_ids:
+				selector.push(index=index, problem=problem)
+				evaluated_problems.append(problem)
+				if strategies[index] is not None:
+					outcomes.append((strategies[index], problem, count_tokens(problem.mutated_description)))
+		round_strategies = [None if problems[index].id in mutated_ids else strategies[index] for index in pending]
+
+		# Forecasting the spend of the remaining rounds before any of their requests is sent
+		forecast_args = {
+			'statements': [problems[index].statement for index in pending],
+			'strategies': round_strategies,
+			'prompt_templates': prompt_templates,
+			'evaluation_template': evaluation_template,
+			'population_size': args.population_size or args.num_problems,
+			'evaluation_max_tokens': args.evaluation_max_tokens,
+			'system_tokens': count_tokens(MUTATION_SYSTEM_MESSAGE)
+		}
+		if forecast is None:
+			forecast = budget.forecast(num_rounds=args.num_rounds - n_round, **forecast_args)
+			logger.info(f"Forecast for {forecast['rounds']} rounds: {forecast['requests']} requests, {forecast['prompt_tokens']} prompt tokens, {forecast['completion_tokens']} completion tokens (at most {forecast['max_completion_tokens']}), cost {forecast['cost']:.4f} (at most {forecast['max_cost']:.4f}).")
+
+		# Stopping before a round whose expected spend would exceed the budget, leaving its checkpoint to resume from
+		stopped = budget.exceeded(budget.forecast(num_rounds=1, **forecast_args))
+		if stopped is not None:
+			logger.warning(f"Stopping the run before round {n_round + 1}/{args.num_rounds}: {stopped}.", round=n_round)
+			budget.end_round()
+			break
+
+		mutation_seconds = {strategy: (metrics.value('mutation_seconds', strategy=strategy), metrics.total('mutation_seconds', strategy=strategy)) for strategy in scheduler.strategies}
+
+		def on_mutated(index, problem):
+			append_journal(checkpoint_dir=args.checkpoint_dir, n_round=n_round, stage='mutation', problem=problem, spent=budget.spent())
+
+		def on_result(index, problem):
+			logger.info(f"Evaluated problem with ID: {problem.id}", problem_id=problem.id, round=n_round, strategy=strategies[pending[index]], score=problem.score)
+			if strategies[pending[index]] is not None:
+				# Keeping the mutated problem and the estimated output tokens of the mutation for the scheduler
+				outcomes.append((strategies[pending[index]], problem, count_tokens(problem.mutated_description)))
+			append_journal(checkpoint_dir=args.checkpoint_dir, n_round=n_round, stage='evaluation', problem=problem, spent=budget.spent())
+			selector.push(index=pending[index], problem=problem)
+			if leaderboard is not None and ensemble is None:
+				leaderboard.append(problem=problem, n_round=n_round)
+			else:
+				evaluated_problems.append(problem)
 
-		# Retaining the top k problems based on score
+		# Mutating and evaluating problems
+		logger.info(f"Mutating and evaluating {len(pending)} problems in {args.round_mode} mode.")
+		round_start = time.perf_counter()
+		run_round(
+			args=args,
+			loop=loop,
+			mutation_client=mutation_client,
+			evaluation_client=evaluation_client,
+			problems=[problems[index] for index in pending],
+			strategies=round_strategies,
+			prompt_templates=prompt_templates,
+			evaluation_template=evaluation_template,
+			packing_templates=packing_templates,
+			on_mutated=on_mutated,
+			on_result=on_result,
+			n_round=n_round,
+			client_factory=client_factory,
+			dedup_index=dedup_index
+		)
+		round_seconds = time.perf_counter() - round_start
+		budget.end_round()
+		logger.info(f"Completed round {n_round + 1}/{args.num_rounds}.", round=n_round, problems=len(pending), latency=round_seconds)
+		metrics.observe('round_seconds', round_seconds, mode=args.round_mode)
+		metrics.inc('round_problems_total', len(pending), mode=args.round_mode)
+		if args.metrics_path:
+			metrics.write_prometheus(filepath=args.metrics_path)
+
+		# Rescoring the problems whose rank against the top k cutoff is unclear and selecting on the ensemble scores
+		if ensemble is not None:
+			ensemble.refine(problems=evaluated_problems)
+			logger.info(f"Judge ensemble stats: {ensemble.stats()}", round=n_round)
+			selector, evaluated_ids = TopKSelector(k=args.topk_problems), {problem.id for problem in evaluated_problems}
+			for index, problem in enumerate(problems):
+				if problem.id in evaluated_ids:
+					selector.push(index=index, problem=problem)
+			if leaderboard is not None:
+				for problem in evaluated_problems:
+					leaderboard.append(problem=problem, n_round=n_round)
+
+		# Rewarding the strategies of the round with their score gain, tokens and mean mutation latency
+		for strategy, (count, total) in mutation_seconds.items():
+			count = metrics.value('mutation_seconds', strategy=strategy) - count
+			mutation_seconds[strategy] = (metrics.total('mutation_seconds', strategy=strategy) - total) / count if count else 0.0
+		for strategy, problem, tokens in outcomes:
+			scheduler.update(strategy=strategy, gain=problem.score - parent_scores.get(problem.parent_id, 0.0), tokens=tokens, seconds=mutation_seconds[strategy])
+		scheduler.save()
+		logger.info(f"Strategy scheduler stats: {scheduler.stats()}", round=n_round)
+
+		# Updating leaderboard when it is rewritten every round
+		if leaderboard is None:
+			logger.info("Updating leaderboard.")
+			update_leaderboard(problems=evaluated_problems)
+
+		# Retaining the top k problems based on score, keeping the next round's population in score order
 		logger.info(f"Retaining top {args.topk_problems} problems.")
 		problems.sort(key=lambda x: x.score, reverse=True)
-		selected_problems = problems[:args.topk_problems]
-		
+		selected_problems = selector.result()
+		survivors = selected_problems
+
 		# Saving mutated and evaluated problems
 		for problem in selected_problems:
-			logger.info(f"Saving mutated problem with ID: {problem.id}")
+			logger.info(f"Saving mutated problem with ID: {problem.id}", problem_id=problem.id, round=n_round, score=problem.score)
 			save_mutated_problem(problem=problem)
 
+	# Marking the run as completed, unless it stopped on its budget
+	if stopped is None:
+		save_checkpoint(checkpoint_dir=args.checkpoint_dir, n_round=args.num_rounds, problems=problems, strategies=[], run_id=run_id, completed=True, spent=budget.spent())
+
+	# Reporting the traffic and health of the deployments of each pool
+	for name, pool in pools.items():
+		logger.info(f"Deployment pool '{name}' stats: {pool.stats()}")
+
+	# Reporting the utilisation of the shared connection pool before closing it
+	transport_stats = transport.stats()
+	logger.info(f"HTTP transport stats: {transport_stats}")
+
+	# Closing asynchronous clients, their connection pool and their event loop
+	if loop is not None:
+		loop.run_until_complete(mutation_client.close())
+		if evaluation_client is not mutation_client:
+			loop.run_until_complete(evaluation_client.close())
+		loop.run_until_complete(transport.aclose())
+		loop.close()
+	transport.close()
+
+	# Closing the leaderboard
+	if leaderboard is not None:
+		leaderboard.close()
+
+	# Releasing the lineage database
+	lineage.connect(':memory:')
+
+	# Reporting rate limiter activity, of the shared limiter and of each deployment of the pools
+	logger.info(f"Rate limiter stats: {rate_limiter.stats}")
+	for name, limiter in rate_limiters.items():
+		logger.info(f"Rate limiter stats of deployment '{name}': {limiter.stats}")
+
+	# Reporting and closing the response cache
+	if cache is not None:
+		logger.info(f"Response cache stats: {cache.stats()}")
+		cache.close()
+
+	# Reporting duplicates that reused a score
+	if dedup_index is not None:
+		logger.info(f"Dedup index stats: {dedup_index.stats()}")
+
+	# Reporting the time to first token and the streams stopped early
+	if args.stream == 'Y':
+		first_tokens = metrics.combined('llm_time_to_first_token_seconds')
+		logger.info(f"Streaming stats: mean time to first token {metrics.combined_total('llm_time_to_first_token_seconds') / first_tokens if first_tokens else 0.0:.3f}s, {metrics.value('mutation_stream_stops_total', reason='commentary'):.0f} mutations stopped on commentary, {metrics.value('mutation_stream_stops_total', reason='length'):.0f} on length")
+
+	# Reporting the spend of the run against its forecast
+	logger.info(f"Token budget stats: {budget.stats()}")
+
+	# Reporting the share of prompt tokens served from the provider's prompt cache, over every model and deployment
+	prompt_tokens = metrics.combined('llm_prompt_tokens_total')
+	logger.info(f"Cached prompt token ratio: {metrics.combined('llm_cached_prompt_tokens_total') / prompt_tokens if prompt_tokens else 0.0:.3f}")
+
+	# Reporting evaluation responses no score could be parsed from
+	parsed, unparseable = metrics.value('evaluation_parses_total', outcome='ok'), metrics.value('evaluation_parses_total', outcome='unparseable')
+	logger.info(f"Evaluation parse failure rate: {unparseable / (parsed + unparseable) if parsed + unparseable else 0.0:.3f} ({metrics.value('evaluation_retries_total'):.0f} retries, {metrics.value('evaluation_reserved_tokens_saved_total'):.0f} fewer completion tokens reserved)")
+
+	# Writing the metrics of the run
+	if args.metrics_summary:
+		logger.info(f"Writing metrics summary to {args.metrics_summary}")
+		metrics.write_summary(
+			filepath=args.metrics_summary, run_id=run_id, round_mode=args.round_mode, num_rounds=args.num_rounds,
+			dedup=dedup_index.stats() if dedup_index is not None else None, strategies=scheduler.stats(),
+			ensemble=ensemble.stats() if ensemble is not None else None, budget={**budget.stats(), 'forecast': forecast, 'stopped': stopped}, transport=transport_stats,
+			deployments={name: pool.stats() for name, pool in pools.items()} or None
+		)
+	metrics.stop()
+
+	# Reporting and stopping the mock backend
+	if mock_server is not None:
+		logger.info(f"Mock backend stats: {mock_server.stats}")
+		mock_server.stop()
+
+	# Writing the queued log records
+	logger.close()
+
 
 if __name__ == '__main__':
 	main()
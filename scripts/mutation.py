@@ -2,47 +2,374 @@
 File to handle mutation and evaluation of problems.
 """
 
+import re
+import json
+import math
+import time
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
 from scripts.data_handling import Problem
-from src.AzureOpenAIClient import AzureOpenAIClient
+from src.LineageStore import lineage
+from src.Metrics import metrics
+from src.DedupIndex import DedupIndex
+from src.TokenBudget import MESSAGE_TOKENS, budget, count_tokens, trim_tokens
+from src.LLMBackend import LLMBackend, AsyncLLMBackend, StreamingLLMBackend, AsyncStreamingLLMBackend
+from scripts.templates import EVALUATION_PLACEHOLDERS, compiled_templates, normalise_message
 
 
-def mutate_problem(client: AzureOpenAIClient, problem: Problem, prompt_template: str) -> str:
+# System messages without their indentation, so every request starts with the same short prefix
+MUTATION_SYSTEM_MESSAGE = normalise_message(
+			"""
+			You are a helpful assistant ready to mutate problem descriptions, providing direct responses without additional commentary.
+			"""
+)
+
+EVALUATION_SYSTEM_MESSAGE = normalise_message(
+			"""
+			You are a helpful assistant tasked with scoring the quality of problem statement mutations.
+			"""
+)
+
+# Maximum number of completion tokens of a request that does not set one
+DEFAULT_MAX_TOKENS = 400
+
+# Fewest statement tokens the length limit of a streamed mutation is computed from
+MIN_STREAM_TOKENS = 16
+
+# Characters of the text already checked that are searched again, so commentary split over two chunks is found
+STOP_OVERLAP = 64
+
+# Structured output constraining evaluation responses to a JSON object holding the score
+EVALUATION_RESPONSE_FORMAT = {
+	'type': 'json_schema',
+	'json_schema': {
+		'name': 'evaluation_score',
+		'strict': True,
+		'schema': {
+			'type': 'object',
+			'properties': {'score': {'type': 'number'}},
+			'required': ['score'],
+			'additionalProperties': False
+		}
+	}
+}
+
+# Evaluation settings of the process, changed with configure_evaluation
+evaluation_settings = {'response_format': 'text', 'max_tokens': 16, 'retries': 1}
+
+# Commentary a mutation drifts into after the statement, a new paragraph speaking about the rewrite rather than the problem,
+# or a separator. Matched case-sensitively, so the notes and explanations of a statement itself are kept
+STOP_PATTERN = (
+	r"\n\s*\n\s*(?:\*\*|#+\s*)?(?:"
+	r"(?:Note|Explanation|Rationale)\s*(?:\*\*)?\s*:\s*(?:\*\*)?\s*(?:I(?:'ve| have| added| made| changed| kept| rewrote| rephrased| simplified| expanded| removed| also)\b|This (?:revised|rewritten|mutated|new|updated|version)\b|The (?:changes|revised|rewritten|mutated|updated)\b)|"
+	r"(?:Explanation|Summary) of (?:the )?(?:changes|modifications)\b|Changes (?:made|I made)\b|"
+	r"Here(?: is|'s) (?:the|a|my|your) (?:revised|rewritten|mutated|new|updated|modified)\b|"
+	r"This (?:revised|rewritten|mutated|new|updated) (?:problem|statement|version)\b|"
+	r"I(?:'ve| have| added| made| changed| kept| rewrote| rephrased| simplified| expanded| removed)\b)|\n\s*(?:---|\*\*\*)\s*(?:\n|$)"
+)
+
+# Streaming settings of the process, changed with configure_streaming
+streaming_settings = {'enabled': False, 'max_growth': 3.0, 'stop_pattern': STOP_PATTERN}
+
+SCORE_PATTERNS = (
+	re.compile(r'\bscore\b\W{0,3}(?:is\s+|of\s+)?(-?\d+(?:\.\d+)?)', re.IGNORECASE),
+	re.compile(r'(-?\d+(?:\.\d+)?)\s*(?:/|out\s+of)\s*10\b', re.IGNORECASE)
+)
+NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+# Scale of the scores asked for by the evaluation templates
+SCORE_RANGE = (0.0, 10.0)
+
+
+def build_mutation_prompt(problem: Problem, prompt_template: str) -> str:
 	'''
-	Mutates a problem using the specified AI model and prompt template.
+	Builds the mutation prompt for a problem, validating the template placeholder.
 
-	:param client: AzureOpenAIClient object.
 	:param problem: Problem object to mutate.
 	:param prompt_template: str, template to format the problem statement for mutation.
-	:return: str, mutated problem statement.
+	:return: str, mutation prompt.
 	'''
-	# Ensuring placeholder exists in the template
-	if "{statement}" not in prompt_template:
+	# Ensuring placeholder exists in the template, unless it was validated when it was compiled
+	if prompt_template not in compiled_templates and "{statement}" not in prompt_template:
 		log_message = "Error: Placeholder '{statement}' not found in the chosen template."
 		problem.error_logs.append(log_message)
 		raise ValueError(log_message)
-	
-	prompt = prompt_template.format(statement=problem.original_description)
 
+	return prompt_template.format(statement=problem.statement)
+
+
+def plan_mutation(problem: Problem, prompt_template: str, strategy: Optional[str]=None) -> Tuple[str, int]:
+	'''
+	Builds the mutation prompt for a problem and sizes its completion tokens with the token budget.
+
+	Statements whose prompt does not fit the context window are trimmed, or rejected when the budget does not trim them.
+
+	:param problem: Problem object to mutate.
+	:param prompt_template: str, template to format the problem statement for mutation.
+	:param strategy: str, optional name of the strategy the template belongs to, sizing the completion with its growth.
+	:return: tuple, mutation prompt and maximum number of completion tokens.
+	'''
+	prompt = build_mutation_prompt(problem=problem, prompt_template=prompt_template)
+	statement_tokens = count_tokens(problem.statement)
+	prompt_tokens = count_tokens(MUTATION_SYSTEM_MESSAGE) + count_tokens(prompt) + 2 * MESSAGE_TOKENS
+
+	# Trimming the end of statements too long for the context window
+	overflow = budget.overflow_tokens(prompt_tokens)
+	if overflow > 0:
+		metrics.inc('context_overflows_total', action=budget.overflow)
+		if budget.overflow == 'reject' or overflow >= statement_tokens:
+			log_message = f"Error: Mutation prompt of {prompt_tokens} tokens does not fit the context window of {budget.context_tokens} tokens."
+			problem.error_logs.append(log_message)
+			raise ValueError(log_message)
+
+		statement = trim_tokens(problem.statement, statement_tokens - overflow)
+		problem.warnings_log.append(f"Warning: Statement trimmed from {statement_tokens} to {count_tokens(statement)} tokens to fit the context window.")
+		prompt = prompt_template.format(statement=statement)
+		prompt_tokens -= statement_tokens - count_tokens(statement)
+		statement_tokens = count_tokens(statement)
+
+	return prompt, budget.max_tokens(strategy=strategy, statement_tokens=statement_tokens, prompt_tokens=prompt_tokens)
+
+
+def record_mutation(problem: Problem, prompt_template: str, response: str, strategy: Optional[str]=None) -> None:
+	'''
+	Stores a mutation response in the problem and records the mutation in the lineage store.
+
+	:param problem: Problem object that was mutated.
+	:param prompt_template: str, template the mutation prompt was built from.
+	:param response: str, mutated problem statement returned by the model.
+	:param strategy: str, optional name of the strategy the template belongs to, whose growth the token budget learns.
+	'''
+	budget.record(strategy=strategy, statement_tokens=count_tokens(problem.statement), completion_tokens=count_tokens(response))
+	lineage.record(problem_id=problem.id, template=prompt_template, statement=problem.statement, result=response)
+	problem.mutated_description = response
+	problem.mutated = True
+
+
+def build_evaluation_prompt(problem: Problem, evaluation_template: str) -> str:
+	'''
+	Builds the evaluation prompt for a problem, validating its state and the template placeholders.
+
+	:param problem: Problem object to evaluate.
+	:param evaluation_template: str, template to format the problem statement for evaluation.
+	:return: str, evaluation prompt.
+	'''
+	# Checking if problem statement is mutated
+	if not problem.mutated:
+		log_message = "Error: Problem statement is not mutated. Cannot evaluate."
+		problem.error_logs.append(log_message)
+		raise ValueError(log_message)
+
+	# Checking if placeholders exist in the evaluation template, unless it was validated when it was compiled
+	for placeholder in EVALUATION_PLACEHOLDERS:
+		if evaluation_template not in compiled_templates and f"{{{placeholder}}}" not in evaluation_template:
+			log_message = f"Error: Placeholder '{{{placeholder}}}' not found in the chosen template for evaluation '{evaluation_template}'"
+			problem.error_logs.append(log_message)
+			raise ValueError(log_message)
+
+	prompt = evaluation_template.format(original_statement=problem.original_description, mutated_statement=problem.mutated_description)
+
+	# Rejecting evaluations too long for the context window, since trimming either statement would bias the score
+	prompt_tokens = count_tokens(EVALUATION_SYSTEM_MESSAGE) + count_tokens(prompt) + 2 * MESSAGE_TOKENS
+	if budget.overflow_tokens(prompt_tokens) > 0:
+		metrics.inc('context_overflows_total', action='reject')
+		log_message = f"Error: Evaluation prompt of {prompt_tokens} tokens does not fit the context window of {budget.context_tokens} tokens."
+		problem.error_logs.append(log_message)
+		raise ValueError(log_message)
+
+	return prompt
+
+
+def configure_evaluation(response_format: str='text', max_tokens: int=16, retries: int=1) -> None:
+	'''
+	Sets how evaluation requests are sent by every evaluation function of the process.
+
+	:param response_format: str, 'text' for a plain answer or 'json' for a structured output holding the score, defaults to 'text'.
+	:param max_tokens: int, maximum number of completion tokens of an evaluation, defaults to 16.
+	:param retries: int, number of times an unparseable evaluation response is requested again, defaults to 1.
+	'''
+	if response_format not in ('text', 'json'):
+		raise ValueError(f"Error: Unknown evaluation response format '{response_format}'.")
+	if max_tokens < 1:
+		raise ValueError(f"Error: Evaluations need at least one completion token, got {max_tokens}.")
+
+	evaluation_settings.update(response_format=response_format, max_tokens=max_tokens, retries=retries)
+
+
+def configure_streaming(enabled: bool=False, max_growth: float=3.0, stop_pattern: str=STOP_PATTERN) -> None:
+	'''
+	Sets whether mutations are streamed by every mutation function of the process, and when their streams stop.
+
+	:param enabled: bool, whether mutations are streamed by clients able to, defaults to False.
+	:param max_growth: float, ratio of the tokens of a mutation to the tokens of its statement at which its stream stops, 0 for no limit, defaults to 3.
+	:param stop_pattern: str, regular expression of the commentary a mutation stops before, empty for none, defaults to STOP_PATTERN.
+	'''
+	if max_growth < 0:
+		raise ValueError(f"Error: Maximum growth of a streamed mutation must be positive, got {max_growth}.")
 	try:
-		# Sending mutation prompt to LLM model
-		response = client.generate_response(
-			system_message=\
-			"""
-			You are a helpful assistant ready to mutate problem descriptions, providing direct responses without additional commentary.
-			""",
-			user_input=prompt
-   		)
-
-		problem.mutated_description = response
-		problem.mutated = True
-		problem.mutation_log.append(
-			{
-				'prompt': prompt,
-				'result': response
-			}
-		)
+		re.compile(stop_pattern)
+
+	except re.error as e:
+		raise ValueError(f"Error: Invalid stop pattern '{stop_pattern}': {str(e)}")
+
+	streaming_settings.update(enabled=enabled, max_growth=max_growth, stop_pattern=stop_pattern)
+
+
+def mutation_stop(problem: Problem) -> Callable[[str], Optional[int]]:
+	'''
+	Creates the stop condition of the stream of a mutation, ending it before any commentary after the statement or,
+	once it grows past the maximum growth, at the end of its last complete sentence.
+
+	:param problem: Problem object being mutated, warned about the stream being stopped.
+	:return: callable, called with the text received so far, returning the position it ends at, or None to continue.
+	'''
+	pattern = re.compile(streaming_settings['stop_pattern']) if streaming_settings['stop_pattern'] else None
+	limit = streaming_settings['max_growth'] * max(count_tokens(problem.statement), MIN_STREAM_TOKENS)
+	# Position checked and counted up to, and tokens counted, so each chunk only costs its own length
+	state = {'checked': 0, 'counted': 0, 'tokens': 0}
+
+	def stop_at(text: str) -> Optional[int]:
+		# Starting over when a new stream is sent, such as a retry of the request
+		if len(text) < state['checked']:
+			state.update(checked=0, counted=0, tokens=0)
+
+		reason, end = None, None
+		match = pattern.search(text, max(state['checked'] - STOP_OVERLAP, 0)) if pattern is not None else None
+		state['checked'] = len(text)
+
+		# Counting the words completed since the last chunk, splitting before whitespace where tokens usually start
+		if limit:
+			boundary = max(text.rfind(' ', state['counted']), text.rfind('\n', state['counted']))
+			if boundary > state['counted']:
+				state['tokens'] += count_tokens(text[state['counted']:boundary])
+				state['counted'] = boundary
+
+		if match is not None and text[:match.start()].strip():
+			reason, end = 'commentary', len(text[:match.start()].rstrip())
+		elif limit and state['tokens'] + count_tokens(text[state['counted']:]) > limit:
+			sentences = [sentence.end() for sentence in re.finditer(r'[.!?]["\')\]]?(?=\s)', text)]
+			reason, end = 'length', sentences[-1] if sentences else len(text.rstrip())
+
+		if reason is not None:
+			metrics.inc('mutation_stream_stops_total', reason=reason)
+			problem.warnings_log.append(f"Warning: Mutation stream stopped early on {reason}, keeping its first {end} characters.")
+
+		return end
+
+	return stop_at
+
+
+def evaluation_request_options() -> dict:
+	'''
+	Returns the keyword arguments of an evaluation request under the current settings.
+
+	:return: dict, maximum number of completion tokens and, for JSON evaluations, the response format.
+	'''
+	options = {'max_tokens': evaluation_settings['max_tokens']}
+	if evaluation_settings['response_format'] == 'json':
+		options['response_format'] = EVALUATION_RESPONSE_FORMAT
+
+	return options
+
+
+def parse_score(response) -> float:
+	'''
+	Extracts the score of an evaluation response, tolerating JSON answers and text around the number.
+
+	:param response: str or number, evaluation response.
+	:return: float, evaluation score.
+	:raises ValueError: if no score on the scale of SCORE_RANGE can be told apart in the response.
+	'''
+	text = str(response).strip()
+	candidates = [text]
+
+	# Reading the score field of JSON answers, possibly wrapped in a markdown code block
+	try:
+		answer = parse_packed_response(text)
+		if isinstance(answer, dict):
+			answer = answer.get('score')
+		if isinstance(answer, (int, float, str)) and not isinstance(answer, bool):
+			candidates.insert(0, str(answer))
+
+	except ValueError:
+		pass
+
+	# Falling back to an explicit score such as 'Score: 7' or '7/10', then to the only number of the text
+	candidates.extend(match.group(1) for pattern in SCORE_PATTERNS for match in [pattern.search(text)] if match)
+	numbers = NUMBER_PATTERN.findall(text)
+	if len(numbers) == 1:
+		candidates.append(numbers[0])
+
+	for candidate in candidates:
+		try:
+			score = float(candidate)
+
+		except ValueError:
+			continue
+
+		# Skipping numbers off the scale, such as years or counts in a chatty response
+		if math.isfinite(score) and SCORE_RANGE[0] <= score <= SCORE_RANGE[1]:
+			return score
+
+	raise ValueError(f"Unparseable evaluation response {text[:80]!r}.")
+
+
+def record_evaluation(problem: Problem, response: str) -> float:
+	'''
+	Parses an evaluation response and stores the score in the problem.
+
+	:param problem: Problem object that was evaluated.
+	:param response: str, evaluation response returned by the model.
+	:return: float, evaluation score.
+	'''
+	try:
+		problem.score = parse_score(response)
+
+	except ValueError:
+		metrics.inc('evaluation_parses_total', outcome='unparseable')
+		raise
+
+	metrics.inc('evaluation_parses_total', outcome='ok')
+
+	return problem.score
+
+
+def mutate_problem(client: LLMBackend, problem: Problem, prompt_template: str, strategy: Optional[str]=None) -> str:
+	'''
+	Mutates a problem using the specified AI model and prompt template.
+
+	:param client: LLMBackend object.
+	:param problem: Problem object to mutate.
+	:param prompt_template: str, template to format the problem statement for mutation.
+	:param strategy: str, optional name of the strategy the template belongs to, labelling its metrics.
+	:return: str, mutated problem statement.
+	'''
+	prompt, max_tokens = plan_mutation(problem=problem, prompt_template=prompt_template, strategy=strategy)
+
+	start = time.perf_counter()
+	try:
+		# Sending mutation prompt to LLM model, with room for the statement as the strategy grows it
+		if streaming_settings['enabled'] and isinstance(client, StreamingLLMBackend):
+			# Streaming the mutation, stopping it as soon as the statement is complete
+			response = client.stream_response(
+				system_message=MUTATION_SYSTEM_MESSAGE,
+				user_input=prompt,
+				max_tokens=max_tokens,
+				stop_at=mutation_stop(problem)
+			)
+		else:
+			response = client.generate_response(
+				system_message=MUTATION_SYSTEM_MESSAGE,
+				user_input=prompt,
+				max_tokens=max_tokens
+			)
+
+		record_mutation(problem=problem, prompt_template=prompt_template, response=response, strategy=strategy)
+		metrics.observe('mutation_seconds', time.perf_counter() - start, strategy=strategy)
+		metrics.inc('mutations_total', strategy=strategy, outcome='ok')
 
 	except Exception as e:
+		metrics.inc('mutations_total', strategy=strategy, outcome='error')
 		log_message = f"Error during mutation: {str(e)}"
 		problem.error_logs.append(log_message)
 		raise ValueError(log_message)
@@ -50,50 +377,415 @@ def mutate_problem(client: AzureOpenAIClient, problem: Problem, prompt_template:
 	return response
 
 
-def evaluate_problem(client: AzureOpenAIClient, problem: Problem, evaluation_template: str) -> float:
+def reuse_duplicate_score(problem: Problem, dedup_index: Optional[DedupIndex]) -> Optional[float]:
+	'''
+	Copies the score of an evaluated duplicate of the mutated statement, compared among problems with the same original.
+
+	:param problem: Problem object to evaluate.
+	:param dedup_index: DedupIndex object with the evaluated statements, None to always evaluate.
+	:return: float, reused score, None if the problem has to be evaluated.
+	'''
+	if dedup_index is None:
+		return None
+
+	twin = dedup_index.lookup(problem.mutated_description, scope=problem.original_description)
+	if twin is None:
+		return None
+
+	return copy_duplicate_score(problem=problem, twin_id=twin[0], score=twin[1])
+
+
+def copy_duplicate_score(problem: Problem, twin_id: str, score: float) -> float:
+	'''
+	Gives a problem the score of its evaluated duplicate.
+
+	:param problem: Problem object to score.
+	:param twin_id: str, id of the evaluated duplicate.
+	:param score: float, score of the duplicate.
+	:return: float, copied score.
+	'''
+	problem.score = score
+	problem.warnings_log.append(f"Warning: Duplicate of problem {twin_id}, reused its score instead of evaluating it.")
+	metrics.inc('evaluations_total', outcome='duplicate')
+
+	return score
+
+
+async def reuse_duplicate_score_async(problem: Problem, dedup_index: Optional[DedupIndex]) -> Optional[float]:
+	'''
+	Copies the score of an evaluated duplicate of the mutated statement, waiting for a duplicate still being evaluated.
+
+	:param problem: Problem object to evaluate.
+	:param dedup_index: DedupIndex object with the evaluated statements and the evaluations in flight, None to always evaluate.
+	:return: float, reused score, None if the problem has to be evaluated.
+	'''
+	if dedup_index is None:
+		return None
+
+	while True:
+		twin = dedup_index.lookup(problem.mutated_description, scope=problem.original_description)
+		if twin is None:
+			return None
+
+		twin_id, score = twin
+		if not isinstance(score, asyncio.Future):
+			return copy_duplicate_score(problem=problem, twin_id=twin_id, score=score)
+
+		# Waiting for the duplicate in flight, then looking up again in case its evaluation failed
+		await asyncio.shield(score)
+
+
+def reserve_evaluation(problem: Problem, dedup_index: Optional[DedupIndex]) -> Optional[asyncio.Future]:
+	'''
+	Registers an evaluation in flight, so duplicates sent meanwhile wait for its score instead of being evaluated too.
+
+	:param problem: Problem object about to be evaluated.
+	:param dedup_index: DedupIndex object, None to skip the registration.
+	:return: asyncio.Future, resolved with the score of the problem by settle_evaluation, None without an index.
+	'''
+	if dedup_index is None:
+		return None
+
+	future = asyncio.get_running_loop().create_future()
+	dedup_index.add(key=problem.id, text=problem.mutated_description, value=future, scope=problem.original_description)
+
+	return future
+
+
+def settle_evaluation(problem: Problem, dedup_index: Optional[DedupIndex], future: Optional[asyncio.Future], score: Optional[float]) -> None:
+	'''
+	Replaces the evaluation in flight of a problem with its score, and wakes up the duplicates waiting for it.
+
+	:param problem: Problem object whose evaluation ended.
+	:param dedup_index: DedupIndex object the evaluation was registered in.
+	:param future: asyncio.Future returned by reserve_evaluation.
+	:param score: float, score of the problem, None if its evaluation failed.
+	'''
+	if future is None:
+		return
+
+	dedup_index.update(key=problem.id, value=score)
+	if not future.done():
+		future.set_result(score)
+
+
+def index_evaluation(problem: Problem, dedup_index: Optional[DedupIndex]) -> None:
+	'''
+	Adds an evaluated problem to the dedup index so its duplicates reuse its score.
+
+	:param problem: evaluated Problem object.
+	:param dedup_index: DedupIndex object, None to skip indexing.
+	'''
+	if dedup_index is not None:
+		dedup_index.add(key=problem.id, text=problem.mutated_description, value=problem.score, scope=problem.original_description)
+
+
+def evaluate_problem(client: LLMBackend, problem: Problem, evaluation_template: str, dedup_index: Optional[DedupIndex]=None) -> float:
 	'''
 	Evaluates a problem using the specified AI model comparing the original and the mutated statements.
 
-	:param client: AzureOpenAIClient object.
+	:param client: LLMBackend object.
 	:param problem: Problem object to mutate..
 	:param evaluation_template: str, template to format the problem statement for evaluation.
+	:param dedup_index: DedupIndex object, optional, reuses the score of an evaluated duplicate instead of sending a request.
 	:return: float, evauation score.
 	'''
-	# Checking if problem statement is mutated
-	if not problem.mutated:
-		log_message = "Error: Problem statement is not mutated. Cannot evaluate."
-		problem.error_logs.append(log_message)
-		raise ValueError(log_message)
+	# Creating evaluation prompt
+	evaluation_prompt = build_evaluation_prompt(problem=problem, evaluation_template=evaluation_template)
+
+	# Reusing the score of an evaluated duplicate
+	score = reuse_duplicate_score(problem=problem, dedup_index=dedup_index)
+	if score is not None:
+		return score
+
+	start = time.perf_counter()
+	options = evaluation_request_options()
+	try:
+		for attempt in range(evaluation_settings['retries'] + 1):
+			# Sending evaluation prompt to LLM model, at temperature 0 when asking again so a cached answer is not reused
+			response = client.generate_response(
+				system_message=EVALUATION_SYSTEM_MESSAGE,
+				user_input=evaluation_prompt,
+				**(options if attempt == 0 else {**options, 'temperature': 0.0})
+			)
+			metrics.inc('evaluation_reserved_tokens_saved_total', max(DEFAULT_MAX_TOKENS - options['max_tokens'], 0))
+
+			try:
+				score = record_evaluation(problem=problem, response=response)
+				break
+
+			except ValueError as e:
+				if attempt == evaluation_settings['retries']:
+					raise
+				metrics.inc('evaluation_retries_total')
+				problem.warnings_log.append(f"Warning: {str(e)} Requesting the evaluation again.")
 
-	# Checking if placeholders exist in the evaluation template
-	if "{original_statement}" not in evaluation_template:
-		log_message = f"Error: Placeholder '{{original_statement}}' not found in the chosen template for evaluation '{evaluation_template}'"
+		metrics.observe('evaluation_seconds', time.perf_counter() - start)
+		metrics.inc('evaluations_total', outcome='ok')
+		index_evaluation(problem=problem, dedup_index=dedup_index)
+
+	except Exception as e:
+		metrics.inc('evaluations_total', outcome='error')
+		log_message = f"Error during evaluation: {str(e)}"
 		problem.error_logs.append(log_message)
 		raise ValueError(log_message)
 
-	if "{mutated_statement}" not in evaluation_template:
-		log_message = f"Error: Placeholder '{{mutated_statement}}' not found in the chosen template for evaluation '{evaluation_template}'"
+	return score
+
+
+async def mutate_problem_async(client: AsyncLLMBackend, problem: Problem, prompt_template: str, strategy: Optional[str]=None) -> str:
+	'''
+	Mutates a problem using the specified AI model and prompt template without blocking the event loop.
+
+	:param client: AsyncLLMBackend object.
+	:param problem: Problem object to mutate.
+	:param prompt_template: str, template to format the problem statement for mutation.
+	:param strategy: str, optional name of the strategy the template belongs to, labelling its metrics.
+	:return: str, mutated problem statement.
+	'''
+	prompt, max_tokens = plan_mutation(problem=problem, prompt_template=prompt_template, strategy=strategy)
+
+	start = time.perf_counter()
+	try:
+		# Sending mutation prompt to LLM model, with room for the statement as the strategy grows it
+		if streaming_settings['enabled'] and isinstance(client, AsyncStreamingLLMBackend):
+			# Streaming the mutation, stopping it as soon as the statement is complete
+			response = await client.stream_response(
+				system_message=MUTATION_SYSTEM_MESSAGE,
+				user_input=prompt,
+				max_tokens=max_tokens,
+				stop_at=mutation_stop(problem)
+			)
+		else:
+			response = await client.generate_response(
+				system_message=MUTATION_SYSTEM_MESSAGE,
+				user_input=prompt,
+				max_tokens=max_tokens
+			)
+
+		record_mutation(problem=problem, prompt_template=prompt_template, response=response, strategy=strategy)
+		metrics.observe('mutation_seconds', time.perf_counter() - start, strategy=strategy)
+		metrics.inc('mutations_total', strategy=strategy, outcome='ok')
+
+	except Exception as e:
+		metrics.inc('mutations_total', strategy=strategy, outcome='error')
+		log_message = f"Error during mutation: {str(e)}"
 		problem.error_logs.append(log_message)
 		raise ValueError(log_message)
-	
+
+	return response
+
+
+async def evaluate_problem_async(client: AsyncLLMBackend, problem: Problem, evaluation_template: str, dedup_index: Optional[DedupIndex]=None) -> float:
+	'''
+	Evaluates a problem comparing the original and the mutated statements without blocking the event loop.
+
+	:param client: AsyncLLMBackend object.
+	:param problem: Problem object to evaluate.
+	:param evaluation_template: str, template to format the problem statement for evaluation.
+	:param dedup_index: DedupIndex object, optional, reuses the score of an evaluated duplicate instead of sending a request.
+	:return: float, evaluation score.
+	'''
 	# Creating evaluation prompt
-	evaluation_prompt = evaluation_template.format(original_statement=problem.original_description, mutated_statement=problem.mutated_description)
+	evaluation_prompt = build_evaluation_prompt(problem=problem, evaluation_template=evaluation_template)
 
+	# Reusing the score of an evaluated duplicate, or of a duplicate in flight once it is evaluated
+	score = await reuse_duplicate_score_async(problem=problem, dedup_index=dedup_index)
+	if score is not None:
+		return score
+
+	start = time.perf_counter()
+	options = evaluation_request_options()
+	future, score = reserve_evaluation(problem=problem, dedup_index=dedup_index), None
 	try:
-		# Sending evaluation prompt to LLM model
-		response = client.generate_response(
-			system_message=\
-			"""
-			You are a helpful assistant tasked with scoring the quality of problem statement mutations.
-			""",
-			user_input=evaluation_prompt
-		)
+		for attempt in range(evaluation_settings['retries'] + 1):
+			# Sending evaluation prompt to LLM model, at temperature 0 when asking again so a cached answer is not reused
+			response = await client.generate_response(
+				system_message=EVALUATION_SYSTEM_MESSAGE,
+				user_input=evaluation_prompt,
+				**(options if attempt == 0 else {**options, 'temperature': 0.0})
+			)
+			metrics.inc('evaluation_reserved_tokens_saved_total', max(DEFAULT_MAX_TOKENS - options['max_tokens'], 0))
+
+			try:
+				score = record_evaluation(problem=problem, response=response)
+				break
 
-		problem.score = float(response)
+			except ValueError as e:
+				if attempt == evaluation_settings['retries']:
+					raise
+				metrics.inc('evaluation_retries_total')
+				problem.warnings_log.append(f"Warning: {str(e)} Requesting the evaluation again.")
+
+		metrics.observe('evaluation_seconds', time.perf_counter() - start)
+		metrics.inc('evaluations_total', outcome='ok')
 
 	except Exception as e:
+		score = None
+		metrics.inc('evaluations_total', outcome='error')
 		log_message = f"Error during evaluation: {str(e)}"
 		problem.error_logs.append(log_message)
 		raise ValueError(log_message)
 
-	return float(response)
+	finally:
+		settle_evaluation(problem=problem, dedup_index=dedup_index, future=future, score=score)
+
+	return score
+
+
+def parse_packed_response(response: str):
+	'''
+	Parses the JSON answer of a packed request, tolerating a surrounding markdown code block.
+
+	:param response: str, packed response returned by the model.
+	:return: parsed JSON value.
+	'''
+	text = response.strip()
+	match = re.match(r'^```[a-zA-Z]*\s*(.*?)\s*```$', text, re.DOTALL)
+	if match:
+		text = match.group(1)
+
+	return json.loads(text)
+
+
+def mutate_problems_packed(client: LLMBackend, problems: List[Problem], prompt_template: str, packing_template: str, strategy: Optional[str]=None) -> Dict[str, str]:
+	'''
+	Mutates several problems sharing a prompt template in a single request.
+
+	Problems missing from the answer, or all of them if the answer is malformed, are mutated one request at a time.
+	A problem whose single request fails keeps the error in its error logs and is left out of the results.
+
+	:param client: LLMBackend object.
+	:param problems: list, list of Problem classes to mutate with the same template.
+	:param prompt_template: str, template to format the problem statement for mutation.
+	:param packing_template: str, template wrapping the instruction and the statements of a packed request.
+	:param strategy: str, optional name of the strategy the template belongs to, labelling its metrics.
+	:return: dict, dictionary where keys are the ids of the mutated problems and values the mutated problem statements.
+	'''
+	# Validating the template placeholder for every problem and sizing the completion of each statement
+	max_tokens = sum(plan_mutation(problem=problem, prompt_template=prompt_template, strategy=strategy)[1] for problem in problems)
+	packed_prompt = packing_template.format(
+		instruction=prompt_template.format(statement='<statement>'),
+		items=json.dumps({problem.id: problem.statement for problem in problems}, ensure_ascii=False, indent=1)
+	)
+
+	# Sending packed mutation prompt to LLM model
+	answer = {}
+	start = time.perf_counter()
+	try:
+		response = client.generate_response(
+			system_message=MUTATION_SYSTEM_MESSAGE,
+			user_input=packed_prompt,
+			max_tokens=max_tokens
+		)
+		answer = parse_packed_response(response)
+		if not isinstance(answer, dict):
+			raise ValueError(f"Expected a JSON object, got {type(answer).__name__}.")
+
+	except Exception as e:
+		answer = {}
+		for problem in problems:
+			problem.warnings_log.append(f"Warning: Malformed packed mutation response, falling back to a single request: {str(e)}")
+
+	# Sharing the time of the packed request between its problems
+	seconds = (time.perf_counter() - start) / len(problems)
+	results = {}
+	for problem in problems:
+		mutated_description = answer.get(problem.id)
+		if isinstance(mutated_description, str) and mutated_description.strip():
+			record_mutation(problem=problem, prompt_template=prompt_template, response=mutated_description, strategy=strategy)
+			metrics.inc('mutations_total', strategy=strategy, outcome='ok')
+			metrics.observe('mutation_seconds', seconds, strategy=strategy)
+			results[problem.id] = mutated_description
+		else:
+			try:
+				results[problem.id] = mutate_problem(client=client, problem=problem, prompt_template=prompt_template, strategy=strategy)
+
+			except ValueError:
+				# The error is already in the error logs of the problem, the rest of the pack goes on
+				continue
+
+	return results
+
+
+def evaluate_problems_packed(client: LLMBackend, problems: List[Problem], evaluation_template: str, packing_template: str, dedup_index: Optional[DedupIndex]=None) -> Dict[str, float]:
+	'''
+	Evaluates several problems in a single request returning a score for each problem id.
+
+	Problems missing from the answer, or all of them if the answer is malformed, are evaluated one request at a time.
+	A problem whose single request fails keeps the error in its error logs and is left out of the results.
+
+	:param client: LLMBackend object.
+	:param problems: list, list of mutated Problem classes to evaluate.
+	:param evaluation_template: str, template to format the problem statement for evaluation.
+	:param packing_template: str, template wrapping the instruction and the pairs of a packed request.
+	:param dedup_index: DedupIndex object, optional, reuses the score of evaluated duplicates instead of packing them.
+	:return: dict, dictionary where keys are the ids of the evaluated problems and values the evaluation scores.
+	'''
+	for problem in problems:
+		build_evaluation_prompt(problem=problem, evaluation_template=evaluation_template)
+
+	# Leaving duplicates of evaluated problems out of the request
+	results = {}
+	for problem in problems:
+		score = reuse_duplicate_score(problem=problem, dedup_index=dedup_index)
+		if score is not None:
+			results[problem.id] = score
+
+	problems = [problem for problem in problems if problem.id not in results]
+	if not problems:
+		return results
+
+	packed_prompt = packing_template.format(
+		instruction=evaluation_template.format(original_statement='<original_statement>', mutated_statement='<mutated_statement>'),
+		items=json.dumps([
+			{'id': problem.id, 'original_statement': problem.original_description, 'mutated_statement': problem.mutated_description}
+			for problem in problems
+		], ensure_ascii=False, indent=1)
+	)
+
+	# Sizing the answer from the completion tokens of a single evaluation and the id of each problem, within the context window
+	max_tokens = budget.cap_tokens(
+		completion_tokens=sum(evaluation_settings['max_tokens'] + count_tokens(json.dumps({'id': problem.id})) for problem in problems),
+		prompt_tokens=count_tokens(EVALUATION_SYSTEM_MESSAGE) + count_tokens(packed_prompt) + 2 * MESSAGE_TOKENS
+	)
+
+	# Sending packed evaluation prompt to LLM model
+	scores = {}
+	start = time.perf_counter()
+	try:
+		response = client.generate_response(
+			system_message=EVALUATION_SYSTEM_MESSAGE,
+			user_input=packed_prompt,
+			max_tokens=max_tokens
+		)
+		answer = parse_packed_response(response)
+		if not isinstance(answer, list):
+			raise ValueError(f"Expected a JSON array, got {type(answer).__name__}.")
+
+		for entry in answer:
+			if isinstance(entry, dict) and 'id' in entry and isinstance(entry.get('score'), (int, float, str)):
+				scores[str(entry['id'])] = entry['score']
+
+	except Exception as e:
+		scores = {}
+		for problem in problems:
+			problem.warnings_log.append(f"Warning: Malformed packed evaluation response, falling back to a single request: {str(e)}")
+
+	# Sharing the time of the packed request between its problems
+	seconds = (time.perf_counter() - start) / len(problems)
+	for problem in problems:
+		try:
+			results[problem.id] = record_evaluation(problem=problem, response=scores[problem.id])
+			index_evaluation(problem=problem, dedup_index=dedup_index)
+			metrics.observe('evaluation_seconds', seconds)
+
+		except (KeyError, TypeError, ValueError):
+			try:
+				results[problem.id] = evaluate_problem(client=client, problem=problem, evaluation_template=evaluation_template, dedup_index=dedup_index)
+
+			except ValueError:
+				# The error is already in the error logs of the problem, the rest of the pack goes on
+				continue
+
+	return results
@@ -0,0 +1,493 @@
+"""
+File to run the mutation and evaluation stages of a round.
+"""
+
+import heapq
+import random
+import asyncio
+import functools
+from typing import Callable, Iterable, List, Optional, Tuple
+from scripts.data_handling import Problem
+from src.Metrics import metrics
+from src.LineageStore import lineage
+from src.DedupIndex import DedupIndex
+from src.StrategyScheduler import StrategyScheduler
+from src.TokenBudget import budget
+from scripts.mutation import MUTATION_SYSTEM_MESSAGE, EVALUATION_SYSTEM_MESSAGE, plan_mutation, build_evaluation_prompt, record_mutation, record_evaluation
+from scripts.mutation import DEFAULT_MAX_TOKENS, evaluation_settings, evaluation_request_options, parse_score
+from scripts.mutation import mutate_problem, evaluate_problem, mutate_problem_async, evaluate_problem_async
+from scripts.mutation import mutate_problems_packed, evaluate_problems_packed, reuse_duplicate_score, copy_duplicate_score, index_evaluation
+
+
+def planned_round(run_round: Callable) -> Callable:
+	'''
+	Wraps a round mode so every request of the round is sized from the growth the token budget learned before it,
+	whatever the order its responses arrive in, unless the caller already began the round.
+
+	:param run_round: callable, function or coroutine function running a round.
+	:return: callable, wrapped round mode.
+	'''
+	if asyncio.iscoroutinefunction(run_round):
+		@functools.wraps(run_round)
+		async def wrapper(*args, **kwargs):
+			with budget.planned_round():
+				return await run_round(*args, **kwargs)
+	else:
+		@functools.wraps(run_round)
+		def wrapper(*args, **kwargs):
+			with budget.planned_round():
+				return run_round(*args, **kwargs)
+
+	return wrapper
+
+
+def select_strategies(problems: List[Problem], prompt_templates: dict, scheduler: Optional[StrategyScheduler]=None) -> List[str]:
+	'''
+	Selects a mutation strategy for each problem, at random or with a strategy scheduler.
+
+	Strategies are drawn in problem order before any request is sent, so the random state consumed by a round
+	does not depend on the order in which responses arrive.
+
+	:param problems: list, list of Problem classes to mutate.
+	:param prompt_templates: dict, dictionary where keys are the mutation strategies and values are the templates.
+	:param scheduler: StrategyScheduler object, optional, allocates the mutations among strategies, defaults to a uniform draw.
+	:return: list, selected strategy for each problem.
+	'''
+	if scheduler is not None:
+		return scheduler.select(len(problems))
+
+	return [random.choice(list(prompt_templates.keys())) for _ in problems]
+
+
+def spawn_generation(survivors: List[Problem], population_size: int) -> List[Problem]:
+	'''
+	Creates the population of the next generation from the survivors of a round.
+
+	Children are handed out to the survivors in score order, one at a time, so every survivor gets about the same
+	number of children and the best survivors get the extra ones. Each child is linked to its parent in the lineage store.
+
+	:param survivors: list, list of surviving Problem classes sorted by descending score.
+	:param population_size: int, number of children in the next generation.
+	:return: list, list of unmutated children.
+	'''
+	if not survivors:
+		raise ValueError("Error: Cannot spawn a generation without survivors.")
+
+	children = []
+	for position in range(population_size):
+		child = survivors[position % len(survivors)].spawn()
+		lineage.link(problem_id=child.id, parent_id=child.parent_id, generation=child.generation)
+		children.append(child)
+
+	return children
+
+
+@planned_round
+def run_round_sequential(mutation_client, evaluation_client, problems: List[Problem], strategies: List[Optional[str]], prompt_templates: dict, evaluation_template: str, on_mutated: Optional[Callable[[int, Problem], None]]=None, on_result: Optional[Callable[[int, Problem], None]]=None, dedup_index: Optional[DedupIndex]=None) -> List[Problem]:
+	'''
+	Mutates and then evaluates every problem of a round one request at a time.
+
+	:param mutation_client: client used for mutation requests.
+	:param evaluation_client: client used for evaluation requests.
+	:param problems: list, list of Problem classes of the round.
+	:param strategies: list, strategy for each problem, None to skip its mutation.
+	:param prompt_templates: dict, dictionary where keys are the mutation strategies and values are the templates.
+	:param evaluation_template: str, evaluation template.
+	:param on_mutated: callable, optional, called with the position of the problem in the round and the mutated Problem class.
+	:param on_result: callable, optional, called with the position of the problem in the round and the evaluated Problem class.
+	:param dedup_index: DedupIndex object, optional, reuses the score of evaluated duplicates instead of evaluating them.
+	:return: list, list of evaluated Problem classes in the same order.
+	'''
+	# Applying mutations
+	for index, (problem, strategy) in enumerate(zip(problems, strategies)):
+		if strategy is not None:
+			mutate_problem(client=mutation_client, problem=problem, prompt_template=prompt_templates[strategy], strategy=strategy)
+			if on_mutated is not None:
+				on_mutated(index, problem)
+
+	# Evaluating the results
+	for index, problem in enumerate(problems):
+		evaluate_problem(client=evaluation_client, problem=problem, evaluation_template=evaluation_template, dedup_index=dedup_index)
+		if on_result is not None:
+			on_result(index, problem)
+
+	return problems
+
+
+@planned_round
+async def run_round_async(mutation_client, evaluation_client, problems: List[Problem], strategies: List[Optional[str]], prompt_templates: dict, evaluation_template: str, concurrency: int=8, on_mutated: Optional[Callable[[int, Problem], None]]=None, on_result: Optional[Callable[[int, Problem], None]]=None, dedup_index: Optional[DedupIndex]=None) -> List[Problem]:
+	'''
+	Mutates and then evaluates every problem of a round keeping up to `concurrency` requests in flight.
+
+	:param mutation_client: asynchronous client used for mutation requests.
+	:param evaluation_client: asynchronous client used for evaluation requests.
+	:param problems: list, list of Problem classes of the round.
+	:param strategies: list, strategy for each problem, None to skip its mutation.
+	:param prompt_templates: dict, dictionary where keys are the mutation strategies and values are the templates.
+	:param evaluation_template: str, evaluation template.
+	:param concurrency: int, maximum number of requests in flight, defaults to 8.
+	:param on_mutated: callable, optional, called with the position of the problem in the round and the mutated Problem class.
+	:param on_result: callable, optional, called with the position of the problem in the round and the evaluated Problem class.
+	:param dedup_index: DedupIndex object, optional, reuses the score of evaluated duplicates instead of evaluating them.
+	:return: list, list of evaluated Problem classes in the same order.
+	'''
+	if concurrency < 1:
+		raise ValueError(f"Error: Concurrency must be at least 1, got {concurrency}.")
+
+	semaphore = asyncio.Semaphore(concurrency)
+
+	async def mutate(index: int, problem: Problem, strategy: str) -> str:
+		async with semaphore:
+			response = await mutate_problem_async(client=mutation_client, problem=problem, prompt_template=prompt_templates[strategy], strategy=strategy)
+
+		if on_mutated is not None:
+			on_mutated(index, problem)
+
+		return response
+
+	async def evaluate(index: int, problem: Problem) -> float:
+		async with semaphore:
+			score = await evaluate_problem_async(client=evaluation_client, problem=problem, evaluation_template=evaluation_template, dedup_index=dedup_index)
+
+		if on_result is not None:
+			on_result(index, problem)
+
+		return score
+
+	# Applying mutations
+	await asyncio.gather(*[
+		mutate(index, problem, strategy) for index, (problem, strategy) in enumerate(zip(problems, strategies)) if strategy is not None
+	])
+
+	# Evaluating the results
+	await asyncio.gather(*[evaluate(index, problem) for index, problem in enumerate(problems)])
+
+	return problems
+
+
+class TopKSelector:
+	'''
+	Keeps the k best scored problems of a stream of results without holding the whole round.
+
+	Ties are broken by the position of the problem in the round, so the selection matches a stable
+	descending sort of the round by score.
+	'''
+	def __init__(self, k: int):
+		'''
+		Initializes the TopKSelector class.
+
+		:param k: int, number of problems to retain.
+		'''
+		self.k = k
+		self.heap = []
+
+
+	def push(self, index: int, problem: Problem) -> None:
+		'''
+		Offers an evaluated problem to the selection.
+
+		:param index: int, position of the problem in the round.
+		:param problem: evaluated Problem class.
+		'''
+		if self.k <= 0:
+			return
+
+		entry = (problem.score, -index, problem)
+		if len(self.heap) < self.k:
+			heapq.heappush(self.heap, entry)
+		elif entry[:2] > self.heap[0][:2]:
+			heapq.heapreplace(self.heap, entry)
+
+
+	def result(self) -> List[Problem]:
+		'''
+		Returns the retained problems sorted by descending score.
+
+		:return: list, list of the top k Problem classes.
+		'''
+		return [problem for _, _, problem in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
+
+
+@planned_round
+async def run_round_pipelined(mutation_client, evaluation_client, items: Iterable[Tuple[Problem, Optional[str]]], prompt_templates: dict, evaluation_template: str, on_result: Callable[[int, Problem], None], concurrency: int=8, queue_size: int=16, on_mutated: Optional[Callable[[int, Problem], None]]=None, dedup_index: Optional[DedupIndex]=None) -> int:
+	'''
+	Streams the problems of a round through mutation and evaluation stages connected by bounded queues.
+
+	Each problem is evaluated as soon as its mutation lands and handed to `on_result` as soon as it is scored,
+	so slow mutations do not hold up evaluation and only `queue_size` problems wait between stages.
+
+	:param mutation_client: asynchronous client used for mutation requests.
+	:param evaluation_client: asynchronous client used for evaluation requests.
+	:param items: iterable, pairs of Problem class and strategy, None to skip its mutation.
+	:param prompt_templates: dict, dictionary where keys are the mutation strategies and values are the templates.
+	:param evaluation_template: str, evaluation template.
+	:param on_result: callable, called with the position of the problem in the round and the evaluated Problem class.
+	:param concurrency: int, maximum number of requests in flight across both stages, defaults to 8.
+	:param queue_size: int, maximum number of problems waiting in each queue, defaults to 16.
+	:param on_mutated: callable, optional, called with the position of the problem in the round and the mutated Problem class.
+	:param dedup_index: DedupIndex object, optional, reuses the score of evaluated duplicates instead of evaluating them.
+	:return: int, number of evaluated problems.
+	'''
+	if concurrency < 1:
+		raise ValueError(f"Error: Concurrency must be at least 1, got {concurrency}.")
+
+	if queue_size < 1:
+		raise ValueError(f"Error: Queue size must be at least 1, got {queue_size}.")
+
+	semaphore = asyncio.Semaphore(concurrency)
+	mutation_queue = asyncio.Queue(maxsize=queue_size)
+	evaluation_queue = asyncio.Queue(maxsize=queue_size)
+	evaluated = 0
+
+	async def produce() -> None:
+		for index, (problem, strategy) in enumerate(items):
+			await mutation_queue.put((index, problem, strategy))
+
+		for _ in range(concurrency):
+			await mutation_queue.put(None)
+
+	async def mutate() -> None:
+		while True:
+			item = await mutation_queue.get()
+			if item is None:
+				await evaluation_queue.put(None)
+				return
+
+			index, problem, strategy = item
+			if strategy is not None:
+				async with semaphore:
+					await mutate_problem_async(client=mutation_client, problem=problem, prompt_template=prompt_templates[strategy], strategy=strategy)
+
+				if on_mutated is not None:
+					on_mutated(index, problem)
+
+			await evaluation_queue.put((index, problem))
+
+	async def evaluate() -> None:
+		nonlocal evaluated
+		while True:
+			item = await evaluation_queue.get()
+			if item is None:
+				return
+
+			index, problem = item
+			async with semaphore:
+				await evaluate_problem_async(client=evaluation_client, problem=problem, evaluation_template=evaluation_template, dedup_index=dedup_index)
+
+			on_result(index, problem)
+			evaluated += 1
+
+	tasks = [asyncio.ensure_future(produce())]
+	tasks += [asyncio.ensure_future(mutate()) for _ in range(concurrency)]
+	tasks += [asyncio.ensure_future(evaluate()) for _ in range(concurrency)]
+
+	try:
+		await asyncio.gather(*tasks)
+
+	except Exception:
+		# Stopping the remaining stages so a failed request does not leave workers blocked on the queues
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather(*tasks, return_exceptions=True)
+		raise
+
+	return evaluated
+
+
+@planned_round
+def run_round_batch(mutation_batch_client, evaluation_batch_client, problems: List[Problem], strategies: List[Optional[str]], prompt_templates: dict, evaluation_template: str, on_mutated: Optional[Callable[[int, Problem], None]]=None, on_result: Optional[Callable[[int, Problem], None]]=None, dedup_index: Optional[DedupIndex]=None) -> List[Problem]:
+	'''
+	Mutates every problem of a round in one batch job and then evaluates them in a second batch job.
+
+	:param mutation_batch_client: BatchClient object used for mutation requests.
+	:param evaluation_batch_client: BatchClient object used for evaluation requests.
+	:param problems: list, list of Problem classes of the round.
+	:param strategies: list, strategy for each problem, None to skip its mutation.
+	:param prompt_templates: dict, dictionary where keys are the mutation strategies and values are the templates.
+	:param evaluation_template: str, evaluation template.
+	:param on_mutated: callable, optional, called with the position of the problem in the round and the mutated Problem class.
+	:param on_result: callable, optional, called with the position of the problem in the round and the evaluated Problem class.
+	:param dedup_index: DedupIndex object, optional, reuses the score of evaluated duplicates instead of evaluating them.
+	:return: list, list of evaluated Problem classes in the same order.
+	'''
+	# Applying mutations
+	prompts = {}
+	for problem, strategy in zip(problems, strategies):
+		if strategy is not None:
+			prompts[problem.id] = plan_mutation(problem=problem, prompt_template=prompt_templates[strategy], strategy=strategy)
+
+	results = mutation_batch_client.run([
+		mutation_batch_client.build_request(custom_id=problem_id, user_input=prompt, system_message=MUTATION_SYSTEM_MESSAGE, max_tokens=max_tokens)
+		for problem_id, (prompt, max_tokens) in prompts.items()
+	], name='mutation')
+
+	errors = []
+	for index, problem in enumerate(problems):
+		if problem.id not in prompts:
+			continue
+
+		result = results[problem.id]
+		if 'error' in result:
+			metrics.inc('mutations_total', strategy=strategies[index], outcome='error')
+			log_message = f"Error during mutation: {result['error']}"
+			problem.error_logs.append(log_message)
+			errors.append(log_message)
+		else:
+			record_mutation(problem=problem, prompt_template=prompt_templates[strategies[index]], response=result['content'], strategy=strategies[index])
+			metrics.inc('mutations_total', strategy=strategies[index], outcome='ok')
+			if on_mutated is not None:
+				on_mutated(index, problem)
+
+	if errors:
+		raise ValueError(f"{len(errors)} mutations failed in batch. First error: {errors[0]}")
+
+	# Evaluating the results, leaving duplicates of evaluated problems out of the batch
+	prompts = {problem.id: build_evaluation_prompt(problem=problem, evaluation_template=evaluation_template) for problem in problems}
+	duplicates = {problem.id for problem in problems if reuse_duplicate_score(problem=problem, dedup_index=dedup_index) is not None}
+
+	# Sending a single representative of each group of duplicates within the round, whose score the others copy
+	twins = {}
+	if dedup_index is not None:
+		round_index = dedup_index.empty_copy()
+		for problem in problems:
+			if problem.id in duplicates:
+				continue
+			twin = round_index.lookup(problem.mutated_description, scope=problem.original_description)
+			if twin is not None:
+				twins[problem.id] = twin[0]
+			else:
+				round_index.add(key=problem.id, text=problem.mutated_description, value=problem.id, scope=problem.original_description)
+
+	options = evaluation_request_options()
+	results = evaluation_batch_client.run([
+		evaluation_batch_client.build_request(custom_id=problem_id, user_input=prompt, system_message=EVALUATION_SYSTEM_MESSAGE, **options)
+		for problem_id, prompt in prompts.items() if problem_id not in duplicates and problem_id not in twins
+	], name='evaluation')
+	metrics.inc('evaluation_reserved_tokens_saved_total', max(DEFAULT_MAX_TOKENS - options['max_tokens'], 0) * len(results))
+
+	# Asking again in smaller batches for the responses no score could be parsed from
+	for attempt in range(evaluation_settings['retries']):
+		unparseable = []
+		for problem in problems:
+			result = results.get(problem.id, {})
+			if 'content' in result:
+				try:
+					parse_score(result['content'])
+
+				except ValueError as e:
+					problem.warnings_log.append(f"Warning: {str(e)} Requesting the evaluation again.")
+					unparseable.append(problem.id)
+
+		if not unparseable:
+			break
+
+		metrics.inc('evaluation_retries_total', len(unparseable))
+		metrics.inc('evaluation_parses_total', len(unparseable), outcome='unparseable')
+		results.update(evaluation_batch_client.run([
+			evaluation_batch_client.build_request(custom_id=problem_id, user_input=prompts[problem_id], system_message=EVALUATION_SYSTEM_MESSAGE, **{**options, 'temperature': 0.0})
+			for problem_id in unparseable
+		], name=f'evaluation-retry-{attempt + 1}'))
+		metrics.inc('evaluation_reserved_tokens_saved_total', max(DEFAULT_MAX_TOKENS - options['max_tokens'], 0) * len(unparseable))
+
+	evaluated, by_id = set(duplicates), {problem.id: problem for problem in problems}
+	for index, problem in enumerate(problems):
+		try:
+			if problem.id in twins:
+				# Representatives come first in the round, so their evaluation is already recorded
+				if twins[problem.id] not in evaluated:
+					raise RuntimeError(f"Evaluation of duplicate problem {twins[problem.id]} failed.")
+				copy_duplicate_score(problem=problem, twin_id=twins[problem.id], score=by_id[twins[problem.id]].score)
+			elif problem.id not in duplicates:
+				result = results[problem.id]
+				if 'error' in result:
+					raise RuntimeError(result['error'])
+				record_evaluation(problem=problem, response=result['content'])
+				index_evaluation(problem=problem, dedup_index=dedup_index)
+			evaluated.add(problem.id)
+
+		except Exception as e:
+			log_message = f"Error during evaluation: {str(e)}"
+			problem.error_logs.append(log_message)
+			errors.append(log_message)
+			continue
+
+		if on_result is not None:
+			on_result(index, problem)
+
+	if errors:
+		raise ValueError(f"{len(errors)} evaluations failed in batch. First error: {errors[0]}")
+
+	return problems
+
+
+@planned_round
+def run_round_packed(mutation_client, evaluation_client, problems: List[Problem], strategies: List[Optional[str]], prompt_templates: dict, evaluation_template: str, packing_templates: dict, pack_size: int=8, on_mutated: Optional[Callable[[int, Problem], None]]=None, on_result: Optional[Callable[[int, Problem], None]]=None, dedup_index: Optional[DedupIndex]=None) -> List[Problem]:
+	'''
+	Mutates and then evaluates the problems of a round packing up to `pack_size` problems in each request.
+
+	Mutations are packed among problems sharing a strategy, evaluations among all problems of the round.
+
+	:param mutation_client: client used for mutation requests.
+	:param evaluation_client: client used for evaluation requests.
+	:param problems: list, list of Problem classes of the round.
+	:param strategies: list, strategy for each problem, None to skip its mutation.
+	:param prompt_templates: dict, dictionary where keys are the mutation strategies and values are the templates.
+	:param evaluation_template: str, evaluation template.
+	:param packing_templates: dict, dictionary with the 'mutate.txt' and 'evaluate.txt' packing templates.
+	:param pack_size: int, maximum number of problems per request, defaults to 8.
+	:param on_mutated: callable, optional, called with the position of the problem in the round and the mutated Problem class.
+	:param on_result: callable, optional, called with the position of the problem in the round and the evaluated Problem class.
+	:param dedup_index: DedupIndex object, optional, reuses the score of evaluated duplicates instead of evaluating them.
+	:return: list, list of evaluated Problem classes in the same order.
+	'''
+	if pack_size < 1:
+		raise ValueError(f"Error: Pack size must be at least 1, got {pack_size}.")
+
+	# Grouping problems by strategy, keeping the order of the round inside each group
+	groups = {}
+	for index, strategy in enumerate(strategies):
+		if strategy is not None:
+			groups.setdefault(strategy, []).append(index)
+
+	# Applying mutations, going on with the rest of the round when single problems fail
+	errors = []
+	for strategy, group in groups.items():
+		for start in range(0, len(group), pack_size):
+			indices = group[start:start + pack_size]
+			results = mutate_problems_packed(
+				client=mutation_client,
+				problems=[problems[index] for index in indices],
+				prompt_template=prompt_templates[strategy],
+				packing_template=packing_templates['mutate.txt'],
+				strategy=strategy
+			)
+
+			for index in indices:
+				if problems[index].id not in results:
+					errors.append(problems[index].error_logs[-1])
+				elif on_mutated is not None:
+					on_mutated(index, problems[index])
+
+	if errors:
+		raise ValueError(f"{len(errors)} mutations failed in packed requests. First error: {errors[0]}")
+
+	# Evaluating the results
+	for start in range(0, len(problems), pack_size):
+		results = evaluate_problems_packed(
+			client=evaluation_client,
+			problems=problems[start:start + pack_size],
+			evaluation_template=evaluation_template,
+			packing_template=packing_templates['evaluate.txt'],
+			dedup_index=dedup_index
+		)
+
+		for index in range(start, min(start + pack_size, len(problems))):
+			if problems[index].id not in results:
+				errors.append(problems[index].error_logs[-1])
+			elif on_result is not None:
+				on_result(index, problems[index])
+
+	if errors:
+		raise ValueError(f"{len(errors)} evaluations failed in packed requests. First error: {errors[0]}")
+
+	return problems
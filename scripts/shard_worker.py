@@ -0,0 +1,56 @@
+"""
+Runs a sharded worker processing shards written by a coordinator started with --round-mode sharded --workers 0.
+"""
+
+import os
+import sys
+sys.path.append('.')
+
+import argparse
+from scripts.create_env import run_env
+from scripts.sharding import create_client, run_worker
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Process shards of rounds written by a sharded coordinator.")
+	parser.add_argument('--shard-dir', default='shards/', help="Directory shared with the coordinator.")
+	parser.add_argument('--agent', default='gpt-4o', help="Model deployment used for mutation and evaluation.")
+	parser.add_argument('--rpm-limit', type=int, default=0, help="Requests per minute quota of this worker, 0 for unlimited.")
+	parser.add_argument('--tpm-limit', type=int, default=0, help="Tokens per minute quota of this worker, 0 for unlimited.")
+	parser.add_argument('--max-retries', type=int, default=5, help="Maximum number of retries of a throttled or failed request.")
+	parser.add_argument('--max-connections', type=int, default=1000, help="Maximum number of open connections of the HTTP pool of this worker.")
+	parser.add_argument('--max-keepalive-connections', type=int, default=100, help="Maximum number of idle connections the HTTP pool keeps alive for reuse.")
+	parser.add_argument('--http2', default='N', choices=['Y', 'N'], help="Whether the HTTP pool negotiates HTTP/2, which needs the h2 package.")
+	parser.add_argument('--cache', default='off', choices=['off', 'on', 'read-only'], help="Whether to serve repeated requests from the response cache shared with the coordinator and the other workers.")
+	parser.add_argument('--cache-path', default='cache/responses.sqlite', help="File path to the response cache database.")
+	parser.add_argument('--cache-max-entries', type=int, default=100000, help="Maximum number of cached responses, 0 for unlimited.")
+	parser.add_argument('--cache-max-mb', type=int, default=0, help="Maximum size of cached responses in megabytes, 0 for unlimited.")
+	parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between checks for new shards.")
+	args = parser.parse_args()
+
+	# Setting environment variables
+	run_env()
+
+	# Waiting for shards until the worker is stopped
+	run_worker(
+		shard_dir=args.shard_dir,
+		client_factory=lambda: create_client(
+			endpoint=os.getenv('OPENAI_API_ENDPOINT'),
+			api_key=os.getenv('OPENAI_API_KEY'),
+			model=args.agent,
+			requests_per_minute=args.rpm_limit,
+			tokens_per_minute=args.tpm_limit,
+			max_retries=args.max_retries,
+			cache_path=args.cache_path,
+			cache_mode=args.cache,
+			cache_max_entries=args.cache_max_entries,
+			cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+			transport_settings={'max_connections': args.max_connections, 'max_keepalive_connections': args.max_keepalive_connections, 'http2': args.http2 == 'Y'}
+		),
+		watch=True,
+		poll_interval=args.poll_interval
+	)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,362 @@
+"""
+File to run rounds sharded across worker processes or hosts sharing a filesystem.
+
+The coordinator writes one input file per shard to a shard directory. Workers claim shard files by renaming them,
+mutate and evaluate their problems and write the results next to them, with the tokens each result cost. A worker
+keeps touching the claimed file of its shard, and the coordinator gives a claim without a recent heartbeat back to the
+other workers, so a dead worker never holds a round. The coordinator
+merges every shard back into the round, in the original order, for the global top k selection and the leaderboard, and
+counts the tokens and mutations of the workers towards the budget of the run.
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+import multiprocessing
+from typing import Callable, List, Optional
+from scripts.data_handling import Problem
+from scripts.rounds import planned_round, run_round_sequential
+from scripts.mutation import evaluation_settings, streaming_settings, configure_evaluation, configure_streaming
+from scripts.checkpoint import problem_to_dict, problem_from_dict
+from src.RateLimiter import RateLimiter
+from src.Metrics import metrics
+from src.LineageStore import lineage
+from src.TokenBudget import budget, count_tokens
+from src.HttpTransport import transport
+from src.ResponseCache import ResponseCache
+from src.AzureOpenAIClient import AzureOpenAIClient
+
+
+def create_client(endpoint: str, api_key: str, model: str, requests_per_minute: float=0, tokens_per_minute: float=0, max_retries: int=5, cache_path: Optional[str]=None, cache_mode: str='off', cache_max_entries: int=100000, cache_max_bytes: int=0, transport_settings: Optional[dict]=None) -> AzureOpenAIClient:
+	'''
+	Creates the client of a worker with its own rate limiter, the connection pool of its process and, optionally, the shared response cache.
+
+	:param endpoint: str, endpoint of the Azure OpenAI resource.
+	:param api_key: str, API key to authenticate requests.
+	:param model: str, name of the model deployment.
+	:param requests_per_minute: float, request quota of the worker, 0 for unlimited, defaults to 0.
+	:param tokens_per_minute: float, token quota of the worker, 0 for unlimited, defaults to 0.
+	:param max_retries: int, maximum number of retries of a request, defaults to 5.
+	:param cache_path: str, optional file path to the response cache database.
+	:param cache_mode: str, 'off', 'on' or 'read-only', defaults to 'off'.
+	:param cache_max_entries: int, maximum number of cached responses, 0 for unlimited, defaults to 100000.
+	:param cache_max_bytes: int, maximum total size of cached responses in bytes, 0 for unlimited, defaults to 0.
+	:param transport_settings: dict, optional settings of the connection pool, see HttpTransport, defaults to its current settings.
+	:return: AzureOpenAIClient object.
+	'''
+	cache = None
+	if cache_mode != 'off' and cache_path:
+		cache = ResponseCache(path=cache_path, max_entries=cache_max_entries, max_bytes=cache_max_bytes, read_only=cache_mode == 'read-only')
+
+	rate_limiter = RateLimiter(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute, max_retries=max_retries)
+
+	# Configuring the pool of the worker process like the one of the coordinator
+	if transport_settings is not None:
+		transport.configure(**transport_settings)
+
+	return AzureOpenAIClient(endpoint=endpoint, api_key=api_key, model=model, cache=cache, rate_limiter=rate_limiter, http_client=transport.client())
+
+
+def worker_id() -> str:
+	'''
+	Returns the identifier of the current process across the hosts sharing a shard directory.
+
+	:return: str, host name and process id.
+	'''
+	return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def write_shards(shard_dir: str, n_round: int, problems: List[Problem], strategies: List[Optional[str]], prompt_templates: dict, evaluation_template: str, num_shards: int, heartbeat_interval: float=60.0) -> List[str]:
+	'''
+	Partitions the problems of a round round-robin and writes one input file per shard.
+
+	:param shard_dir: str, directory path shared by the coordinator and the workers.
+	:param n_round: int, round number.
+	:param problems: list, list of Problem classes of the round.
+	:param strategies: list, strategy for each problem, None to skip its mutation.
+	:param prompt_templates: dict, dictionary where keys are the mutation strategies and values are the templates.
+	:param evaluation_template: str, evaluation template.
+	:param num_shards: int, number of shards.
+	:param heartbeat_interval: float, seconds between two heartbeats of the worker of a shard, defaults to 60.
+	:return: list, names of the shards.
+	'''
+	os.makedirs(shard_dir, exist_ok=True)
+
+	names = []
+	for shard in range(min(num_shards, len(problems))):
+		name = f'round-{n_round}-shard-{shard}'
+		indices = range(shard, len(problems), num_shards)
+
+		# Removing files left by an interrupted attempt of the same round
+		for suffix in ('.claimed', '.output.jsonl', '.done', '.failed'):
+			if os.path.exists(os.path.join(shard_dir, f'{name}{suffix}')):
+				os.remove(os.path.join(shard_dir, f'{name}{suffix}'))
+
+		# Writing to a temporary name first so workers never claim a partial shard
+		filepath = os.path.join(shard_dir, f'{name}.input.jsonl')
+		with open(f'{filepath}.tmp', 'w') as file:
+			file.write(json.dumps({'prompt_templates': prompt_templates, 'evaluation_template': evaluation_template, 'evaluation_settings': evaluation_settings, 'streaming_settings': streaming_settings, 'budget_settings': budget.settings, 'growth': budget.round_growth or budget.growth, 'heartbeat_interval': heartbeat_interval}) + '\n')
+			for index in indices:
+				file.write(json.dumps({'index': index, 'strategy': strategies[index], 'problem': problem_to_dict(problems[index])}) + '\n')
+		os.replace(f'{filepath}.tmp', filepath)
+		names.append(name)
+
+	return names
+
+
+def process_shard(shard_dir: str, name: str, client) -> None:
+	'''
+	Mutates and evaluates the problems of a claimed shard, writing each result as soon as it is evaluated.
+
+	:param shard_dir: str, directory path shared by the coordinator and the workers.
+	:param name: str, name of the shard.
+	:param client: client used for mutation and evaluation requests.
+	'''
+	with open(os.path.join(shard_dir, f'{name}.claimed'), 'r') as file:
+		header = json.loads(file.readline())
+		items = [json.loads(line) for line in file if line.strip()]
+
+	problems = [problem_from_dict(item['problem']) for item in items]
+	configure_evaluation(**header.get('evaluation_settings', {}))
+	configure_streaming(**header.get('streaming_settings', {}))
+	budget.configure(**header.get('budget_settings', {}))
+	output_path = os.path.join(shard_dir, f'{name}.output.jsonl')
+	spent = budget.spent()
+
+	# Touching the claimed file while the shard is processed, so the coordinator knows its worker is alive
+	stopped = threading.Event()
+	def heartbeat():
+		while not stopped.wait(header.get('heartbeat_interval', 60.0)):
+			try:
+				os.utime(os.path.join(shard_dir, f'{name}.claimed'))
+
+			except FileNotFoundError:
+				return
+	threading.Thread(target=heartbeat, name=f'{name}-heartbeat', daemon=True).start()
+
+	# Planning the shard from the growth of its round, unless the worker runs in the process of the coordinator during the round
+	try:
+		with budget.planned_round(growth=header.get('growth')), open(output_path, 'w') as output_file:
+			def on_result(position, problem):
+				nonlocal spent
+				# Handing the mutations of the problem and the tokens spent since the previous result over to the coordinator
+				previous, spent = spent, budget.spent()
+				usage = {key: spent[key] - previous[key] for key in ('prompt_tokens', 'completion_tokens')}
+				output_file.write(json.dumps({
+					'index': items[position]['index'], 'problem': problem_to_dict(problem), 'lineage': lineage.export(problem.id),
+					'usage': {'worker': worker_id(), 'model': getattr(client, 'model', 'shard'), **usage}
+				}) + '\n')
+				output_file.flush()
+				lineage.discard(problem.id)
+
+			run_round_sequential(
+				mutation_client=client,
+				evaluation_client=client,
+				problems=problems,
+				strategies=[item['strategy'] for item in items],
+				prompt_templates=header['prompt_templates'],
+				evaluation_template=header['evaluation_template'],
+				on_result=on_result
+			)
+
+	except Exception as e:
+		with open(os.path.join(shard_dir, f'{name}.failed'), 'w') as file:
+			file.write(str(e))
+		return
+
+	finally:
+		stopped.set()
+
+	open(os.path.join(shard_dir, f'{name}.done'), 'w').close()
+
+
+def claim_shard(shard_dir: str) -> Optional[str]:
+	'''
+	Claims the next unclaimed shard by atomically renaming its input file.
+
+	:param shard_dir: str, directory path shared by the coordinator and the workers.
+	:return: str, name of the claimed shard, None if no shard is waiting.
+	'''
+	if not os.path.isdir(shard_dir):
+		return None
+
+	for filename in sorted(os.listdir(shard_dir)):
+		if filename.endswith('.input.jsonl'):
+			name = filename[:-len('.input.jsonl')]
+			try:
+				os.rename(os.path.join(shard_dir, filename), os.path.join(shard_dir, f'{name}.claimed'))
+				# Starting the lease of the claim from now rather than from when the shard was written
+				os.utime(os.path.join(shard_dir, f'{name}.claimed'))
+
+			except FileNotFoundError:
+				# Another worker claimed it first, or the coordinator gave it back before the lease started
+				continue
+
+			return name
+
+	return None
+
+
+def run_worker(shard_dir: str, client_factory: Callable, watch: bool=False, poll_interval: float=1.0) -> int:
+	'''
+	Processes shards from a shard directory until none is left or, when watching, forever.
+
+	:param shard_dir: str, directory path shared by the coordinator and the workers.
+	:param client_factory: callable, creates the client of the worker.
+	:param watch: bool, whether to keep waiting for new shards, defaults to False.
+	:param poll_interval: float, seconds between checks for new shards when watching, defaults to 1.
+	:return: int, number of processed shards.
+	'''
+	client = client_factory()
+	processed = 0
+	while True:
+		name = claim_shard(shard_dir)
+		if name is not None:
+			process_shard(shard_dir=shard_dir, name=name, client=client)
+			processed += 1
+		elif watch:
+			time.sleep(poll_interval)
+		else:
+			return processed
+
+
+def reclaim_stale_shard(shard_dir: str, name: str, shard_timeout: float) -> bool:
+	'''
+	Gives a claimed shard back to the workers when its worker stopped sending heartbeats.
+
+	:param shard_dir: str, directory path shared by the coordinator and the workers.
+	:param name: str, name of the shard.
+	:param shard_timeout: float, seconds without a heartbeat after which the worker of a shard is considered dead.
+	:return: bool, True if the shard was given back.
+	'''
+	filepath = os.path.join(shard_dir, f'{name}.claimed')
+	try:
+		if time.time() - os.path.getmtime(filepath) <= shard_timeout:
+			return False
+		os.rename(filepath, os.path.join(shard_dir, f'{name}.input.jsonl'))
+
+	except FileNotFoundError:
+		return False
+
+	# Discarding the results written by the dead worker, which the next worker writes again
+	if os.path.exists(os.path.join(shard_dir, f'{name}.output.jsonl')):
+		os.remove(os.path.join(shard_dir, f'{name}.output.jsonl'))
+	metrics.inc('shard_reclaims_total')
+
+	return True
+
+
+@planned_round
+def run_round_sharded(problems: List[Problem], strategies: List[Optional[str]], prompt_templates: dict, evaluation_template: str, n_round: int, shard_dir: str='shards/', num_shards: int=4, client_factory: Optional[Callable]=None, workers: int=4, poll_interval: float=1.0, shard_timeout: float=300.0, round_timeout: float=86400.0, on_mutated: Optional[Callable[[int, Problem], None]]=None, on_result: Optional[Callable[[int, Problem], None]]=None) -> List[Problem]:
+	'''
+	Mutates and evaluates the problems of a round across sharded workers and merges their results.
+
+	With a client factory, local worker processes are started and joined. Without one, the coordinator only waits
+	for external workers, started with scripts/shard_worker.py on hosts sharing the shard directory.
+
+	:param problems: list, list of Problem classes of the round, updated in place.
+	:param strategies: list, strategy for each problem, None to skip its mutation.
+	:param prompt_templates: dict, dictionary where keys are the mutation strategies and values are the templates.
+	:param evaluation_template: str, evaluation template.
+	:param n_round: int, round number.
+	:param shard_dir: str, directory path shared by the coordinator and the workers, defaults to shards/
+	:param num_shards: int, number of shards the round is split into, defaults to 4.
+	:param client_factory: callable, optional, picklable callable creating the client of a local worker process.
+	:param workers: int, number of local worker processes, defaults to 4.
+	:param poll_interval: float, seconds between checks for finished shards, defaults to 1.
+	:param shard_timeout: float, seconds without a heartbeat after which a claimed shard is given back to the workers, defaults to 300.
+	:param round_timeout: float, seconds after which the round fails if shards are still unfinished, defaults to a day.
+	:param on_mutated: callable, optional, called with the position of the problem in the round and the mutated Problem class.
+	:param on_result: callable, optional, called with the position of the problem in the round and the evaluated Problem class.
+	:return: list, list of evaluated Problem classes in the same order.
+	'''
+	if num_shards < 1:
+		raise ValueError(f"Error: Number of shards must be at least 1, got {num_shards}.")
+
+	names = write_shards(shard_dir, n_round, problems, strategies, prompt_templates, evaluation_template, num_shards, heartbeat_interval=shard_timeout / 4)
+	deadline = time.monotonic() + round_timeout
+	timeout_message = f"Error: Round {n_round} did not finish within {round_timeout:g} seconds, unfinished shards in {shard_dir}"
+
+	# Starting local workers, which claim shards exactly as external workers do
+	if client_factory is not None:
+		context = multiprocessing.get_context('spawn')
+		processes = [
+			context.Process(target=run_worker, args=(shard_dir, client_factory), name=f'shard-worker-{worker}')
+			for worker in range(min(workers, len(names)))
+		]
+		for process in processes:
+			process.start()
+		for process in processes:
+			process.join(max(deadline - time.monotonic(), 0))
+		if any(process.is_alive() for process in processes):
+			for process in processes:
+				process.terminate()
+			raise ValueError(f"{timeout_message}.")
+
+	# Waiting until every shard is finished, giving the shards of dead workers back to the others
+	pending = set(names)
+	failures = []
+	while pending:
+		for name in sorted(pending):
+			if os.path.exists(os.path.join(shard_dir, f'{name}.done')):
+				pending.discard(name)
+			elif os.path.exists(os.path.join(shard_dir, f'{name}.failed')):
+				with open(os.path.join(shard_dir, f'{name}.failed'), 'r') as file:
+					failures.append(f"{name}: {file.read()}")
+				pending.discard(name)
+			elif client_factory is None:
+				reclaim_stale_shard(shard_dir=shard_dir, name=name, shard_timeout=shard_timeout)
+
+		if pending and client_factory is not None:
+			failures.extend(f"{name}: worker exited without finishing the shard" for name in sorted(pending))
+			break
+
+		if pending and time.monotonic() > deadline:
+			raise ValueError(f"{timeout_message}: {', '.join(sorted(pending))}.")
+
+		if pending:
+			time.sleep(poll_interval)
+
+	if failures:
+		raise ValueError(f"{len(failures)} shards failed on {socket.gethostname()}. First error: {failures[0]}")
+
+	# Merging results into the round in their original order
+	results = {}
+	for name in names:
+		with open(os.path.join(shard_dir, f'{name}.output.jsonl'), 'r') as file:
+			for line in file:
+				if line.strip():
+					entry = json.loads(line)
+					results[entry['index']] = problem_from_dict(entry['problem'])
+					for template, statement, result in entry.get('lineage', []):
+						lineage.record(problem_id=entry['problem']['id'], template=template, statement=statement, result=result)
+
+					# Counting the tokens and mutations of the worker towards the budget of the run, unless it ran in this process
+					usage = entry.get('usage') or {}
+					if usage.get('worker') != worker_id():
+						for metric, key in (('llm_prompt_tokens_total', 'prompt_tokens'), ('llm_completion_tokens_total', 'completion_tokens')):
+							if usage.get(key):
+								metrics.inc(metric, usage[key], model=usage['model'])
+						for template, statement, result in entry.get('lineage', []):
+							budget.record(strategy=strategies[entry['index']], statement_tokens=count_tokens(statement), completion_tokens=count_tokens(result))
+
+	for index, problem in enumerate(problems):
+		restored = results[index]
+		for field in ('mutated_description', 'mutated', 'score', 'error_logs', 'warnings_log'):
+			setattr(problem, field, getattr(restored, field))
+
+		if on_mutated is not None and strategies[index] is not None:
+			on_mutated(index, problem)
+		if on_result is not None:
+			on_result(index, problem)
+
+	# Removing the files of the round
+	for name in names:
+		for suffix in ('.claimed', '.output.jsonl', '.done'):
+			filepath = os.path.join(shard_dir, f'{name}{suffix}')
+			if os.path.exists(filepath):
+				os.remove(filepath)
+
+	return problems
@@ -0,0 +1,86 @@
+"""
+File to compile prompt templates into a prefix-stable form.
+"""
+
+import re
+from string import Formatter
+from typing import Iterable, Optional
+
+# Placeholders of each kind of template
+MUTATION_PLACEHOLDERS = ('statement',)
+EVALUATION_PLACEHOLDERS = ('original_statement', 'mutated_statement')
+PACKING_PLACEHOLDERS = ('instruction', 'items')
+
+PLACEHOLDER_PATTERN = re.compile(r'(?<!\{)\{(\w+)\}(?!\})')
+
+# Templates that passed validation when they were compiled, which are not checked again on every call
+compiled_templates = set()
+
+
+def normalise_message(message: str) -> str:
+	'''
+	Collapses the indentation and line breaks of a message written as an indented triple-quoted string.
+
+	:param message: str, message to normalise.
+	:return: str, message on a single line without surrounding whitespace.
+	'''
+	return ' '.join(message.split())
+
+
+def compile_template(template: str, placeholders: Optional[Iterable[str]]=None, name: str='template', reorder: Optional[bool]=None) -> str:
+	'''
+	Validates the placeholders of a template once and moves its static instructions ahead of them.
+
+	Providers cache the longest prefix shared by successive requests, so a template is rewritten to start with all of
+	its static text. Instructions written after the last placeholder are moved to the front, leaving the statements
+	at the end of the prompt. Text around placeholders, such as labels and quotes, stays in place.
+
+	:param template: str, template text.
+	:param placeholders: iterable, names of the placeholders the template must hold, defaults to the ones it holds.
+	:param name: str, name of the template used in error messages, defaults to 'template'.
+	:param reorder: bool, whether to move trailing instructions to the front, defaults to mutation and evaluation templates only,
+		since packing templates wrap an instruction that is already compiled and keep their answer format after the items.
+	:return: str, compiled template.
+	:raises ValueError: if a placeholder is missing or unknown.
+	'''
+	try:
+		fields = {field for _, field, _, _ in Formatter().parse(template) if field is not None}
+
+	except ValueError as e:
+		raise ValueError(f"Error: Malformed template '{name}': {str(e)}")
+
+	expected = fields if placeholders is None else set(placeholders)
+
+	if expected - fields:
+		raise ValueError(f"Error: Placeholder '{{{sorted(expected - fields)[0]}}}' not found in the template '{name}'.")
+	if fields - expected:
+		raise ValueError(f"Error: Unknown placeholder '{{{sorted(fields - expected)[0]}}}' in the template '{name}'.")
+
+	if reorder is None:
+		reorder = bool(fields) and fields <= set(MUTATION_PLACEHOLDERS + EVALUATION_PLACEHOLDERS)
+
+	template = template.strip()
+	matches = list(PLACEHOLDER_PATTERN.finditer(template))
+	if reorder and matches:
+		# Keeping closing punctuation such as quotes in place and moving instructions
+		end = matches[-1].end() + len(re.match(r'[^\w\s]*', template[matches[-1].end():]).group())
+		body, tail = template[:end], template[end:]
+
+		if re.search(r'\w', tail):
+			template = f"{tail.strip()}\n\n{body.rstrip()}"
+
+	compiled_templates.add(template)
+
+	return template
+
+
+def static_prefix(template: str) -> str:
+	'''
+	Returns the text of a template before its first placeholder, the part shared by every prompt built from it.
+
+	:param template: str, template text.
+	:return: str, static prefix.
+	'''
+	match = PLACEHOLDER_PATTERN.search(template)
+
+	return template[:match.start()] if match else template
@@ -0,0 +1,97 @@
+import time
+import functools
+from typing import Callable, Optional
+from src.BaseAzureOpenAIClient import BaseAzureOpenAIClient
+from src.RateLimiter import estimate_tokens
+from openai import AsyncAzureOpenAI
+
+class AsyncAzureOpenAIClient(BaseAzureOpenAIClient):
+	sdk_class = AsyncAzureOpenAI
+
+	async def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: Optional[dict]=None) -> str:
+		"""
+		Generates a response from the user input using the OpenAI model without blocking the event loop.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response. Higher values introduce more variability.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param response_format: dict, optional structured output format, such as a JSON schema the response must follow.
+		:return: str, response generated by the model.
+		:raises RuntimeError: if the request fails after any retries.
+		"""
+		# Serving identical requests from the cache
+		cache_key, cached_response = self.lookup(system_message, user_input, temperature, max_tokens, response_format)
+		if cached_response is not None:
+			return cached_response
+
+		start = time.perf_counter()
+		try:
+			request = functools.partial(self.client.chat.completions.create, **self.request_options(user_input, system_message, temperature, max_tokens, response_format=response_format))
+			estimated_tokens = estimate_tokens(system_message, user_input) + max_tokens
+
+			# Sending the request through the shared rate limiter when there is one
+			if self.rate_limiter is not None:
+				response = await self.rate_limiter.call_async(request, tokens=estimated_tokens)
+			else:
+				response = await request()
+
+			return self.read_response(response, estimated_tokens=estimated_tokens, start=start, cache_key=cache_key)
+
+		except Exception as e:
+			raise self.request_error(e, 'generating') from e
+
+
+	async def stream_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, stop_at: Optional[Callable[[str], Optional[int]]]=None) -> str:
+		"""
+		Streams a response from the user input without blocking the event loop, reading chunks as they arrive.
+
+		The time to the first token is recorded, and the stream is closed as soon as stop_at finds where the response
+		ends, so the model stops generating the rest. Responses stopped early are not cached, and cached responses
+		are cut where stop_at ends them.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response. Higher values introduce more variability.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param stop_at: callable, optional, called with the text received so far, returning the position it ends at to stop the stream, or None to continue.
+		:return: str, response generated by the model, cut where the stream was stopped.
+		:raises RuntimeError: if the request fails after any retries.
+		"""
+		# Serving identical requests from the cache
+		cache_key, cached_response = self.lookup(system_message, user_input, temperature, max_tokens)
+		if cached_response is not None:
+			return self.read_cached(cached_response, stop_at=stop_at)
+
+		start = time.perf_counter()
+		try:
+			request = functools.partial(self.client.chat.completions.create, **self.request_options(user_input, system_message, temperature, max_tokens, stream=True))
+			estimated_tokens = estimate_tokens(system_message, user_input) + max_tokens
+
+			# Opening the stream through the shared rate limiter when there is one
+			if self.rate_limiter is not None:
+				stream = await self.rate_limiter.call_async(request, tokens=estimated_tokens)
+			else:
+				stream = await request()
+
+			received = {'text': '', 'usage': None, 'stopped': False}
+			try:
+				async for chunk in stream:
+					if self.read_chunk(received, chunk, start=start, stop_at=stop_at):
+						break
+
+			finally:
+				await stream.close()
+
+			return self.read_stream(received, user_input=user_input, system_message=system_message, estimated_tokens=estimated_tokens, start=start, cache_key=cache_key)
+
+		except Exception as e:
+			raise self.request_error(e, 'streaming') from e
+
+
+	async def close(self) -> None:
+		"""
+		Closes the underlying HTTP connections, unless they belong to a pool shared with other clients.
+		"""
+		if self.http_client is None:
+			await self.client.close()
@@ -0,0 +1,219 @@
+import re
+import time
+import httpx
+from types import SimpleNamespace
+from typing import Callable, Optional, Union
+from src.ResponseCache import ResponseCache
+from src.RateLimiter import RateLimiter, estimate_tokens
+from src.Metrics import metrics
+
+class BaseAzureOpenAIClient:
+	"""
+	Base class of AzureOpenAIClient and AsyncAzureOpenAIClient.
+
+	It builds the requests, serves and stores cached responses, reads streamed chunks, records the usage of each request
+	and maps errors, so subclasses only send the requests with their own SDK client.
+	"""
+	sdk_class = None
+
+	def __init__(self, endpoint: str, api_key: str, model: str, cache: Optional[ResponseCache]=None, rate_limiter: Optional[RateLimiter]=None, http_client: Optional[Union[httpx.Client, httpx.AsyncClient]]=None):
+		"""
+		Initializes the client with the endpoint, API key, and deployment name.
+
+		:param endpoint: The endpoint of your Azure OpenAI resource.
+		:param api_key: The API key to authenticate requests.
+		:param model: The name of the model deployment.
+		:param cache: Optional ResponseCache serving identical requests without calling the model.
+		:param rate_limiter: Optional RateLimiter shared by every client of the deployment, which then owns retries.
+		:param http_client: Optional HTTP client holding the connection pool shared by every client of the process, see HttpTransport.
+		"""
+		self.endpoint = endpoint
+		self.api_key = api_key
+		self.model = model
+		self.cache = cache
+		self.rate_limiter = rate_limiter
+		self.http_client = http_client
+		self.client = self.sdk_class(
+			api_key=self.api_key,
+			api_version='2024-08-01-preview',
+			azure_endpoint=self.endpoint,
+			max_retries=0 if rate_limiter is not None else 2,
+			http_client=http_client
+		)
+
+
+	def request_options(self, user_input: str, system_message: str, temperature: float, max_tokens: int, response_format: Optional[dict]=None, stream: bool=False) -> dict:
+		"""
+		Builds the arguments of a chat-completion request.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param response_format: dict, optional structured output format of the request.
+		:param stream: bool, whether the response is streamed with its usage, defaults to False.
+		:return: dict, keyword arguments of chat.completions.create.
+		"""
+		options = {
+			'model': self.model,
+			'temperature': temperature,
+			'max_tokens': max_tokens,
+			'messages': [
+				{'role': 'system', 'content': system_message},
+				{'role': 'user', 'content': user_input}
+			]
+		}
+		if response_format is not None:
+			options['response_format'] = response_format
+		if stream:
+			options.update(stream=True, stream_options={'include_usage': True})
+
+		return options
+
+
+	def lookup(self, *request) -> tuple:
+		"""
+		Looks up the response of an identical request in the cache.
+
+		:param request: settings of the request the cache key is made of, after the model.
+		:return: tuple, cache key, None without a cache, and cached response, None when there is none.
+		"""
+		if self.cache is None:
+			return None, None
+
+		cache_key = self.cache.make_key(self.model, *request)
+		cached_response = self.cache.get(cache_key)
+		if cached_response is not None:
+			metrics.inc('llm_requests_total', model=self.model, outcome='cache_hit')
+
+		return cache_key, cached_response
+
+
+	def read_response(self, response, estimated_tokens: int, start: float, cache_key: Optional[str]=None) -> str:
+		"""
+		Records the usage of a response and caches its content.
+
+		:param response: chat completion returned by the SDK client.
+		:param estimated_tokens: int, tokens reserved for the request from the rate limiter.
+		:param start: float, performance counter value when the request started.
+		:param cache_key: str, key the content is cached under, defaults to None.
+		:return: str, content of the response.
+		"""
+		usage = getattr(response, 'usage', None)
+		if self.rate_limiter is not None:
+			self.rate_limiter.record_usage(estimated_tokens, getattr(usage, 'total_tokens', None))
+		self.record_usage(usage=usage, start=start)
+
+		content = response.choices[0].message.content
+		if self.cache is not None and content is not None:
+			self.cache.put(cache_key, content)
+
+		return content
+
+
+	@staticmethod
+	def read_cached(text: str, stop_at: Optional[Callable[[str], Optional[int]]]=None) -> str:
+		"""
+		Cuts a cached response where its stream would have been stopped, since cached responses are the full ones.
+
+		:param text: str, cached response.
+		:param stop_at: callable, optional, called with the text received so far, returning the position it ends at to stop the stream, or None to continue.
+		:return: str, cached response, cut where stop_at ends it.
+		"""
+		if stop_at is None:
+			return text
+
+		# Feeding the text word by word, as the chunks of a stream would arrive
+		for word in re.finditer(r'\s*\S+', text):
+			end = stop_at(text[:word.end()])
+			if end is not None:
+				return text[:end]
+
+		return text
+
+
+	def read_chunk(self, received: dict, chunk, start: float, stop_at: Optional[Callable[[str], Optional[int]]]=None) -> bool:
+		"""
+		Adds a streamed chunk to the text received so far, recording the time to the first token.
+
+		:param received: dict, 'text', 'usage' and 'stopped' of the stream, updated in place.
+		:param chunk: chat completion chunk returned by the SDK client.
+		:param start: float, performance counter value when the request started.
+		:param stop_at: callable, optional, called with the text received so far, returning the position it ends at to stop the stream, or None to continue.
+		:return: bool, whether the response is complete and the stream can be closed.
+		"""
+		received['usage'] = getattr(chunk, 'usage', None) or received['usage']
+		delta = chunk.choices[0].delta.content if chunk.choices else None
+		if not delta:
+			return False
+
+		if not received['text']:
+			metrics.observe('llm_time_to_first_token_seconds', time.perf_counter() - start, model=self.model)
+		received['text'] += delta
+
+		# Closing the stream once the response is complete
+		end = stop_at(received['text']) if stop_at is not None else None
+		if end is not None:
+			received.update(text=received['text'][:end], stopped=True)
+
+		return received['stopped']
+
+
+	def read_stream(self, received: dict, user_input: str, system_message: str, estimated_tokens: int, start: float, cache_key: Optional[str]=None) -> str:
+		"""
+		Records the usage of a closed stream and caches its text unless it was stopped early.
+
+		:param received: dict, 'text', 'usage' and 'stopped' of the stream, filled by read_chunk.
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param estimated_tokens: int, tokens reserved for the request from the rate limiter.
+		:param start: float, performance counter value when the request started.
+		:param cache_key: str, key the text is cached under, defaults to None.
+		:return: str, text of the stream.
+		"""
+		# Estimating the usage of streams closed before the model reported it
+		usage = received['usage']
+		if usage is None:
+			usage = SimpleNamespace(prompt_tokens=estimate_tokens(system_message, user_input), completion_tokens=estimate_tokens(received['text']))
+		if self.rate_limiter is not None:
+			self.rate_limiter.record_usage(estimated_tokens, usage.prompt_tokens + usage.completion_tokens)
+		self.record_usage(usage=usage, start=start)
+		if received['stopped']:
+			metrics.inc('llm_streams_stopped_total', model=self.model)
+
+		if self.cache is not None and not received['stopped']:
+			self.cache.put(cache_key, received['text'])
+
+		return received['text']
+
+
+	def record_usage(self, usage, start: float) -> None:
+		"""
+		Records the latency of a request and the token usage reported by the model.
+
+		:param usage: usage of the response, None if the model did not report it.
+		:param start: float, performance counter value when the request started.
+		"""
+		metrics.observe('llm_request_seconds', time.perf_counter() - start, model=self.model)
+		metrics.inc('llm_requests_total', model=self.model, outcome='ok')
+		for name, tokens in (('llm_prompt_tokens_total', getattr(usage, 'prompt_tokens', None)), ('llm_completion_tokens_total', getattr(usage, 'completion_tokens', None))):
+			if isinstance(tokens, int):
+				metrics.inc(name, tokens, model=self.model)
+
+		# Recording the prompt tokens served from the provider's prompt cache
+		cached_tokens = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None)
+		if isinstance(cached_tokens, int):
+			metrics.inc('llm_cached_prompt_tokens_total', cached_tokens, model=self.model)
+
+
+	def request_error(self, error: Exception, action: str) -> RuntimeError:
+		"""
+		Records a failed request and maps its error.
+
+		:param error: Exception raised by the request, after any retries.
+		:param action: str, what the request was doing, such as 'generating' or 'streaming'.
+		:return: RuntimeError to raise from the error.
+		"""
+		metrics.inc('llm_requests_total', model=self.model, outcome='error')
+
+		return RuntimeError(f"An error occurred while {action} response: {str(error)}")
@@ -0,0 +1,312 @@
+import os
+import re
+import json
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+from src.Metrics import metrics
+
+
+def window_seconds(completion_window: str) -> float:
+	'''
+	Converts a batch completion window, such as '24h', to seconds.
+
+	:param completion_window: str, number followed by s, m, h or d.
+	:return: float, seconds of the window.
+	'''
+	match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhd])\s*', completion_window)
+	if match is None:
+		raise ValueError(f"Error: Invalid completion window '{completion_window}', expected a number followed by s, m, h or d.")
+
+	return float(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+
+
+class BatchClient(ABC):
+	'''
+	Base class for clients submitting many chat-completion requests as a single JSONL batch job.
+
+	Subclasses implement `submit`, `status`, `cancel` and `download`; `run` takes care of writing the input file,
+	polling the job until its deadline, mapping each result back to its custom id and recording the token usage of the results.
+	'''
+	terminal_statuses = ('completed', 'failed', 'expired', 'cancelled')
+
+	def __init__(self, model: str, work_dir: str='batches/', poll_interval: float=30.0, timeout: float=86400.0):
+		'''
+		Initializes the BatchClient class.
+
+		:param model: str, name of the model deployment requests are sent to.
+		:param work_dir: str, directory path where batch input and output files are written, defaults to batches/
+		:param poll_interval: float, seconds to wait between status checks, defaults to 30.
+		:param timeout: float, seconds a job may run before it is cancelled, defaults to a day.
+		'''
+		self.model = model
+		self.work_dir = work_dir
+		self.poll_interval = poll_interval
+		self.timeout = timeout
+
+
+	def build_request(self, custom_id: str, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: Optional[dict]=None) -> dict:
+		'''
+		Builds one line of a batch input file.
+
+		:param custom_id: str, identifier used to map the result back to its request.
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param response_format: dict, optional structured output format of the request.
+		:return: dict, batch request.
+		'''
+		request = {
+			'custom_id': custom_id,
+			'method': 'POST',
+			'url': '/chat/completions',
+			'body': {
+				'model': self.model,
+				'temperature': temperature,
+				'max_tokens': max_tokens,
+				'messages': [
+					{'role': 'system', 'content': system_message},
+					{'role': 'user', 'content': user_input}
+				]
+			}
+		}
+		if response_format is not None:
+			request['body']['response_format'] = response_format
+
+		return request
+
+
+	@abstractmethod
+	def submit(self, input_path: str) -> str:
+		'''
+		Submits a batch input file.
+
+		:param input_path: str, path of the JSONL input file.
+		:return: str, batch job identifier.
+		'''
+
+
+	@abstractmethod
+	def status(self, batch_id: str) -> str:
+		'''
+		Returns the status of a batch job.
+
+		:param batch_id: str, batch job identifier.
+		:return: str, batch job status.
+		'''
+
+
+	@abstractmethod
+	def download(self, batch_id: str, output_path: str) -> None:
+		'''
+		Writes the results of a completed batch job, including failed requests, to a JSONL file.
+
+		:param batch_id: str, batch job identifier.
+		:param output_path: str, path of the JSONL output file.
+		'''
+
+
+	@abstractmethod
+	def cancel(self, batch_id: str) -> None:
+		'''
+		Cancels a batch job.
+
+		:param batch_id: str, batch job identifier.
+		'''
+
+
+	def run(self, requests: List[dict], name: Optional[str]=None) -> Dict[str, dict]:
+		'''
+		Submits a list of requests as one batch job, waits until it finishes and collects its results.
+
+		:param requests: list, requests built with build_request.
+		:param name: str, optional prefix for the batch files.
+		:return: dict, dictionary where keys are custom ids and values hold either a 'content' or an 'error' entry.
+		'''
+		if not requests:
+			return {}
+
+		# Writing batch input file
+		os.makedirs(self.work_dir, exist_ok=True)
+		prefix = f"{name or 'batch'}-{uuid.uuid4().hex[:8]}"
+		input_path = os.path.join(self.work_dir, f'{prefix}.input.jsonl')
+		output_path = os.path.join(self.work_dir, f'{prefix}.output.jsonl')
+
+		with open(input_path, 'w') as file:
+			for request in requests:
+				file.write(json.dumps(request) + '\n')
+
+		# Submitting and polling until the job finishes, cancelling it once its deadline has passed
+		batch_id = self.submit(input_path)
+		deadline = time.monotonic() + self.timeout
+		status = self.status(batch_id)
+		while status not in self.terminal_statuses:
+			if time.monotonic() > deadline:
+				self.cancel(batch_id)
+				raise RuntimeError(f"Error: Batch {batch_id} did not finish within {self.timeout:g} seconds and was cancelled, last status '{status}'.")
+			time.sleep(self.poll_interval)
+			status = self.status(batch_id)
+
+		if status != 'completed':
+			raise RuntimeError(f"Error: Batch {batch_id} finished with status '{status}'.")
+
+		# Mapping results back to their requests
+		self.download(batch_id, output_path)
+		results = {}
+		with open(output_path, 'r') as file:
+			for line in file:
+				if line.strip():
+					record = json.loads(line)
+					results[record['custom_id']] = self.parse_result(record)
+					self.record_usage(record)
+
+		for request in requests:
+			if request['custom_id'] not in results:
+				results[request['custom_id']] = {'error': "Missing result in batch output."}
+
+		return results
+
+
+	def record_usage(self, record: dict) -> None:
+		'''
+		Records the token usage reported in one line of a batch output file, as the clients do for their requests.
+
+		:param record: dict, line of a batch output file.
+		'''
+		usage = ((record.get('response') or {}).get('body') or {}).get('usage') or {}
+		for name, key in (('llm_prompt_tokens_total', 'prompt_tokens'), ('llm_completion_tokens_total', 'completion_tokens')):
+			if isinstance(usage.get(key), int):
+				metrics.inc(name, usage[key], model=self.model)
+
+		cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+		if isinstance(cached_tokens, int):
+			metrics.inc('llm_cached_prompt_tokens_total', cached_tokens, model=self.model)
+
+
+	@staticmethod
+	def parse_result(record: dict) -> dict:
+		'''
+		Extracts the completion content or the error of one line of a batch output file.
+
+		:param record: dict, line of a batch output file.
+		:return: dict, either {'content': str} or {'error': str}.
+		'''
+		if record.get('error'):
+			return {'error': str(record['error'])}
+
+		response = record.get('response') or {}
+		if response.get('status_code') != 200:
+			return {'error': f"Request failed with status {response.get('status_code')}: {response.get('body')}"}
+
+		try:
+			return {'content': response['body']['choices'][0]['message']['content']}
+
+		except (KeyError, IndexError, TypeError) as e:
+			return {'error': f"Malformed batch result: {str(e)}"}
+
+
+class AzureBatchClient(BatchClient):
+	def __init__(self, client, work_dir: str='batches/', poll_interval: float=30.0, completion_window: str='24h'):
+		'''
+		Initializes the AzureBatchClient class on top of an AzureOpenAIClient.
+
+		:param client: AzureOpenAIClient object whose SDK client and deployment are used.
+		:param work_dir: str, directory path where batch input and output files are written, defaults to batches/
+		:param poll_interval: float, seconds to wait between status checks, defaults to 30.
+		:param completion_window: str, time frame within which the batch must be processed, also the deadline of the polling, defaults to 24h.
+		'''
+		super().__init__(model=client.model, work_dir=work_dir, poll_interval=poll_interval, timeout=window_seconds(completion_window))
+		self.client = client.client
+		self.completion_window = completion_window
+
+
+	def submit(self, input_path: str) -> str:
+		with open(input_path, 'rb') as file:
+			input_file = self.client.files.create(file=file, purpose='batch')
+
+		batch = self.client.batches.create(
+			input_file_id=input_file.id,
+			endpoint='/chat/completions',
+			completion_window=self.completion_window
+		)
+
+		return batch.id
+
+
+	def status(self, batch_id: str) -> str:
+		return self.client.batches.retrieve(batch_id).status
+
+
+	def cancel(self, batch_id: str) -> None:
+		self.client.batches.cancel(batch_id)
+
+
+	def download(self, batch_id: str, output_path: str) -> None:
+		batch = self.client.batches.retrieve(batch_id)
+		with open(output_path, 'w') as file:
+			for file_id in (batch.output_file_id, batch.error_file_id):
+				if file_id:
+					content = self.client.files.content(file_id).text
+					file.write(content if content.endswith('\n') or not content else content + '\n')
+
+
+class LocalBatchClient(BatchClient):
+	def __init__(self, client, work_dir: str='batches/', poll_interval: float=0.0):
+		'''
+		Initializes the LocalBatchClient class, a stand-in processing batch files with a synchronous client.
+		Its output lines carry no usage, since the client records the usage of each request itself.
+
+		:param client: object with a generate_response method and a model attribute, used to answer each request.
+		:param work_dir: str, directory path where batch input and output files are written, defaults to batches/
+		:param poll_interval: float, seconds to wait between status checks, defaults to 0.
+		'''
+		super().__init__(model=getattr(client, 'model', 'local'), work_dir=work_dir, poll_interval=poll_interval)
+		self.client = client
+		self.jobs = {}
+
+
+	def submit(self, input_path: str) -> str:
+		batch_id = f'batch_{uuid.uuid4().hex}'
+		self.jobs[batch_id] = input_path
+
+		return batch_id
+
+
+	def status(self, batch_id: str) -> str:
+		return 'completed' if batch_id in self.jobs else 'failed'
+
+
+	def cancel(self, batch_id: str) -> None:
+		self.jobs.pop(batch_id, None)
+
+
+	def download(self, batch_id: str, output_path: str) -> None:
+		with open(self.jobs[batch_id], 'r') as input_file, open(output_path, 'w') as output_file:
+			for line in input_file:
+				if not line.strip():
+					continue
+
+				request = json.loads(line)
+				body = request['body']
+				messages = {message['role']: message['content'] for message in body['messages']}
+
+				try:
+					content = self.client.generate_response(
+						user_input=messages.get('user', ''),
+						system_message=messages.get('system', ''),
+						temperature=body.get('temperature', 0.7),
+						max_tokens=body.get('max_tokens', 400),
+						**({'response_format': body['response_format']} if 'response_format' in body else {})
+					)
+					record = {
+						'custom_id': request['custom_id'],
+						'response': {'status_code': 200, 'body': {'choices': [{'message': {'role': 'assistant', 'content': content}}]}},
+						'error': None
+					}
+
+				except Exception as e:
+					record = {'custom_id': request['custom_id'], 'response': None, 'error': {'message': str(e)}}
+
+				output_file.write(json.dumps(record) + '\n')
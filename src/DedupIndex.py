@@ -0,0 +1,229 @@
+import re
+import random
+import hashlib
+import threading
+from array import array
+from typing import List, Optional, Tuple
+
+# Mersenne prime modulus of the MinHash permutations
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+class DedupIndex:
+	def __init__(self, threshold: float=0.9, num_perm: int=64, bands: int=16, shingle_size: int=5, seed: int=1):
+		'''
+		Initializes the DedupIndex class, an in-memory index of near-duplicate texts built on MinHash and LSH.
+
+		Texts are normalised and split into character shingles, and each text is summarised by a MinHash signature
+		whose agreement with another signature estimates the Jaccard similarity of their shingles. Signatures are split
+		into bands hashed into buckets, so a lookup only compares the texts sharing a bucket instead of every text.
+		Exact duplicates of the normalised text are found through a digest without computing a signature. The value of
+		an indexed text can be updated later, such as a placeholder for an evaluation still in flight, and texts whose
+		value is None are skipped by lookups.
+
+		:param threshold: float, estimated Jaccard similarity from which two texts are duplicates, defaults to 0.9.
+		:param num_perm: int, number of hash permutations of a signature, defaults to 64.
+		:param bands: int, number of LSH bands, must divide num_perm, defaults to 16.
+		:param shingle_size: int, number of characters of each shingle, defaults to 5.
+		:param seed: int, seed of the hash permutations, defaults to 1.
+		'''
+		if not 0.0 < threshold <= 1.0:
+			raise ValueError(f"Error: Dedup threshold must be in (0, 1], got {threshold}.")
+		if num_perm % bands:
+			raise ValueError(f"Error: The number of bands ({bands}) must divide the number of permutations ({num_perm}).")
+
+		self.threshold = threshold
+		self.num_perm = num_perm
+		self.bands = bands
+		self.rows = num_perm // bands
+		self.shingle_size = shingle_size
+		self.seed = seed
+
+		rng = random.Random(seed)
+		self.permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+
+		self.exact = {}
+		self.buckets = {}
+		self.entries = []
+		self.values = {}
+		self.lookups = 0
+		self.exact_hits = 0
+		self.near_hits = 0
+		self.lock = threading.Lock()
+
+
+	@staticmethod
+	def normalise(text: str) -> str:
+		'''
+		Normalises a text so differences in case and whitespace are ignored.
+
+		:param text: str, text to normalise.
+		:return: str, normalised text.
+		'''
+		return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+	def signature(self, text: str) -> array:
+		'''
+		Computes the MinHash signature of the shingles of a normalised text.
+
+		:param text: str, normalised text.
+		:return: array, minimum of each permutation over the hashed shingles.
+		'''
+		size = self.shingle_size
+		shingles = {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+		hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') for shingle in shingles]
+
+		return array('Q', (min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in self.permutations))
+
+
+	def _bands(self, scope: str, signature: array) -> List[tuple]:
+		'''
+		Returns the bucket key of each band of a signature.
+		'''
+		return [(scope, band, tuple(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+
+
+	@staticmethod
+	def _digest(text: str) -> str:
+		'''
+		Returns the digest of a text.
+		'''
+		return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+	def lookup(self, text: str, scope: str='') -> Optional[Tuple[str, float]]:
+		'''
+		Finds an indexed duplicate of a text.
+
+		:param text: str, text to look up.
+		:param scope: str, only texts added with the same scope are compared, defaults to ''.
+		:return: tuple, key and value of the most similar duplicate, None if no indexed text reaches the threshold.
+		'''
+		normalised, scope = self.normalise(text), self._digest(scope)[:16]
+		with self.lock:
+			self.lookups += 1
+			key = self.exact.get((scope, self._digest(normalised)))
+			if key is not None and self.values.get(key) is not None:
+				self.exact_hits += 1
+				return key, self.values[key]
+
+		signature = self.signature(normalised)
+		with self.lock:
+			candidates = {position for key in self._bands(scope, signature) for position in self.buckets.get(key, ())}
+
+			best, best_similarity = None, 0.0
+			for position in sorted(candidates):
+				key, other = self.entries[position][:2]
+				if self.values.get(key) is None:
+					continue
+				similarity = sum(1 for x, y in zip(signature, other) if x == y) / self.num_perm
+				if similarity >= self.threshold and similarity > best_similarity:
+					best, best_similarity = (key, self.values[key]), similarity
+
+			if best is not None:
+				self.near_hits += 1
+
+		return best
+
+
+	def add(self, key: str, text: str, value: float, scope: str='') -> None:
+		'''
+		Indexes a text.
+
+		:param key: str, identifier returned when a duplicate of the text is looked up.
+		:param text: str, text to index.
+		:param value: value returned with the key, such as a score, None to leave the text out of lookups.
+		:param scope: str, scope the text is compared within, defaults to ''.
+		'''
+		normalised, scope = self.normalise(text), self._digest(scope)[:16]
+		signature = self.signature(normalised)
+		with self.lock:
+			digest = (scope, self._digest(normalised))
+			if self.values.get(self.exact.get(digest)) is None:
+				self.exact[digest] = key
+			self.values[key] = value
+			self.entries.append((key, signature, scope))
+			for bucket in self._bands(scope, signature):
+				self.buckets.setdefault(bucket, []).append(len(self.entries) - 1)
+
+
+	def update(self, key: str, value) -> None:
+		'''
+		Changes the value returned for the texts indexed with a key.
+
+		:param key: str, identifier the texts were indexed with.
+		:param value: new value, None to leave the texts out of lookups.
+		'''
+		with self.lock:
+			if key in self.values:
+				self.values[key] = value
+
+
+	def to_dict(self) -> dict:
+		'''
+		Converts the index into a JSON serialisable dictionary, such as for a checkpoint. Evaluations still in flight are left out.
+
+		:return: dict, settings the signatures were computed with, indexed entries, exact digests, values and counters.
+		'''
+		with self.lock:
+			values = {key: value for key, value in self.values.items() if isinstance(value, (int, float))}
+
+			return {
+				'settings': {'num_perm': self.num_perm, 'bands': self.bands, 'shingle_size': self.shingle_size, 'seed': self.seed},
+				'entries': [[key, scope, list(signature)] for key, signature, scope in self.entries if key in values],
+				'exact': [[scope, digest, key] for (scope, digest), key in self.exact.items() if key in values],
+				'values': values,
+				'counters': {'lookups': self.lookups, 'exact': self.exact_hits, 'near': self.near_hits}
+			}
+
+
+	def load(self, state: dict) -> None:
+		'''
+		Adds the entries of an index converted with to_dict, such as when resuming a run.
+
+		:param state: dict, dictionary created by to_dict.
+		:raises ValueError: if its signatures were computed with other settings.
+		'''
+		settings = {'num_perm': self.num_perm, 'bands': self.bands, 'shingle_size': self.shingle_size, 'seed': self.seed}
+		if state['settings'] != settings:
+			raise ValueError(f"Error: Cannot load a dedup index built with {state['settings']} into an index with {settings}.")
+
+		with self.lock:
+			for key, scope, signature in state['entries']:
+				signature = array('Q', signature)
+				self.entries.append((key, signature, scope))
+				for bucket in self._bands(scope, signature):
+					self.buckets.setdefault(bucket, []).append(len(self.entries) - 1)
+			for scope, digest, key in state['exact']:
+				self.exact.setdefault((scope, digest), key)
+			self.values.update(state['values'])
+			self.lookups += state['counters']['lookups']
+			self.exact_hits += state['counters']['exact']
+			self.near_hits += state['counters']['near']
+
+
+	def empty_copy(self) -> 'DedupIndex':
+		'''
+		Creates an empty index with the same settings, whose signatures can be compared with the ones of this index.
+
+		:return: DedupIndex object.
+		'''
+		return DedupIndex(threshold=self.threshold, num_perm=self.num_perm, bands=self.bands, shingle_size=self.shingle_size, seed=self.seed)
+
+
+	def stats(self) -> dict:
+		'''
+		Returns the index counters.
+
+		:return: dict, number of lookups, exact and near duplicates found, indexed entries and dedup rate.
+		'''
+		duplicates = self.exact_hits + self.near_hits
+
+		return {
+			'lookups': self.lookups,
+			'exact': self.exact_hits,
+			'near': self.near_hits,
+			'entries': len(self.entries),
+			'dedup_rate': duplicates / self.lookups if self.lookups else 0.0
+		}
@@ -0,0 +1,323 @@
+import time
+import random
+import threading
+from typing import Callable, List, Optional, Tuple
+from src.RateLimiter import CircuitBreaker, CircuitOpenError, RateLimiter
+from src.LLMBackend import StreamingLLMBackend, AsyncStreamingLLMBackend
+from src.Metrics import metrics
+
+
+ROUTING_MODES = ('weighted', 'least-latency')
+
+
+class Deployment:
+	def __init__(self, name: str, client, weight: float=1.0, failure_threshold: int=3, cooldown: float=30.0):
+		'''
+		Initializes a deployment of a pool, with the health and latency the pool routes on.
+
+		:param name: str, name of the deployment.
+		:param client: client sending the requests of the deployment, with its own endpoint, model and rate limiter.
+		:param weight: float, share of the requests routed to the deployment in 'weighted' routing, defaults to 1.
+		:param failure_threshold: int, consecutive failures that take the deployment out of the pool, defaults to 3.
+		:param cooldown: float, seconds before a failed deployment is tried again, defaults to 30.
+		'''
+		if weight <= 0:
+			raise ValueError(f"Error: Weight of deployment '{name}' must be positive, got {weight}.")
+
+		self.name = name
+		self.client = client
+		self.weight = weight
+		self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=cooldown)
+		self.latency: Optional[float] = None
+		self.in_flight = 0
+		self.stats = {'requests': 0, 'failures': 0, 'failovers': 0}
+
+
+class DeploymentPool:
+	def __init__(self, deployments: List[Deployment], name: str='pool', routing: str='weighted', smoothing: float=0.2):
+		'''
+		Initializes the DeploymentPool class, spreading requests over several deployments and failing over between them.
+
+		Each request is routed to a healthy deployment, drawn by weight or picked for its lowest expected latency
+		given the requests it already has in flight. When a deployment fails after its own retries, the request
+		is sent to the next one. Consecutive failures take a deployment out of the pool for a cooldown, after
+		which a single trial request decides whether it comes back. Throttling fails over without counting as a
+		failure, since the deployment is healthy but out of quota.
+
+		:param deployments: list, Deployment classes of the pool.
+		:param name: str, name of the pool, used as its model in metrics, defaults to 'pool'.
+		:param routing: str, 'weighted' or 'least-latency', defaults to 'weighted'.
+		:param smoothing: float, weight of each new request in the latency of a deployment, defaults to 0.2.
+		'''
+		if not deployments:
+			raise ValueError(f"Error: Deployment pool '{name}' has no deployments.")
+		if routing not in ROUTING_MODES:
+			raise ValueError(f"Error: Unknown routing '{routing}', select from {', '.join(ROUTING_MODES)}.")
+
+		self.deployments = deployments
+		self.model = name
+		self.routing = routing
+		self.smoothing = smoothing
+		self.lock = threading.Lock()
+		# Draws from its own generator so routing never shifts the seeded random state of a run
+		self.random = random.Random()
+
+
+	def _order(self) -> List[Deployment]:
+		'''
+		Orders the deployments a request is tried on, healthy ones first in routing order.
+
+		:return: list, Deployment classes to try in turn.
+		'''
+		with self.lock:
+			healthy = [deployment for deployment in self.deployments if deployment.breaker.state != 'open']
+			if self.routing == 'least-latency':
+				# Trying deployments without a measured latency first, then the fastest given their load
+				return sorted(healthy, key=lambda deployment: ((deployment.latency or 0.0) * (deployment.in_flight + 1), deployment.in_flight))
+
+			order = []
+			while healthy:
+				deployment = self.random.choices(healthy, weights=[deployment.weight for deployment in healthy])[0]
+				order.append(deployment)
+				healthy.remove(deployment)
+
+			return order
+
+
+	def _acquire(self, deployment: Deployment) -> Tuple[bool, bool]:
+		'''
+		Reserves a deployment for a request, unless it was taken out of the pool meanwhile.
+
+		:param deployment: Deployment class.
+		:return: tuple, True if the request can be sent to the deployment, and True if it is the trial request of the deployment.
+		'''
+		with self.lock:
+			try:
+				trial = deployment.breaker.before_request()
+
+			except CircuitOpenError:
+				return False, False
+
+			deployment.in_flight += 1
+			deployment.stats['requests'] += 1
+
+		return True, trial
+
+
+	def _release(self, deployment: Deployment, start: float, trial: bool, error: Optional[BaseException]=None) -> bool:
+		'''
+		Records the outcome of a request sent to a deployment.
+
+		:param deployment: Deployment class.
+		:param start: float, time the request was sent at.
+		:param trial: bool, whether the request was the trial request of the deployment.
+		:param error: exception raised by the request, including cancellation and interrupts, None if it succeeded.
+		:return: bool, True if the request should be sent to another deployment.
+		'''
+		cause = error.__cause__ or error if error is not None else None
+		failover = isinstance(cause, Exception) and (isinstance(cause, CircuitOpenError) or RateLimiter.is_retryable(cause))
+		outcome = 'ok' if error is None else 'failover' if failover else 'error' if isinstance(error, Exception) else 'cancelled'
+
+		with self.lock:
+			deployment.in_flight -= 1
+			if error is None:
+				seconds = time.perf_counter() - start
+				deployment.latency = seconds if deployment.latency is None else (1 - self.smoothing) * deployment.latency + self.smoothing * seconds
+				deployment.breaker.record_success()
+			elif failover and getattr(cause, 'status_code', None) != 429:
+				deployment.stats['failures'] += 1
+				deployment.stats['failovers'] += 1
+				deployment.breaker.record_failure()
+			else:
+				# Neither throttling, errors caused by the request itself nor cancellation say anything about the health of the deployment
+				deployment.stats['failovers'] += failover
+				if trial:
+					deployment.breaker.release_trial()
+
+		metrics.inc('deployment_requests_total', pool=self.model, deployment=deployment.name, outcome=outcome)
+
+		return failover
+
+
+	def _route(self, send: Callable[[Deployment], object]):
+		'''
+		Sends a request to the deployments in routing order until one answers.
+
+		:param send: callable, sends the request to a deployment and returns its response.
+		:return: response of the first deployment that answered.
+		:raises RuntimeError: if every deployment failed or is out of the pool.
+		'''
+		error = None
+		for deployment in self._order():
+			acquired, trial = self._acquire(deployment)
+			if not acquired:
+				continue
+
+			start, settled = time.perf_counter(), False
+			try:
+				response = send(deployment)
+
+			except Exception as e:
+				error, settled = e, True
+				if self._release(deployment, start, trial, e):
+					continue
+				raise
+
+			except BaseException as e:
+				# Settling the deployment of a cancelled or interrupted request before it propagates
+				settled = True
+				self._release(deployment, start, trial, e)
+				raise
+
+			finally:
+				if not settled:
+					self._release(deployment, start, trial)
+
+			return response
+
+		raise RuntimeError(f"Error: No deployment of pool '{self.model}' could answer the request: {str(error) if error is not None else 'every deployment is out of the pool'}.")
+
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: Optional[dict]=None) -> str:
+		'''
+		Generates a response from the deployments of the pool.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param response_format: dict, optional structured output format, such as a JSON schema the response must follow.
+		:return: str, response generated by the model.
+		:raises RuntimeError: if every deployment failed.
+		'''
+		return self._route(lambda deployment: deployment.client.generate_response(
+			user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens, response_format=response_format
+		))
+
+
+	def stream_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, stop_at: Optional[Callable[[str], Optional[int]]]=None) -> str:
+		'''
+		Streams a response from the deployments of the pool, or generates it from deployments that cannot stream.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param stop_at: callable, optional, called with the text received so far, returning the position it ends at to stop the stream.
+		:return: str, response generated by the model.
+		:raises RuntimeError: if every deployment failed.
+		'''
+		def send(deployment: Deployment) -> str:
+			if isinstance(deployment.client, StreamingLLMBackend):
+				return deployment.client.stream_response(user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens, stop_at=stop_at)
+
+			return deployment.client.generate_response(user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens)
+
+		return self._route(send)
+
+
+	def stats(self) -> dict:
+		'''
+		Returns the traffic, health and latency of each deployment of the pool.
+
+		:return: dict, statistics of each deployment, by name.
+		'''
+		with self.lock:
+			return {
+				deployment.name: {
+					**deployment.stats,
+					'weight': deployment.weight,
+					'health': 'healthy' if deployment.breaker.state == 'closed' else 'unhealthy',
+					'latency_ms': round(deployment.latency * 1000, 3) if deployment.latency is not None else None
+				}
+				for deployment in self.deployments
+			}
+
+
+class AsyncDeploymentPool(DeploymentPool):
+	'''
+	Asynchronous counterpart of DeploymentPool over asynchronous clients, used by the 'async' and 'pipeline' round modes.
+	'''
+	async def _route(self, send: Callable[[Deployment], object]):
+		'''
+		Sends a request to the deployments in routing order until one answers, without blocking the event loop.
+
+		:param send: callable, returns an awaitable sending the request to a deployment.
+		:return: response of the first deployment that answered.
+		:raises RuntimeError: if every deployment failed or is out of the pool.
+		'''
+		error = None
+		for deployment in self._order():
+			acquired, trial = self._acquire(deployment)
+			if not acquired:
+				continue
+
+			start, settled = time.perf_counter(), False
+			try:
+				response = await send(deployment)
+
+			except Exception as e:
+				error, settled = e, True
+				if self._release(deployment, start, trial, e):
+					continue
+				raise
+
+			except BaseException as e:
+				# Settling the deployment of a cancelled or interrupted request before it propagates
+				settled = True
+				self._release(deployment, start, trial, e)
+				raise
+
+			finally:
+				if not settled:
+					self._release(deployment, start, trial)
+
+			return response
+
+		raise RuntimeError(f"Error: No deployment of pool '{self.model}' could answer the request: {str(error) if error is not None else 'every deployment is out of the pool'}.")
+
+
+	async def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: Optional[dict]=None) -> str:
+		'''
+		Generates a response from the deployments of the pool without blocking the event loop.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param response_format: dict, optional structured output format, such as a JSON schema the response must follow.
+		:return: str, response generated by the model.
+		:raises RuntimeError: if every deployment failed.
+		'''
+		return await self._route(lambda deployment: deployment.client.generate_response(
+			user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens, response_format=response_format
+		))
+
+
+	async def stream_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, stop_at: Optional[Callable[[str], Optional[int]]]=None) -> str:
+		'''
+		Streams a response from the deployments of the pool without blocking the event loop.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param stop_at: callable, optional, called with the text received so far, returning the position it ends at to stop the stream.
+		:return: str, response generated by the model.
+		:raises RuntimeError: if every deployment failed.
+		'''
+		def send(deployment: Deployment):
+			if isinstance(deployment.client, AsyncStreamingLLMBackend):
+				return deployment.client.stream_response(user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens, stop_at=stop_at)
+
+			return deployment.client.generate_response(user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens)
+
+		return await self._route(send)
+
+
+	async def close(self) -> None:
+		'''
+		Closes the connections of every deployment.
+		'''
+		for deployment in self.deployments:
+			await deployment.client.close()
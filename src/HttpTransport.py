@@ -0,0 +1,181 @@
+import threading
+import importlib.util
+from typing import Optional
+import httpx
+from src.Metrics import metrics
+
+
+class HttpTransport:
+	def __init__(self, max_connections: int=1000, max_keepalive_connections: int=100, keepalive_expiry: float=5.0, connect_timeout: float=5.0, read_timeout: float=600.0, http2: bool=False):
+		'''
+		Initializes the HttpTransport class, holding the HTTP connection pools shared by every client of a process.
+
+		Each SDK client otherwise opens its own pool, so the mutation, evaluation and judge clients of a run pay for
+		separate connections and handshakes to the same endpoint. The synchronous and asynchronous clients get one
+		pool each, created on first use with the limits, keep-alive and timeouts of the transport, and every request
+		sent through them is counted with the connections it had to open.
+
+		:param max_connections: int, maximum number of open connections of a pool, defaults to 1000.
+		:param max_keepalive_connections: int, maximum number of idle connections kept alive, at most max_connections, defaults to 100.
+		:param keepalive_expiry: float, seconds an idle connection is kept alive, defaults to 5.
+		:param connect_timeout: float, seconds allowed to open a connection, defaults to 5.
+		:param read_timeout: float, seconds allowed between two reads of a response, defaults to 600.
+		:param http2: bool, whether to negotiate HTTP/2, which needs the h2 package, defaults to False.
+		'''
+		self.lock = threading.Lock()
+		self.sync_pool: Optional[httpx.Client] = None
+		self.async_pool: Optional[httpx.AsyncClient] = None
+		self.counts = {'requests': 0, 'connections': 0}
+		self.configure(
+			max_connections=max_connections, max_keepalive_connections=max_keepalive_connections, keepalive_expiry=keepalive_expiry,
+			connect_timeout=connect_timeout, read_timeout=read_timeout, http2=http2
+		)
+
+
+	def configure(self, **settings) -> None:
+		'''
+		Changes the settings of the transport. Pools created before keep their settings and are no longer handed out.
+
+		:param settings: settings named as the arguments of the constructor.
+		'''
+		settings = {**getattr(self, 'settings', {}), **settings}
+		if not 0 < settings['max_connections']:
+			raise ValueError(f"Error: Maximum number of connections must be positive, got {settings['max_connections']}.")
+		if settings['max_keepalive_connections'] < 0:
+			raise ValueError(f"Error: Maximum number of keep-alive connections cannot be negative, got {settings['max_keepalive_connections']}.")
+		if settings['http2'] and importlib.util.find_spec('h2') is None:
+			raise ValueError("Error: HTTP/2 requires the h2 package, install it with 'pip install httpx[http2]'.")
+
+		with self.lock:
+			self.settings = settings
+			self.sync_pool, self.async_pool = None, None
+
+
+	def _options(self) -> dict:
+		'''
+		Returns the limits, timeouts and protocol options of a pool.
+		'''
+		return {
+			'limits': httpx.Limits(
+				max_connections=self.settings['max_connections'],
+				max_keepalive_connections=min(self.settings['max_keepalive_connections'], self.settings['max_connections']),
+				keepalive_expiry=self.settings['keepalive_expiry']
+			),
+			'timeout': httpx.Timeout(self.settings['read_timeout'], connect=self.settings['connect_timeout']),
+			'http2': self.settings['http2']
+		}
+
+
+	def _record(self, event: str) -> None:
+		'''
+		Counts a request, or a connection opened by the pool for it.
+		'''
+		if event not in ('request', 'connection.connect_tcp.complete'):
+			return
+
+		key = 'requests' if event == 'request' else 'connections'
+		with self.lock:
+			self.counts[key] += 1
+		metrics.inc('http_requests_total' if event == 'request' else 'http_connections_opened_total')
+
+
+	def client(self) -> httpx.Client:
+		'''
+		Returns the shared pool of the synchronous clients, creating it on first use.
+
+		:return: httpx.Client object, to pass as the http_client of AzureOpenAIClient.
+		'''
+		def trace(event: str, info: dict) -> None:
+			self._record(event)
+
+		def on_request(request: httpx.Request) -> None:
+			self._record('request')
+			request.extensions['trace'] = trace
+
+		with self.lock:
+			if self.sync_pool is None:
+				self.sync_pool = httpx.Client(event_hooks={'request': [on_request]}, **self._options())
+
+			return self.sync_pool
+
+
+	def async_client(self) -> httpx.AsyncClient:
+		'''
+		Returns the shared pool of the asynchronous clients, creating it on first use. Its connections belong to the
+		event loop they are opened on, so it must be used and closed on a single event loop.
+
+		:return: httpx.AsyncClient object, to pass as the http_client of AsyncAzureOpenAIClient.
+		'''
+		async def trace(event: str, info: dict) -> None:
+			self._record(event)
+
+		async def on_request(request: httpx.Request) -> None:
+			self._record('request')
+			request.extensions['trace'] = trace
+
+		with self.lock:
+			if self.async_pool is None:
+				self.async_pool = httpx.AsyncClient(event_hooks={'request': [on_request]}, **self._options())
+
+			return self.async_pool
+
+
+	def stats(self) -> dict:
+		'''
+		Returns the utilisation of the pools: requests sent, connections opened and reused, and open connections.
+
+		:return: dict, pool statistics.
+		'''
+		with self.lock:
+			counts = dict(self.counts)
+			clients = [client for client in (self.sync_pool, self.async_pool) if client is not None]
+
+		# Reading the open connections of the pools behind the clients, when the transport exposes them
+		connections = []
+		for client in clients:
+			pool = getattr(getattr(client, '_transport', None), '_pool', None)
+			connections.extend(getattr(pool, 'connections', []))
+		idle = sum(1 for connection in connections if connection.is_idle())
+
+		return {
+			'requests': counts['requests'],
+			'connections_opened': counts['connections'],
+			'reuse_ratio': round(1 - counts['connections'] / counts['requests'], 3) if counts['requests'] else 0.0,
+			'open_connections': len(connections),
+			'active_connections': len(connections) - idle,
+			'idle_connections': idle,
+			'max_connections': self.settings['max_connections'],
+			'http2': self.settings['http2']
+		}
+
+
+	def close(self) -> None:
+		'''
+		Closes the synchronous pool. The asynchronous pool is closed with aclose on its event loop.
+		'''
+		with self.lock:
+			client, self.sync_pool = self.sync_pool, None
+		if client is not None:
+			client.close()
+
+
+	async def aclose(self) -> None:
+		'''
+		Closes the asynchronous pool.
+		'''
+		with self.lock:
+			client, self.async_pool = self.async_pool, None
+		if client is not None:
+			await client.aclose()
+
+
+	def reset(self) -> None:
+		'''
+		Starts counting the requests and connections of a run from zero.
+		'''
+		with self.lock:
+			self.counts = {'requests': 0, 'connections': 0}
+
+
+# HTTP transport shared by the clients of the process, configured by a run from its arguments
+transport = HttpTransport()
@@ -0,0 +1,194 @@
+import math
+from statistics import NormalDist
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from scripts.data_handling import Problem
+from scripts.mutation import EVALUATION_SYSTEM_MESSAGE, build_evaluation_prompt, evaluation_request_options, evaluation_settings, parse_score
+from src.DedupIndex import DedupIndex
+from src.Metrics import metrics
+
+
+class JudgeEnsemble:
+	def __init__(self, judges: List[Tuple[str, object, str]], k: int, confidence: float=0.9, prior_sd: float=1.5, concurrency: int=8, dedup_index: Optional[DedupIndex]=None):
+		'''
+		Initializes the JudgeEnsemble class, scoring the problems of a round with several judges only where it can change the top k.
+
+		The first judge is the evaluation every problem gets during the round. Each problem then has a confidence interval
+		around its mean score, and only the problems whose interval straddles the cutoff between the k-th and the k+1-th
+		mean are asked to the next judge, in parallel, until no interval straddles the cutoff or the judges run out.
+		Problems clearly inside or outside the top k are not evaluated again.
+
+		Judges are calibrated against the first one before their scores are averaged: each score is shifted by the mean
+		difference between the first judge and the judge on every problem both scored so far in the run, so a lenient or
+		strict judge does not move the problems it happens to be asked about.
+
+		:param judges: list, name, client and evaluation template of each judge, the first one being the evaluation of the round.
+		:param k: int, number of problems retained each round.
+		:param confidence: float, confidence level of the intervals, defaults to 0.9.
+		:param prior_sd: float, standard deviation assumed for the scores of a judge before any disagreement is seen, defaults to 1.5.
+		:param concurrency: int, maximum number of judge requests in flight, defaults to 8.
+		:param dedup_index: DedupIndex object, optional, whose scores are replaced with the ensemble scores.
+		'''
+		if not judges:
+			raise ValueError("Error: The ensemble needs at least one judge.")
+		if not 0.0 < confidence < 1.0:
+			raise ValueError(f"Error: Confidence must be in (0, 1), got {confidence}.")
+
+		self.judges = judges
+		self.k = k
+		self.z = NormalDist().inv_cdf((1.0 + confidence) / 2.0)
+		self.prior_variance = prior_sd ** 2
+		self.concurrency = max(concurrency, 1)
+		self.dedup_index = dedup_index
+		# Sum and number of the differences between the first judge and each judge, over the problems both scored
+		self.calibration = [[0.0, 0] for _ in judges]
+		self.calls = 0
+		self.full_calls = 0
+		self.stopped_early = 0
+
+
+	def interval(self, scores: List[float]) -> Tuple[float, float]:
+		'''
+		Computes the mean of the scores of a problem and the half width of its confidence interval.
+
+		The variance is shrunk towards the prior, so a single score or judges agreeing by chance do not give a narrow interval.
+
+		:param scores: list, scores given by the judges so far.
+		:return: tuple, mean score and half width of the interval.
+		'''
+		n = len(scores)
+		mean = sum(scores) / n
+		variance = (self.prior_variance + sum((score - mean) ** 2 for score in scores)) / n
+
+		return mean, self.z * math.sqrt(variance / n)
+
+
+	def calibrated(self, scores: Dict[int, float]) -> List[float]:
+		'''
+		Shifts the scores of a problem onto the scale of the first judge.
+
+		:param scores: dict, score given by each judge, by position.
+		:return: list, calibrated scores.
+		'''
+		calibrated = []
+		for position, score in scores.items():
+			total, count = self.calibration[position]
+			calibrated.append(score + (total / count if count else 0.0))
+
+		return calibrated
+
+
+	def borderline(self, problems: List[Problem], samples: Dict[str, Dict[int, float]], asked: Dict[str, int]) -> List[Problem]:
+		'''
+		Returns the problems whose interval straddles the top k cutoff and that have judges left.
+
+		:param problems: list, evaluated Problem classes of the round.
+		:param samples: dict, score given by each judge, by position, of each problem id.
+		:param asked: dict, number of judges each problem id was asked to.
+		:return: list, Problem classes to ask to their next judge.
+		'''
+		if len(problems) <= self.k or self.k <= 0:
+			return []
+
+		intervals = {problem.id: self.interval(self.calibrated(samples[problem.id])) for problem in problems}
+		means = sorted((mean for mean, _ in intervals.values()), reverse=True)
+		cutoff = (means[self.k - 1] + means[self.k]) / 2
+
+		return [
+			problem for problem in problems
+			if asked[problem.id] < len(self.judges) and abs(intervals[problem.id][0] - cutoff) <= intervals[problem.id][1]
+		]
+
+
+	def judge(self, problem: Problem, position: int) -> Optional[float]:
+		'''
+		Asks a judge to score a problem, leaving its score and the evaluation metrics of the round untouched.
+
+		:param problem: mutated Problem class.
+		:param position: int, position of the judge.
+		:return: float, score given by the judge, None if the evaluation failed.
+		'''
+		name, client, template = self.judges[position]
+		options = evaluation_request_options()
+		try:
+			prompt = build_evaluation_prompt(problem=problem, evaluation_template=template)
+			for attempt in range(evaluation_settings['retries'] + 1):
+				# Asking again at temperature 0 when no score could be parsed from the response
+				response = client.generate_response(
+					system_message=EVALUATION_SYSTEM_MESSAGE,
+					user_input=prompt,
+					**(options if attempt == 0 else {**options, 'temperature': 0.0})
+				)
+				try:
+					score = parse_score(response)
+					break
+
+				except ValueError:
+					if attempt == evaluation_settings['retries']:
+						raise
+
+		except Exception as e:
+			problem.warnings_log.append(f"Warning: Judge {name} could not score the problem: {str(e)}")
+			metrics.inc('ensemble_evaluations_total', judge=name, outcome='error')
+			return None
+
+		metrics.inc('ensemble_evaluations_total', judge=name, outcome='ok')
+
+		return score
+
+
+	def refine(self, problems: List[Problem]) -> List[Problem]:
+		'''
+		Asks further judges about the borderline problems of a round and sets the score of every problem to its mean.
+
+		:param problems: list, Problem classes of the round, scored by the first judge.
+		:return: list, same Problem classes with their ensemble scores.
+		'''
+		problems = [problem for problem in problems if problem.mutated and problem.score is not None]
+		samples = {problem.id: {0: problem.score} for problem in problems}
+		asked = {problem.id: 1 for problem in problems}
+
+		with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+			candidates = self.borderline(problems, samples, asked)
+			while candidates:
+				scores = list(executor.map(lambda problem: self.judge(problem, asked[problem.id]), candidates))
+				for problem, score in zip(candidates, scores):
+					position = asked[problem.id]
+					asked[problem.id] += 1
+					if score is not None:
+						samples[problem.id][position] = score
+						self.calibration[position][0] += samples[problem.id][0] - score
+						self.calibration[position][1] += 1
+
+				candidates = self.borderline(problems, samples, asked)
+
+		for problem in problems:
+			if len(samples[problem.id]) > 1:
+				scores = self.calibrated(samples[problem.id])
+				problem.score = sum(scores) / len(scores)
+				# Letting later duplicates of the problem reuse its ensemble score
+				if self.dedup_index is not None:
+					self.dedup_index.update(key=problem.id, value=problem.score)
+
+		# Comparing the calls made with asking every judge about every problem
+		calls = sum(asked.values()) - len(problems)
+		self.calls += calls
+		self.full_calls += len(problems) * (len(self.judges) - 1)
+		self.stopped_early += sum(1 for problem in problems if asked[problem.id] < len(self.judges))
+		metrics.inc('ensemble_calls_saved_total', len(problems) * (len(self.judges) - 1) - calls)
+
+		return problems
+
+
+	def stats(self) -> dict:
+		'''
+		Returns the ensemble counters.
+
+		:return: dict, number of judges, judge calls made, calls a full ensemble would have made and problems stopped early.
+		'''
+		return {
+			'judges': len(self.judges),
+			'calls': self.calls,
+			'full_ensemble_calls': self.full_calls,
+			'stopped_early': self.stopped_early
+		}
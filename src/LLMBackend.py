@@ -0,0 +1,98 @@
+from typing import Callable, Optional, Protocol, runtime_checkable
+
+@runtime_checkable
+class LLMBackend(Protocol):
+	"""
+	Interface of the clients used for mutation and evaluation requests.
+
+	AzureOpenAIClient and MockLLMClient implement it, and any object with the same method can be passed to the
+	mutation functions and round drivers.
+	"""
+	model: str
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: Optional[dict]=None) -> str:
+		"""
+		Generates a response from the user input.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param response_format: dict, optional structured output format, such as a JSON schema the response must follow.
+		:return: str, response generated by the model.
+		:raises RuntimeError: if the request fails.
+		"""
+		...
+
+
+@runtime_checkable
+class AsyncLLMBackend(Protocol):
+	"""
+	Interface of the asynchronous clients used by the 'async' and 'pipeline' round modes.
+	"""
+	model: str
+
+	async def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: Optional[dict]=None) -> str:
+		"""
+		Generates a response from the user input without blocking the event loop.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param response_format: dict, optional structured output format, such as a JSON schema the response must follow.
+		:return: str, response generated by the model.
+		:raises RuntimeError: if the request fails.
+		"""
+		...
+
+
+	async def close(self) -> None:
+		"""
+		Closes the connections of the client.
+		"""
+		...
+
+
+@runtime_checkable
+class StreamingLLMBackend(Protocol):
+	"""
+	Interface of the clients able to stream mutation responses, implemented by AzureOpenAIClient.
+	"""
+	model: str
+
+	def stream_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, stop_at: Optional[Callable[[str], Optional[int]]]=None) -> str:
+		"""
+		Streams a response from the user input, stopping as soon as stop_at finds where it ends.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param stop_at: callable, optional, called with the text received so far, returning the position it ends at to stop the stream, or None to continue.
+		:return: str, response generated by the model, cut where the stream was stopped.
+		:raises RuntimeError: if the request fails.
+		"""
+		...
+
+
+@runtime_checkable
+class AsyncStreamingLLMBackend(Protocol):
+	"""
+	Interface of the asynchronous clients able to stream mutation responses, implemented by AsyncAzureOpenAIClient.
+	"""
+	model: str
+
+	async def stream_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, stop_at: Optional[Callable[[str], Optional[int]]]=None) -> str:
+		"""
+		Streams a response from the user input without blocking the event loop, stopping as soon as stop_at finds where it ends.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, degree of randomness in the generated response.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param stop_at: callable, optional, called with the text received so far, returning the position it ends at to stop the stream, or None to continue.
+		:return: str, response generated by the model, cut where the stream was stopped.
+		:raises RuntimeError: if the request fails.
+		"""
+		...
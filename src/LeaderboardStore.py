@@ -0,0 +1,122 @@
+import os
+import json
+import uuid
+import sqlite3
+import datetime
+import threading
+from typing import List, Optional
+from src.LineageStore import LineageStore, lineage
+
+class LeaderboardStore:
+	def __init__(self, path: str='logs/leaderboard.sqlite', run_id: Optional[str]=None, lineage_store: Optional[LineageStore]=None):
+		'''
+		Initializes the LeaderboardStore class, an append-only leaderboard written one evaluated problem at a time.
+
+		Rows do not copy the mutation log, they hold how many mutations of the problem the lineage store had when
+		the row was appended, so the cost of a write does not grow with the history of the problem. Every row is
+		committed as it is appended.
+
+		:param path: str, SQLite database file path, defaults to logs/leaderboard.sqlite
+		:param run_id: str, optional identifier of the run rows are appended for, defaults to a new UUID.
+		:param lineage_store: LineageStore object holding the mutation history, defaults to the shared lineage store.
+		'''
+		self.path = path
+		self.run_id = run_id or str(uuid.uuid4())
+		self.lineage = lineage_store or lineage
+		self.lock = threading.Lock()
+
+		# Creating logs folder if it does not exist
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		self.connection.execute('PRAGMA journal_mode=WAL')
+		self.connection.execute('PRAGMA synchronous=NORMAL')
+		self.connection.execute(
+			'CREATE TABLE IF NOT EXISTS leaderboard ('
+			'seq INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, round INTEGER NOT NULL, ts TEXT NOT NULL, '
+			'id TEXT NOT NULL, original_description TEXT, mutated_description TEXT, mutated INTEGER, score REAL, '
+			'history_length INTEGER NOT NULL, error_logs TEXT, warnings_log TEXT)'
+		)
+		self.connection.execute('CREATE INDEX IF NOT EXISTS leaderboard_round ON leaderboard (run_id, round)')
+		self.connection.execute('CREATE INDEX IF NOT EXISTS leaderboard_score ON leaderboard (score)')
+		self.connection.execute('CREATE INDEX IF NOT EXISTS leaderboard_id ON leaderboard (id)')
+		self.connection.commit()
+
+
+	def append(self, problem, n_round: int) -> None:
+		'''
+		Appends the current state of an evaluated problem.
+
+		:param problem: Problem class to append.
+		:param n_round: int, round the problem was evaluated in.
+		'''
+		history_length = self.lineage.count(problem.id)
+		with self.lock:
+			self.connection.execute(
+				'INSERT INTO leaderboard (run_id, round, ts, id, original_description, mutated_description, mutated, score, '
+				'history_length, error_logs, warnings_log) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+				(
+					self.run_id, n_round, str(datetime.datetime.now()), str(problem.id), problem.original_description,
+					problem.mutated_description, int(problem.mutated), problem.score, history_length,
+					json.dumps(problem.error_logs), json.dumps(problem.warnings_log)
+				)
+			)
+			self.connection.commit()
+
+
+	def last_round(self, run_id: Optional[str]=None) -> Optional[int]:
+		'''
+		Returns the last round with entries in a run.
+
+		:param run_id: str, optional run identifier, defaults to the run of the store.
+		:return: int, last round, None if the run has no entries.
+		'''
+		with self.lock:
+			return self.connection.execute(
+				'SELECT MAX(round) FROM leaderboard WHERE run_id = ?', (run_id or self.run_id,)
+			).fetchone()[0]
+
+
+	def entries(self, n_round: Optional[int]=None, run_id: Optional[str]=None) -> List[dict]:
+		'''
+		Returns the entries of a round in the leaderboard YAML format, loading mutation logs from the lineage store.
+
+		:param n_round: int, optional round, defaults to the last round of the run.
+		:param run_id: str, optional run identifier, defaults to the run of the store.
+		:return: list, list of leaderboard entries in the order they were evaluated.
+		'''
+		run_id = run_id or self.run_id
+		if n_round is None:
+			n_round = self.last_round(run_id)
+
+		with self.lock:
+			rows = self.connection.execute(
+				'SELECT ts, id, original_description, mutated_description, mutated, score, history_length, error_logs, warnings_log '
+				'FROM leaderboard WHERE run_id = ? AND round = ? ORDER BY seq', (run_id, n_round)
+			).fetchall()
+
+		entries = []
+		for ts, problem_id, original_description, mutated_description, mutated, score, history_length, error_logs, warnings_log in rows:
+			entries.append({
+				'ts': ts,
+				'id': problem_id,
+				'original_description': original_description,
+				'mutated_description': mutated_description,
+				'mutated': bool(mutated),
+				'score': score,
+				'mutation_log': self.lineage.history(problem_id, limit=history_length),
+				'error_logs': json.loads(error_logs),
+				'warnings_log': json.loads(warnings_log)
+			})
+
+		return entries
+
+
+	def close(self) -> None:
+		'''
+		Closes the database connection.
+		'''
+		with self.lock:
+			self.connection.close()
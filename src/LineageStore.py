@@ -0,0 +1,218 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+class LineageStore:
+	def __init__(self, path: str=':memory:'):
+		'''
+		Initializes the LineageStore class, the store of the mutation history of problems.
+
+		Templates and statements are interned once under the digest of their text, so a mutation is recorded as a
+		template id, a statement id and its result instead of the expanded prompt. Problems do not hold their history,
+		it is only read back when it is requested. The parent of each problem is recorded as well, so the ancestors and
+		descendants of a problem can be queried across generations.
+
+		:param path: str, SQLite database file path, defaults to an in-memory database.
+		'''
+		self.lock = threading.Lock()
+		self.connection = None
+		self.connect(path)
+
+
+	def connect(self, path: str) -> None:
+		'''
+		Switches the store to a database, creating it if it does not exist.
+
+		:param path: str, SQLite database file path, ':memory:' for an in-memory database.
+		'''
+		with self.lock:
+			if self.connection is not None:
+				self.connection.close()
+
+			# Creating logs folder if it does not exist
+			directory = os.path.dirname(path)
+			if directory:
+				os.makedirs(directory, exist_ok=True)
+
+			self.path = path
+			self.connection = sqlite3.connect(path, check_same_thread=False)
+			if path != ':memory:':
+				self.connection.execute('PRAGMA journal_mode=WAL')
+				self.connection.execute('PRAGMA synchronous=NORMAL')
+			self.connection.execute('CREATE TABLE IF NOT EXISTS texts (id TEXT PRIMARY KEY, text TEXT NOT NULL)')
+			self.connection.execute(
+				'CREATE TABLE IF NOT EXISTS mutations (seq INTEGER PRIMARY KEY AUTOINCREMENT, problem_id TEXT NOT NULL, '
+				'template_id TEXT NOT NULL, statement_id TEXT NOT NULL, result TEXT)'
+			)
+			self.connection.execute('CREATE INDEX IF NOT EXISTS mutations_problem ON mutations (problem_id, seq)')
+			self.connection.execute('CREATE TABLE IF NOT EXISTS parents (id TEXT PRIMARY KEY, parent_id TEXT NOT NULL, generation INTEGER NOT NULL)')
+			self.connection.execute('CREATE INDEX IF NOT EXISTS parents_parent ON parents (parent_id)')
+			self.connection.commit()
+
+
+	@staticmethod
+	def text_id(text: str) -> str:
+		'''
+		Returns the id a text is interned under.
+
+		:param text: str, template or statement.
+		:return: str, digest of the text.
+		'''
+		return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+	def _intern(self, text: str) -> str:
+		'''
+		Stores a text once and returns its id. Must be called holding the lock.
+		'''
+		text_id = self.text_id(text)
+		self.connection.execute('INSERT OR IGNORE INTO texts (id, text) VALUES (?, ?)', (text_id, text))
+
+		return text_id
+
+
+	def record(self, problem_id: str, template: str, statement: str, result: str) -> Tuple[str, str]:
+		'''
+		Records a mutation of a problem.
+
+		:param problem_id: str, problem identifier.
+		:param template: str, prompt template of the mutation.
+		:param statement: str, statement the template was formatted with.
+		:param result: str, mutated statement returned by the model.
+		:return: tuple, template id and statement id of the mutation.
+		'''
+		with self.lock:
+			template_id, statement_id = self._intern(template), self._intern(statement)
+			self.connection.execute(
+				'INSERT INTO mutations (problem_id, template_id, statement_id, result) VALUES (?, ?, ?, ?)',
+				(str(problem_id), template_id, statement_id, result)
+			)
+			self.connection.commit()
+
+		return template_id, statement_id
+
+
+	def _rows(self, problem_id: str, limit: Optional[int]=None) -> list:
+		'''
+		Returns the template id, statement id, template, statement and result of each mutation of a problem in order.
+		'''
+		with self.lock:
+			return self.connection.execute(
+				'SELECT m.template_id, m.statement_id, t.text, s.text, m.result FROM mutations m '
+				'JOIN texts t ON t.id = m.template_id JOIN texts s ON s.id = m.statement_id '
+				'WHERE m.problem_id = ? ORDER BY m.seq LIMIT ?', (str(problem_id), -1 if limit is None else limit)
+			).fetchall()
+
+
+	def history(self, problem_id: str, limit: Optional[int]=None) -> List[dict]:
+		'''
+		Loads the mutation history of a problem, expanding each prompt from its template and statement.
+
+		:param problem_id: str, problem identifier.
+		:param limit: int, optional number of first mutations to load, defaults to all of them.
+		:return: list, mutation log entries with template_id, statement_id, prompt and result.
+		'''
+		return [
+			{
+				'template_id': template_id,
+				'statement_id': statement_id,
+				'prompt': template.format(statement=statement),
+				'result': result
+			}
+			for template_id, statement_id, template, statement, result in self._rows(problem_id, limit)
+		]
+
+
+	def export(self, problem_id: str) -> List[Tuple[str, str, str]]:
+		'''
+		Returns the mutations of a problem as texts, so they can be recorded again in another store.
+
+		:param problem_id: str, problem identifier.
+		:return: list, template, statement and result of each mutation.
+		'''
+		return [(template, statement, result) for _, _, template, statement, result in self._rows(problem_id)]
+
+
+	def link(self, problem_id: str, parent_id: str, generation: int) -> None:
+		'''
+		Records the parent of a problem.
+
+		:param problem_id: str, identifier of the child.
+		:param parent_id: str, identifier of the problem the child was spawned from.
+		:param generation: int, generation of the child.
+		'''
+		with self.lock:
+			self.connection.execute(
+				'INSERT OR REPLACE INTO parents (id, parent_id, generation) VALUES (?, ?, ?)', (str(problem_id), str(parent_id), generation)
+			)
+			self.connection.commit()
+
+
+	def ancestors(self, problem_id: str) -> List[str]:
+		'''
+		Returns the ancestors of a problem.
+
+		:param problem_id: str, problem identifier.
+		:return: list, identifiers of the ancestors from the parent to the root.
+		'''
+		with self.lock:
+			rows = self.connection.execute(
+				'WITH RECURSIVE chain (id, parent_id, depth) AS ('
+				'SELECT id, parent_id, 1 FROM parents WHERE id = ? '
+				'UNION ALL SELECT p.id, p.parent_id, c.depth + 1 FROM parents p JOIN chain c ON p.id = c.parent_id) '
+				'SELECT parent_id FROM chain ORDER BY depth', (str(problem_id),)
+			).fetchall()
+
+		return [parent_id for (parent_id,) in rows]
+
+
+	def descendants(self, problem_id: str) -> List[Tuple[str, int]]:
+		'''
+		Returns the descendants of a problem.
+
+		:param problem_id: str, problem identifier.
+		:return: list, identifier and generation of each descendant, by generation.
+		'''
+		with self.lock:
+			return self.connection.execute(
+				'WITH RECURSIVE tree (id, generation) AS ('
+				'SELECT id, generation FROM parents WHERE parent_id = ? '
+				'UNION ALL SELECT p.id, p.generation FROM parents p JOIN tree t ON p.parent_id = t.id) '
+				'SELECT id, generation FROM tree ORDER BY generation, id', (str(problem_id),)
+			).fetchall()
+
+
+	def count(self, problem_id: str) -> int:
+		'''
+		Returns the number of mutations recorded for a problem.
+
+		:param problem_id: str, problem identifier.
+		:return: int, number of mutations.
+		'''
+		with self.lock:
+			return self.connection.execute('SELECT COUNT(*) FROM mutations WHERE problem_id = ?', (str(problem_id),)).fetchone()[0]
+
+
+	def discard(self, problem_id: str) -> None:
+		'''
+		Removes the mutations of a problem, leaving interned texts in place.
+
+		:param problem_id: str, problem identifier.
+		'''
+		with self.lock:
+			self.connection.execute('DELETE FROM mutations WHERE problem_id = ?', (str(problem_id),))
+			self.connection.commit()
+
+
+	def close(self) -> None:
+		'''
+		Closes the database connection.
+		'''
+		with self.lock:
+			self.connection.close()
+
+
+# Lineage store shared by every problem of the process, kept in memory until a run connects it to a file
+lineage = LineageStore()
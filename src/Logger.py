@@ -1,19 +1,89 @@
+import os
+import json
+import queue
+import atexit
 import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Attributes every LogRecord has, anything else on a record comes from the extra fields of the call
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+	def format(self, record: logging.LogRecord) -> str:
+		'''
+		Formats a record as a single JSON line with its extra fields, such as problem_id, round, strategy or latency.
+
+		:param record: LogRecord to format.
+		:return: str, JSON line.
+		'''
+		entry = {
+			'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+			'level': record.levelname,
+			'logger': record.name,
+			'message': record.getMessage()
+		}
+		entry.update({key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES})
+		if record.exc_info:
+			entry['exception'] = self.formatException(record.exc_info)
+
+		return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+	def format(self, record: logging.LogRecord) -> str:
+		'''
+		Formats a record as text, appending its extra fields as key=value pairs.
+
+		:param record: LogRecord to format.
+		:return: str, formatted line.
+		'''
+		text = super().format(record)
+		fields = ' '.join(f'{key}={value}' for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+
+		return f'{text} [{fields}]' if fields else text
+
 
 class Logger:
-	def __init__(self, log_file='logs/app.log', level=logging.DEBUG):
+	# Listener of each configured logger name, so building a Logger again replaces handlers instead of adding more
+	_listeners = {}
+
+	def __init__(self, log_file='logs/app.log', level=logging.DEBUG, log_format='text', max_bytes=10 * 1024 * 1024, backup_count=5):
 		'''
 		Initializes the Logger class.
 
+		Records are put on a queue by the calling thread and formatted and written by a background listener,
+		so logging does not block requests in flight.
+
 		:param log_file: str, file path for logging output, defaults to logs/app.log
 		:param level: Logging level (default is DEBUG)
+		:param log_format: str, 'text' or 'json' for JSON lines in the log file, defaults to 'text'.
+		:param max_bytes: int, size in bytes at which the log file is rotated, 0 to never rotate, defaults to 10 MB.
+		:param backup_count: int, number of rotated log files kept, defaults to 5.
 		'''
+		if log_format not in ('text', 'json'):
+			raise ValueError(f"Error: Unknown log format '{log_format}'.")
+
 		# Creating a custom logger
 		self.logger = logging.getLogger(__name__)
 		self.logger.setLevel(level)
+		self.logger.propagate = False
+
+		# Stopping the listener of a previous setup and removing its handlers
+		previous = Logger._listeners.pop(self.logger.name, None)
+		if previous is not None:
+			Logger._stop(previous)
+		for handler in list(self.logger.handlers):
+			self.logger.removeHandler(handler)
+			handler.close()
+
+		# Creating logs folder if it does not exist
+		if os.path.dirname(log_file):
+			os.makedirs(os.path.dirname(log_file), exist_ok=True)
 
 		# Creating handlers
-		file_handler = logging.FileHandler(log_file)
+		file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
 		stream_handler = logging.StreamHandler()
 
 		# Setting level for handlers
@@ -21,56 +91,98 @@ class Logger:
 		stream_handler.setLevel(level)
 
 		# Creating formatters and adding them to handlers
-		file_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-		stream_format = logging.Formatter('%(levelname)s - %(message)s')
+		file_format = JsonFormatter() if log_format == 'json' else TextFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+		stream_format = TextFormatter('%(levelname)s - %(message)s')
 		file_handler.setFormatter(file_format)
 		stream_handler.setFormatter(stream_format)
 
-		# Adding handlers to the logger
-		self.logger.addHandler(file_handler)
-		self.logger.addHandler(stream_handler)
+		# Adding a queue handler to the logger and the writing handlers to its listener
+		log_queue = queue.SimpleQueue()
+		self.logger.addHandler(QueueHandler(log_queue))
+		self.listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+		self.listener.start()
+		Logger._listeners[self.logger.name] = self.listener
 
 
-	def debug(self, message) -> None:
+	@staticmethod
+	def _stop(listener: QueueListener) -> None:
+		'''
+		Writes the records still queued by a listener, stops it and closes its handlers.
+
+		:param listener: QueueListener to stop.
+		'''
+		listener.stop()
+		for handler in listener.handlers:
+			handler.close()
+
+
+	@classmethod
+	def close_all(cls) -> None:
+		'''
+		Stops the listeners of every configured logger, registered once to run when the process exits.
+		'''
+		while cls._listeners:
+			cls._stop(cls._listeners.popitem()[1])
+
+
+	def close(self) -> None:
+		'''
+		Writes the records still queued and stops the listener.
+		'''
+		if Logger._listeners.get(self.logger.name) is self.listener:
+			del Logger._listeners[self.logger.name]
+			Logger._stop(self.listener)
+
+
+	def debug(self, message, **fields) -> None:
 		'''
 		Logs a message with level DEBUG.
 
 		:param message: str, message to log.
+		:param fields: structured fields of the record, such as problem_id, round, strategy or latency.
 		'''
-		self.logger.debug(message)
+		self.logger.debug(message, extra=fields)
 
 
-	def info(self, message) -> None:
+	def info(self, message, **fields) -> None:
 		'''
 		Logs a message with level INFO.
 
 		:param message: str, message to log.
+		:param fields: structured fields of the record, such as problem_id, round, strategy or latency.
 		'''
-		self.logger.info(message)
+		self.logger.info(message, extra=fields)
 
 
-	def warning(self, message) -> None:
+	def warning(self, message, **fields) -> None:
 		'''
 		Logs a message with level WARNING.
 
 		:param message: str, message to log.
+		:param fields: structured fields of the record, such as problem_id, round, strategy or latency.
 		'''
-		self.logger.warning(message)
+		self.logger.warning(message, extra=fields)
 
 
-	def error(self, message) -> None:
+	def error(self, message, **fields) -> None:
 		'''
 		Logs a message with level ERROR.
 
 		:param message: str, message to log.
+		:param fields: structured fields of the record, such as problem_id, round, strategy or latency.
 		'''
-		self.logger.error(message)
+		self.logger.error(message, extra=fields)
 
 
-	def critical(self, message) -> None:
+	def critical(self, message, **fields) -> None:
 		'''
 		Logs a message with level CRITICAL.
 
 		:param message: str, message to log.
+		:param fields: structured fields of the record, such as problem_id, round, strategy or latency.
 		'''
-		self.logger.critical(message)
+		self.logger.critical(message, extra=fields)
+
+
+# Flushing the loggers still open when the process exits, whatever number of times they were configured
+atexit.register(Logger.close_all)
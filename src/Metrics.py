@@ -0,0 +1,373 @@
+import os
+import time
+import json
+import threading
+from typing import Dict, Optional, Tuple
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+	def __init__(self, buckets: Tuple[float, ...]=DEFAULT_BUCKETS):
+		'''
+		Initializes a histogram with cumulative buckets, as exposed by Prometheus.
+
+		:param buckets: tuple, upper bounds of the buckets, defaults to DEFAULT_BUCKETS.
+		'''
+		self.buckets = buckets
+		self.counts = [0] * len(buckets)
+		self.count = 0
+		self.sum = 0.0
+
+
+	def observe(self, value: float) -> None:
+		'''
+		Adds a value to the histogram.
+
+		:param value: float, observed value.
+		'''
+		self.count += 1
+		self.sum += value
+		for position, bound in enumerate(self.buckets):
+			if value <= bound:
+				self.counts[position] += 1
+				break
+
+
+	def quantile(self, q: float) -> Optional[float]:
+		'''
+		Estimates a quantile as the upper bound of the bucket holding it.
+
+		:param q: float, quantile between 0 and 1.
+		:return: float, estimated quantile, None if nothing was observed or it is above the last bucket.
+		'''
+		if not self.count:
+			return None
+
+		cumulative = 0
+		for bound, count in zip(self.buckets, self.counts):
+			cumulative += count
+			if cumulative >= q * self.count:
+				return bound
+
+		return None
+
+
+class Metrics:
+	def __init__(self):
+		'''
+		Initializes the Metrics class, a thread-safe registry of labelled counters and histograms.
+		'''
+		self.lock = threading.Lock()
+		self.counters: Dict[str, Dict[tuple, float]] = {}
+		self.histograms: Dict[str, Dict[tuple, Histogram]] = {}
+		self.help: Dict[str, str] = {}
+		self.server = None
+
+
+	@staticmethod
+	def _key(labels: dict) -> tuple:
+		'''
+		Returns a hashable key for a set of labels.
+		'''
+		return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+	def inc(self, name: str, value: float=1, **labels) -> None:
+		'''
+		Increments a counter.
+
+		:param name: str, name of the counter.
+		:param value: float, increment, defaults to 1.
+		:param labels: label values of the series.
+		'''
+		key = self._key(labels)
+		with self.lock:
+			series = self.counters.setdefault(name, {})
+			series[key] = series.get(key, 0) + value
+
+
+	def observe(self, name: str, value: float, **labels) -> None:
+		'''
+		Adds a value to a histogram.
+
+		:param name: str, name of the histogram.
+		:param value: float, observed value.
+		:param labels: label values of the series.
+		'''
+		key = self._key(labels)
+		with self.lock:
+			series = self.histograms.setdefault(name, {})
+			if key not in series:
+				series[key] = Histogram()
+			series[key].observe(value)
+
+
+	@contextmanager
+	def timer(self, name: str, **labels):
+		'''
+		Observes the seconds spent in a block into a histogram.
+
+		:param name: str, name of the histogram.
+		:param labels: label values of the series.
+		'''
+		start = time.perf_counter()
+		try:
+			yield
+
+		finally:
+			self.observe(name, time.perf_counter() - start, **labels)
+
+
+	def describe(self, name: str, text: str) -> None:
+		'''
+		Sets the help text of a metric.
+
+		:param name: str, name of the metric.
+		:param text: str, help text.
+		'''
+		self.help[name] = text
+
+
+	def value(self, name: str, **labels) -> float:
+		'''
+		Returns the value of a counter, or the count of a histogram.
+
+		:param name: str, name of the metric.
+		:param labels: label values of the series.
+		:return: float, current value, 0 if it was never recorded.
+		'''
+		key = self._key(labels)
+		with self.lock:
+			if name in self.histograms:
+				histogram = self.histograms[name].get(key)
+				return histogram.count if histogram is not None else 0
+
+			return self.counters.get(name, {}).get(key, 0)
+
+
+	def combined(self, name: str) -> float:
+		'''
+		Returns the value of a counter, or the count of a histogram, summed over all its series.
+
+		:param name: str, name of the metric.
+		:return: float, sum of the values of every series, 0 if it was never recorded.
+		'''
+		with self.lock:
+			if name in self.histograms:
+				return sum(histogram.count for histogram in self.histograms[name].values())
+
+			return sum(self.counters.get(name, {}).values())
+
+
+	def combined_total(self, name: str) -> float:
+		'''
+		Returns the sum of the values observed by a histogram over all its series.
+
+		:param name: str, name of the histogram.
+		:return: float, sum of the observed values of every series, 0 if it was never recorded.
+		'''
+		with self.lock:
+			return sum(histogram.sum for histogram in self.histograms.get(name, {}).values())
+
+
+	def total(self, name: str, **labels) -> float:
+		'''
+		Returns the sum of the values observed by a histogram.
+
+		:param name: str, name of the histogram.
+		:param labels: label values of the series.
+		:return: float, sum of the observed values, 0 if it was never recorded.
+		'''
+		key = self._key(labels)
+		with self.lock:
+			histogram = self.histograms.get(name, {}).get(key)
+			return histogram.sum if histogram is not None else 0.0
+
+
+	def reset(self) -> None:
+		'''
+		Clears every recorded series.
+		'''
+		with self.lock:
+			self.counters.clear()
+			self.histograms.clear()
+
+
+	@staticmethod
+	def _format_labels(key: tuple, extra: Optional[tuple]=None) -> str:
+		'''
+		Formats labels in the Prometheus text format.
+		'''
+		pairs = list(key) + ([extra] if extra else [])
+		if not pairs:
+			return ''
+
+		escaped = [(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in pairs]
+
+		return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+	def render_prometheus(self) -> str:
+		'''
+		Renders every metric in the Prometheus text exposition format.
+
+		:return: str, metrics text.
+		'''
+		lines = []
+		with self.lock:
+			for name in sorted(self.counters):
+				if name in self.help:
+					lines.append(f'# HELP {name} {self.help[name]}')
+				lines.append(f'# TYPE {name} counter')
+				for key, value in sorted(self.counters[name].items()):
+					lines.append(f'{name}{self._format_labels(key)} {value}')
+
+			for name in sorted(self.histograms):
+				if name in self.help:
+					lines.append(f'# HELP {name} {self.help[name]}')
+				lines.append(f'# TYPE {name} histogram')
+				for key, histogram in sorted(self.histograms[name].items()):
+					cumulative = 0
+					for bound, count in zip(histogram.buckets, histogram.counts):
+						cumulative += count
+						lines.append(f'{name}_bucket{self._format_labels(key, ("le", str(bound)))} {cumulative}')
+					lines.append(f'{name}_bucket{self._format_labels(key, ("le", "+Inf"))} {histogram.count}')
+					lines.append(f'{name}_sum{self._format_labels(key)} {histogram.sum}')
+					lines.append(f'{name}_count{self._format_labels(key)} {histogram.count}')
+
+		return '\n'.join(lines) + '\n'
+
+
+	def summary(self) -> dict:
+		'''
+		Summarises every metric as a JSON serialisable dictionary.
+
+		:return: dict, counters with their values and histograms with count, sum, mean and estimated quantiles.
+		'''
+		with self.lock:
+			counters = {
+				name: [{'labels': dict(key), 'value': value} for key, value in sorted(series.items())]
+				for name, series in sorted(self.counters.items())
+			}
+			histograms = {
+				name: [{
+					'labels': dict(key),
+					'count': histogram.count,
+					'sum': histogram.sum,
+					'mean': histogram.sum / histogram.count if histogram.count else None,
+					'p50': histogram.quantile(0.5),
+					'p95': histogram.quantile(0.95),
+					'p99': histogram.quantile(0.99)
+				} for key, histogram in sorted(series.items())]
+				for name, series in sorted(self.histograms.items())
+			}
+
+		return {'counters': counters, 'histograms': histograms}
+
+
+	def write_prometheus(self, filepath: str) -> None:
+		'''
+		Atomically writes the metrics in the Prometheus text format, for the node exporter textfile collector.
+
+		:param filepath: str, metrics file path.
+		'''
+		# Creating metrics folder if it does not exist
+		if os.path.dirname(filepath):
+			os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+		with open(f'{filepath}.tmp', 'w') as file:
+			file.write(self.render_prometheus())
+		os.replace(f'{filepath}.tmp', filepath)
+
+
+	def write_summary(self, filepath: str, **extra) -> None:
+		'''
+		Writes the JSON summary of the metrics.
+
+		:param filepath: str, summary file path.
+		:param extra: additional fields of the summary, such as the run id.
+		'''
+		# Creating metrics folder if it does not exist
+		if os.path.dirname(filepath):
+			os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+		with open(filepath, 'w') as file:
+			json.dump({**extra, **self.summary()}, file, indent=2)
+
+
+	def serve(self, port: int, host: str='0.0.0.0') -> int:
+		'''
+		Serves the metrics in the Prometheus text format on /metrics from a background thread.
+
+		:param port: int, port to listen on, 0 for any free port.
+		:param host: str, host to listen on, defaults to 0.0.0.0.
+		:return: int, port the metrics are served on.
+		'''
+		metrics = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.split('?')[0] != '/metrics':
+					self.send_error(404)
+					return
+
+				payload = metrics.render_prometheus().encode('utf-8')
+				self.send_response(200)
+				self.send_header('Content-Type', 'text/plain; version=0.0.4')
+				self.send_header('Content-Length', str(len(payload)))
+				self.end_headers()
+				self.wfile.write(payload)
+
+
+			def log_message(self, format, *args):
+				pass
+
+		self.server = ThreadingHTTPServer((host, port), Handler)
+		self.server.daemon_threads = True
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+		return self.server.server_address[1]
+
+
+	def stop(self) -> None:
+		'''
+		Stops serving the metrics.
+		'''
+		if self.server is not None:
+			self.server.shutdown()
+			self.server.server_close()
+			self.server = None
+
+
+# Registry shared by the clients, the mutation functions and the rounds of a process
+metrics = Metrics()
+metrics.describe('llm_requests_total', "Requests by model and outcome: ok, error or cache_hit.")
+metrics.describe('llm_request_seconds', "Latency of requests sent to the model, including retries.")
+metrics.describe('llm_prompt_tokens_total', "Prompt tokens reported by the model.")
+metrics.describe('llm_completion_tokens_total', "Completion tokens reported by the model.")
+metrics.describe('llm_cached_prompt_tokens_total', "Prompt tokens the model reported as served from its prompt cache.")
+metrics.describe('llm_time_to_first_token_seconds', "Seconds from sending a streamed request to receiving its first token.")
+metrics.describe('llm_streams_stopped_total', "Streamed requests closed before the model finished its response.")
+metrics.describe('http_requests_total', "HTTP requests sent through the connection pool shared by the clients.")
+metrics.describe('http_connections_opened_total', "Connections opened by the shared pool, the other requests reusing a kept-alive connection.")
+metrics.describe('deployment_requests_total', "Requests sent to each deployment of a pool, by outcome: ok, failover, error or cancelled.")
+metrics.describe('llm_queue_wait_seconds', "Seconds requests waited for the rate limiter before being sent.")
+metrics.describe('llm_retries_total', "Retried requests by reason: throttled or error.")
+metrics.describe('mutation_seconds', "Seconds spent mutating a problem, by strategy.")
+metrics.describe('mutation_stream_stops_total', "Streamed mutations stopped early, by reason: commentary or length.")
+metrics.describe('mutations_total', "Mutations by strategy and outcome.")
+metrics.describe('evaluation_seconds', "Seconds spent evaluating a problem.")
+metrics.describe('evaluations_total', "Evaluations by outcome.")
+metrics.describe('evaluation_parses_total', "Evaluation responses by parse outcome: ok or unparseable.")
+metrics.describe('evaluation_retries_total', "Evaluations requested again after an unparseable response.")
+metrics.describe('context_overflows_total', "Prompts too long for the context window, by action: trim or reject.")
+metrics.describe('evaluation_reserved_tokens_saved_total', "Completion tokens evaluation requests, retries included, reserved less than the default maximum, not the tokens they actually used.")
+metrics.describe('round_seconds', "Seconds spent mutating and evaluating a round, by round mode.")
+metrics.describe('round_problems_total', "Problems evaluated, by round mode.")
+metrics.describe('ensemble_evaluations_total', "Evaluations asked to the further judges of the ensemble, by judge and outcome.")
+metrics.describe('ensemble_calls_saved_total', "Judge calls not made because the problems were clearly inside or outside the top k.")
+metrics.describe('shard_reclaims_total', "Claimed shards given back to the workers after their worker stopped sending heartbeats.")
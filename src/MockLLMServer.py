@@ -0,0 +1,487 @@
+import re
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import itertools
+import argparse
+import threading
+from typing import Optional
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append('.')
+
+from src.RateLimiter import RateLimiter, estimate_tokens
+from src.ResponseCache import ResponseCache
+from src.TokenBudget import count_tokens
+
+
+LATENCY_DISTRIBUTIONS = ('constant', 'uniform', 'exponential', 'lognormal')
+
+# Commentary some mutation answers drift into after the statement, despite the prompt asking for the statement only
+MOCK_COMMENTARY = (
+	"\n\nNote: This revised problem statement keeps the original goal while changing how it is worded. The changes make the "
+	"requirements more explicit, clarify the expected inputs and outputs, and add context that a solver may find useful. "
+	"Let me know if you would like a different level of difficulty or further constraints on the solution."
+)
+
+
+def sample_latency(rng: random.Random, distribution: str, mean: float, jitter: float) -> float:
+	'''
+	Samples the latency of a simulated request.
+
+	:param rng: random.Random, generator the latency is drawn from.
+	:param distribution: str, 'constant', 'uniform', 'exponential' or 'lognormal'.
+	:param mean: float, mean latency in seconds.
+	:param jitter: float, spread around the mean in seconds, the half width for 'uniform' and the standard deviation for 'lognormal'.
+	:return: float, latency in seconds.
+	'''
+	if mean <= 0:
+		return 0.0
+	if distribution == 'uniform':
+		return max(0.0, rng.uniform(mean - jitter, mean + jitter))
+	if distribution == 'exponential':
+		return rng.expovariate(1 / mean)
+	if distribution == 'lognormal':
+		# Matching the mean and standard deviation of the underlying normal to the requested ones
+		sigma = math.sqrt(math.log(1 + (jitter / mean) ** 2))
+		return rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+
+	return mean
+
+
+def mock_completion(system_message: str, user_input: str, response_format: Optional[dict]=None, commentary_rate: float=0) -> str:
+	'''
+	Answers a prompt deterministically, with a numerical score for scoring prompts and a variant of the statement
+	otherwise. Packed prompts get a JSON answer covering each of their items, and scoring prompts requesting a
+	structured output get a JSON object holding the score.
+
+	:param system_message: str, system message of the request.
+	:param user_input: str, user message of the request.
+	:param response_format: dict, optional structured output format of the request.
+	:param commentary_rate: float, fraction of statement variants followed by commentary, defaults to 0.
+	:return: str, completion text.
+	'''
+	def digest(text: str) -> int:
+		return int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:12], 16)
+
+	scoring = re.search(r'\bscor(e|ing)\b', system_message, re.IGNORECASE) is not None
+
+	# Answering packed prompts item by item
+	packed = re.search(r':\n(\[.*\]|\{.*\})(?:\n\nAnswer only|\s*$)', user_input, re.DOTALL)
+	if packed:
+		try:
+			items = json.loads(packed.group(1))
+
+		except json.JSONDecodeError:
+			items = None
+
+		if isinstance(items, dict):
+			return json.dumps({key: f"{value} (variant {digest(value) % 1000})" for key, value in items.items()})
+		if isinstance(items, list):
+			return json.dumps([{'id': item.get('id'), 'score': digest(json.dumps(item, sort_keys=True)) % 100 / 10} for item in items])
+
+	if scoring and response_format is not None:
+		return json.dumps({'score': digest(user_input) % 100 / 10})
+	if scoring:
+		return str(digest(user_input) % 100 / 10)
+
+	statement = user_input.strip().split('\n\n')[-1]
+	commentary = MOCK_COMMENTARY if digest(f'commentary:{user_input}') % 1000 < commentary_rate * 1000 else ''
+
+	return f"{statement} (variant {digest(user_input) % 1000}){commentary}"
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+	"""
+	Handles chat-completion requests on Azure deployment paths and on /v1/chat/completions.
+	"""
+	protocol_version = 'HTTP/1.1'
+
+	# Sending headers and body without waiting for delayed acknowledgements on keep-alive connections
+	disable_nagle_algorithm = True
+
+	def do_POST(self):
+		body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+		path = self.path.split('?')[0]
+		match = re.match(r'^/openai/deployments/([^/]+)/chat/completions$', path)
+		if match is None and path != '/v1/chat/completions':
+			self.send_json(404, {'error': {'code': '404', 'message': f"Unknown path {path}"}})
+			return
+
+		self.server.mock.handle(self, model=match.group(1) if match else body.get('model', 'mock'), body=body)
+
+
+	def send_json(self, status: int, body: dict, headers: Optional[dict]=None) -> None:
+		payload = json.dumps(body).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(payload)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(payload)
+
+
+	def send_events(self, events) -> bool:
+		'''
+		Sends server-sent events with chunked transfer encoding, as streamed chat completions are.
+
+		:param events: iterable, JSON serialisable events, each sent as soon as it is produced.
+		:return: bool, whether every event was sent before the client closed the connection.
+		'''
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/event-stream')
+		self.send_header('Transfer-Encoding', 'chunked')
+		self.end_headers()
+
+		try:
+			for event in itertools.chain(events, ['[DONE]']):
+				payload = f"data: {event if isinstance(event, str) else json.dumps(event)}\n\n".encode('utf-8')
+				self.wfile.write(f"{len(payload):X}\r\n".encode('ascii') + payload + b"\r\n")
+				self.wfile.flush()
+			self.wfile.write(b"0\r\n\r\n")
+			self.wfile.flush()
+
+		except (BrokenPipeError, ConnectionResetError):
+			self.close_connection = True
+			return False
+
+		return True
+
+
+	def log_message(self, format, *args):
+		pass
+
+
+class MockLLMServer:
+	def __init__(self, host: str='127.0.0.1', port: int=0, latency_ms: float=0, latency_jitter_ms: float=0, latency_distribution: str='constant', ms_per_token: float=0, error_rate: float=0, throttle_rate: float=0, retry_after: float=1.0, seed: int=0, cache_min_tokens: int=1024, cache_block_tokens: int=128, cache_max_prefixes: int=100000, commentary_rate: float=0):
+		"""
+		Initializes a local stand-in of the chat-completions API for offline benchmarks and stress tests.
+
+		:param host: str, host to listen on, defaults to 127.0.0.1.
+		:param port: int, port to listen on, 0 for any free port, defaults to 0.
+		:param latency_ms: float, mean latency of a request in milliseconds, defaults to 0.
+		:param latency_jitter_ms: float, spread of the latency in milliseconds, defaults to 0.
+		:param latency_distribution: str, 'constant', 'uniform', 'exponential' or 'lognormal', defaults to 'constant'.
+		:param ms_per_token: float, extra latency per completion token in milliseconds, defaults to 0.
+		:param error_rate: float, fraction of requests answered with a 500 error, defaults to 0.
+		:param throttle_rate: float, fraction of requests answered with a 429 error, defaults to 0.
+		:param retry_after: float, seconds sent in the Retry-After header of 429 errors, defaults to 1.
+		:param seed: int, seed of the latency and failure draws, defaults to 0.
+		:param cache_min_tokens: int, shortest prompt prefix reported as cached, like provider prompt caching, defaults to 1024.
+		:param cache_block_tokens: int, granularity of cached prefixes in tokens, defaults to 128.
+		:param cache_max_prefixes: int, number of prefixes kept, the least recently used being evicted first, defaults to 100000.
+		:param commentary_rate: float, fraction of mutation answers drifting into commentary after the statement, defaults to 0.
+		"""
+		if latency_distribution not in LATENCY_DISTRIBUTIONS:
+			raise ValueError(f"Error: Unknown latency distribution '{latency_distribution}'.")
+		if not 0 <= error_rate + throttle_rate <= 1:
+			raise ValueError("Error: Error and throttle rates must add up to a value between 0 and 1.")
+
+		self.latency = latency_ms / 1000
+		self.latency_jitter = latency_jitter_ms / 1000
+		self.latency_distribution = latency_distribution
+		self.seconds_per_token = ms_per_token / 1000
+		self.error_rate = error_rate
+		self.throttle_rate = throttle_rate
+		self.retry_after = retry_after
+		self.random = random.Random(seed)
+		self.lock = threading.Lock()
+		self.cache_min_tokens = cache_min_tokens
+		self.cache_block_tokens = max(cache_block_tokens, 1)
+		self.cache_max_prefixes = max(cache_max_prefixes, 1)
+		self.prefixes = OrderedDict()
+		self.commentary_rate = commentary_rate
+		self.stats = {'requests': 0, 'completed': 0, 'throttled': 0, 'errors': 0, 'cancelled': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}
+
+		self.server = ThreadingHTTPServer((host, port), MockLLMHandler)
+		self.server.daemon_threads = True
+		self.server.mock = self
+		self.thread = None
+
+
+	@property
+	def endpoint(self) -> str:
+		"""
+		Returns the base URL to pass as the endpoint of the clients.
+		"""
+		host, port = self.server.server_address[:2]
+
+		return f'http://{host}:{port}'
+
+
+	def start(self) -> 'MockLLMServer':
+		"""
+		Starts serving requests in a background thread.
+		"""
+		self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+		self.thread.start()
+
+		return self
+
+
+	def stop(self) -> None:
+		"""
+		Stops serving requests and releases the port.
+		"""
+		if self.thread is not None:
+			self.server.shutdown()
+			self.thread.join()
+			self.thread = None
+		self.server.server_close()
+
+
+	def __enter__(self) -> 'MockLLMServer':
+		return self.start()
+
+
+	def __exit__(self, *exc) -> None:
+		self.stop()
+
+
+	def cached_tokens(self, prompt: str) -> int:
+		"""
+		Simulates provider prompt caching, returning the tokens of the longest block-aligned prefix seen in an earlier prompt.
+
+		:param prompt: str, system and user messages of the request.
+		:return: int, number of cached prompt tokens, 0 if the cached prefix is shorter than cache_min_tokens.
+		"""
+		block = self.cache_block_tokens * 4
+		cached = 0
+		with self.lock:
+			for end in range(block, len(prompt) + 1, block):
+				digest = hashlib.sha1(prompt[:end].encode('utf-8')).digest()
+				if digest in self.prefixes:
+					cached = end // 4
+					self.prefixes.move_to_end(digest)
+				else:
+					self.prefixes[digest] = None
+					if len(self.prefixes) > self.cache_max_prefixes:
+						self.prefixes.popitem(last=False)
+
+		return cached if cached >= self.cache_min_tokens else 0
+
+
+	def handle(self, handler: MockLLMHandler, model: str, body: dict) -> None:
+		"""
+		Answers a chat-completion request after the simulated latency, or with an injected failure.
+
+		Streamed requests get their first chunk after the latency and each following chunk after the time of its tokens,
+		and only the chunks sent before the client closes the stream count as completion tokens.
+
+		:param handler: MockLLMHandler, handler of the request.
+		:param model: str, deployment or model of the request.
+		:param body: dict, JSON body of the request.
+		"""
+		messages = body.get('messages', [])
+		system_message = ''.join(m.get('content', '') for m in messages if m.get('role') == 'system')
+		user_input = ''.join(m.get('content', '') for m in messages if m.get('role') == 'user')
+
+		with self.lock:
+			self.stats['requests'] += 1
+			number = self.stats['requests']
+			draw = self.random.random()
+			latency = sample_latency(self.random, self.latency_distribution, self.latency, self.latency_jitter)
+
+		if draw < self.throttle_rate:
+			with self.lock:
+				self.stats['throttled'] += 1
+			handler.send_json(429, {'error': {'code': '429', 'message': "Rate limit is exceeded."}}, headers={'Retry-After': str(self.retry_after)})
+			return
+
+		if draw < self.throttle_rate + self.error_rate:
+			time.sleep(latency)
+			with self.lock:
+				self.stats['errors'] += 1
+			handler.send_json(500, {'error': {'code': '500', 'message': "Injected server error."}})
+			return
+
+		# Truncating the completion to the requested maximum number of tokens
+		content = mock_completion(system_message=system_message, user_input=user_input, response_format=body.get('response_format'), commentary_rate=self.commentary_rate)
+		max_tokens = body.get('max_tokens') or 0
+		finish_reason = 'stop'
+		if max_tokens and len(content) > max_tokens * 4:
+			content, finish_reason = content[:max_tokens * 4], 'length'
+
+		prompt_tokens = estimate_tokens(system_message, user_input)
+		cached_tokens = min(self.cached_tokens(system_message + user_input), prompt_tokens)
+		completion_tokens = estimate_tokens(content)
+		if body.get('stream'):
+			self.stream(handler, number=number, model=model, body=body, content=content, latency=latency, prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, finish_reason=finish_reason)
+			return
+
+		time.sleep(latency + completion_tokens * self.seconds_per_token)
+
+		with self.lock:
+			self.stats['completed'] += 1
+			self.stats['prompt_tokens'] += prompt_tokens
+			self.stats['cached_tokens'] += cached_tokens
+			self.stats['completion_tokens'] += completion_tokens
+
+		handler.send_json(200, {
+			'id': f'chatcmpl-mock-{number}',
+			'object': 'chat.completion',
+			'created': int(time.time()),
+			'model': model,
+			'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': finish_reason}],
+			'usage': {
+				'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens,
+				'prompt_tokens_details': {'cached_tokens': cached_tokens}
+			}
+		})
+
+
+	def stream(self, handler: MockLLMHandler, number: int, model: str, body: dict, content: str, latency: float, prompt_tokens: int, cached_tokens: int, finish_reason: str) -> None:
+		"""
+		Streams a completion word by word, ending with its usage when the request asks for it.
+
+		:param handler: MockLLMHandler, handler of the request.
+		:param number: int, number of the request.
+		:param model: str, deployment or model of the request.
+		:param body: dict, JSON body of the request.
+		:param content: str, completion text.
+		:param latency: float, seconds before the first chunk.
+		:param prompt_tokens: int, prompt tokens of the request.
+		:param cached_tokens: int, prompt tokens served from the simulated prompt cache.
+		:param finish_reason: str, finish reason of the completion.
+		"""
+		pieces = re.findall(r'\s*\S+', content)
+		chunk = {'id': f'chatcmpl-mock-{number}', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model}
+		streamed = []
+
+		def events():
+			time.sleep(latency)
+			yield {**chunk, 'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None}]}
+			for position, piece in enumerate(pieces):
+				if position:
+					time.sleep(count_tokens(piece) * self.seconds_per_token)
+				streamed.append(piece)
+				yield {**chunk, 'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+			yield {**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': finish_reason}]}
+			if (body.get('stream_options') or {}).get('include_usage'):
+				completion_tokens = estimate_tokens(content)
+				yield {**chunk, 'choices': [], 'usage': {
+					'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens,
+					'prompt_tokens_details': {'cached_tokens': cached_tokens}
+				}}
+
+		completed = handler.send_events(events())
+
+		# Counting the completion tokens generated before the client stopped reading
+		with self.lock:
+			self.stats['completed' if completed else 'cancelled'] += 1
+			self.stats['prompt_tokens'] += prompt_tokens
+			self.stats['cached_tokens'] += cached_tokens
+			self.stats['completion_tokens'] += estimate_tokens(''.join(streamed)) if len(streamed) == len(pieces) else count_tokens(''.join(streamed))
+
+
+class MockLLMClient:
+	def __init__(self, endpoint: Optional[str]=None, api_key: Optional[str]=None, model: str='mock', cache: Optional[ResponseCache]=None, rate_limiter: Optional[RateLimiter]=None, http_client=None, latency_ms: float=0, latency_jitter_ms: float=0, latency_distribution: str='constant', error_rate: float=0, seed: int=0):
+		"""
+		Initializes an in-process client answering like MockLLMServer without any HTTP round trip.
+
+		It takes the arguments of AzureOpenAIClient, so it can be created wherever an Azure client is.
+
+		:param endpoint: str, ignored, since no request leaves the process, defaults to None.
+		:param api_key: str, ignored, since no request leaves the process, defaults to None.
+		:param model: str, name of the model, defaults to mock.
+		:param cache: Optional ResponseCache serving identical requests without answering them again.
+		:param rate_limiter: Optional RateLimiter the requests are sent through, which then owns retries.
+		:param http_client: ignored, since no request leaves the process, defaults to None.
+		:param latency_ms: float, mean latency of a request in milliseconds, defaults to 0.
+		:param latency_jitter_ms: float, spread of the latency in milliseconds, defaults to 0.
+		:param latency_distribution: str, 'constant', 'uniform', 'exponential' or 'lognormal', defaults to 'constant'.
+		:param error_rate: float, fraction of requests failing, defaults to 0.
+		:param seed: int, seed of the latency and failure draws, defaults to 0.
+		"""
+		if latency_distribution not in LATENCY_DISTRIBUTIONS:
+			raise ValueError(f"Error: Unknown latency distribution '{latency_distribution}'.")
+
+		self.endpoint = endpoint
+		self.api_key = api_key
+		self.model = model
+		self.cache = cache
+		self.rate_limiter = rate_limiter
+		self.http_client = http_client
+		self.latency = latency_ms / 1000
+		self.latency_jitter = latency_jitter_ms / 1000
+		self.latency_distribution = latency_distribution
+		self.error_rate = error_rate
+		self.random = random.Random(seed)
+		self.lock = threading.Lock()
+
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: Optional[dict]=None) -> str:
+		"""
+		Generates a deterministic response after the simulated latency.
+
+		:param user_input: str, input text provided by the user.
+		:param system_message: str, system message providing context to the model.
+		:param temperature: float, ignored, kept for interface compatibility.
+		:param max_tokens: int, maximum number of tokens allowed in the generated response.
+		:param response_format: dict, optional structured output format, scores are then answered as JSON.
+		:return: str, response generated by the mock.
+		:raises RuntimeError: if the request is drawn as a failure.
+		"""
+		# Serving identical requests from the cache, as the Azure clients do
+		cache_key = None
+		if self.cache is not None:
+			cache_key = self.cache.make_key(self.model, system_message, user_input, temperature, max_tokens, response_format)
+			cached_response = self.cache.get(cache_key)
+			if cached_response is not None:
+				return cached_response
+
+		def request() -> str:
+			with self.lock:
+				draw = self.random.random()
+				latency = sample_latency(self.random, self.latency_distribution, self.latency, self.latency_jitter)
+
+			time.sleep(latency)
+			if draw < self.error_rate:
+				raise RuntimeError("An error occurred while generating response: Injected server error.")
+
+			return mock_completion(system_message=system_message, user_input=user_input, response_format=response_format)[:max_tokens * 4]
+
+		# Sending the request through the shared rate limiter when there is one
+		if self.rate_limiter is not None:
+			estimated_tokens = estimate_tokens(system_message, user_input) + max_tokens
+			response = self.rate_limiter.call(request, tokens=estimated_tokens)
+			self.rate_limiter.record_usage(estimated_tokens, estimate_tokens(system_message, user_input, response))
+		else:
+			response = request()
+
+		if self.cache is not None:
+			self.cache.put(cache_key, response)
+
+		return response
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Serve a local stand-in of the Azure OpenAI chat-completions API.")
+	parser.add_argument('--host', default='127.0.0.1', help="Host to listen on.")
+	parser.add_argument('--port', type=int, default=8000, help="Port to listen on.")
+	parser.add_argument('--latency-ms', type=float, default=0, help="Mean latency of a request in milliseconds.")
+	parser.add_argument('--latency-jitter-ms', type=float, default=0, help="Spread of the latency in milliseconds.")
+	parser.add_argument('--latency-distribution', default='constant', choices=LATENCY_DISTRIBUTIONS, help="Distribution of the latency.")
+	parser.add_argument('--ms-per-token', type=float, default=0, help="Extra latency per completion token in milliseconds.")
+	parser.add_argument('--error-rate', type=float, default=0, help="Fraction of requests answered with a 500 error.")
+	parser.add_argument('--throttle-rate', type=float, default=0, help="Fraction of requests answered with a 429 error.")
+	parser.add_argument('--retry-after', type=float, default=1.0, help="Seconds sent in the Retry-After header of 429 errors.")
+	parser.add_argument('--seed', type=int, default=0, help="Seed of the latency and failure draws.")
+	parser.add_argument('--cache-min-tokens', type=int, default=1024, help="Shortest prompt prefix reported as cached.")
+	parser.add_argument('--cache-block-tokens', type=int, default=128, help="Granularity of cached prompt prefixes in tokens.")
+	parser.add_argument('--cache-max-prefixes', type=int, default=100000, help="Number of cached prompt prefixes kept, the least recently used being evicted first.")
+	parser.add_argument('--commentary-rate', type=float, default=0, help="Fraction of mutation answers drifting into commentary after the statement.")
+	args = parser.parse_args()
+
+	server = MockLLMServer(**vars(args))
+	print(f"Serving mock chat completions on {server.endpoint}")
+	try:
+		server.server.serve_forever()
+
+	except KeyboardInterrupt:
+		server.server.server_close()
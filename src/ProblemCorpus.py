@@ -0,0 +1,204 @@
+import os
+import gzip
+import json
+import mmap
+import struct
+import random
+from array import array
+from collections.abc import Sequence
+from typing import Iterator, List, Optional
+from scripts.data_handling import Problem
+
+# Header of the line-offset index: size and modification time of the indexed file
+INDEX_HEADER = struct.Struct('<QQ')
+DESCRIPTION_FIELDS = ('description', 'statement', 'problem', 'text')
+
+
+class ProblemCorpus(Sequence):
+	def __init__(self, filepath: str, file_format: Optional[str]=None, index_path: Optional[str]=None):
+		'''
+		Initializes a problem corpus read on demand instead of loaded up front.
+
+		Uncompressed files are memory-mapped and indexed by the offset of each non-empty line, so any problem can be
+		read without reading the others. The index is saved next to the file and reused while the file is unchanged.
+		Gzip files cannot be read at an offset, so they are streamed and sampled with reservoir sampling.
+
+		:param filepath: str, problems file path, either text with one statement per line or JSONL, optionally gzip compressed.
+		:param file_format: str, 'text' or 'jsonl', defaults to 'jsonl' for .jsonl files and 'text' otherwise.
+		:param index_path: str, file path to the line-offset index, defaults to the problems file path with .idx appended.
+		'''
+		# Checking if problems file exists
+		if not os.path.exists(filepath):
+			raise FileNotFoundError(f"Error: The file {filepath} does not exist.")
+
+		self.filepath = filepath
+		self.compressed = filepath.endswith('.gz')
+		name = filepath[:-3] if self.compressed else filepath
+		self.file_format = file_format or ('jsonl' if name.endswith('.jsonl') else 'text')
+		if self.file_format not in ('text', 'jsonl'):
+			raise ValueError(f"Error: Unknown corpus format '{self.file_format}'.")
+
+		self.index_path = index_path or f'{filepath}.idx'
+		self.offsets = None
+		self.file = None
+		self.map = None
+		self._length = None
+
+		if not self.compressed:
+			self.offsets = self._load_index() or self._build_index()
+			if os.path.getsize(filepath) > 0:
+				self.file = open(filepath, 'rb')
+				self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+	def _signature(self) -> bytes:
+		'''
+		Returns the index header identifying the current version of the file.
+		'''
+		stat = os.stat(self.filepath)
+
+		return INDEX_HEADER.pack(stat.st_size, stat.st_mtime_ns)
+
+
+	def _load_index(self) -> Optional[array]:
+		'''
+		Loads the saved line-offset index if it matches the current file.
+
+		:return: array, offset of each non-empty line, None if there is no up to date index.
+		'''
+		try:
+			with open(self.index_path, 'rb') as file:
+				if file.read(INDEX_HEADER.size) != self._signature():
+					return None
+				offsets = array('Q')
+				offsets.frombytes(file.read())
+
+		except (OSError, ValueError):
+			return None
+
+		return offsets
+
+
+	def _build_index(self) -> array:
+		'''
+		Scans the file once for the offset of each non-empty line and saves the index.
+
+		:return: array, offset of each non-empty line.
+		'''
+		offsets = array('Q')
+		position = 0
+		with open(self.filepath, 'rb') as file:
+			for line in file:
+				if line.strip():
+					offsets.append(position)
+				position += len(line)
+
+		# Writing to a temporary file first so a partial index is never reused, skipping read-only directories
+		try:
+			with open(f'{self.index_path}.tmp', 'wb') as file:
+				file.write(self._signature())
+				offsets.tofile(file)
+			os.replace(f'{self.index_path}.tmp', self.index_path)
+
+		except OSError:
+			pass
+
+		return offsets
+
+
+	def _parse(self, line: str) -> str:
+		'''
+		Extracts the problem statement of a line.
+
+		:param line: str, line of the corpus.
+		:return: str, problem statement.
+		'''
+		description = line.strip()
+		if self.file_format == 'jsonl':
+			entry = json.loads(description)
+			if isinstance(entry, dict):
+				entry = next((entry[key] for key in DESCRIPTION_FIELDS if key in entry), None)
+			if not isinstance(entry, str):
+				raise ValueError(f"Error: No problem statement found in line {description[:80]!r}.")
+			description = entry.strip()
+
+		return description
+
+
+	def _lines(self) -> Iterator[str]:
+		'''
+		Streams the non-empty lines of the corpus.
+		'''
+		opener = gzip.open if self.compressed else open
+		with opener(self.filepath, 'rt', encoding='utf-8') as file:
+			for line in file:
+				if line.strip():
+					yield line
+
+
+	def __len__(self) -> int:
+		if self.offsets is not None:
+			return len(self.offsets)
+
+		# Counting the lines of a compressed corpus once
+		if self._length is None:
+			self._length = sum(1 for _ in self._lines())
+
+		return self._length
+
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self[position] for position in range(*index.indices(len(self)))]
+
+		if self.offsets is None:
+			raise TypeError("Error: Compressed corpora cannot be read at an index, use sample() or iterate instead.")
+
+		offset = self.offsets[index]
+		end = self.map.find(b'\n', offset)
+
+		return Problem(original_description=self._parse(self.map[offset:end if end != -1 else len(self.map)].decode('utf-8')))
+
+
+	def __iter__(self) -> Iterator[Problem]:
+		for line in self._lines():
+			yield Problem(original_description=self._parse(line))
+
+
+	def sample(self, k: int, rng=random) -> List[Problem]:
+		'''
+		Samples k problems without replacement, reading only the sampled lines.
+
+		Indexed corpora draw the same positions as random.sample on the list returned by load_problems, so a seeded
+		run selects the same problems. Compressed corpora are sampled with reservoir sampling in a single pass.
+
+		:param k: int, number of problems, capped to the size of the corpus.
+		:param rng: random.Random or the random module, generator of the draws, defaults to the random module.
+		:return: list, sampled Problem classes.
+		'''
+		if self.offsets is not None:
+			return [self[index] for index in rng.sample(range(len(self)), min(k, len(self)))]
+
+		reservoir = []
+		for position, line in enumerate(self._lines()):
+			if position < k:
+				reservoir.append(line)
+			else:
+				slot = rng.randrange(position + 1)
+				if slot < k:
+					reservoir[slot] = line
+
+		# Shuffling so the order of the sample does not follow the order of the file
+		rng.shuffle(reservoir)
+
+		return [Problem(original_description=self._parse(line)) for line in reservoir]
+
+
+	def close(self) -> None:
+		'''
+		Closes the memory map of the corpus.
+		'''
+		if self.map is not None:
+			self.map.close()
+			self.file.close()
+			self.map, self.file = None, None
@@ -0,0 +1,400 @@
+import time
+import random
+import asyncio
+import threading
+from typing import Callable, Optional, Tuple
+from openai import APIConnectionError
+from src.Metrics import metrics
+from src.TokenBudget import MESSAGE_TOKENS, count_tokens
+
+
+class CircuitOpenError(RuntimeError):
+	'''
+	Raised when a request is rejected because the circuit breaker is open.
+	'''
+
+
+class TokenBucket:
+	def __init__(self, rate_per_minute: float, burst_seconds: float=10.0):
+		'''
+		Initializes the TokenBucket class, refilling continuously up to `burst_seconds` worth of quota.
+
+		:param rate_per_minute: float, units refilled per minute.
+		:param burst_seconds: float, seconds of quota the bucket can hold, defaults to 10.
+		'''
+		self.rate_per_minute = rate_per_minute
+		self.burst_seconds = burst_seconds
+		self.capacity = max(1.0, rate_per_minute * burst_seconds / 60.0)
+		self.available = self.capacity
+		self.updated = time.monotonic()
+
+
+	def set_rate(self, rate_per_minute: float, now: Optional[float]=None) -> None:
+		'''
+		Changes the refill rate, keeping the units already available.
+
+		:param rate_per_minute: float, units refilled per minute.
+		:param now: float, optional monotonic time, defaults to the current time.
+		'''
+		self._refill(now)
+		self.rate_per_minute = rate_per_minute
+		self.capacity = max(1.0, rate_per_minute * self.burst_seconds / 60.0)
+		self.available = min(self.available, self.capacity)
+
+
+	def _refill(self, now: Optional[float]=None) -> None:
+		'''
+		Adds the units accumulated since the last update.
+
+		:param now: float, optional monotonic time, defaults to the current time.
+		'''
+		now = time.monotonic() if now is None else now
+		self.available = min(self.capacity, self.available + (now - self.updated) * self.rate_per_minute / 60.0)
+		self.updated = now
+
+
+	def reserve(self, amount: float, now: Optional[float]=None) -> float:
+		'''
+		Takes `amount` units from the bucket, going into debt if needed, and returns how long to wait before using them.
+
+		:param amount: float, units to take.
+		:param now: float, optional monotonic time, defaults to the current time.
+		:return: float, seconds to wait.
+		'''
+		self._refill(now)
+		self.available -= amount
+
+		return 0.0 if self.available >= 0 else -self.available * 60.0 / self.rate_per_minute
+
+
+	def refund(self, amount: float) -> None:
+		'''
+		Gives back units reserved in excess, or takes more if `amount` is negative.
+
+		:param amount: float, units to give back.
+		'''
+		self.available = min(self.capacity, self.available + amount)
+
+
+class CircuitBreaker:
+	def __init__(self, failure_threshold: int=5, reset_timeout: float=30.0):
+		'''
+		Initializes the CircuitBreaker class.
+
+		:param failure_threshold: int, consecutive failures that open the circuit, 0 to disable, defaults to 5.
+		:param reset_timeout: float, seconds the circuit stays open before letting a trial request through, defaults to 30.
+		'''
+		self.failure_threshold = failure_threshold
+		self.reset_timeout = reset_timeout
+		self.failures = 0
+		self.opened_at = None
+		self.trial_in_flight = False
+
+
+	@property
+	def state(self) -> str:
+		'''
+		Returns the state of the circuit: 'closed', 'open' or 'half-open'.
+		'''
+		if self.opened_at is None:
+			return 'closed'
+
+		return 'half-open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+
+	def before_request(self) -> bool:
+		'''
+		Rejects the request while the circuit is open, letting a single trial request through once it is half-open.
+
+		:return: bool, True if the request is the trial request of a half-open circuit, which must then be settled.
+		'''
+		state = self.state
+		if state == 'open' or (state == 'half-open' and self.trial_in_flight):
+			raise CircuitOpenError(f"Error: Circuit breaker is open after {self.failures} consecutive failures.")
+
+		if state == 'half-open':
+			self.trial_in_flight = True
+			return True
+
+		return False
+
+
+	def record_success(self) -> None:
+		'''
+		Closes the circuit after a successful request.
+		'''
+		self.failures = 0
+		self.opened_at = None
+		self.trial_in_flight = False
+
+
+	def release_trial(self) -> None:
+		'''
+		Lets another trial request through after a trial that ended without telling whether the circuit can close,
+		such as a throttled, rejected or cancelled request. Does nothing once the trial was recorded as a success or a failure.
+		'''
+		self.trial_in_flight = False
+
+
+	def record_failure(self) -> None:
+		'''
+		Counts a failed request, opening the circuit at the threshold or when a trial request fails.
+		'''
+		self.failures += 1
+		self.trial_in_flight = False
+		if self.failure_threshold and (self.failures >= self.failure_threshold or self.opened_at is not None):
+			self.opened_at = time.monotonic()
+
+
+class RateLimiter:
+	def __init__(self, requests_per_minute: float=0, tokens_per_minute: float=0, max_retries: int=5, base_delay: float=1.0, max_delay: float=60.0, failure_threshold: int=5, reset_timeout: float=30.0):
+		'''
+		Initializes the RateLimiter class, a client-side scheduler shared by every client talking to a deployment.
+
+		Requests wait for both a request and a token bucket. Retryable failures are retried with exponential
+		backoff and full jitter, honouring Retry-After. Throttling halves the effective rate, which then recovers
+		additively with each success, and consecutive failures open a circuit breaker.
+
+		:param requests_per_minute: float, request quota per minute, 0 for unlimited, defaults to 0.
+		:param tokens_per_minute: float, token quota per minute, 0 for unlimited, defaults to 0.
+		:param max_retries: int, maximum number of retries of a request, defaults to 5.
+		:param base_delay: float, seconds of the first backoff, defaults to 1.
+		:param max_delay: float, maximum seconds of a backoff, defaults to 60.
+		:param failure_threshold: int, consecutive failures that open the circuit breaker, 0 to disable, defaults to 5.
+		:param reset_timeout: float, seconds the circuit breaker stays open, defaults to 30.
+		'''
+		self.requests_per_minute = requests_per_minute
+		self.tokens_per_minute = tokens_per_minute
+		self.max_retries = max_retries
+		self.base_delay = base_delay
+		self.max_delay = max_delay
+		self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+		self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+		self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+		self.scale = 1.0
+		self.paused_until = 0.0
+		self.lock = threading.Lock()
+		# Jitter draws from its own generator so retries never shift the seeded random state of a run
+		self.random = random.Random()
+		self.stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'failures': 0, 'wait_seconds': 0.0}
+
+
+	def _reserve(self, tokens: int) -> Tuple[float, bool]:
+		'''
+		Reserves quota for a request and returns how long to wait before sending it.
+
+		:param tokens: int, estimated tokens of the request.
+		:return: tuple, seconds to wait and whether the request is the trial request of the circuit breaker.
+		'''
+		with self.lock:
+			trial = self.breaker.before_request()
+			now = time.monotonic()
+			delay = max(0.0, self.paused_until - now)
+			if self.request_bucket is not None:
+				delay = max(delay, self.request_bucket.reserve(1, now))
+			if self.token_bucket is not None:
+				delay = max(delay, self.token_bucket.reserve(tokens, now))
+
+			self.stats['requests'] += 1
+			self.stats['wait_seconds'] += delay
+
+		metrics.observe('llm_queue_wait_seconds', delay)
+
+		return delay, trial
+
+
+	def _release_trial(self) -> None:
+		'''
+		Settles the trial request of the circuit breaker once it ended, whatever its outcome.
+		'''
+		with self.lock:
+			self.breaker.release_trial()
+
+
+	def _set_scale(self, scale: float) -> None:
+		'''
+		Sets the fraction of the configured quota that buckets refill, between 10% and 100%.
+
+		:param scale: float, fraction of the configured quota.
+		'''
+		self.scale = min(1.0, max(0.1, scale))
+		if self.request_bucket is not None:
+			self.request_bucket.set_rate(self.requests_per_minute * self.scale)
+		if self.token_bucket is not None:
+			self.token_bucket.set_rate(self.tokens_per_minute * self.scale)
+
+
+	def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+		'''
+		Corrects the token bucket once the actual usage of a request is known.
+
+		:param estimated_tokens: int, tokens reserved for the request.
+		:param actual_tokens: int, tokens reported by the response, None if unknown.
+		'''
+		if self.token_bucket is not None and actual_tokens is not None:
+			with self.lock:
+				self.token_bucket.refund(estimated_tokens - actual_tokens)
+
+
+	@staticmethod
+	def retry_after(error: Exception) -> Optional[float]:
+		'''
+		Reads the Retry-After delay of a failed request.
+
+		:param error: Exception raised by the request.
+		:return: float, seconds to wait requested by the server, None if not provided.
+		'''
+		response = getattr(error, 'response', None)
+		headers = getattr(response, 'headers', None) or {}
+		try:
+			if headers.get('retry-after-ms') is not None:
+				return float(headers.get('retry-after-ms')) / 1000.0
+			if headers.get('retry-after') is not None:
+				return float(headers.get('retry-after'))
+
+		except (TypeError, ValueError):
+			pass
+
+		return None
+
+
+	@staticmethod
+	def is_retryable(error: Exception) -> bool:
+		'''
+		Checks if a failed request is worth retrying.
+
+		:param error: Exception raised by the request.
+		:return: bool, True for throttling, timeouts, server errors and connection errors.
+		'''
+		if isinstance(error, (APIConnectionError, ConnectionError, TimeoutError)):
+			return True
+
+		status_code = getattr(error, 'status_code', None)
+
+		return status_code is not None and (status_code in (408, 409, 429) or status_code >= 500)
+
+
+	def _on_failure(self, error: Exception, attempt: int) -> float:
+		'''
+		Records a failed request and returns how long to wait before retrying it.
+
+		:param error: Exception raised by the request.
+		:param attempt: int, number of the failed attempt, starting at 0.
+		:return: float, seconds to wait before retrying.
+		'''
+		retry_after = self.retry_after(error)
+		delay = self.random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+		if retry_after is not None:
+			delay = max(delay, retry_after)
+
+		with self.lock:
+			self.stats['failures'] += 1
+			if getattr(error, 'status_code', None) == 429:
+				# Throttling means the deployment is healthy but the quota is exhausted, so every caller pauses
+				self.stats['throttled'] += 1
+				self._set_scale(self.scale / 2)
+				self.paused_until = max(self.paused_until, time.monotonic() + delay)
+			else:
+				self.breaker.record_failure()
+
+		return delay
+
+
+	def _on_success(self) -> None:
+		'''
+		Records a successful request, recovering the effective rate after throttling.
+		'''
+		with self.lock:
+			self.breaker.record_success()
+			if self.scale < 1.0:
+				self._set_scale(self.scale + 0.05)
+
+
+	def call(self, request: Callable, tokens: int=0):
+		'''
+		Sends a request within the quota, retrying retryable failures.
+
+		:param request: callable, sends the request and returns its response.
+		:param tokens: int, estimated tokens of the request, defaults to 0.
+		:return: response of the request.
+		'''
+		attempt = 0
+		while True:
+			delay, trial = self._reserve(tokens)
+			try:
+				time.sleep(delay)
+				try:
+					response = request()
+
+				except Exception as e:
+					if not self.is_retryable(e) or attempt >= self.max_retries:
+						if self.is_retryable(e):
+							self._on_failure(e, attempt)
+						raise
+
+					backoff, reason = self._on_failure(e, attempt), 'throttled' if getattr(e, 'status_code', None) == 429 else 'error'
+
+				else:
+					self._on_success()
+					return response
+
+			finally:
+				# Settling the trial request on every exit, so the breaker never waits for a trial that already ended
+				if trial:
+					self._release_trial()
+
+			time.sleep(backoff)
+			attempt += 1
+			with self.lock:
+				self.stats['retries'] += 1
+			metrics.inc('llm_retries_total', reason=reason)
+
+
+	async def call_async(self, request: Callable, tokens: int=0):
+		'''
+		Sends an asynchronous request within the quota, retrying retryable failures.
+
+		:param request: callable, returns an awaitable sending the request.
+		:param tokens: int, estimated tokens of the request, defaults to 0.
+		:return: response of the request.
+		'''
+		attempt = 0
+		while True:
+			delay, trial = self._reserve(tokens)
+			try:
+				await asyncio.sleep(delay)
+				try:
+					response = await request()
+
+				except Exception as e:
+					if not self.is_retryable(e) or attempt >= self.max_retries:
+						if self.is_retryable(e):
+							self._on_failure(e, attempt)
+						raise
+
+					backoff, reason = self._on_failure(e, attempt), 'throttled' if getattr(e, 'status_code', None) == 429 else 'error'
+
+				else:
+					self._on_success()
+					return response
+
+			finally:
+				# Settling the trial request on every exit, including cancellation
+				if trial:
+					self._release_trial()
+
+			await asyncio.sleep(backoff)
+			attempt += 1
+			with self.lock:
+				self.stats['retries'] += 1
+			metrics.inc('llm_retries_total', reason=reason)
+
+
+def estimate_tokens(*texts: str) -> int:
+	'''
+	Estimates the number of tokens of a request from its texts with the local tokenizer estimate.
+
+	:param texts: str, texts sent in the request.
+	:return: int, estimated number of tokens.
+	'''
+	return sum(count_tokens(text) for text in texts) + MESSAGE_TOKENS * len(texts)
@@ -0,0 +1,191 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+class ResponseCache:
+	def __init__(self, path: str='cache/responses.sqlite', max_entries: int=100000, max_bytes: int=0, read_only: bool=False):
+		'''
+		Initializes the ResponseCache class, a persistent content-addressed store of model responses.
+
+		:param path: str, SQLite database file path, defaults to cache/responses.sqlite
+		:param max_entries: int, maximum number of cached responses before evicting the least recently used, 0 for unlimited, defaults to 100000.
+		:param max_bytes: int, maximum total size of cached responses in bytes, 0 for unlimited, defaults to 0.
+		:param read_only: bool, whether to serve cached responses without storing new ones or updating recency, defaults to False.
+		'''
+		self.path = path
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.read_only = read_only
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.lock = threading.Lock()
+
+		# Creating cache folder if it does not exist
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+
+		self.connection = sqlite3.connect(path, check_same_thread=False)
+		self.connection.execute('PRAGMA journal_mode=WAL')
+		self.connection.execute(
+			'CREATE TABLE IF NOT EXISTS responses ('
+			'key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access INTEGER NOT NULL)'
+		)
+		self.connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+
+		# Keeping the number and size of entries in a row updated with every write, so limits are checked without
+		# scanning the table and stay exact when several processes share the file
+		self.connection.execute(
+			'CREATE TABLE IF NOT EXISTS totals ('
+			'id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, bytes INTEGER NOT NULL)'
+		)
+		self.connection.execute('INSERT OR IGNORE INTO totals (id, entries, bytes) SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM responses')
+		self.connection.commit()
+
+
+	def _tick(self) -> int:
+		'''
+		Returns the next value of the recency counter, persisted with each entry so the order survives restarts and is
+		shared by the processes using the file.
+
+		:return: int, new recency value.
+		'''
+		return self.connection.execute('SELECT COALESCE(MAX(last_access), 0) + 1 FROM responses').fetchone()[0]
+
+
+	def _totals(self) -> tuple:
+		'''
+		Returns the number and total size of the cached responses.
+
+		:return: tuple, number of entries and their size in bytes.
+		'''
+		return self.connection.execute('SELECT entries, bytes FROM totals WHERE id = 0').fetchone()
+
+
+	@staticmethod
+	def make_key(model: str, system_message: str, user_input: str, temperature: float, max_tokens: int, response_format: Optional[dict]=None) -> str:
+		'''
+		Builds the cache key of a request as a hash of every field that determines the response.
+
+		:param model: str, model deployment name.
+		:param system_message: str, system message of the request.
+		:param user_input: str, user message of the request.
+		:param temperature: float, sampling temperature of the request.
+		:param max_tokens: int, maximum number of tokens of the request.
+		:param response_format: dict, optional structured output format of the request, left out of the key when not set.
+		:return: str, hexadecimal SHA-256 digest.
+		'''
+		fields = [model, system_message, user_input, temperature, max_tokens]
+		if response_format is not None:
+			fields.append(response_format)
+		payload = json.dumps(fields, ensure_ascii=False, sort_keys=True)
+
+		return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+	def get(self, key: str) -> Optional[str]:
+		'''
+		Returns the cached response for a key, refreshing its recency.
+
+		:param key: str, cache key built with make_key.
+		:return: str, cached response, or None if the key is not cached.
+		'''
+		with self.lock:
+			row = self.connection.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+			if row is None:
+				self.misses += 1
+				return None
+
+			self.hits += 1
+			if not self.read_only:
+				self.connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (self._tick(), key))
+				self.connection.commit()
+
+			return row[0]
+
+
+	def put(self, key: str, response: str) -> None:
+		'''
+		Stores a response, evicting the least recently used entries beyond the configured limits.
+
+		:param key: str, cache key built with make_key.
+		:param response: str, response to store.
+		'''
+		if self.read_only:
+			return
+
+		size = len(response.encode('utf-8'))
+		with self.lock:
+			# Taking the write lock before reading, so the totals include the writes of every process sharing the file
+			self.connection.execute('BEGIN IMMEDIATE')
+			try:
+				previous = self.connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+				self.connection.execute(
+					'INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)',
+					(key, response, size, self._tick())
+				)
+				self.connection.execute(
+					'UPDATE totals SET entries = entries + ?, bytes = bytes + ? WHERE id = 0',
+					(1, size) if previous is None else (0, size - previous[0])
+				)
+
+				self._evict()
+				self.connection.commit()
+
+			except Exception:
+				self.connection.rollback()
+				raise
+
+
+	def _evict(self) -> None:
+		'''
+		Deletes the least recently used entries until the cache fits its limits, within the transaction of the write.
+		'''
+		entries, total_bytes = self._totals()
+		excess_entries = entries - self.max_entries if self.max_entries else 0
+		if excess_entries <= 0 and (not self.max_bytes or total_bytes <= self.max_bytes):
+			return
+
+		rows = self.connection.execute('SELECT key, size FROM responses ORDER BY last_access')
+		keys, freed = [], 0
+		for key, size in rows:
+			if len(keys) >= excess_entries and (not self.max_bytes or total_bytes - freed <= self.max_bytes):
+				break
+			keys.append((key,))
+			freed += size
+
+		self.connection.executemany('DELETE FROM responses WHERE key = ?', keys)
+		self.connection.execute('UPDATE totals SET entries = entries - ?, bytes = bytes - ? WHERE id = 0', (len(keys), freed))
+		self.evictions += len(keys)
+
+
+	def stats(self) -> dict:
+		'''
+		Returns the cache counters.
+
+		:return: dict, number of hits, misses, evictions, stored entries and bytes, and hit rate.
+		'''
+		lookups = self.hits + self.misses
+		with self.lock:
+			entries, total_bytes = self._totals()
+
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions,
+			'entries': entries,
+			'bytes': total_bytes,
+			'hit_rate': self.hits / lookups if lookups else 0.0
+		}
+
+
+	def close(self) -> None:
+		'''
+		Closes the database connection.
+		'''
+		with self.lock:
+			self.connection.close()
@@ -0,0 +1,159 @@
+import os
+import json
+import math
+import random
+from typing import Dict, List, Optional
+
+SCHEDULER_MODES = ('uniform', 'ucb', 'thompson')
+
+
+class StrategyScheduler:
+	def __init__(self, strategies: List[str], mode: str='uniform', state_path: Optional[str]=None, exploration: float=1.0, max_score: float=10.0, token_scale: float=1000.0, seconds_scale: float=10.0):
+		'''
+		Initializes the StrategyScheduler class, a multi-armed bandit allocating mutations among strategies.
+
+		Each evaluated mutation rewards its strategy with the score gained over its parent, as a fraction of the
+		maximum score, divided by its cost, 1 + tokens / token_scale + seconds / seconds_scale. Strategies that improve
+		problems cheaply and quickly end up with most mutations. Uniform mode draws with random.choice like before, so
+		seeded runs are unchanged, while still learning the rewards for later runs.
+
+		:param strategies: list, names of the mutation strategies.
+		:param mode: str, 'uniform', 'ucb' for UCB1 or 'thompson' for Thompson sampling, defaults to 'uniform'.
+		:param state_path: str, optional JSON file path the learned rewards are loaded from and saved to.
+		:param exploration: float, weight of the UCB exploration bonus, defaults to 1.0.
+		:param max_score: float, maximum evaluation score, defaults to 10.0.
+		:param token_scale: float, number of tokens costing as much as a mutation, defaults to 1000.
+		:param seconds_scale: float, number of seconds costing as much as a mutation, defaults to 10.
+		'''
+		if mode not in SCHEDULER_MODES:
+			raise ValueError(f"Error: Unknown scheduler mode '{mode}', select from {', '.join(SCHEDULER_MODES)}.")
+
+		self.strategies = list(strategies)
+		self.mode = mode
+		self.state_path = state_path
+		self.exploration = exploration
+		self.max_score = max_score
+		self.token_scale = token_scale
+		self.seconds_scale = seconds_scale
+		self.arms = {strategy: {'pulls': 0, 'reward': 0.0, 'gain': 0.0, 'tokens': 0.0, 'seconds': 0.0} for strategy in self.strategies}
+
+		# Restoring what previous runs learned about the strategies that still exist
+		if state_path and os.path.exists(state_path):
+			with open(state_path, 'r') as file:
+				state = json.load(file)
+			for strategy, arm in state.get('arms', {}).items():
+				if strategy in self.arms:
+					self.arms[strategy].update(arm)
+
+
+	def select(self, n: int) -> List[str]:
+		'''
+		Selects the strategy of each of the next n mutations.
+
+		UCB counts the selections of the batch as pulls without reward, so a round spreads its mutations instead of
+		giving every one to the current best strategy.
+
+		:param n: int, number of mutations.
+		:return: list, selected strategy for each mutation.
+		'''
+		if self.mode == 'uniform':
+			return [random.choice(self.strategies) for _ in range(n)]
+
+		if self.mode == 'thompson':
+			selected = []
+			for _ in range(n):
+				samples = {
+					strategy: random.betavariate(1.0 + arm['reward'], 1.0 + max(arm['pulls'] - arm['reward'], 0.0))
+					for strategy, arm in self.arms.items()
+				}
+				selected.append(max(self.strategies, key=lambda strategy: samples[strategy]))
+
+			return selected
+
+		pulls = {strategy: arm['pulls'] for strategy, arm in self.arms.items()}
+		selected = []
+		for _ in range(n):
+			untried = [strategy for strategy in self.strategies if pulls[strategy] == 0]
+			if untried:
+				strategy = untried[0]
+			else:
+				total = sum(pulls.values())
+				strategy = max(
+					self.strategies,
+					key=lambda strategy: self.arms[strategy]['reward'] / max(self.arms[strategy]['pulls'], 1)
+					+ self.exploration * math.sqrt(2 * math.log(total) / pulls[strategy])
+				)
+			pulls[strategy] += 1
+			selected.append(strategy)
+
+		return selected
+
+
+	def reward(self, gain: float, tokens: float, seconds: float) -> float:
+		'''
+		Computes the reward of a mutation.
+
+		:param gain: float, score of the mutation minus the score of its parent.
+		:param tokens: float, tokens of the mutation.
+		:param seconds: float, latency of the mutation.
+		:return: float, reward between 0 and 1.
+		'''
+		value = min(max(gain / self.max_score, 0.0), 1.0)
+		cost = 1.0 + tokens / self.token_scale + seconds / self.seconds_scale
+
+		return value / cost
+
+
+	def update(self, strategy: str, gain: float, tokens: float, seconds: float) -> None:
+		'''
+		Records the outcome of a mutation.
+
+		:param strategy: str, strategy of the mutation.
+		:param gain: float, score of the mutation minus the score of its parent.
+		:param tokens: float, tokens of the mutation.
+		:param seconds: float, latency of the mutation.
+		'''
+		if strategy not in self.arms:
+			return
+
+		arm = self.arms[strategy]
+		arm['pulls'] += 1
+		arm['reward'] += self.reward(gain=gain, tokens=tokens, seconds=seconds)
+		arm['gain'] += gain
+		arm['tokens'] += tokens
+		arm['seconds'] += seconds
+
+
+	def stats(self) -> Dict[str, dict]:
+		'''
+		Returns what the scheduler learned about each strategy.
+
+		:return: dict, number of mutations, mean reward, gain, tokens and seconds of each strategy.
+		'''
+		return {
+			strategy: {
+				'pulls': arm['pulls'],
+				'mean_reward': arm['reward'] / arm['pulls'] if arm['pulls'] else 0.0,
+				'mean_gain': arm['gain'] / arm['pulls'] if arm['pulls'] else 0.0,
+				'mean_tokens': arm['tokens'] / arm['pulls'] if arm['pulls'] else 0.0,
+				'mean_seconds': arm['seconds'] / arm['pulls'] if arm['pulls'] else 0.0
+			}
+			for strategy, arm in self.arms.items()
+		}
+
+
+	def save(self) -> None:
+		'''
+		Atomically writes the learned rewards to the state file, if there is one.
+		'''
+		if not self.state_path:
+			return
+
+		# Creating state folder if it does not exist
+		directory = os.path.dirname(self.state_path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+
+		with open(f'{self.state_path}.tmp', 'w') as file:
+			json.dump({'mode': self.mode, 'arms': self.arms}, file, indent=1)
+		os.replace(f'{self.state_path}.tmp', self.state_path)
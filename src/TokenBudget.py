@@ -0,0 +1,384 @@
+import re
+import math
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from src.Metrics import metrics
+
+# Pieces a BPE tokenizer splits text into before merging, approximating the pre-tokenization of OpenAI models
+TOKEN_PATTERN = re.compile(r"'(?:s|t|re|ve|m|ll|d)\b| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+", re.IGNORECASE)
+
+# Letters of a word merged into a single token, and tokens added by the framing of each chat message
+WORD_CHARS = 7
+MESSAGE_TOKENS = 4
+
+# Ratio of the tokens of a mutated statement to the tokens of its statement, before any mutation is seen
+GROWTH_PRIORS = {'add_constraints.txt': 1.5, 'expand.txt': 2.0, 'rephrase.txt': 1.2, 'simplify.txt': 0.9}
+DEFAULT_GROWTH = 1.5
+
+OVERFLOW_MODES = ('trim', 'reject')
+
+
+def piece_tokens(piece: str) -> int:
+	'''
+	Counts the tokens of a piece of pre-tokenized text.
+
+	:param piece: str, piece matched by TOKEN_PATTERN.
+	:return: int, number of tokens.
+	'''
+	text = piece.strip()
+	if not text:
+		return 1
+	if not text.isascii():
+		return len(text)
+	if text[0].isalpha():
+		return math.ceil(len(text) / WORD_CHARS)
+	if text[0].isdigit():
+		return 1
+
+	return math.ceil(len(text) / 2)
+
+
+def count_tokens(text: str) -> int:
+	'''
+	Estimates the number of tokens of a text offline, splitting it like a BPE tokenizer and counting long words
+	and punctuation runs as several tokens.
+
+	:param text: str, text to count.
+	:return: int, estimated number of tokens.
+	'''
+	return sum(piece_tokens(match.group()) for match in TOKEN_PATTERN.finditer(text))
+
+
+def trim_tokens(text: str, max_tokens: int) -> str:
+	'''
+	Cuts a text to its longest prefix of at most max_tokens tokens, between two pieces.
+
+	:param text: str, text to trim.
+	:param max_tokens: int, maximum number of tokens kept.
+	:return: str, trimmed text.
+	'''
+	tokens, end = 0, 0
+	for match in TOKEN_PATTERN.finditer(text):
+		piece = match.group()
+		if tokens + piece_tokens(piece) > max_tokens:
+			# Keeping the characters that fit of text counted a token per character
+			if not piece.isascii():
+				end = match.start() + len(piece) - len(piece.lstrip()) + max_tokens - tokens
+			break
+		tokens += piece_tokens(piece)
+		end = match.end()
+
+	return text[:end].rstrip()
+
+
+class TokenBudget:
+	def __init__(self, context_tokens: int=128000, max_completion_tokens: int=4096, min_completion_tokens: int=64, headroom: float=1.5, overflow: str='trim', token_cap: int=0, cost_cap: float=0.0, prompt_price: float=0.0025, completion_price: float=0.01, smoothing: float=0.2):
+		'''
+		Initializes the TokenBudget class, planning the tokens of requests and of whole runs from local token estimates.
+
+		The completion tokens of a mutation are sized from the tokens of its statement and the growth of its strategy,
+		learned from the mutations of the previous rounds, instead of a fixed maximum. Every request of a round is
+		planned from the growth of the round start and its mutations are only learned once it ends, so the requests
+		do not depend on the order in which responses arrive. Prompts that do not fit the context window
+		are trimmed or rejected before they are sent. A run can be forecast before it starts, and stopped between
+		rounds once its spend, plus the forecast of the next round, would exceed a token or cost cap.
+
+		:param context_tokens: int, context window of the model, defaults to 128000.
+		:param max_completion_tokens: int, largest completion a mutation is allowed, defaults to 4096.
+		:param min_completion_tokens: int, smallest completion a mutation is allowed, defaults to 64.
+		:param headroom: float, factor applied to the expected completion tokens, defaults to 1.5.
+		:param overflow: str, 'trim' to cut statements that overflow the context window or 'reject' to fail them, defaults to 'trim'.
+		:param token_cap: int, maximum number of tokens spent by a run, 0 for unlimited, defaults to 0.
+		:param cost_cap: float, maximum cost of a run, 0 for unlimited, defaults to 0.
+		:param prompt_price: float, price of a thousand prompt tokens, defaults to 0.0025.
+		:param completion_price: float, price of a thousand completion tokens, defaults to 0.01.
+		:param smoothing: float, weight of each new mutation in the learned growth of its strategy, defaults to 0.2.
+		'''
+		self.lock = threading.Lock()
+		self.growth: Dict[str, float] = dict(GROWTH_PRIORS)
+		# Growth the requests of the round in progress are planned from, and the mutations it recorded
+		self.round_growth: Optional[Dict[str, float]] = None
+		self.round_mutations: List[tuple] = []
+		self.baseline = (0.0, 0.0)
+		self.configure(
+			context_tokens=context_tokens, max_completion_tokens=max_completion_tokens, min_completion_tokens=min_completion_tokens,
+			headroom=headroom, overflow=overflow, token_cap=token_cap, cost_cap=cost_cap, prompt_price=prompt_price,
+			completion_price=completion_price, smoothing=smoothing
+		)
+
+
+	def configure(self, **settings) -> None:
+		'''
+		Changes the settings of the budget, keeping the learned growth of the strategies.
+
+		:param settings: settings named as the arguments of the constructor.
+		'''
+		settings = {**getattr(self, 'settings', {}), **settings}
+		if settings['overflow'] not in OVERFLOW_MODES:
+			raise ValueError(f"Error: Unknown context overflow mode '{settings['overflow']}', select from {', '.join(OVERFLOW_MODES)}.")
+		if not 0 < settings['min_completion_tokens'] <= settings['max_completion_tokens'] < settings['context_tokens']:
+			raise ValueError(f"Error: Completion tokens must be between 1 and the context window, got {settings['min_completion_tokens']} to {settings['max_completion_tokens']} of {settings['context_tokens']}.")
+		if settings['headroom'] < 1.0:
+			raise ValueError(f"Error: Headroom must be at least 1, got {settings['headroom']}.")
+
+		self.settings = settings
+		for name, value in settings.items():
+			setattr(self, name, value)
+
+
+	def reset(self, spent: Optional[dict]=None) -> None:
+		'''
+		Starts a run, counting its spend from the tokens recorded so far in the process and learning the growth of the
+		strategies from their priors.
+
+		:param spent: dict, optional spend of the run before it was interrupted, as returned by spent, counted when resuming.
+		'''
+		with self.lock:
+			self.growth = dict(GROWTH_PRIORS)
+			self.round_growth, self.round_mutations = None, []
+
+		spent = spent or {}
+		self.baseline = (
+			metrics.combined('llm_prompt_tokens_total') - spent.get('prompt_tokens', 0),
+			metrics.combined('llm_completion_tokens_total') - spent.get('completion_tokens', 0)
+		)
+
+
+	def expected_tokens(self, strategy: Optional[str], statement_tokens: int) -> float:
+		'''
+		Returns the expected completion tokens of a mutation.
+
+		:param strategy: str, strategy of the mutation.
+		:param statement_tokens: int, tokens of the mutated statement.
+		:return: float, expected completion tokens.
+		'''
+		with self.lock:
+			growth = self.round_growth if self.round_growth is not None else self.growth
+			return statement_tokens * growth.get(strategy, DEFAULT_GROWTH)
+
+
+	def max_tokens(self, strategy: Optional[str], statement_tokens: int, prompt_tokens: int=0) -> int:
+		'''
+		Sizes the completion tokens of a mutation from its expected tokens, within the limits and the room left by the prompt.
+
+		:param strategy: str, strategy of the mutation.
+		:param statement_tokens: int, tokens of the mutated statement.
+		:param prompt_tokens: int, tokens of the request, defaults to 0.
+		:return: int, maximum number of completion tokens.
+		'''
+		planned = math.ceil(self.expected_tokens(strategy, statement_tokens) * self.headroom)
+
+		return max(min(planned, self.max_completion_tokens, self.context_tokens - prompt_tokens), self.min_completion_tokens)
+
+
+	def cap_tokens(self, completion_tokens: int, prompt_tokens: int=0) -> int:
+		'''
+		Caps the completion tokens of a request sized by the caller, such as a packed request answering several problems,
+		to the limits and the room left by the prompt.
+
+		:param completion_tokens: int, completion tokens asked for.
+		:param prompt_tokens: int, tokens of the request, defaults to 0.
+		:return: int, maximum number of completion tokens.
+		'''
+		return max(min(completion_tokens, self.max_completion_tokens, self.context_tokens - prompt_tokens), 1)
+
+
+	def overflow_tokens(self, prompt_tokens: int) -> int:
+		'''
+		Returns the tokens a request has to lose to leave the smallest completion room in the context window.
+
+		:param prompt_tokens: int, tokens of the request.
+		:return: int, number of tokens over the context window, 0 or less if the request fits.
+		'''
+		return prompt_tokens + self.min_completion_tokens - self.context_tokens
+
+
+	def record(self, strategy: Optional[str], statement_tokens: int, completion_tokens: int) -> None:
+		'''
+		Learns the growth of a strategy from one of its mutations, once the round in progress ends.
+
+		:param strategy: str, strategy of the mutation.
+		:param statement_tokens: int, tokens of the mutated statement.
+		:param completion_tokens: int, tokens of the mutated statement returned by the model.
+		'''
+		if strategy is None or statement_tokens <= 0:
+			return
+
+		with self.lock:
+			if self.round_growth is not None:
+				self.round_mutations.append((strategy, statement_tokens, completion_tokens))
+			else:
+				self._learn(strategy, statement_tokens, completion_tokens)
+
+
+	def _learn(self, strategy: str, statement_tokens: int, completion_tokens: int) -> None:
+		'''
+		Moves the growth of a strategy towards the growth of a mutation, with the lock held.
+		'''
+		growth = self.growth.get(strategy, DEFAULT_GROWTH)
+		self.growth[strategy] = growth + self.smoothing * (completion_tokens / statement_tokens - growth)
+
+
+	def begin_round(self, growth: Optional[Dict[str, float]]=None) -> None:
+		'''
+		Plans the requests of a round from the growth learned so far, keeping its mutations until the round ends.
+
+		:param growth: dict, optional growth of each strategy to plan from, such as the growth of a checkpointed round, defaults to the learned growth.
+		'''
+		with self.lock:
+			if growth is not None:
+				self.growth = dict(growth)
+			self.round_growth = dict(self.growth)
+			self.round_mutations = []
+
+
+	def end_round(self) -> None:
+		'''
+		Learns the growth of the strategies from the mutations of the round, in an order that does not depend on the
+		order in which they completed.
+		'''
+		with self.lock:
+			for strategy, statement_tokens, completion_tokens in sorted(self.round_mutations):
+				self._learn(strategy, statement_tokens, completion_tokens)
+			self.round_growth, self.round_mutations = None, []
+
+
+	@contextmanager
+	def planned_round(self, growth: Optional[Dict[str, float]]=None) -> Iterator[None]:
+		'''
+		Plans the requests sent within the context as a round, unless a round is already in progress.
+
+		:param growth: dict, optional growth of each strategy to plan from when the context begins the round.
+		'''
+		with self.lock:
+			begins = self.round_growth is None
+		if begins:
+			self.begin_round(growth=growth)
+		try:
+			yield
+
+		finally:
+			if begins:
+				self.end_round()
+
+
+	def cost(self, prompt_tokens: float, completion_tokens: float) -> float:
+		'''
+		Prices prompt and completion tokens.
+
+		:param prompt_tokens: float, number of prompt tokens.
+		:param completion_tokens: float, number of completion tokens.
+		:return: float, cost of the tokens.
+		'''
+		return (prompt_tokens * self.prompt_price + completion_tokens * self.completion_price) / 1000
+
+
+	def forecast(self, statements: List[str], strategies: List[Optional[str]], prompt_templates: dict, evaluation_template: str, num_rounds: int=1, population_size: int=0, evaluation_max_tokens: int=16, system_tokens: int=0) -> dict:
+		'''
+		Forecasts the requests, tokens and cost of the next rounds of a run, without evaluation retries or judge ensembles.
+
+		The first round mutates the given statements with their strategies. Later rounds mutate population_size children,
+		spread over every strategy, whose statements grow as the mutated statements of their parents did.
+
+		:param statements: list, statements of the problems of the first round.
+		:param strategies: list, strategy of each problem of the first round, None for problems that are not mutated.
+		:param prompt_templates: dict, dictionary where keys are the mutation strategies and values are the templates.
+		:param evaluation_template: str, evaluation template.
+		:param num_rounds: int, number of rounds to forecast, defaults to 1.
+		:param population_size: int, number of problems of the later rounds, defaults to the number of statements.
+		:param evaluation_max_tokens: int, maximum number of completion tokens of an evaluation, defaults to 16.
+		:param system_tokens: int, tokens of the system message of a request, defaults to 0.
+		:return: dict, requests, prompt tokens, expected and maximum completion tokens, and expected and maximum cost.
+		'''
+		template_tokens = {strategy: count_tokens(template.format(statement='')) for strategy, template in prompt_templates.items()}
+		evaluation_tokens = count_tokens(evaluation_template.format(original_statement='', mutated_statement=''))
+		overhead = system_tokens + 2 * MESSAGE_TOKENS
+		items = [(count_tokens(statement), count_tokens(statement), strategy) for statement, strategy in zip(statements, strategies)]
+
+		requests, prompt_tokens, completion_tokens, max_completion_tokens = 0, 0.0, 0.0, 0.0
+		for n_round in range(num_rounds):
+			children = []
+			for original, statement, strategy in items:
+				mutated = statement
+				if strategy is not None:
+					mutated = self.expected_tokens(strategy, statement)
+					requests += 1
+					prompt_tokens += template_tokens.get(strategy, 0) + statement + overhead
+					completion_tokens += mutated
+					max_completion_tokens += self.max_tokens(strategy, round(statement))
+
+				requests += 1
+				prompt_tokens += evaluation_tokens + original + mutated + overhead
+				completion_tokens += evaluation_max_tokens
+				max_completion_tokens += evaluation_max_tokens
+				children.append((original, mutated))
+
+			# Spreading the children of the next round over the strategies, with the statement sizes of the round
+			if not children:
+				break
+			size = population_size or len(children)
+			names = list(prompt_templates.keys())
+			items = [children[position % len(children)] + (names[position % len(names)],) for position in range(size)]
+
+		return {
+			'rounds': num_rounds,
+			'requests': requests,
+			'prompt_tokens': round(prompt_tokens),
+			'completion_tokens': round(completion_tokens),
+			'max_completion_tokens': round(max_completion_tokens),
+			'cost': round(self.cost(prompt_tokens, completion_tokens), 4),
+			'max_cost': round(self.cost(prompt_tokens, max_completion_tokens), 4)
+		}
+
+
+	def spent(self) -> dict:
+		'''
+		Returns the tokens reported by the model since the budget was reset and their cost.
+
+		:return: dict, prompt, completion and total tokens, and their cost.
+		'''
+		prompt_tokens = metrics.combined('llm_prompt_tokens_total') - self.baseline[0]
+		completion_tokens = metrics.combined('llm_completion_tokens_total') - self.baseline[1]
+
+		return {
+			'prompt_tokens': prompt_tokens,
+			'completion_tokens': completion_tokens,
+			'tokens': prompt_tokens + completion_tokens,
+			'cost': round(self.cost(prompt_tokens, completion_tokens), 4)
+		}
+
+
+	def exceeded(self, forecast: Optional[dict]=None) -> Optional[str]:
+		'''
+		Checks whether the spend of the run, plus the expected spend of a forecast, goes over a cap.
+
+		:param forecast: dict, optional forecast of the next rounds.
+		:return: str, description of the exceeded cap, None if the run is within its budget.
+		'''
+		spent = self.spent()
+		tokens = spent['tokens'] + (forecast['prompt_tokens'] + forecast['completion_tokens'] if forecast else 0)
+		cost = spent['cost'] + (forecast['cost'] if forecast else 0.0)
+
+		if self.token_cap and tokens > self.token_cap:
+			return f"{spent['tokens']:.0f} tokens spent and {tokens - spent['tokens']:.0f} forecast exceed the budget of {self.token_cap} tokens"
+		if self.cost_cap and cost > self.cost_cap:
+			return f"a cost of {spent['cost']:.4f} spent and {cost - spent['cost']:.4f} forecast exceeds the budget of {self.cost_cap:.4f}"
+
+		return None
+
+
+	def stats(self) -> dict:
+		'''
+		Returns the spend of the run and the learned growth of each strategy.
+
+		:return: dict, tokens and cost spent, and growth of each strategy.
+		'''
+		with self.lock:
+			growth = {strategy: round(value, 3) for strategy, value in self.growth.items()}
+
+		return {**self.spent(), 'growth': growth}
+
+
+# Token budget of the process, configured by a run from its arguments
+budget = TokenBudget()
@@ -0,0 +1,79 @@
+"""
+Fake clients and problems shared by the round tests.
+"""
+
+import sys
+sys.path.append('.')
+
+import asyncio
+import hashlib
+from scripts.data_handling import Problem
+from src.TokenBudget import trim_tokens
+
+
+def make_problems(n: int, original: str="Problem {i} description", **fields) -> list:
+	'''
+	Creates the problems of a round.
+
+	:param n: int, number of problems.
+	:param original: str, original statement of each problem, formatted with its position.
+	:param fields: other fields of every problem, such as mutated_description or mutated.
+	:return: list, list of Problem classes with ids '0' to 'n-1'.
+	'''
+	return [Problem(id=str(i), original_description=original.format(i=i), **fields) for i in range(n)]
+
+
+class FakeClient:
+	'''
+	Deterministic client answering from a hash of the prompt and of the request options.
+
+	Mutations repeat the prompt followed by a number of added constraints, cut to max_tokens as a model would cut
+	them, and evaluations return a score, both depending on the temperature. Rounds sending the same prompts with
+	different options therefore get different results, as they would from a model.
+	'''
+	model = 'fake'
+
+	def __init__(self, fail_on: str=None):
+		'''
+		:param fail_on: str, optional, requests whose prompt contains it fail.
+		'''
+		self.fail_on = fail_on
+
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: dict=None) -> str:
+		if self.fail_on and self.fail_on in user_input:
+			raise RuntimeError("Content filtered")
+
+		digest = int(hashlib.sha256(f'{temperature:g} {user_input}'.encode('utf-8')).hexdigest(), 16)
+		if 'scoring' in system_message:
+			return str(digest % 100 / 10)
+
+		constraints = ''.join(f" Constraint {k}: the answer fits in {k + 1} bits." for k in range(digest % 40))
+		return trim_tokens(f"Mutated: {user_input}{constraints}", max_tokens)
+
+
+class FakeAsyncClient(FakeClient):
+	'''
+	Asynchronous counterpart of FakeClient, adding artificial latency and tracking the requests in flight.
+	'''
+	def __init__(self, latency: float=0.05, fail_on: str=None):
+		'''
+		:param latency: float, seconds each request takes, defaults to 0.05.
+		:param fail_on: str, optional, requests whose prompt contains it fail.
+		'''
+		super().__init__(fail_on=fail_on)
+		self.latency = latency
+		self.in_flight = 0
+		self.max_in_flight = 0
+
+
+	async def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: dict=None) -> str:
+		self.in_flight += 1
+		self.max_in_flight = max(self.max_in_flight, self.in_flight)
+		try:
+			await asyncio.sleep(self.latency)
+
+		finally:
+			self.in_flight -= 1
+
+		return FakeClient.generate_response(self, user_input, system_message, temperature, max_tokens, response_format)
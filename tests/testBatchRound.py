@@ -0,0 +1,184 @@
+"""
+Unit test class for batch rounds.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+import scripts.main
+from scripts.rounds import run_round_sequential, run_round_batch
+from src.BatchClient import BatchClient, LocalBatchClient, AzureBatchClient
+from src.Metrics import metrics
+from src.TokenBudget import budget
+from tests.fakes import FakeClient, make_problems
+
+
+class TestBatchRound(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.prompt_templates = {'rephrase.txt': "Rephrase: {statement}", 'simplify.txt': "Simplify: {statement}"}
+		self.evaluation_template = "Evaluate: {original_statement} vs {mutated_statement}"
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def test_batch_matches_sequential(self):
+		'''
+		Test that the batch round maps every result back to its problem.
+		'''
+		strategies = ['rephrase.txt', 'simplify.txt'] * 3
+		budget.reset()
+		sequential_problems = make_problems(6)
+		run_round_sequential(FakeClient(), FakeClient(), sequential_problems, strategies, self.prompt_templates, self.evaluation_template)
+
+		# Starting from the growth the sequential round started from
+		budget.reset()
+		batch_problems = make_problems(6)
+		batch_client = LocalBatchClient(client=FakeClient(), work_dir=self.directory)
+		results = []
+		run_round_batch(batch_client, batch_client, batch_problems, strategies, self.prompt_templates, self.evaluation_template, on_result=lambda index, problem: results.append(index))
+
+		self.assertEqual([p.mutated_description for p in sequential_problems], [p.mutated_description for p in batch_problems])
+		self.assertEqual([p.score for p in sequential_problems], [p.score for p in batch_problems])
+		self.assertEqual(results, list(range(6)))
+
+		# One input and one output file per stage
+		self.assertEqual(len(os.listdir(self.directory)), 4)
+
+
+	def test_failed_requests_are_logged(self):
+		'''
+		Test that failed batch requests are logged in their problems and raise once the batch is processed.
+		'''
+		problems = make_problems(3)
+		batch_client = LocalBatchClient(client=FakeClient(fail_on='Problem 1 '), work_dir=self.directory)
+
+		with self.assertRaises(ValueError):
+			run_round_batch(batch_client, batch_client, problems, ['rephrase.txt'] * 3, self.prompt_templates, self.evaluation_template)
+
+		self.assertTrue(problems[0].mutated)
+		self.assertFalse(problems[1].mutated)
+		self.assertIn("Content filtered", problems[1].error_logs[-1])
+
+
+	def test_parse_result(self):
+		'''
+		Test parsing of successful, failed and malformed batch output lines.
+		'''
+		success = {'custom_id': '1', 'response': {'status_code': 200, 'body': {'choices': [{'message': {'content': '7'}}]}}, 'error': None}
+		failure = {'custom_id': '2', 'response': {'status_code': 429, 'body': {}}, 'error': None}
+		malformed = {'custom_id': '3', 'response': {'status_code': 200, 'body': {'choices': []}}, 'error': None}
+
+		self.assertEqual(BatchClient.parse_result(success), {'content': '7'})
+		self.assertIn('429', BatchClient.parse_result(failure)['error'])
+		self.assertIn('Malformed', BatchClient.parse_result(malformed)['error'])
+
+
+	def test_azure_batch_client_polls_until_completed(self):
+		'''
+		Test that the Azure batch client uploads the input, polls the job and downloads its output.
+		'''
+		azure_client = Mock(model='batch-usage')
+		sdk = azure_client.client
+		sdk.files.create.return_value = Mock(id='file-in')
+		sdk.batches.create.return_value = Mock(id='batch-1')
+		sdk.batches.retrieve.side_effect = [
+			Mock(status='validating'), Mock(status='in_progress'),
+			Mock(status='completed'), Mock(status='completed', output_file_id='file-out', error_file_id=None)
+		]
+		output = {'custom_id': 'a', 'response': {'status_code': 200, 'body': {'choices': [{'message': {'content': 'done'}}], 'usage': {'prompt_tokens': 12, 'completion_tokens': 3}}}, 'error': None}
+		sdk.files.content.return_value = Mock(text=json.dumps(output) + '\n')
+
+		batch_client = AzureBatchClient(client=azure_client, work_dir=self.directory, poll_interval=0)
+		results = batch_client.run([batch_client.build_request(custom_id='a', user_input='Hi', system_message='System')])
+
+		self.assertEqual(results, {'a': {'content': 'done'}})
+		self.assertEqual(metrics.value('llm_prompt_tokens_total', model='batch-usage'), 12)
+		self.assertEqual(metrics.value('llm_completion_tokens_total', model='batch-usage'), 3)
+		self.assertEqual(sdk.batches.create.call_args.kwargs['input_file_id'], 'file-in')
+		sdk.files.content.assert_called_once_with('file-out')
+
+
+	def test_stuck_batch_is_cancelled(self):
+		'''
+		Test that a batch job still running past its completion window is cancelled and raises.
+		'''
+		azure_client = Mock(model='batch-stuck')
+		sdk = azure_client.client
+		sdk.files.create.return_value = Mock(id='file-in')
+		sdk.batches.create.return_value = Mock(id='batch-2')
+		sdk.batches.retrieve.return_value = Mock(status='in_progress')
+
+		batch_client = AzureBatchClient(client=azure_client, work_dir=self.directory, poll_interval=0.01, completion_window='0.05s')
+		self.assertEqual(batch_client.timeout, 0.05)
+		with self.assertRaises(RuntimeError):
+			batch_client.run([batch_client.build_request(custom_id='a', user_input='Hi', system_message='System')])
+		sdk.batches.cancel.assert_called_once_with('batch-2')
+
+		self.assertEqual(AzureBatchClient(client=azure_client, work_dir=self.directory).timeout, 86400)
+		with self.assertRaises(ValueError):
+			AzureBatchClient(client=azure_client, work_dir=self.directory, completion_window='a day')
+		with self.assertRaises(TypeError):
+			BatchClient(model='abstract')
+
+
+	def test_unparseable_responses_are_resubmitted(self):
+		'''
+		Test that only the evaluations without a score are sent again in a smaller batch.
+		'''
+		class ChattyClient(FakeClient):
+			def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: dict=None) -> str:
+				if 'scoring' in system_message and 'Problem 1 ' in user_input and temperature > 0:
+					return "This one is quite good."
+				return super().generate_response(user_input, system_message, temperature, max_tokens, response_format)
+
+		budget.reset()
+		problems = make_problems(3)
+		batch_client = LocalBatchClient(client=ChattyClient(), work_dir=self.directory)
+		run_round_batch(batch_client, batch_client, problems, ['rephrase.txt'] * 3, self.prompt_templates, self.evaluation_template)
+
+		budget.reset()
+		expected = make_problems(3)
+		run_round_sequential(ChattyClient(), ChattyClient(), expected, ['rephrase.txt'] * 3, self.prompt_templates, self.evaluation_template)
+		self.assertEqual([p.score for p in problems], [p.score for p in expected])
+		self.assertIn("Unparseable", problems[1].warnings_log[-1])
+
+		# Mutation, evaluation and retried evaluation stages
+		self.assertEqual(len(os.listdir(self.directory)), 6)
+
+
+
+	def test_mock_backend_runs_batch_rounds(self):
+		'''
+		Test that a run in 'batch' round mode against the mock backend processes its batch jobs locally and scores as a sequential run.
+		'''
+		saved = {}
+		for mode in ('sequential', 'batch'):
+			argv = [
+				'main.py', '--backend', 'mock', '--mock-latency-ms', '0', '--seed', '5', '--num-rounds', '2', '--num-problems', '6', '--topk-problems', '2',
+				'--round-mode', mode, '--batch-dir', os.path.join(self.directory, mode, 'batches'),
+				'--checkpoint-dir', os.path.join(self.directory, mode, 'checkpoints'),
+				'--leaderboard-path', os.path.join(self.directory, mode, 'leaderboard.sqlite'),
+				'--metrics-summary', os.path.join(self.directory, mode, 'metrics.json'),
+				'--lineage-path', os.path.join(self.directory, mode, 'lineage.sqlite'),
+				'--scheduler-state', os.path.join(self.directory, mode, 'scheduler.json')
+			]
+			saved[mode] = []
+			with patch('sys.argv', argv), patch('scripts.main.Logger', Mock()), patch('scripts.main.save_mutated_problem', lambda problem: saved[mode].append((problem.mutated_description, problem.score))):
+				scripts.main.main()
+
+		self.assertEqual(len(saved['batch']), 4)
+		self.assertEqual(saved['batch'], saved['sequential'])
+		self.assertTrue(os.listdir(os.path.join(self.directory, 'batch', 'batches')))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,87 @@
+"""
+Unit test class for the benchmark harness.
+"""
+
+import sys
+sys.path.append('.')
+
+import copy
+import unittest
+from unittest.mock import Mock
+from scripts.benchmark import TimedClient, run_benchmark, compare_results, percentile
+from src.LLMBackend import StreamingLLMBackend
+
+
+class TestBenchmark(unittest.TestCase):
+	def test_percentile(self):
+		'''
+		Test nearest-rank percentiles.
+		'''
+		values = [float(i) for i in range(1, 101)]
+		self.assertEqual(percentile(values, 50), 50.0)
+		self.assertEqual(percentile(values, 99), 99.0)
+		self.assertEqual(percentile([3.0], 95), 3.0)
+		self.assertIsNone(percentile([], 50))
+
+
+	def test_run_benchmark_reports_every_metric(self):
+		'''
+		Test that a small run against the mock backend reports throughput, latency, stages, memory and tokens.
+		'''
+		for round_mode in ('sequential', 'pipeline', 'packed'):
+			result = run_benchmark(size=12, round_mode=round_mode, num_rounds=2, latency_ms=1)
+			self.assertGreater(result['stage_seconds']['mutation'], 0)
+			self.assertGreater(result['stage_seconds']['evaluation'], 0)
+			if round_mode == 'packed':
+				continue
+
+			self.assertEqual(result['latency']['mutation']['calls'], 24)
+			self.assertEqual(result['latency']['evaluation']['calls'], 24)
+			self.assertEqual(result['requests'], 48)
+			self.assertGreater(result['problems_per_second'], 0)
+			self.assertLessEqual(result['latency']['all']['p50_ms'], result['latency']['all']['p99_ms'])
+			self.assertEqual(set(result['stage_seconds']), {'load', 'round', 'mutation', 'evaluation', 'leaderboard', 'save'})
+			self.assertEqual(len(result['tokens_per_round']), 2)
+			self.assertGreater(result['peak_rss_mb'], 0)
+
+
+	def test_timed_client_forwards_requests(self):
+		'''
+		Test that the timed client forwards the structured output format and streams of the requests it times.
+		'''
+		client = Mock(model='fake')
+		client.generate_response.return_value = '{"score": 7}'
+		client.stream_response.return_value = "Mutated statement."
+		latencies = []
+		timed_client = TimedClient(client, latencies)
+		stop_at = lambda text: None
+
+		self.assertIsInstance(timed_client, StreamingLLMBackend)
+		self.assertEqual(timed_client.generate_response(user_input="Evaluate", system_message="Score.", response_format={'type': 'json_object'}), '{"score": 7}')
+		self.assertEqual(timed_client.stream_response(user_input="Mutate", system_message="Mutate.", stop_at=stop_at), "Mutated statement.")
+		self.assertEqual(client.generate_response.call_args.kwargs['response_format'], {'type': 'json_object'})
+		self.assertIs(client.stream_response.call_args.kwargs['stop_at'], stop_at)
+		self.assertEqual(len(latencies), 2)
+
+
+	def test_compare_results_flags_regressions(self):
+		'''
+		Test that slower throughput beyond the tolerance is reported and changes within it are not.
+		'''
+		baseline = [{
+			'size': 10, 'round_mode': 'sequential', 'problems_per_second': 100.0, 'peak_rss_mb': 50.0,
+			'latency': {'all': {'p95_ms': 10.0}}, 'tokens_per_round': [1000]
+		}]
+		results = copy.deepcopy(baseline)
+		results[0]['problems_per_second'] = 95.0
+		self.assertEqual(compare_results(results, baseline, tolerance=0.1), [])
+
+		results[0]['problems_per_second'] = 80.0
+		results[0]['latency']['all']['p95_ms'] = 12.0
+		regressions = compare_results(results, baseline, tolerance=0.1)
+		self.assertEqual(len(regressions), 2)
+		self.assertIn("problems/sec", regressions[0])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,177 @@
+"""
+Unit test class for checkpointing and resuming runs.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from scripts.checkpoint import save_checkpoint, load_checkpoint, append_journal, replay_journal
+from tests.fakes import FakeClient, make_problems
+import scripts.main
+
+
+class FlakyClient(FakeClient):
+	'''
+	Fake client created by a run, which can be made to fail once after a number of calls across all instances.
+	'''
+	calls = 0
+	fail_at = None
+
+	def __init__(self, **kwargs):
+		super().__init__()
+		self.model = kwargs.get('model')
+
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: dict=None) -> str:
+		FlakyClient.calls += 1
+		if FlakyClient.fail_at is not None and FlakyClient.calls == FlakyClient.fail_at:
+			raise RuntimeError("Network blip")
+
+		return super().generate_response(user_input, system_message, temperature, max_tokens, response_format)
+
+
+class RestatingClient(FlakyClient):
+	'''
+	Flaky client restating every problem the same way, so the children of a survivor duplicate its statement.
+	'''
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: dict=None) -> str:
+		response = super().generate_response(user_input, system_message, temperature, max_tokens, response_format)
+
+		return response if 'scoring' in system_message else "Count the islands of the grid, where each island is a group of adjacent land cells."
+
+
+class TestCheckpoint(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.saved = []
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def run_main(self, run_name: str, resume: str='N', fail_at: int=None, client_class=FlakyClient, options: list=()) -> None:
+		FlakyClient.calls = 0
+		FlakyClient.fail_at = fail_at
+		argv = [
+			'main.py', '--seed', '7', '--num-rounds', '3', '--num-problems', '6', '--topk-problems', '3',
+			'--checkpoint-dir', os.path.join(self.directory, run_name),
+			'--leaderboard-path', os.path.join(self.directory, f'{run_name}.sqlite'),
+			'--metrics-summary', os.path.join(self.directory, f'{run_name}.json'),
+			'--lineage-path', os.path.join(self.directory, f'{run_name}-lineage.sqlite'),
+			'--scheduler-state', os.path.join(self.directory, f'{run_name}-scheduler.json'),
+			'--resume', resume, *options
+		]
+		save = lambda problem: self.saved.append((problem.mutated_description, problem.score))
+
+		with patch('sys.argv', argv), patch('scripts.main.Logger', Mock()), patch('scripts.main.run_env', Mock()), \
+			patch('scripts.main.AzureOpenAIClient', client_class), patch('scripts.main.save_mutated_problem', save):
+			scripts.main.main()
+
+
+	def test_resume_matches_uninterrupted_run(self):
+		'''
+		Test that a run interrupted mid-round and resumed saves the same problems as an uninterrupted run.
+		'''
+		self.run_main('uninterrupted')
+		expected, self.saved = self.saved, []
+
+		# Failing on the 20th call, in the middle of the second round
+		with self.assertRaises(ValueError):
+			self.run_main('interrupted', fail_at=20)
+		self.run_main('interrupted', resume='Y')
+
+		self.assertEqual(self.saved, expected)
+		self.assertTrue(load_checkpoint(os.path.join(self.directory, 'interrupted'))['completed'])
+
+
+	def test_resume_keeps_scheduler_state(self):
+		'''
+		Test that the strategy scheduler of a resumed run learns the same outcomes as in an uninterrupted run.
+		'''
+		def scheduler_state(run_name: str) -> dict:
+			with open(os.path.join(self.directory, f'{run_name}-scheduler.json'), 'r') as file:
+				arms = json.load(file)['arms']
+
+			# Leaving out the latency of the mutations, which differs between runs
+			return {strategy: (arm['pulls'], round(arm['gain'], 6), arm['tokens']) for strategy, arm in arms.items()}
+
+		self.run_main('uninterrupted')
+		with self.assertRaises(ValueError):
+			self.run_main('interrupted', fail_at=20)
+		self.run_main('interrupted', resume='Y')
+
+		self.assertEqual(scheduler_state('interrupted'), scheduler_state('uninterrupted'))
+		self.assertGreater(sum(pulls for pulls, _, _ in scheduler_state('uninterrupted').values()), 0)
+
+
+	def test_resume_skips_completed_calls(self):
+		'''
+		Test that resuming only sends the calls that were not completed before the interruption.
+		'''
+		self.run_main('uninterrupted')
+		total_calls = FlakyClient.calls
+
+		with self.assertRaises(ValueError):
+			self.run_main('interrupted', fail_at=20)
+		self.run_main('interrupted', resume='Y')
+
+		# The 19 calls completed before the failure are not sent again
+		self.assertEqual(19 + FlakyClient.calls, total_calls)
+
+
+	def test_resume_keeps_dedup_index(self):
+		'''
+		Test that a resumed run reuses the scores of the statements evaluated before the interruption instead of evaluating their duplicates.
+		'''
+		run = lambda run_name, **kwargs: self.run_main(run_name, client_class=RestatingClient, options=['--dedup', 'Y'], **kwargs)
+		run('uninterrupted')
+		expected, total_calls, self.saved = self.saved, FlakyClient.calls, []
+
+		# Failing in the middle of the second round, whose duplicates reuse scores of the first round
+		with self.assertRaises(ValueError):
+			run('interrupted', fail_at=16)
+		self.assertEqual(load_checkpoint(os.path.join(self.directory, 'interrupted'))['n_round'], 1)
+		run('interrupted', resume='Y')
+
+		self.assertEqual(15 + FlakyClient.calls, total_calls)
+		self.assertEqual(self.saved, expected)
+
+
+	def test_journal_replay(self):
+		'''
+		Test that the journal restores completed stages and the checkpoint restores the random state.
+		'''
+		checkpoint_dir = os.path.join(self.directory, 'journal')
+		problems = make_problems(3)
+
+		random.seed(3)
+		save_checkpoint(checkpoint_dir, n_round=1, problems=problems, strategies=['rephrase.txt'] * 3, run_id='run')
+		expected_draw = random.random()
+
+		problems[0].mutated, problems[0].mutated_description = True, "Mutated 0"
+		append_journal(checkpoint_dir, n_round=1, stage='mutation', problem=problems[0])
+		problems[0].score = 9.0
+		append_journal(checkpoint_dir, n_round=1, stage='evaluation', problem=problems[0])
+		with open(os.path.join(checkpoint_dir, 'journal-1.jsonl'), 'a') as file:
+			file.write('{"stage": "mutation", "prob')
+
+		checkpoint = load_checkpoint(checkpoint_dir)
+		self.assertEqual(random.random(), expected_draw)
+		self.assertEqual(checkpoint['run_id'], 'run')
+
+		mutated, evaluated = replay_journal(checkpoint_dir, n_round=1, problems=checkpoint['problems'])
+		self.assertEqual((mutated, evaluated), ({'0'}, {'0'}))
+		self.assertEqual(checkpoint['problems'][0].score, 9.0)
+		self.assertFalse(checkpoint['problems'][1].mutated)
+
+
+if __name__ == '__main__':
+	unittest.main()
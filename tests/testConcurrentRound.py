@@ -0,0 +1,78 @@
+"""
+Unit test class for concurrent rounds.
+"""
+
+import sys
+sys.path.append('.')
+
+import time
+import random
+import asyncio
+import unittest
+from src.LineageStore import lineage
+from src.TokenBudget import budget
+from scripts.rounds import select_strategies, run_round_sequential, run_round_async
+from tests.fakes import FakeClient, FakeAsyncClient, make_problems
+
+
+class TestConcurrentRound(unittest.TestCase):
+	def setUp(self):
+		self.prompt_templates = {'rephrase.txt': "Rephrase: {statement}", 'simplify.txt': "Simplify this problem: {statement}"}
+		self.evaluation_template = "Evaluate: {original_statement} vs {mutated_statement}"
+
+
+	def test_async_matches_sequential(self):
+		'''
+		Test that the concurrent round produces the same results as the sequential round for a given seed.
+		'''
+		budget.reset()
+		random.seed(42)
+		sequential_problems = make_problems(12)
+		strategies = select_strategies(problems=sequential_problems, prompt_templates=self.prompt_templates)
+		run_round_sequential(FakeClient(), FakeClient(), sequential_problems, strategies, self.prompt_templates, self.evaluation_template)
+
+		# Keeping the history of the sequential round apart, as both rounds use the same problem ids
+		sequential_logs = [p.mutation_log for p in sequential_problems]
+		for problem in sequential_problems:
+			lineage.discard(problem.id)
+
+		# Starting from the growth the sequential round started from
+		budget.reset()
+		random.seed(42)
+		async_problems = make_problems(12)
+		strategies = select_strategies(problems=async_problems, prompt_templates=self.prompt_templates)
+		client = FakeAsyncClient(latency=0.01)
+		asyncio.run(run_round_async(client, client, async_problems, strategies, self.prompt_templates, self.evaluation_template, concurrency=4))
+
+		self.assertEqual([p.mutated_description for p in sequential_problems], [p.mutated_description for p in async_problems])
+		self.assertEqual([p.score for p in sequential_problems], [p.score for p in async_problems])
+		self.assertEqual(sequential_logs, [p.mutation_log for p in async_problems])
+
+
+	def test_concurrency_limit(self):
+		'''
+		Test that no more than `concurrency` requests are in flight and that latencies overlap.
+		'''
+		problems = make_problems(16)
+		strategies = ['rephrase.txt'] * len(problems)
+		client = FakeAsyncClient(latency=0.05)
+
+		start = time.perf_counter()
+		asyncio.run(run_round_async(client, client, problems, strategies, self.prompt_templates, self.evaluation_template, concurrency=8))
+		elapsed = time.perf_counter() - start
+
+		self.assertEqual(client.max_in_flight, 8)
+		self.assertLess(elapsed, 32 * 0.05 / 2)
+		self.assertTrue(all(problem.mutated for problem in problems))
+
+
+	def test_invalid_concurrency(self):
+		'''
+		Test that a concurrency lower than one is rejected.
+		'''
+		with self.assertRaises(ValueError):
+			asyncio.run(run_round_async(FakeAsyncClient(), FakeAsyncClient(), [], [], self.prompt_templates, self.evaluation_template, concurrency=0))
+
+
+if __name__ == '__main__':
+	unittest.main()
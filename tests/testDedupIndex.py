@@ -0,0 +1,182 @@
+"""
+Unit test class for the near-duplicate index.
+"""
+
+import sys
+sys.path.append('.')
+
+import json
+import shutil
+import asyncio
+import tempfile
+import unittest
+from scripts.data_handling import load_prompt_templates
+from scripts.rounds import run_round_sequential, run_round_packed, run_round_batch, run_round_async
+from src.BatchClient import LocalBatchClient
+from src.DedupIndex import DedupIndex
+from tests.fakes import make_problems
+
+
+STATEMENT = "Given a weighted directed graph with n nodes and m edges, find the length of the shortest path from node 1 to node n, or print -1 if node n cannot be reached."
+
+
+class DuplicatingClient:
+	'''
+	Client answering every other mutation with the same statement or a near duplicate, and counting evaluation requests.
+	'''
+	def __init__(self):
+		self.mutations = 0
+		self.evaluations = 0
+
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400) -> str:
+		if 'scoring' in system_message:
+			self.evaluations += 1
+			return '7'
+
+		self.mutations += 1
+		if self.mutations % 2 == 0:
+			return f"Count the palindromic substrings of the string number {self.mutations} in the input."
+
+		return STATEMENT if self.mutations % 4 == 1 else STATEMENT.replace('print -1', 'output -1')
+
+
+class AsyncDuplicatingClient(DuplicatingClient):
+	'''
+	Asynchronous counterpart of DuplicatingClient, whose evaluations take long enough for the whole round to be in flight.
+	'''
+	async def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format=None) -> str:
+		await asyncio.sleep(0.02 if 'scoring' in system_message else 0.0)
+
+		return DuplicatingClient.generate_response(self, user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens)
+
+
+class TestDedupIndex(unittest.TestCase):
+	def test_exact_and_near_duplicates(self):
+		'''
+		Test that exact and near duplicates are found within a scope and distinct texts are not.
+		'''
+		index = DedupIndex(threshold=0.8)
+		index.add(key='a', text=STATEMENT, value=7.0, scope='original')
+
+		self.assertEqual(index.lookup(f"  {STATEMENT.upper()} ", scope='original'), ('a', 7.0))
+		self.assertEqual(index.lookup(STATEMENT.replace('print -1', 'output -1'), scope='original'), ('a', 7.0))
+		self.assertIsNone(index.lookup("Count the palindromic substrings of a string of length up to 10^5.", scope='original'))
+		self.assertIsNone(index.lookup(STATEMENT, scope='other original'))
+		self.assertEqual(index.stats(), {'lookups': 4, 'exact': 1, 'near': 1, 'entries': 1, 'dedup_rate': 0.5})
+
+
+	def test_update_values(self):
+		'''
+		Test that updated values are returned by lookups, and that texts without a value are skipped.
+		'''
+		index = DedupIndex(threshold=0.8)
+		index.add(key='a', text=STATEMENT, value=None, scope='original')
+		self.assertIsNone(index.lookup(STATEMENT, scope='original'))
+
+		index.update(key='a', value=6.5)
+		self.assertEqual(index.lookup(STATEMENT, scope='original'), ('a', 6.5))
+
+		index.update(key='a', value=None)
+		index.add(key='b', text=STATEMENT, value=8.0, scope='original')
+		self.assertEqual(index.lookup(STATEMENT, scope='original'), ('b', 8.0))
+		self.assertEqual(index.empty_copy().stats()['entries'], 0)
+
+
+	def test_serialised_index(self):
+		'''
+		Test that an index converted to JSON and loaded into a new index finds the same duplicates and keeps its counters.
+		'''
+		index = DedupIndex(threshold=0.8)
+		index.add(key='a', text=STATEMENT, value=7.0, scope='original')
+		index.add(key='b', text="Count the palindromic substrings of a string of length up to 10^5.", value=None, scope='original')
+		index.lookup(STATEMENT, scope='original')
+
+		loaded = DedupIndex(threshold=0.8)
+		loaded.load(json.loads(json.dumps(index.to_dict())))
+		self.assertEqual(loaded.lookup(STATEMENT, scope='original'), ('a', 7.0))
+		self.assertEqual(loaded.lookup(STATEMENT.replace('print -1', 'output -1'), scope='original'), ('a', 7.0))
+		self.assertIsNone(loaded.lookup(STATEMENT, scope='other original'))
+		self.assertEqual(loaded.stats(), {'lookups': 4, 'exact': 2, 'near': 1, 'entries': 1, 'dedup_rate': 0.75})
+
+		with self.assertRaises(ValueError):
+			DedupIndex(seed=2).load(index.to_dict())
+
+
+	def test_invalid_configuration(self):
+		'''
+		Test that thresholds outside (0, 1] and bands not dividing the permutations are rejected.
+		'''
+		with self.assertRaises(ValueError):
+			DedupIndex(threshold=0.0)
+		with self.assertRaises(ValueError):
+			DedupIndex(num_perm=64, bands=10)
+
+
+	def test_round_skips_duplicate_evaluations(self):
+		'''
+		Test that duplicates in a round reuse the score of their evaluated twin instead of sending a request.
+		'''
+		client = DuplicatingClient()
+		index = DedupIndex()
+		problems = make_problems(8, original="Original")
+
+		run_round_sequential(client, client, problems, ['mutate'] * 8, {'mutate': "Mutate: {statement}"}, "{original_statement} {mutated_statement}", dedup_index=index)
+
+		self.assertEqual(client.evaluations, 5)
+		self.assertTrue(all(problem.score == 7.0 for problem in problems))
+		self.assertIn("Duplicate of problem 0", problems[2].warnings_log[-1])
+		self.assertEqual(index.stats()['dedup_rate'], 3 / 8)
+
+
+	def test_packed_round_leaves_duplicates_out(self):
+		'''
+		Test that a packed evaluation only packs problems without an evaluated duplicate.
+		'''
+		client = DuplicatingClient()
+		index = DedupIndex()
+		index.add(key='earlier', text=STATEMENT, value=9.0, scope="Original")
+		problems = make_problems(3, original="Original", mutated_description=STATEMENT, mutated=True)
+
+		run_round_packed(client, client, problems, [None] * 3, {}, "{original_statement} {mutated_statement}", load_prompt_templates(strategies_dir='prompts/packing/'), dedup_index=index)
+
+		self.assertEqual(client.evaluations, 0)
+		self.assertEqual([problem.score for problem in problems], [9.0] * 3)
+
+
+	def test_batch_round_sends_one_twin(self):
+		'''
+		Test that a batch round sends a single duplicate of each group of twins of the round and copies its score to the others.
+		'''
+		directory = tempfile.mkdtemp()
+		client = DuplicatingClient()
+		problems = make_problems(8, original="Original")
+		try:
+			batch_client = LocalBatchClient(client=client, work_dir=directory)
+			run_round_batch(batch_client, batch_client, problems, ['mutate'] * 8, {'mutate': "Mutate: {statement}"}, "{original_statement} {mutated_statement}", dedup_index=DedupIndex())
+
+		finally:
+			shutil.rmtree(directory, ignore_errors=True)
+
+		self.assertEqual(client.evaluations, 5)
+		self.assertTrue(all(problem.score == 7.0 for problem in problems))
+		self.assertIn("Duplicate of problem 0", problems[2].warnings_log[-1])
+
+
+	def test_async_round_waits_for_twins_in_flight(self):
+		'''
+		Test that concurrent duplicates wait for the evaluation of their twin in flight instead of being evaluated too.
+		'''
+		client = AsyncDuplicatingClient()
+		index = DedupIndex()
+		problems = make_problems(8, original="Original")
+
+		asyncio.run(run_round_async(client, client, problems, ['mutate'] * 8, {'mutate': "Mutate: {statement}"}, "{original_statement} {mutated_statement}", concurrency=8, dedup_index=index))
+
+		self.assertEqual(client.evaluations, 5)
+		self.assertTrue(all(problem.score == 7.0 for problem in problems))
+		self.assertEqual(sum(1 for problem in problems if any("Duplicate" in warning for warning in problem.warnings_log)), 3)
+
+
+if __name__ == '__main__':
+	unittest.main()
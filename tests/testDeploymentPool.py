@@ -0,0 +1,232 @@
+"""
+Unit test class for deployment pools.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import json
+import argparse
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from scripts.create_env import load_deployments
+from src.DeploymentPool import Deployment, DeploymentPool, AsyncDeploymentPool
+from src.RateLimiter import RateLimiter
+from src.MockLLMServer import MockLLMServer
+from src.AzureOpenAIClient import AzureOpenAIClient
+from src.AsyncAzureOpenAIClient import AsyncAzureOpenAIClient
+import scripts.main
+
+
+def create_deployment(name: str, endpoint: str, client_class=AzureOpenAIClient, weight: float=1.0, failure_threshold: int=2, cooldown: float=30.0) -> Deployment:
+	'''
+	Creates a deployment whose requests fail over as soon as they fail, without retries.
+	'''
+	client = client_class(endpoint=endpoint, api_key='mock', model=name, rate_limiter=RateLimiter(max_retries=0, failure_threshold=0))
+
+	return Deployment(name=name, client=client, weight=weight, failure_threshold=failure_threshold, cooldown=cooldown)
+
+
+class StalledClient:
+	'''
+	Client whose requests are interrupted, or never answer until they are cancelled.
+	'''
+	model = 'stalled'
+
+	def generate_response(self, **kwargs) -> str:
+		raise KeyboardInterrupt
+
+
+	async def agenerate_response(self, **kwargs) -> str:
+		await asyncio.sleep(60)
+
+
+class TestDeploymentPool(unittest.TestCase):
+	def test_weighted_routing(self):
+		'''
+		Test that requests are spread over the deployments of a pool in proportion to their weights.
+		'''
+		with MockLLMServer() as heavy, MockLLMServer() as light:
+			pool = DeploymentPool(deployments=[create_deployment('heavy', heavy.endpoint, weight=3), create_deployment('light', light.endpoint, weight=1)])
+			pool.random.seed(0)
+			for i in range(200):
+				pool.generate_response(user_input=f"Problem {i}", system_message="Mutate.")
+
+		self.assertEqual(heavy.stats['requests'] + light.stats['requests'], 200)
+		self.assertAlmostEqual(heavy.stats['requests'] / 200, 0.75, delta=0.08)
+		self.assertEqual(pool.stats()['heavy']['requests'], heavy.stats['requests'])
+
+		with self.assertRaises(ValueError):
+			DeploymentPool(deployments=[], name='empty')
+		with self.assertRaises(ValueError):
+			DeploymentPool(deployments=[create_deployment('heavy', heavy.endpoint)], routing='random')
+
+
+	def test_failover(self):
+		'''
+		Test that failing and unreachable deployments are failed over, taken out of the pool, and tried again after their cooldown.
+		'''
+		with MockLLMServer(error_rate=1) as failing, MockLLMServer() as healthy:
+			with MockLLMServer() as stopped:
+				unreachable = stopped.endpoint
+
+			pool = DeploymentPool(deployments=[
+				create_deployment('failing', failing.endpoint, weight=100, cooldown=0.3),
+				create_deployment('unreachable', unreachable, weight=100, cooldown=0.3),
+				create_deployment('healthy', healthy.endpoint)
+			])
+			responses = [pool.generate_response(user_input=f"Problem {i}", system_message="Mutate.") for i in range(10)]
+			stats = pool.stats()
+
+			# Trying the failed deployments again once their cooldown is over
+			time.sleep(0.4)
+			pool.generate_response(user_input="After the cooldown", system_message="Mutate.")
+
+		self.assertEqual(len(responses), 10)
+		self.assertEqual(healthy.stats['requests'], 11)
+		self.assertEqual(stats['failing']['requests'], 2)
+		self.assertEqual(stats['unreachable']['failures'], 2)
+		self.assertEqual(stats['failing']['health'], 'unhealthy')
+		self.assertEqual(stats['healthy']['health'], 'healthy')
+		self.assertEqual(failing.stats['requests'], 3)
+
+		with self.assertRaises(RuntimeError):
+			DeploymentPool(deployments=[create_deployment('unreachable', unreachable)]).generate_response(user_input="Problem", system_message="Mutate.")
+
+
+	def test_interrupted_requests_are_settled(self):
+		'''
+		Test that an interrupted or cancelled trial request gives its deployment back to the pool.
+		'''
+		def half_open_deployment() -> Deployment:
+			deployment = Deployment(name='stalled', client=StalledClient(), failure_threshold=1, cooldown=0.01)
+			deployment.breaker.record_failure()
+			time.sleep(0.02)
+			return deployment
+
+		deployment = half_open_deployment()
+		with self.assertRaises(KeyboardInterrupt):
+			DeploymentPool(deployments=[deployment]).generate_response(user_input="Problem", system_message="Mutate.")
+		self.assertEqual(deployment.in_flight, 0)
+		self.assertFalse(deployment.breaker.trial_in_flight)
+
+		async def cancel(pool: AsyncDeploymentPool) -> None:
+			task = asyncio.ensure_future(pool._route(lambda deployment: deployment.client.agenerate_response()))
+			await asyncio.sleep(0.01)
+			task.cancel()
+			with self.assertRaises(asyncio.CancelledError):
+				await task
+
+		deployment = half_open_deployment()
+		asyncio.run(cancel(AsyncDeploymentPool(deployments=[deployment])))
+		self.assertEqual(deployment.in_flight, 0)
+		self.assertFalse(deployment.breaker.trial_in_flight)
+		self.assertEqual(deployment.breaker.state, 'half-open')
+
+
+	def test_least_latency_routing(self):
+		'''
+		Test that least-latency routing sends most requests to the fastest deployment.
+		'''
+		with MockLLMServer(latency_ms=5) as fast, MockLLMServer(latency_ms=60) as slow:
+			pool = DeploymentPool(deployments=[create_deployment('slow', slow.endpoint), create_deployment('fast', fast.endpoint)], routing='least-latency')
+			for i in range(20):
+				pool.generate_response(user_input=f"Problem {i}", system_message="Mutate.")
+
+		self.assertGreaterEqual(fast.stats['requests'], 18)
+		self.assertLess(pool.stats()['fast']['latency_ms'], pool.stats()['slow']['latency_ms'])
+
+
+	def test_async_pool(self):
+		'''
+		Test that concurrent requests of an asynchronous pool are spread over its deployments and fail over.
+		'''
+		async def run(endpoints: list) -> list:
+			pool = AsyncDeploymentPool(deployments=[create_deployment(f'deployment-{i}', endpoint, client_class=AsyncAzureOpenAIClient) for i, endpoint in enumerate(endpoints)])
+			responses = await asyncio.gather(*[pool.generate_response(user_input=f"Problem {i}", system_message="Mutate.") for i in range(30)])
+			await pool.close()
+
+			return responses
+
+		with MockLLMServer(latency_ms=10) as first, MockLLMServer(latency_ms=10) as second, MockLLMServer(error_rate=1) as failing:
+			responses = asyncio.run(run([first.endpoint, second.endpoint, failing.endpoint]))
+
+		self.assertEqual(len(responses), 30)
+		self.assertEqual(first.stats['completed'] + second.stats['completed'], 30)
+		self.assertGreater(min(first.stats['completed'], second.stats['completed']), 0)
+
+
+	def test_pools_share_the_quota(self):
+		'''
+		Test that deployments without a quota of their own share the quota of the command line, counted once across pools.
+		'''
+		args = argparse.Namespace(rpm_limit=600, tpm_limit=90000, max_retries=3, failover_threshold=3, failover_cooldown=30.0, routing='weighted')
+		settings = {'endpoint': 'http://127.0.0.1:1', 'api_key': 'mock', 'model': 'gpt-4o', 'weight': 1.0, 'rpm_limit': None, 'tpm_limit': None, 'max_retries': None}
+		east, west = dict(settings, name='east'), dict(settings, name='west')
+		judge = dict(settings, name='judge', rpm_limit=100.0)
+
+		quota = scripts.main.share_quota(args=args, deployments=[east, west, east, judge])
+		self.assertEqual(quota, {'rpm_limit': 300.0, 'tpm_limit': 30000.0})
+
+		rate_limiters = {}
+		scripts.main.create_pool(args=args, name='mutation', deployments=[east, west], client_class=AzureOpenAIClient, rate_limiters=rate_limiters, quota=quota)
+		scripts.main.create_pool(args=args, name='evaluation', deployments=[east, judge], client_class=AzureOpenAIClient, rate_limiters=rate_limiters, quota=quota)
+		self.assertEqual({name: limiter.requests_per_minute for name, limiter in rate_limiters.items()}, {'east': 300.0, 'west': 300.0, 'judge': 100.0})
+		self.assertEqual(rate_limiters['judge'].tokens_per_minute, 30000.0)
+		self.assertEqual(scripts.main.share_quota(args=argparse.Namespace(rpm_limit=0, tpm_limit=0), deployments=[east, west]), {'rpm_limit': 0.0, 'tpm_limit': 0.0})
+
+
+	def test_run_with_pools(self):
+		'''
+		Test that a run reads its pools from the config file and sends mutation and evaluation requests to their deployments.
+		'''
+		directory = tempfile.mkdtemp()
+		with MockLLMServer() as east, MockLLMServer() as west, MockLLMServer() as judge:
+			with open(os.path.join(directory, 'config.ini'), 'w') as file:
+				file.write(
+					f"[OpenAI]\nOPENAI_API_KEY = key\nOPENAI_API_ENDPOINT = {judge.endpoint}\n\n"
+					f"[deployment:east]\nendpoint = {east.endpoint}\napi_key = mock\nmodel = gpt-4o\nweight = 2\npools = mutation\n\n"
+					f"[deployment:west]\nendpoint = {west.endpoint}\napi_key = mock\nmodel = gpt-4o\npools = mutation\n\n"
+					f"[deployment:judge]\nendpoint = {judge.endpoint}\napi_key = mock\nmodel = gpt-4o-mini\nrpm_limit = 600\npools = evaluation\n"
+				)
+
+			pools = load_deployments(config_path=os.path.join(directory, 'config.ini'))
+			self.assertEqual([deployment['name'] for deployment in pools['mutation']], ['east', 'west'])
+			self.assertEqual(pools['mutation'][0]['weight'], 2.0)
+			self.assertEqual(pools['evaluation'][0]['rpm_limit'], 600.0)
+
+			argv = [
+				'main.py', '--backend', 'mock', '--num-rounds', '1', '--num-problems', '8', '--topk-problems', '2',
+				'--deployments-config', os.path.join(directory, 'config.ini'), '--round-mode', 'async',
+				'--checkpoint-dir', os.path.join(directory, 'checkpoints'),
+				'--leaderboard-path', os.path.join(directory, 'leaderboard.sqlite'),
+				'--metrics-summary', os.path.join(directory, 'metrics.json'),
+				'--lineage-path', os.path.join(directory, 'lineage.sqlite'),
+				'--scheduler-state', os.path.join(directory, 'scheduler.json')
+			]
+			logger = Mock()
+			try:
+				with patch('sys.argv', argv), patch('scripts.main.Logger', logger), patch('scripts.main.save_mutated_problem', lambda problem: None):
+					scripts.main.main()
+				with open(os.path.join(directory, 'metrics.json'), 'r') as file:
+					stats = json.load(file)['deployments']
+				messages = [call.args[0] for call in logger.return_value.info.call_args_list]
+
+			finally:
+				shutil.rmtree(directory, ignore_errors=True)
+
+		self.assertEqual(east.stats['requests'] + west.stats['requests'], 8)
+		self.assertEqual(judge.stats['requests'], 8)
+		self.assertEqual(stats['mutation']['east']['requests'], east.stats['requests'])
+		self.assertEqual(stats['evaluation']['judge']['health'], 'healthy')
+		for name in ('east', 'west', 'judge'):
+			self.assertTrue(any(message.startswith(f"Rate limiter stats of deployment '{name}'") for message in messages))
+
+
+if __name__ == '__main__':
+	unittest.main()
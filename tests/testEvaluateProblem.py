@@ -8,9 +8,15 @@ sys.path.append('.')
 import unittest
 from unittest.mock import Mock
 from scripts.data_handling import Problem
-from scripts.mutation import evaluate_problem
+from scripts.mutation import evaluate_problem, parse_score, configure_evaluation, EVALUATION_RESPONSE_FORMAT
+from src.MockLLMServer import MockLLMClient
+from src.Metrics import metrics
 
 class TestEvaluateProblem(unittest.TestCase):
+	def tearDown(self):
+		configure_evaluation()
+
+
 	def test_evaluation_successful(self):
 		'''
 		Test that the evaluation of a mutated problem returns the correct score.
@@ -40,5 +46,74 @@ class TestEvaluateProblem(unittest.TestCase):
 		self.assertIn("Error", problem.error_logs[-1])
 
 
+	def test_parse_score(self):
+		'''
+		Test that scores are extracted from plain, JSON and chatty responses, and that ambiguous responses are rejected.
+		'''
+		self.assertEqual(parse_score(" 7.5\n"), 7.5)
+		self.assertEqual(parse_score(8), 8.0)
+		self.assertEqual(parse_score('{"score": 6}'), 6.0)
+		self.assertEqual(parse_score('```json\n{"score": "4.5"}\n```'), 4.5)
+		self.assertEqual(parse_score("Score: 9"), 9.0)
+		self.assertEqual(parse_score("I would rate this mutation 3 out of 10."), 3.0)
+		self.assertEqual(parse_score("The mutation deserves 8.25 overall."), 8.25)
+
+		self.assertEqual(parse_score("10"), 10.0)
+		self.assertEqual(parse_score("0"), 0.0)
+
+		for response in ("", "Great mutation!", "Between 6 and 7", "nan", "42", "-3", "Score: 15", "2024 was a good year", '{"score": 11}'):
+			with self.assertRaises(ValueError):
+				parse_score(response)
+
+
+	def test_unparseable_response_is_retried(self):
+		'''
+		Test that only a response without a score is requested again, at temperature 0 and within the token bound.
+		'''
+		client = Mock()
+		client.generate_response.side_effect = ["It is a good mutation.", "7"]
+		problem = Problem(original_description="Original description", mutated_description="Mutated description", mutated=True)
+		retries = metrics.value('evaluation_retries_total')
+
+		score = evaluate_problem(client=client, problem=problem, evaluation_template="{original_statement} vs {mutated_statement}")
+
+		self.assertEqual(score, 7.0)
+		self.assertEqual(client.generate_response.call_count, 2)
+		self.assertEqual(client.generate_response.call_args_list[0].kwargs['max_tokens'], 16)
+		self.assertEqual(client.generate_response.call_args_list[1].kwargs['temperature'], 0.0)
+		self.assertIn("Unparseable", problem.warnings_log[-1])
+		self.assertEqual(metrics.value('evaluation_retries_total'), retries + 1)
+
+		# Request failures are left to the client and not retried as parse failures
+		client = Mock()
+		client.generate_response.side_effect = RuntimeError("Timeout")
+		with self.assertRaises(ValueError):
+			evaluate_problem(client=client, problem=problem, evaluation_template="{original_statement} vs {mutated_statement}")
+		self.assertEqual(client.generate_response.call_count, 1)
+
+		client = Mock()
+		client.generate_response.return_value = "No idea."
+		with self.assertRaises(ValueError):
+			evaluate_problem(client=client, problem=problem, evaluation_template="{original_statement} vs {mutated_statement}")
+		self.assertEqual(client.generate_response.call_count, 2)
+
+
+	def test_structured_evaluation(self):
+		'''
+		Test that JSON evaluations request the score schema and read the score of the structured answer.
+		'''
+		configure_evaluation(response_format='json', max_tokens=12, retries=0)
+		client = Mock(wraps=MockLLMClient())
+		problem = Problem(original_description="Original description", mutated_description="Mutated description", mutated=True)
+
+		score = evaluate_problem(client=client, problem=problem, evaluation_template="Score: {original_statement} vs {mutated_statement}")
+
+		self.assertEqual(client.generate_response.call_args.kwargs['response_format'], EVALUATION_RESPONSE_FORMAT)
+		self.assertEqual(client.generate_response.call_args.kwargs['max_tokens'], 12)
+		self.assertTrue(0.0 <= score < 10.0)
+		with self.assertRaises(ValueError):
+			configure_evaluation(response_format='xml')
+
+
 if __name__ == '__main__':
 	unittest.main()
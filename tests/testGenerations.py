@@ -0,0 +1,100 @@
+"""
+Unit test class for generations and the lineage of problems.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from scripts.data_handling import Problem
+from scripts.rounds import spawn_generation
+from scripts.mutation import mutate_problem, build_evaluation_prompt
+from src.LineageStore import LineageStore, lineage
+import scripts.main
+
+
+class TestGenerations(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def test_spawn_generation(self):
+		'''
+		Test that survivors share the children of the next generation in score order and are linked as their parents.
+		'''
+		survivors = [
+			Problem(original_description="Original A", mutated_description="Mutated A", mutated=True, score=9.0),
+			Problem(original_description="Original B", mutated_description="Mutated B", mutated=True, score=7.0)
+		]
+
+		children = spawn_generation(survivors=survivors, population_size=5)
+
+		self.assertEqual([child.parent_id for child in children], [survivors[i % 2].id for i in range(5)])
+		self.assertTrue(all(child.generation == 1 and not child.mutated and child.score == 0.0 for child in children))
+		self.assertEqual(children[1].statement, "Mutated B")
+		self.assertEqual(children[1].original_description, "Original B")
+		self.assertEqual(lineage.ancestors(children[0].id), [survivors[0].id])
+		self.assertEqual({child_id for child_id, _ in lineage.descendants(survivors[0].id)}, {children[i].id for i in (0, 2, 4)})
+		with self.assertRaises(ValueError):
+			spawn_generation(survivors=[], population_size=5)
+
+
+	def test_children_mutate_the_mutated_description(self):
+		'''
+		Test that a child is mutated from the description it inherited and still evaluated against the original.
+		'''
+		client = Mock()
+		client.generate_response.return_value = "Grandchild"
+		parent = Problem(original_description="Original", mutated_description="Child", mutated=True)
+		child = parent.spawn()
+
+		mutate_problem(client=client, problem=child, prompt_template="Rephrase: {statement}")
+
+		self.assertEqual(client.generate_response.call_args.kwargs['user_input'], "Rephrase: Child")
+		self.assertEqual(child.mutation_log[0]['prompt'], "Rephrase: Child")
+		self.assertEqual(build_evaluation_prompt(problem=child, evaluation_template="{original_statement} -> {mutated_statement}"), "Original -> Grandchild")
+
+
+	def test_run_evolves_generations(self):
+		'''
+		Test that each round of a run evolves the survivors of the previous round at the configured population size.
+		'''
+		saved = []
+		lineage_path = os.path.join(self.directory, 'lineage.sqlite')
+		argv = [
+			'main.py', '--backend', 'mock', '--num-rounds', '3', '--num-problems', '4', '--topk-problems', '2', '--population-size', '6',
+			'--checkpoint-dir', os.path.join(self.directory, 'checkpoints'),
+			'--leaderboard-path', os.path.join(self.directory, 'leaderboard.sqlite'),
+			'--metrics-summary', os.path.join(self.directory, 'metrics.json'),
+			'--lineage-path', lineage_path,
+			'--scheduler-state', os.path.join(self.directory, 'scheduler.json')
+		]
+
+		with patch('sys.argv', argv), patch('scripts.main.Logger', Mock()), patch('scripts.main.save_mutated_problem', lambda problem: saved.append(problem)):
+			scripts.main.main()
+
+		store = LineageStore(path=lineage_path)
+		last = saved[-2:]
+		ancestors = store.ancestors(last[0].id)
+		descendants = store.descendants(ancestors[-1])
+		history = store.history(last[0].id)
+		parent_history = store.history(ancestors[0])
+		store.close()
+
+		self.assertEqual([problem.generation for problem in saved], [0, 0, 1, 1, 2, 2])
+		self.assertIn(last[0].parent_id, {problem.id for problem in saved[2:4]})
+		self.assertEqual(len(ancestors), 2)
+		self.assertEqual(sorted({generation for _, generation in descendants}), [1, 2])
+		self.assertEqual(history[0]['statement_id'], LineageStore.text_id(parent_history[0]['result']))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,131 @@
+"""
+Unit test class for the shared HTTP transport.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+import unittest
+import importlib.util
+from unittest.mock import Mock, patch
+from concurrent.futures import ThreadPoolExecutor
+from src.HttpTransport import HttpTransport
+from src.MockLLMServer import MockLLMServer
+from src.AzureOpenAIClient import AzureOpenAIClient
+from src.AsyncAzureOpenAIClient import AsyncAzureOpenAIClient
+import scripts.main
+
+
+class TestHttpTransport(unittest.TestCase):
+	def test_settings(self):
+		'''
+		Test that the settings of the pool are validated and applied to the pools created afterwards.
+		'''
+		transport = HttpTransport(max_connections=4, max_keepalive_connections=8, read_timeout=30.0)
+		client = transport.client()
+
+		self.assertEqual(client.timeout.read, 30.0)
+		self.assertIs(transport.client(), client)
+
+		transport.configure(read_timeout=60.0)
+		self.assertIsNot(transport.client(), client)
+		self.assertEqual(transport.client().timeout.read, 60.0)
+		client.close()
+		transport.close()
+
+		with self.assertRaises(ValueError):
+			transport.configure(max_connections=0)
+		with self.assertRaises(ValueError):
+			transport.configure(max_keepalive_connections=-1)
+		if importlib.util.find_spec('h2') is None:
+			with self.assertRaises(ValueError):
+				transport.configure(http2=True)
+
+
+	def test_clients_share_connections(self):
+		'''
+		Test that clients sharing the transport reuse kept-alive connections, within the limit of the pool.
+		'''
+		transport = HttpTransport(max_connections=2)
+		with MockLLMServer(latency_ms=20) as server:
+			clients = [AzureOpenAIClient(endpoint=server.endpoint, api_key='mock', model=model, http_client=transport.client()) for model in ('mutation', 'evaluation')]
+			for i in range(5):
+				for client in clients:
+					client.generate_response(user_input=f"Problem {i}", system_message="Mutate.")
+
+			self.assertEqual(transport.stats()['requests'], 10)
+			self.assertEqual(transport.stats()['connections_opened'], 1)
+
+			with ThreadPoolExecutor(max_workers=8) as executor:
+				responses = list(executor.map(lambda i: clients[i % 2].generate_response(user_input=f"Concurrent {i}", system_message="Mutate."), range(16)))
+			stats = transport.stats()
+
+		transport.close()
+
+		self.assertEqual(len(responses), 16)
+		self.assertEqual(server.stats['completed'], 26)
+		self.assertEqual(stats['requests'], 26)
+		self.assertLessEqual(stats['connections_opened'], 2)
+		self.assertLessEqual(stats['open_connections'], 2)
+		self.assertGreater(stats['reuse_ratio'], 0.9)
+
+
+	def test_async_clients_share_connections(self):
+		'''
+		Test that asynchronous clients share a pool, which stays open when one of them is closed.
+		'''
+		transport = HttpTransport(max_connections=3)
+
+		async def run(endpoint: str) -> dict:
+			clients = [AsyncAzureOpenAIClient(endpoint=endpoint, api_key='mock', model=model, http_client=transport.async_client()) for model in ('mutation', 'evaluation')]
+			await asyncio.gather(*[client.generate_response(user_input=f"Problem {i}", system_message="Mutate.") for i in range(10) for client in clients])
+			await clients[0].close()
+			await clients[1].generate_response(user_input="After closing", system_message="Mutate.")
+			stats = transport.stats()
+			await transport.aclose()
+
+			return stats
+
+		with MockLLMServer(latency_ms=30) as server:
+			stats = asyncio.run(run(server.endpoint))
+
+		self.assertEqual(stats['requests'], 21)
+		self.assertLessEqual(stats['connections_opened'], 3)
+		self.assertEqual(server.stats['completed'], 21)
+
+
+	def test_run_reports_pool_stats(self):
+		'''
+		Test that a concurrent run sends its requests through the bounded shared pool and reports its utilisation.
+		'''
+		directory = tempfile.mkdtemp()
+		argv = [
+			'main.py', '--backend', 'mock', '--mock-latency-ms', '20', '--num-rounds', '2', '--num-problems', '6', '--topk-problems', '2',
+			'--round-mode', 'async', '--concurrency', '8', '--max-connections', '2',
+			'--checkpoint-dir', os.path.join(directory, 'checkpoints'),
+			'--leaderboard-path', os.path.join(directory, 'leaderboard.sqlite'),
+			'--metrics-summary', os.path.join(directory, 'metrics.json'),
+			'--lineage-path', os.path.join(directory, 'lineage.sqlite'),
+			'--scheduler-state', os.path.join(directory, 'scheduler.json')
+		]
+		try:
+			with patch('sys.argv', argv), patch('scripts.main.Logger', Mock()), patch('scripts.main.save_mutated_problem', lambda problem: None):
+				scripts.main.main()
+			with open(os.path.join(directory, 'metrics.json'), 'r') as file:
+				stats = json.load(file)['transport']
+
+		finally:
+			shutil.rmtree(directory, ignore_errors=True)
+
+		self.assertEqual(stats['requests'], 24)
+		self.assertLessEqual(stats['connections_opened'], 2)
+		self.assertEqual(stats['max_connections'], 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,204 @@
+"""
+Unit test class for the judge ensemble.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from scripts.data_handling import Problem
+from scripts.mutation import evaluate_problem
+from src.JudgeEnsemble import JudgeEnsemble
+from src.DedupIndex import DedupIndex
+from src.Metrics import metrics
+import scripts.main
+
+
+EVALUATION_TEMPLATE = "{original_statement}|{mutated_statement}"
+
+
+class NoisyJudge:
+	'''
+	Judge scoring the true quality written in the mutated statement with deterministic Gaussian noise.
+	'''
+	model = 'judge'
+
+	def __init__(self, name: str, noise: float=1.5, fail: bool=False, bias: float=0.0):
+		self.name = name
+		self.noise = noise
+		self.fail = fail
+		self.bias = bias
+		self.calls = 0
+
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400) -> str:
+		self.calls += 1
+		if self.fail:
+			raise RuntimeError("Judge unavailable")
+		quality = float(user_input.split('|')[1])
+		rng = random.Random(f'{self.name}:{user_input}')
+
+		return str(min(max(quality + self.bias + rng.gauss(0, self.noise), 0.0), 10.0))
+
+
+class TestJudgeEnsemble(unittest.TestCase):
+	def make_problems(self, qualities: list, judge: NoisyJudge) -> list:
+		problems = [Problem(id=str(i), original_description="Original", mutated_description=f"{quality:.4f}", mutated=True) for i, quality in enumerate(qualities)]
+		for problem in problems:
+			evaluate_problem(client=judge, problem=problem, evaluation_template=EVALUATION_TEMPLATE)
+
+		return problems
+
+
+	@staticmethod
+	def top(problems: list, k: int) -> set:
+		return {int(problem.id) for problem in sorted(problems, key=lambda problem: problem.score, reverse=True)[:k]}
+
+
+	def test_clear_round_is_not_rescored(self):
+		'''
+		Test that no judge is asked again when every problem is far from the top k cutoff.
+		'''
+		judges = [(f'judge-{j}', NoisyJudge(f'judge-{j}', noise=0.0), EVALUATION_TEMPLATE) for j in range(3)]
+		problems = self.make_problems([0.5, 1.0, 9.0, 9.5], judges[0][1])
+		ensemble = JudgeEnsemble(judges=judges, k=2)
+
+		ensemble.refine(problems)
+
+		self.assertEqual(ensemble.stats(), {'judges': 3, 'calls': 0, 'full_ensemble_calls': 8, 'stopped_early': 4})
+		self.assertEqual(self.top(problems, 2), {2, 3})
+		self.assertEqual(judges[1][1].calls + judges[2][1].calls, 0)
+
+
+	def test_only_borderline_problems_are_rescored(self):
+		'''
+		Test that further judges are only asked about problems near the cutoff, and that scores become their mean.
+		'''
+		judges = [(f'judge-{j}', NoisyJudge(f'judge-{j}', noise=0.0), EVALUATION_TEMPLATE) for j in range(3)]
+		problems = self.make_problems([0.0, 5.0, 5.2, 10.0], judges[0][1])
+		ensemble = JudgeEnsemble(judges=judges, k=2)
+
+		ensemble.refine(problems)
+
+		self.assertEqual(ensemble.calls, 4)
+		self.assertEqual([problem.score for problem in problems], [0.0, 5.0, 5.2, 10.0])
+		self.assertEqual(self.top(problems, 2), {2, 3})
+
+
+	def test_judges_are_calibrated(self):
+		'''
+		Test that a lenient judge is shifted onto the scale of the first judge, without counting as evaluations of the round.
+		'''
+		judges = [('judge-0', NoisyJudge('judge-0', noise=0.0), EVALUATION_TEMPLATE), ('lenient', NoisyJudge('lenient', noise=0.0, bias=2.0), EVALUATION_TEMPLATE)]
+		problems = self.make_problems([0.0, 5.0, 5.2, 7.0], judges[0][1])
+		evaluations = metrics.value('evaluations_total', outcome='ok')
+
+		JudgeEnsemble(judges=judges, k=2).refine(problems)
+
+		self.assertGreaterEqual(judges[1][1].calls, 2)
+		self.assertEqual([round(problem.score, 6) for problem in problems], [0.0, 5.0, 5.2, 7.0])
+		self.assertEqual(metrics.value('evaluations_total', outcome='ok'), evaluations)
+
+
+	def test_dedup_index_gets_ensemble_scores(self):
+		'''
+		Test that duplicates evaluated after the ensemble reuse the ensemble score of their twin.
+		'''
+		judges = [(f'judge-{j}', NoisyJudge(f'judge-{j}'), EVALUATION_TEMPLATE) for j in range(3)]
+		problems = self.make_problems([4.0, 4.5, 5.0, 5.5], judges[0][1])
+		index = DedupIndex()
+		for problem in problems:
+			index.add(key=problem.id, text=problem.mutated_description, value=problem.score, scope=problem.original_description)
+		first_scores = [problem.score for problem in problems]
+
+		JudgeEnsemble(judges=judges, k=2, dedup_index=index).refine(problems)
+
+		self.assertNotEqual([problem.score for problem in problems], first_scores)
+		for problem in problems:
+			self.assertEqual(index.lookup(problem.mutated_description, scope=problem.original_description), (problem.id, problem.score))
+
+
+	def test_failed_judge_is_skipped(self):
+		'''
+		Test that a failing judge counts as asked without adding a score.
+		'''
+		judges = [('judge-0', NoisyJudge('judge-0', noise=0.0), EVALUATION_TEMPLATE), ('judge-1', NoisyJudge('judge-1', fail=True), EVALUATION_TEMPLATE)]
+		problems = self.make_problems([4.9, 5.1], judges[0][1])
+
+		JudgeEnsemble(judges=judges, k=1).refine(problems)
+
+		self.assertEqual([problem.score for problem in problems], [4.9, 5.1])
+		self.assertEqual(judges[1][1].calls, 2)
+		with self.assertRaises(ValueError):
+			JudgeEnsemble(judges=[], k=1)
+
+
+	def test_selection_quality_per_call(self):
+		'''
+		Test that the adaptive ensemble selects the top k about as well as averaging every judge, with a fraction of the calls.
+		'''
+		adaptive_hits, adaptive_calls, full_hits, full_calls, single_hits = 0, 0, 0, 0, 0
+		for seed in range(10):
+			rng = random.Random(seed)
+			qualities = [rng.uniform(0, 10) for _ in range(30)]
+			truth = set(sorted(range(30), key=lambda i: qualities[i], reverse=True)[:5])
+			judges = [(f'judge-{j}', NoisyJudge(f'{seed}-judge-{j}'), EVALUATION_TEMPLATE) for j in range(5)]
+
+			single_hits += len(truth & self.top(self.make_problems(qualities, judges[0][1]), 5))
+
+			problems = self.make_problems(qualities, judges[0][1])
+			ensemble = JudgeEnsemble(judges=judges, k=5)
+			ensemble.refine(problems)
+			adaptive_hits += len(truth & self.top(problems, 5))
+			adaptive_calls += ensemble.calls
+
+			problems = self.make_problems(qualities, judges[0][1])
+			for problem in problems:
+				scores = [problem.score] + [evaluate_problem(client=client, problem=problem, evaluation_template=template) for _, client, template in judges[1:]]
+				problem.score = sum(scores) / len(scores)
+			full_hits += len(truth & self.top(problems, 5))
+			full_calls += 30 * 4
+
+		self.assertGreater(adaptive_hits, single_hits)
+		self.assertGreaterEqual(adaptive_hits, full_hits - 2)
+		self.assertLess(adaptive_calls, full_calls / 2)
+
+
+	def test_run_with_ensemble(self):
+		'''
+		Test that a run rescores its rounds with the judges of prompts/judges/ and reports the ensemble in the summary.
+		'''
+		directory = tempfile.mkdtemp()
+		saved = []
+		argv = [
+			'main.py', '--backend', 'mock', '--num-rounds', '2', '--num-problems', '6', '--topk-problems', '2', '--ensemble', 'Y',
+			'--checkpoint-dir', os.path.join(directory, 'checkpoints'),
+			'--leaderboard-path', os.path.join(directory, 'leaderboard.sqlite'),
+			'--metrics-summary', os.path.join(directory, 'metrics.json'),
+			'--lineage-path', os.path.join(directory, 'lineage.sqlite'),
+			'--scheduler-state', os.path.join(directory, 'scheduler.json')
+		]
+
+		try:
+			with patch('sys.argv', argv), patch('scripts.main.Logger', Mock()), patch('scripts.main.save_mutated_problem', lambda problem: saved.append(problem)):
+				scripts.main.main()
+			with open(os.path.join(directory, 'metrics.json'), 'r') as file:
+				summary = json.load(file)
+
+		finally:
+			shutil.rmtree(directory, ignore_errors=True)
+
+		self.assertEqual(len(saved), 4)
+		self.assertEqual(summary['ensemble']['judges'], 1 + len(os.listdir('prompts/judges/')))
+		self.assertEqual(summary['ensemble']['full_ensemble_calls'], 12 * (summary['ensemble']['judges'] - 1))
+		self.assertLessEqual(summary['ensemble']['calls'], summary['ensemble']['full_ensemble_calls'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,111 @@
+"""
+Unit test class for the append-only leaderboard.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import json
+import yaml
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from scripts.data_handling import Problem, export_leaderboard
+from src.LeaderboardStore import LeaderboardStore
+from src.LineageStore import LineageStore
+
+class TestLeaderboardStore(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'leaderboard.sqlite')
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def test_rows_do_not_copy_mutation_log(self):
+		'''
+		Test that each row stores the length of the mutation history instead of the mutation log entries.
+		'''
+		lineage_store = LineageStore(path=os.path.join(self.directory, 'lineage.sqlite'))
+		store = LeaderboardStore(path=self.path, lineage_store=lineage_store)
+		problem = Problem(id="123", original_description="Original", mutated=True)
+		for n_round in range(3):
+			lineage_store.record(problem_id=problem.id, template="Rephrase: {statement}", statement=problem.original_description, result=f"Result {n_round}")
+			problem.score = float(n_round)
+			store.append(problem=problem, n_round=n_round)
+		store.close()
+		lineage_store.close()
+
+		connection = sqlite3.connect(self.path)
+		lengths = [row[0] for row in connection.execute('SELECT history_length FROM leaderboard ORDER BY seq')]
+		columns = [row[1] for row in connection.execute('PRAGMA table_info(leaderboard)')]
+		connection.close()
+
+		self.assertEqual(lengths, [1, 2, 3])
+		self.assertNotIn('mutation_log', columns)
+
+
+	def test_entries_rebuild_history_of_the_round(self):
+		'''
+		Test that entries of a round come back in the leaderboard format with the mutation log up to that round.
+		'''
+		lineage_store = LineageStore()
+		store = LeaderboardStore(path=self.path, lineage_store=lineage_store)
+		problem = Problem(id="123", original_description="Original", mutated=True)
+		lineage_store.record(problem_id=problem.id, template="Rephrase: {statement}", statement="Original", result="Result 0")
+		store.append(problem=problem, n_round=0)
+		lineage_store.record(problem_id=problem.id, template="Simplify: {statement}", statement="Original", result="Result 1")
+		problem.score = 8.0
+		store.append(problem=problem, n_round=1)
+		store.append(problem=Problem(id="456", mutated=True, score=3.0), n_round=1)
+		lineage_store.record(problem_id=problem.id, template="Expand: {statement}", statement="Original", result="Result 2")
+
+		entries = store.entries()
+		first = store.entries(n_round=0)
+		store.close()
+
+		self.assertEqual([entry['id'] for entry in entries], ["123", "456"])
+		self.assertEqual(entries[0]['score'], 8.0)
+		self.assertEqual([log['prompt'] for log in entries[0]['mutation_log']], ["Rephrase: Original", "Simplify: Original"])
+		self.assertEqual([log['result'] for log in first[0]['mutation_log']], ["Result 0"])
+		self.assertEqual(set(entries[0].keys()), {'ts', 'id', 'original_description', 'mutated_description', 'mutated', 'score', 'mutation_log', 'error_logs', 'warnings_log'})
+
+
+	def test_rows_survive_without_close(self):
+		'''
+		Test that appended rows are committed immediately and visible to another connection.
+		'''
+		store = LeaderboardStore(path=self.path, run_id='run')
+		store.append(problem=Problem(id="123", score=1.0), n_round=0)
+
+		reader = LeaderboardStore(path=self.path, run_id='run')
+		self.assertEqual(len(reader.entries(n_round=0)), 1)
+		reader.close()
+		store.close()
+
+
+	def test_export_yaml(self):
+		'''
+		Test that the exporter writes the last round in the leaderboard YAML format.
+		'''
+		store = LeaderboardStore(path=self.path)
+		store.append(problem=Problem(id="123", score=1.0), n_round=0)
+		store.append(problem=Problem(id="456", score=2.0), n_round=1)
+
+		filepath = os.path.join(self.directory, 'logs', 'leaderboard.yml')
+		export_leaderboard(store=store, filepath=filepath)
+		store.close()
+
+		with open(filepath, 'r') as file:
+			content = yaml.safe_load(file)
+
+		self.assertEqual([entry['id'] for entry in content], ["456"])
+		self.assertEqual(content[0]['score'], 2.0)
+
+
+if __name__ == '__main__':
+	unittest.main()
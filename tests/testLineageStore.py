@@ -0,0 +1,84 @@
+"""
+Unit test class for the compact problem representation and the lineage store.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import sqlite3
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock
+from scripts.data_handling import Problem, MAX_LOG_MESSAGES
+from scripts.checkpoint import problem_to_dict, problem_from_dict
+from scripts.mutation import mutate_problem
+from src.LineageStore import LineageStore, lineage
+
+
+class TestLineageStore(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def test_texts_are_interned(self):
+		'''
+		Test that templates and statements are stored once and mutations only reference them.
+		'''
+		path = os.path.join(self.directory, 'lineage.sqlite')
+		store = LineageStore(path=path)
+		for i in range(5):
+			store.record(problem_id="123", template="Rephrase: {statement}", statement="Original", result=f"Result {i}")
+		history = store.history("123")
+		store.close()
+
+		connection = sqlite3.connect(path)
+		texts = connection.execute('SELECT COUNT(*) FROM texts').fetchone()[0]
+		connection.close()
+
+		self.assertEqual(texts, 2)
+		self.assertEqual([entry['result'] for entry in history], [f"Result {i}" for i in range(5)])
+		self.assertEqual(history[0]['prompt'], "Rephrase: Original")
+		self.assertEqual(history[0]['template_id'], LineageStore.text_id("Rephrase: {statement}"))
+		self.assertEqual(history[0]['statement_id'], LineageStore.text_id("Original"))
+
+
+	def test_problem_memory_is_bounded(self):
+		'''
+		Test that a problem has no instance dictionary and does not grow with its mutations and errors.
+		'''
+		client = Mock()
+		client.generate_response.return_value = "Mutated"
+		problem = Problem(original_description="Original")
+		for i in range(MAX_LOG_MESSAGES * 2):
+			mutate_problem(client=client, problem=problem, prompt_template=f"Template {i}: {{statement}}")
+			problem.error_logs.append(f"Error {i}")
+
+		self.assertFalse(hasattr(problem, '__dict__'))
+		self.assertEqual(len(problem.error_logs), MAX_LOG_MESSAGES)
+		self.assertEqual(problem.error_logs[-1], f"Error {MAX_LOG_MESSAGES * 2 - 1}")
+		self.assertEqual(lineage.count(problem.id), MAX_LOG_MESSAGES * 2)
+		self.assertEqual(problem.mutation_log[-1]['prompt'], f"Template {MAX_LOG_MESSAGES * 2 - 1}: Original")
+		lineage.discard(problem.id)
+
+
+	def test_problem_round_trip(self):
+		'''
+		Test that a problem serialises without its history and is rebuilt equal, ignoring old mutation logs.
+		'''
+		problem = Problem(id="123", original_description="Original", mutated_description="Mutated", mutated=True, score=7.5, warnings_log=["Warning"])
+		data = problem_to_dict(problem)
+
+		self.assertNotIn('mutation_log', data)
+		self.assertEqual(problem_from_dict(data), problem)
+		self.assertEqual(problem_from_dict(dict(data, mutation_log=[{'prompt': "Old", 'result': "Old"}])), problem)
+		self.assertNotEqual(problem_from_dict(dict(data, score=1.0)), problem)
+
+
+if __name__ == '__main__':
+	unittest.main()
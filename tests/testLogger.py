@@ -0,0 +1,113 @@
+"""
+Unit test class for the queue-based logger.
+"""
+
+import sys
+sys.path.append('.')
+
+import io
+import os
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+from unittest.mock import patch
+from logging.handlers import QueueHandler
+from src.Logger import Logger
+
+
+class TestLogger(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.log_file = os.path.join(self.directory, 'nested', 'app.log')
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def make_logger(self, **kwargs) -> Logger:
+		# Keeping console output out of the test report
+		with patch('sys.stderr', io.StringIO()):
+			return Logger(log_file=self.log_file, **kwargs)
+
+
+	def read_lines(self) -> list:
+		with open(self.log_file, 'r') as file:
+			return file.read().splitlines()
+
+
+	def test_setup_is_idempotent(self):
+		'''
+		Test that building the logger again replaces its handlers instead of duplicating every record.
+		'''
+		self.make_logger()
+		logger = self.make_logger()
+		logger.info("Only once")
+		logger.close()
+
+		self.assertEqual(len(logger.logger.handlers), 1)
+		self.assertIsInstance(logger.logger.handlers[0], QueueHandler)
+		self.assertEqual(len([line for line in self.read_lines() if "Only once" in line]), 1)
+
+
+	def test_exit_hook_is_registered_once(self):
+		'''
+		Test that building loggers registers no exit hook of its own, and that the module hook flushes every open logger.
+		'''
+		with patch('atexit.register') as register:
+			for _ in range(3):
+				logger = self.make_logger()
+		register.assert_not_called()
+
+		logger.info("Flushed at exit")
+		Logger.close_all()
+
+		self.assertEqual(Logger._listeners, {})
+		self.assertTrue(any("Flushed at exit" in line for line in self.read_lines()))
+
+
+	def test_json_lines_carry_fields(self):
+		'''
+		Test that JSON records carry the structured fields of the call.
+		'''
+		logger = self.make_logger(log_format='json', level=logging.INFO)
+		logger.debug("Hidden")
+		logger.info("Evaluated problem", problem_id="123", round=2, strategy='rephrase.txt', latency=0.25)
+		logger.close()
+
+		lines = [json.loads(line) for line in self.read_lines()]
+		self.assertEqual(len(lines), 1)
+		self.assertEqual(lines[0]['message'], "Evaluated problem")
+		self.assertEqual(lines[0]['level'], 'INFO')
+		self.assertEqual((lines[0]['problem_id'], lines[0]['round'], lines[0]['strategy'], lines[0]['latency']), ("123", 2, 'rephrase.txt', 0.25))
+
+
+	def test_text_lines_append_fields(self):
+		'''
+		Test that text records append their structured fields.
+		'''
+		logger = self.make_logger()
+		logger.warning("Slow request", latency=3.5)
+		logger.close()
+
+		self.assertTrue(self.read_lines()[0].endswith("WARNING - Slow request [latency=3.5]"))
+
+
+	def test_rotation_by_size(self):
+		'''
+		Test that the log file is rotated once it reaches its maximum size.
+		'''
+		logger = self.make_logger(max_bytes=2000, backup_count=2)
+		for i in range(200):
+			logger.info(f"Message {i}")
+		logger.close()
+
+		rotated = sorted(filename for filename in os.listdir(os.path.dirname(self.log_file)) if filename.startswith('app.log'))
+		self.assertEqual(rotated, ['app.log', 'app.log.1', 'app.log.2'])
+		self.assertLessEqual(os.path.getsize(self.log_file), 2000)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,149 @@
+"""
+Unit test class for metrics instrumentation.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import urllib.request
+from unittest.mock import Mock, patch
+from scripts.data_handling import Problem
+from scripts.mutation import mutate_problem, evaluate_problem, MUTATION_SYSTEM_MESSAGE
+from src.Metrics import Metrics, metrics
+from src.MockLLMServer import MockLLMServer
+from src.ResponseCache import ResponseCache
+from src.AzureOpenAIClient import AzureOpenAIClient
+import scripts.main
+
+
+class TestMetrics(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		metrics.reset()
+
+
+	def tearDown(self):
+		metrics.reset()
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def test_prometheus_text_format(self):
+		'''
+		Test that counters and cumulative histogram buckets are rendered in the Prometheus text format.
+		'''
+		registry = Metrics()
+		registry.describe('requests_total', "Requests.")
+		registry.inc('requests_total', model='gpt-4o', outcome='ok')
+		registry.inc('requests_total', 2, model='gpt-4o', outcome='ok')
+		for value in (0.003, 0.2, 100.0):
+			registry.observe('request_seconds', value, model='say "hi"')
+
+		text = registry.render_prometheus()
+
+		self.assertIn('# HELP requests_total Requests.', text)
+		self.assertIn('requests_total{model="gpt-4o",outcome="ok"} 3', text)
+		self.assertIn('request_seconds_bucket{model="say \\"hi\\"",le="0.005"} 1', text)
+		self.assertIn('request_seconds_bucket{model="say \\"hi\\"",le="60.0"} 2', text)
+		self.assertIn('request_seconds_bucket{model="say \\"hi\\"",le="+Inf"} 3', text)
+		self.assertIn('request_seconds_count{model="say \\"hi\\""} 3', text)
+		self.assertEqual(registry.summary()['histograms']['request_seconds'][0]['p50'], 0.25)
+
+		# Summing every series, such as the deployments of a pool
+		registry.inc('requests_total', 4, model='gpt-4o-mini', outcome='ok')
+		registry.observe('request_seconds', 0.5, model='gpt-4o-mini')
+		self.assertEqual(registry.combined('requests_total'), 7)
+		self.assertEqual(registry.combined('request_seconds'), 4)
+		self.assertAlmostEqual(registry.combined_total('request_seconds'), 100.703)
+		self.assertEqual(registry.combined_total('missing_seconds'), 0.0)
+
+
+	def test_client_records_latency_tokens_and_cache_hits(self):
+		'''
+		Test that the client records request latency, reported token usage and cache hits.
+		'''
+		cache = ResponseCache(path=os.path.join(self.directory, 'cache.sqlite'))
+		with MockLLMServer() as server:
+			client = AzureOpenAIClient(endpoint=server.endpoint, api_key='mock', model='gpt-4o', cache=cache)
+			for _ in range(3):
+				client.generate_response(user_input="Rephrase: A", system_message=MUTATION_SYSTEM_MESSAGE)
+		cache.close()
+
+		self.assertEqual(metrics.value('llm_requests_total', model='gpt-4o', outcome='ok'), 1)
+		self.assertEqual(metrics.value('llm_requests_total', model='gpt-4o', outcome='cache_hit'), 2)
+		self.assertEqual(metrics.value('llm_request_seconds', model='gpt-4o'), 1)
+		self.assertEqual(metrics.value('llm_prompt_tokens_total', model='gpt-4o'), server.stats['prompt_tokens'])
+		self.assertEqual(metrics.value('llm_completion_tokens_total', model='gpt-4o'), server.stats['completion_tokens'])
+
+
+	def test_mutation_and_evaluation_metrics(self):
+		'''
+		Test that mutations are timed per strategy and failures are counted by outcome.
+		'''
+		client = Mock()
+		client.generate_response.return_value = "8"
+		problem = Problem(original_description="Original")
+
+		mutate_problem(client=client, problem=problem, prompt_template="Rephrase: {statement}", strategy='rephrase.txt')
+		evaluate_problem(client=client, problem=problem, evaluation_template="{original_statement} {mutated_statement}")
+		client.generate_response.side_effect = RuntimeError("Network blip")
+		with self.assertRaises(ValueError):
+			mutate_problem(client=client, problem=problem, prompt_template="Simplify: {statement}", strategy='simplify.txt')
+
+		self.assertEqual(metrics.value('mutation_seconds', strategy='rephrase.txt'), 1)
+		self.assertEqual(metrics.value('mutations_total', strategy='rephrase.txt', outcome='ok'), 1)
+		self.assertEqual(metrics.value('mutations_total', strategy='simplify.txt', outcome='error'), 1)
+		self.assertEqual(metrics.value('evaluations_total', outcome='ok'), 1)
+
+
+	def test_metrics_endpoint(self):
+		'''
+		Test that metrics are served on /metrics.
+		'''
+		registry = Metrics()
+		registry.inc('rounds_total')
+		port = registry.serve(port=0, host='127.0.0.1')
+		try:
+			with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+				text = response.read().decode('utf-8')
+
+		finally:
+			registry.stop()
+
+		self.assertIn('rounds_total 1', text)
+
+
+	def test_run_writes_prometheus_file_and_summary(self):
+		'''
+		Test that a run writes the Prometheus file every round and a JSON summary at the end.
+		'''
+		metrics_path = os.path.join(self.directory, 'metrics.prom')
+		summary_path = os.path.join(self.directory, 'metrics.json')
+		argv = [
+			'main.py', '--backend', 'mock', '--num-rounds', '2', '--num-problems', '3',
+			'--checkpoint-dir', os.path.join(self.directory, 'checkpoints'),
+			'--leaderboard-path', os.path.join(self.directory, 'leaderboard.sqlite'),
+			'--lineage-path', os.path.join(self.directory, 'lineage.sqlite'),
+			'--scheduler-state', os.path.join(self.directory, 'scheduler.json'),
+			'--metrics-path', metrics_path, '--metrics-summary', summary_path
+		]
+
+		with patch('sys.argv', argv), patch('scripts.main.Logger', Mock()), patch('scripts.main.save_mutated_problem', Mock()):
+			scripts.main.main()
+
+		with open(summary_path, 'r') as file:
+			summary = json.load(file)
+		with open(metrics_path, 'r') as file:
+			self.assertIn('round_seconds_count{mode="sequential"} 2', file.read())
+
+		self.assertEqual(summary['round_mode'], 'sequential')
+		self.assertEqual(summary['counters']['round_problems_total'][0]['value'], 6)
+		self.assertEqual(sum(entry['count'] for entry in summary['histograms']['mutation_seconds']), 6)
+
+
+if __name__ == '__main__':
+	unittest.main()
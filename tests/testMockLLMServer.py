@@ -0,0 +1,180 @@
+"""
+Unit test class for the LLM backend interface and the local mock backend.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from scripts.data_handling import Problem, load_prompt_templates
+from scripts.rounds import run_round_packed
+from scripts.mutation import EVALUATION_SYSTEM_MESSAGE, MUTATION_SYSTEM_MESSAGE, EVALUATION_RESPONSE_FORMAT
+from src.LLMBackend import LLMBackend, AsyncLLMBackend
+from src.RateLimiter import RateLimiter
+from src.ResponseCache import ResponseCache
+from src.MockLLMServer import MockLLMServer, MockLLMClient, mock_completion
+from src.AzureOpenAIClient import AzureOpenAIClient
+from src.AsyncAzureOpenAIClient import AsyncAzureOpenAIClient
+import scripts.main
+
+
+class TestMockLLMServer(unittest.TestCase):
+	def make_client(self, server: MockLLMServer, rate_limiter: RateLimiter=None) -> AzureOpenAIClient:
+		return AzureOpenAIClient(endpoint=server.endpoint, api_key='mock', model='gpt-4o', rate_limiter=rate_limiter)
+
+
+	def test_clients_implement_backend_interface(self):
+		'''
+		Test that the Azure and mock clients implement the backend interface.
+		'''
+		self.assertIsInstance(AzureOpenAIClient(endpoint='http://127.0.0.1:1', api_key='mock', model='gpt-4o'), LLMBackend)
+		self.assertIsInstance(AsyncAzureOpenAIClient(endpoint='http://127.0.0.1:1', api_key='mock', model='gpt-4o'), AsyncLLMBackend)
+		self.assertIsInstance(MockLLMClient(), LLMBackend)
+
+
+	def test_mock_client_takes_azure_client_arguments(self):
+		'''
+		Test that the mock client is created with the arguments of the Azure client, honours its cache and rate limiter, and rejects unknown arguments.
+		'''
+		directory = tempfile.mkdtemp()
+		try:
+			rate_limiter = RateLimiter(requests_per_minute=600)
+			client = MockLLMClient(endpoint='http://127.0.0.1:1', api_key='mock', model='gpt-4o', cache=ResponseCache(path=os.path.join(directory, 'responses.sqlite')), rate_limiter=rate_limiter, http_client=None)
+			first = client.generate_response(user_input="Rephrase: A", system_message=MUTATION_SYSTEM_MESSAGE)
+			second = client.generate_response(user_input="Rephrase: A", system_message=MUTATION_SYSTEM_MESSAGE)
+
+		finally:
+			shutil.rmtree(directory, ignore_errors=True)
+
+		self.assertEqual(first, second)
+		self.assertEqual(client.cache.stats()['hits'], 1)
+		self.assertEqual(rate_limiter.stats['requests'], 1)
+		with self.assertRaises(TypeError):
+			MockLLMClient(model='gpt-4o', temperature=0.2)
+
+
+	def test_prefix_cache_is_bounded(self):
+		'''
+		Test that the simulated prompt cache keeps its most recently used prefixes up to its capacity.
+		'''
+		server = MockLLMServer(cache_min_tokens=1, cache_block_tokens=1, cache_max_prefixes=2)
+		try:
+			self.assertEqual(server.cached_tokens('abcdefgh'), 0)
+			self.assertEqual(server.cached_tokens('abcdxxxx'), 1)
+			self.assertEqual(len(server.prefixes), 2)
+
+			# The shared prefix was used last and is kept, the whole first prompt was evicted
+			self.assertEqual(server.cached_tokens('abcdefgh'), 1)
+			self.assertEqual(len(server.prefixes), 2)
+
+		finally:
+			server.stop()
+
+
+	def test_deterministic_outputs(self):
+		'''
+		Test that the server answers scoring prompts with a score and repeated prompts with the same output.
+		'''
+		with MockLLMServer() as server:
+			client = self.make_client(server)
+			score = client.generate_response(user_input="Evaluate: A vs B", system_message=EVALUATION_SYSTEM_MESSAGE)
+			mutation = client.generate_response(user_input="Rephrase: A", system_message=MUTATION_SYSTEM_MESSAGE)
+			repeated = client.generate_response(user_input="Rephrase: A", system_message=MUTATION_SYSTEM_MESSAGE)
+			structured = client.generate_response(user_input="Evaluate: A vs B", system_message=EVALUATION_SYSTEM_MESSAGE, max_tokens=16, response_format=EVALUATION_RESPONSE_FORMAT)
+
+		self.assertTrue(0 <= float(score) < 10)
+		self.assertEqual(json.loads(structured), {'score': float(score)})
+		self.assertEqual(mutation, repeated)
+		self.assertEqual(mutation, mock_completion(MUTATION_SYSTEM_MESSAGE, "Rephrase: A"))
+		self.assertEqual(server.stats['completed'], 4)
+
+
+	def test_injected_throttling_is_retried(self):
+		'''
+		Test that injected 429 errors are retried by the rate limiter until every request succeeds.
+		'''
+		with MockLLMServer(throttle_rate=0.5, retry_after=0.01, seed=1) as server:
+			client = self.make_client(server, rate_limiter=RateLimiter(max_retries=20, base_delay=0.001))
+			for i in range(10):
+				client.generate_response(user_input=f"Rephrase: {i}", system_message=MUTATION_SYSTEM_MESSAGE)
+
+		self.assertEqual(server.stats['completed'], 10)
+		self.assertGreater(server.stats['throttled'], 0)
+
+
+	def test_concurrent_requests_overlap_latency(self):
+		'''
+		Test that concurrent requests wait for their simulated latency in parallel.
+		'''
+		async def run(endpoint):
+			client = AsyncAzureOpenAIClient(endpoint=endpoint, api_key='mock', model='gpt-4o')
+			await asyncio.gather(*[client.generate_response(user_input=f"Rephrase: {i}", system_message=MUTATION_SYSTEM_MESSAGE) for i in range(20)])
+			await client.close()
+
+		with MockLLMServer(latency_ms=200) as server:
+			start = time.monotonic()
+			asyncio.run(run(server.endpoint))
+			elapsed = time.monotonic() - start
+
+		self.assertGreaterEqual(elapsed, 0.2)
+		self.assertLess(elapsed, 2.0)
+
+
+	def test_packed_prompts_are_answered_per_item(self):
+		'''
+		Test that packed prompts get a well formed answer, so packed rounds need no fallback requests.
+		'''
+		client = MockLLMClient()
+		problems = [Problem(id=str(i), original_description=f"Problem {i}") for i in range(5)]
+
+		run_round_packed(
+			mutation_client=client,
+			evaluation_client=client,
+			problems=problems,
+			strategies=['rephrase.txt'] * 5,
+			prompt_templates={'rephrase.txt': "Rephrase: {statement}"},
+			evaluation_template="Evaluate: {original_statement} vs {mutated_statement}",
+			packing_templates=load_prompt_templates(strategies_dir='prompts/packing/'),
+			pack_size=5
+		)
+
+		self.assertTrue(all(problem.mutated and problem.score is not None for problem in problems))
+		self.assertEqual([problem.warnings_log for problem in problems], [[]] * 5)
+
+
+	def test_main_with_mock_backend(self):
+		'''
+		Test that a whole run completes offline against the mock backend.
+		'''
+		directory = tempfile.mkdtemp()
+		saved = []
+		argv = [
+			'main.py', '--backend', 'mock', '--mock-latency-ms', '5', '--round-mode', 'pipeline',
+			'--num-rounds', '2', '--num-problems', '4', '--topk-problems', '2',
+			'--checkpoint-dir', os.path.join(directory, 'checkpoints'),
+			'--leaderboard-path', os.path.join(directory, 'leaderboard.sqlite'),
+			'--metrics-summary', os.path.join(directory, 'metrics.json'),
+			'--lineage-path', os.path.join(directory, 'lineage.sqlite'),
+			'--scheduler-state', os.path.join(directory, 'scheduler.json')
+		]
+
+		try:
+			with patch('sys.argv', argv), patch('scripts.main.Logger', Mock()), patch('scripts.main.save_mutated_problem', lambda problem: saved.append(problem)):
+				scripts.main.main()
+
+		finally:
+			shutil.rmtree(directory, ignore_errors=True)
+
+		self.assertEqual(len(saved), 4)
+		self.assertTrue(all(problem.score is not None for problem in saved))
+
+
+if __name__ == '__main__':
+	unittest.main()
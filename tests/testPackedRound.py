@@ -0,0 +1,168 @@
+"""
+Unit test class for packed mutation and evaluation.
+"""
+
+import sys
+sys.path.append('.')
+
+import json
+import unittest
+from unittest.mock import Mock
+from scripts.data_handling import Problem, load_prompt_templates
+from scripts.rounds import run_round_packed
+from scripts.mutation import configure_evaluation, mutate_problems_packed, evaluate_problems_packed
+from src.TokenBudget import budget, count_tokens
+from src.DedupIndex import DedupIndex
+
+
+class FakePackingClient:
+	'''
+	Client answering packed prompts with well formed JSON and single prompts with plain text.
+	'''
+	def __init__(self):
+		self.calls = 0
+
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400) -> str:
+		self.calls += 1
+		if user_input.startswith('Apply the following'):
+			items = json.loads(user_input.split('\n\n')[1].split('\n', 1)[1])
+			if isinstance(items, dict):
+				return json.dumps({problem_id: f"Mutated: {statement}" for problem_id, statement in items.items()})
+			return json.dumps([{'id': item['id'], 'score': len(item['mutated_statement']) % 10} for item in items])
+
+		return '5' if 'scoring' in system_message else f"Mutated: {user_input}"
+
+
+class TestPackedRound(unittest.TestCase):
+	def setUp(self):
+		self.packing_templates = load_prompt_templates(strategies_dir='prompts/packing/')
+		self.prompt_template = "Rephrase: {statement}"
+		self.evaluation_template = "Evaluate: {original_statement} vs {mutated_statement}"
+
+
+	def make_problems(self, n: int, mutated: bool=False) -> list:
+		return [
+			Problem(id=str(i), original_description=f"Problem {i}", mutated_description=f"Mutated {i}", mutated=mutated)
+			for i in range(n)
+		]
+
+
+	def test_packed_evaluation(self):
+		'''
+		Test that a well formed packed answer scores every problem with a single request.
+		'''
+		client = Mock()
+		client.generate_response.return_value = '```json\n[{"id": "0", "score": 7.5}, {"id": "1", "score": "3"}]\n```'
+		problems = self.make_problems(2, mutated=True)
+
+		scores = evaluate_problems_packed(client, problems, self.evaluation_template, self.packing_templates['evaluate.txt'])
+
+		self.assertEqual(scores, {'0': 7.5, '1': 3.0})
+		self.assertEqual(problems[1].score, 3.0)
+		self.assertEqual(client.generate_response.call_count, 1)
+
+
+	def test_packed_evaluation_is_sized_from_single_evaluations(self):
+		'''
+		Test that a packed evaluation asks for the completion tokens of a single evaluation per problem, within the completion limit.
+		'''
+		client = Mock()
+		client.generate_response.return_value = '[]'
+		settings = dict(budget.settings)
+		try:
+			configure_evaluation(max_tokens=8)
+			for n in (2, 4):
+				evaluate_problems_packed(client, self.make_problems(n, mutated=True), self.evaluation_template, self.packing_templates['evaluate.txt'])
+			packed_tokens = [call.kwargs['max_tokens'] for call in client.generate_response.call_args_list if call.kwargs['user_input'].startswith('Apply the following')]
+			self.assertEqual(packed_tokens, [2 * (8 + count_tokens('{"id": "0"}')), 4 * (8 + count_tokens('{"id": "0"}'))])
+
+			budget.configure(min_completion_tokens=1, max_completion_tokens=20)
+			client.generate_response.reset_mock()
+			evaluate_problems_packed(client, self.make_problems(4, mutated=True), self.evaluation_template, self.packing_templates['evaluate.txt'])
+			self.assertEqual(client.generate_response.call_args_list[0].kwargs['max_tokens'], 20)
+
+		finally:
+			configure_evaluation()
+			budget.configure(**settings)
+
+
+	def test_packed_evaluation_falls_back_on_malformed_answer(self):
+		'''
+		Test that every problem is evaluated with its own request when the packed answer is malformed.
+		'''
+		client = Mock()
+		client.generate_response.side_effect = ['Here are the scores: 7 and 8', '7', '8']
+		problems = self.make_problems(2, mutated=True)
+
+		scores = evaluate_problems_packed(client, problems, self.evaluation_template, self.packing_templates['evaluate.txt'])
+
+		self.assertEqual(scores, {'0': 7.0, '1': 8.0})
+		self.assertEqual(client.generate_response.call_count, 3)
+		self.assertIn("Malformed packed evaluation response", problems[0].warnings_log[-1])
+
+
+	def test_packed_mutation_falls_back_on_missing_ids(self):
+		'''
+		Test that only problems missing from the packed answer are mutated with their own request.
+		'''
+		client = Mock()
+		client.generate_response.side_effect = ['{"0": "Mutated 0", "2": ""}', 'Mutated 1', 'Mutated 2']
+		problems = self.make_problems(3)
+
+		results = mutate_problems_packed(client, problems, self.prompt_template, self.packing_templates['mutate.txt'])
+
+		self.assertEqual(results, {'0': 'Mutated 0', '1': 'Mutated 1', '2': 'Mutated 2'})
+		self.assertEqual(client.generate_response.call_count, 3)
+		self.assertEqual(problems[0].mutation_log[-1]['prompt'], "Rephrase: Problem 0")
+		self.assertTrue(all(problem.mutated for problem in problems))
+
+
+	def test_failed_fallback_requests_are_logged(self):
+		'''
+		Test that a failing single request leaves its problem out with an error, while the rest of the pack goes on.
+		'''
+		client = Mock()
+		client.generate_response.side_effect = ['Not JSON', RuntimeError('Service unavailable'), 'Mutated 1']
+		problems = self.make_problems(2)
+
+		results = mutate_problems_packed(client, problems, self.prompt_template, self.packing_templates['mutate.txt'])
+
+		self.assertEqual(results, {'1': 'Mutated 1'})
+		self.assertIn("Service unavailable", problems[0].error_logs[-1])
+
+		client.generate_response.side_effect = ['Not JSON', RuntimeError('Service unavailable'), '6']
+		problems = self.make_problems(3, mutated=True)
+		problems[2].original_description, problems[2].mutated_description = problems[1].original_description, problems[1].mutated_description
+
+		scores = evaluate_problems_packed(client, problems, self.evaluation_template, self.packing_templates['evaluate.txt'], dedup_index=DedupIndex())
+
+		self.assertEqual(scores, {'1': 6.0, '2': 6.0})
+		self.assertIn("Service unavailable", problems[0].error_logs[-1])
+		self.assertEqual(client.generate_response.call_count, 6)
+
+		client = FakePackingClient()
+		client.generate_response = Mock(side_effect=['Not JSON', RuntimeError('Service unavailable'), 'Mutated 1'])
+		with self.assertRaises(ValueError):
+			run_round_packed(client, client, self.make_problems(2), ['rephrase.txt'] * 2, {'rephrase.txt': self.prompt_template}, self.evaluation_template, self.packing_templates)
+
+
+	def test_packed_round_request_count(self):
+		'''
+		Test that a packed round sends one mutation request per strategy and pack, and one evaluation request per pack.
+		'''
+		client = FakePackingClient()
+		problems = self.make_problems(10)
+		prompt_templates = {'rephrase.txt': "Rephrase: {statement}", 'simplify.txt': "Simplify: {statement}"}
+		strategies = ['rephrase.txt', 'simplify.txt'] * 5
+		results = []
+
+		run_round_packed(client, client, problems, strategies, prompt_templates, self.evaluation_template, self.packing_templates, pack_size=4, on_result=lambda index, problem: results.append(index))
+
+		self.assertEqual(client.calls, 2 + 2 + 3)
+		self.assertEqual(problems[1].mutated_description, "Mutated: Problem 1")
+		self.assertEqual(results, list(range(10)))
+
+
+if __name__ == '__main__':
+	unittest.main()
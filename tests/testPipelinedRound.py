@@ -0,0 +1,113 @@
+"""
+Unit test class for pipelined rounds.
+"""
+
+import sys
+sys.path.append('.')
+
+import random
+import asyncio
+import unittest
+from scripts.data_handling import Problem
+from scripts.rounds import TopKSelector, run_round_sequential, run_round_pipelined
+from src.TokenBudget import budget
+from tests.fakes import FakeClient, FakeAsyncClient, make_problems
+
+
+class SlowFirstClient(FakeAsyncClient):
+	'''
+	Asynchronous fake client where mutations of the first problem are much slower than the rest.
+	'''
+	def __init__(self):
+		super().__init__()
+		self.events = []
+
+
+	async def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: dict=None) -> str:
+		stage = 'evaluate' if 'scoring' in system_message else 'mutate'
+		self.latency = 0.2 if stage == 'mutate' and 'Problem 0 ' in user_input else 0.01
+		response = await super().generate_response(user_input, system_message, temperature, max_tokens, response_format)
+		self.events.append(stage)
+		return response
+
+
+class FailingAsyncClient:
+	async def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400) -> str:
+		raise RuntimeError("Service unavailable")
+
+
+class TestPipelinedRound(unittest.TestCase):
+	def setUp(self):
+		self.prompt_templates = {'rephrase.txt': "Rephrase: {statement}"}
+		self.evaluation_template = "Evaluate: {original_statement} vs {mutated_statement}"
+
+
+	def test_pipeline_matches_sequential(self):
+		'''
+		Test that the pipelined round scores every problem as the sequential round does.
+		'''
+		budget.reset()
+		sequential_problems = make_problems(10)
+		run_round_sequential(FakeClient(), FakeClient(), sequential_problems, ['rephrase.txt'] * 10, self.prompt_templates, self.evaluation_template)
+
+		# Starting from the growth the sequential round started from
+		budget.reset()
+		results = {}
+		client = SlowFirstClient()
+		evaluated = asyncio.run(run_round_pipelined(
+			client, client, zip(make_problems(10), ['rephrase.txt'] * 10), self.prompt_templates, self.evaluation_template,
+			on_result=lambda index, problem: results.__setitem__(index, problem), concurrency=3, queue_size=2
+		))
+
+		self.assertEqual(evaluated, 10)
+		self.assertEqual([p.score for p in sequential_problems], [results[i].score for i in range(10)])
+
+
+	def test_evaluation_starts_before_mutations_finish(self):
+		'''
+		Test that evaluations start while a slow mutation is still in flight.
+		'''
+		client = SlowFirstClient()
+		order = []
+		asyncio.run(run_round_pipelined(
+			client, client, zip(make_problems(6), ['rephrase.txt'] * 6), self.prompt_templates, self.evaluation_template,
+			on_result=lambda index, problem: order.append(index), concurrency=4, queue_size=4
+		))
+
+		self.assertLess(client.events.index('evaluate'), len(client.events) - 2)
+		self.assertEqual(order[-1], 0)
+
+
+	def test_failure_propagates(self):
+		'''
+		Test that a failed request stops the pipeline and raises.
+		'''
+		problems = make_problems(5)
+		with self.assertRaises(ValueError):
+			asyncio.run(run_round_pipelined(
+				FailingAsyncClient(), FailingAsyncClient(), zip(problems, ['rephrase.txt'] * 5), self.prompt_templates, self.evaluation_template,
+				on_result=lambda index, problem: None, concurrency=2, queue_size=1
+			))
+
+		self.assertIn("Error during mutation", problems[0].error_logs[-1])
+
+
+	def test_topk_selector_matches_stable_sort(self):
+		'''
+		Test that the streaming top k selection equals a stable descending sort, whatever the arrival order.
+		'''
+		random.seed(0)
+		problems = [Problem(id=str(i), score=float(random.randint(0, 4))) for i in range(50)]
+		expected = sorted(problems, key=lambda x: x.score, reverse=True)[:7]
+
+		arrivals = list(enumerate(problems))
+		random.shuffle(arrivals)
+		selector = TopKSelector(k=7)
+		for index, problem in arrivals:
+			selector.push(index=index, problem=problem)
+
+		self.assertEqual([p.id for p in selector.result()], [p.id for p in expected])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,136 @@
+"""
+Unit test class for the streaming problem corpus.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import gzip
+import json
+import time
+import random
+import shutil
+import tempfile
+import unittest
+from scripts.data_handling import load_problems
+from src.ProblemCorpus import ProblemCorpus
+
+
+class TestProblemCorpus(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.statements = [f"Problem {i}: find the shortest path in graph {i}." for i in range(50)]
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def write(self, filename: str, lines: list, compressed: bool=False) -> str:
+		filepath = os.path.join(self.directory, filename)
+		opener = gzip.open if compressed else open
+		with opener(filepath, 'wt', encoding='utf-8') as file:
+			file.write('\n'.join(lines) + '\n')
+
+		return filepath
+
+
+	def test_sample_matches_load_problems(self):
+		'''
+		Test that a seeded sample of an indexed corpus selects the same problems as sampling the loaded list.
+		'''
+		filepath = self.write('problems.txt', self.statements[:20] + ['', '   '] + self.statements[20:])
+
+		random.seed(7)
+		expected = [problem.original_description for problem in random.sample(load_problems(filepath), 10)]
+		random.seed(7)
+		corpus = ProblemCorpus(filepath)
+		sampled = [problem.original_description for problem in corpus.sample(10)]
+
+		self.assertEqual(sampled, expected)
+		self.assertEqual(len(corpus), 50)
+		self.assertEqual(corpus[-1].original_description, self.statements[-1])
+		self.assertEqual([problem.original_description for problem in corpus[20:22]], self.statements[20:22])
+		corpus.close()
+
+
+	def test_jsonl_corpus(self):
+		'''
+		Test that JSONL corpora accept objects with a statement field and plain strings.
+		'''
+		lines = [json.dumps({'id': i, 'description': statement}) for i, statement in enumerate(self.statements[:3])]
+		lines.append(json.dumps(self.statements[3]))
+		corpus = ProblemCorpus(self.write('problems.jsonl', lines))
+
+		self.assertEqual([problem.original_description for problem in corpus], self.statements[:4])
+		self.assertEqual(corpus[3].original_description, self.statements[3])
+		corpus.close()
+
+
+	def test_index_is_reused_until_file_changes(self):
+		'''
+		Test that the saved line-offset index is reused for an unchanged file and rebuilt after a change.
+		'''
+		filepath = self.write('problems.txt', self.statements)
+		ProblemCorpus(filepath).close()
+		self.assertTrue(os.path.exists(f'{filepath}.idx'))
+
+		corpus = ProblemCorpus(filepath)
+		self.assertIsNotNone(corpus._load_index())
+		corpus.close()
+
+		# Making sure the modification time changes
+		time.sleep(0.01)
+		self.write('problems.txt', self.statements[:5])
+		corpus = ProblemCorpus(filepath)
+		self.assertEqual(len(corpus), 5)
+		self.assertEqual(corpus[4].original_description, self.statements[4])
+		corpus.close()
+
+
+	def test_compressed_corpus_reservoir_sampling(self):
+		'''
+		Test that gzip corpora are sampled deterministically with reservoir sampling without indexing.
+		'''
+		filepath = self.write('problems.txt.gz', self.statements, compressed=True)
+		corpus = ProblemCorpus(filepath)
+
+		first = [problem.original_description for problem in corpus.sample(10, rng=random.Random(3))]
+		second = [problem.original_description for problem in corpus.sample(10, rng=random.Random(3))]
+
+		self.assertEqual(first, second)
+		self.assertEqual(len(set(first)), 10)
+		self.assertTrue(set(first) <= set(self.statements))
+		self.assertEqual(len(corpus.sample(100, rng=random.Random(3))), 50)
+		self.assertEqual(len(corpus), 50)
+		self.assertFalse(os.path.exists(f'{filepath}.idx'))
+		with self.assertRaises(TypeError):
+			corpus[0]
+
+
+	def test_reservoir_sampling_is_uniform(self):
+		'''
+		Test that every line of a compressed corpus is about equally likely to be sampled.
+		'''
+		corpus = ProblemCorpus(self.write('problems.txt.gz', self.statements[:10], compressed=True))
+		rng = random.Random(0)
+		counts = {statement: 0 for statement in self.statements[:10]}
+		for _ in range(2000):
+			for problem in corpus.sample(2, rng=rng):
+				counts[problem.original_description] += 1
+
+		# Each line is expected 400 times
+		self.assertTrue(all(300 < count < 500 for count in counts.values()))
+
+
+	def test_file_not_found(self):
+		'''
+		Test that a missing corpus raises FileNotFoundError.
+		'''
+		with self.assertRaises(FileNotFoundError):
+			ProblemCorpus(os.path.join(self.directory, 'missing.txt'))
+
+
+if __name__ == '__main__':
+	unittest.main()
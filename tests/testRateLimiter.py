@@ -0,0 +1,200 @@
+"""
+Unit test class for the rate limiter and retry scheduler.
+"""
+
+import sys
+sys.path.append('.')
+
+import json
+import time
+import asyncio
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.AzureOpenAIClient import AzureOpenAIClient
+from src.AsyncAzureOpenAIClient import AsyncAzureOpenAIClient
+from src.RateLimiter import RateLimiter, TokenBucket, CircuitOpenError
+
+
+class FakeServerHandler(BaseHTTPRequestHandler):
+	'''
+	Chat-completions stand-in answering with the status codes queued in `server.statuses`, then with 200.
+	'''
+	def do_POST(self):
+		self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		with self.server.lock:
+			self.server.requests += 1
+			status = self.server.statuses.pop(0) if self.server.statuses else 200
+
+		if status == 200:
+			body = {
+				'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-4o',
+				'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': '7'}, 'finish_reason': 'stop'}],
+				'usage': {'prompt_tokens': 10, 'completion_tokens': 1, 'total_tokens': 11}
+			}
+		else:
+			body = {'error': {'code': str(status), 'message': 'Injected failure'}}
+
+		payload = json.dumps(body).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(payload)))
+		if status == 429:
+			self.send_header('Retry-After', '0.05')
+		self.end_headers()
+		self.wfile.write(payload)
+
+
+	def log_message(self, format, *args):
+		pass
+
+
+class TestRateLimiter(unittest.TestCase):
+	def setUp(self):
+		self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeServerHandler)
+		self.server.lock = threading.Lock()
+		self.server.requests = 0
+		self.server.statuses = []
+		self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+		self.thread.start()
+		self.endpoint = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+
+	def make_client(self, rate_limiter: RateLimiter) -> AzureOpenAIClient:
+		return AzureOpenAIClient(endpoint=self.endpoint, api_key='key', model='gpt-4o', rate_limiter=rate_limiter)
+
+
+	def test_retries_throttled_requests_honouring_retry_after(self):
+		'''
+		Test that 429 responses are retried after the Retry-After delay and slow the effective rate down.
+		'''
+		self.server.statuses = [429, 429]
+		rate_limiter = RateLimiter(requests_per_minute=6000, base_delay=0.001)
+
+		start = time.monotonic()
+		response = self.make_client(rate_limiter).generate_response(user_input="Evaluate", system_message="Score")
+		elapsed = time.monotonic() - start
+
+		self.assertEqual(response, '7')
+		self.assertEqual(self.server.requests, 3)
+		self.assertGreaterEqual(elapsed, 0.1)
+		self.assertEqual(rate_limiter.stats['throttled'], 2)
+		self.assertEqual(rate_limiter.stats['retries'], 2)
+		self.assertLess(rate_limiter.scale, 1.0)
+
+
+	def test_non_retryable_error_raises(self):
+		'''
+		Test that client errors are not retried and raise instead of returning an error string.
+		'''
+		self.server.statuses = [400]
+		with self.assertRaises(RuntimeError):
+			self.make_client(RateLimiter(base_delay=0.001)).generate_response(user_input="Evaluate", system_message="Score")
+
+		self.assertEqual(self.server.requests, 1)
+
+
+	def test_circuit_breaker_opens(self):
+		'''
+		Test that consecutive server errors open the circuit and stop sending requests.
+		'''
+		self.server.statuses = [500] * 20
+		rate_limiter = RateLimiter(max_retries=10, base_delay=0.001, failure_threshold=3, reset_timeout=60)
+
+		with self.assertRaises(RuntimeError) as context:
+			self.make_client(rate_limiter).generate_response(user_input="Evaluate", system_message="Score")
+
+		self.assertIsInstance(context.exception.__cause__, CircuitOpenError)
+		self.assertEqual(self.server.requests, 3)
+		self.assertEqual(rate_limiter.breaker.state, 'open')
+
+
+	def test_trial_request_is_always_settled(self):
+		'''
+		Test that a half-open circuit lets a new trial through after a trial that was throttled, rejected or cancelled.
+		'''
+		class StatusError(Exception):
+			def __init__(self, status_code):
+				super().__init__(f"Status {status_code}")
+				self.status_code = status_code
+
+		def failing(error):
+			def request():
+				raise error
+			return request
+
+		for error in (StatusError(429), StatusError(400), KeyboardInterrupt()):
+			rate_limiter = RateLimiter(max_retries=0, base_delay=0.001, failure_threshold=1, reset_timeout=0.01)
+			with self.assertRaises(StatusError):
+				rate_limiter.call(failing(StatusError(500)))
+			time.sleep(0.02)
+
+			with self.assertRaises(type(error)):
+				rate_limiter.call(failing(error))
+			self.assertEqual(rate_limiter.call(lambda: 'ok'), 'ok')
+			self.assertEqual(rate_limiter.breaker.state, 'closed')
+
+		async def cancelled_trial() -> str:
+			rate_limiter = RateLimiter(max_retries=0, failure_threshold=1, reset_timeout=0.01)
+			with self.assertRaises(StatusError):
+				await rate_limiter.call_async(failing(StatusError(500)))
+			await asyncio.sleep(0.02)
+
+			task = asyncio.ensure_future(rate_limiter.call_async(lambda: asyncio.sleep(10)))
+			await asyncio.sleep(0.01)
+			task.cancel()
+			with self.assertRaises(asyncio.CancelledError):
+				await task
+
+			async def request():
+				return 'ok'
+
+			return await rate_limiter.call_async(request)
+
+		self.assertEqual(asyncio.run(cancelled_trial()), 'ok')
+
+
+	def test_shared_limiter_across_async_clients(self):
+		'''
+		Test that asynchronous mutation and evaluation clients sharing a limiter all recover from throttling.
+		'''
+		self.server.statuses = [429] * 4
+		rate_limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=10 ** 6, base_delay=0.001)
+
+		async def run():
+			mutation_client = AsyncAzureOpenAIClient(endpoint=self.endpoint, api_key='key', model='gpt-4o', rate_limiter=rate_limiter)
+			evaluation_client = AsyncAzureOpenAIClient(endpoint=self.endpoint, api_key='key', model='gpt-4o', rate_limiter=rate_limiter)
+			responses = await asyncio.gather(*[
+				client.generate_response(user_input=f"Input {i}", system_message="System")
+				for i in range(4) for client in (mutation_client, evaluation_client)
+			])
+			await mutation_client.close()
+			await evaluation_client.close()
+			return responses
+
+		self.assertEqual(asyncio.run(run()), ['7'] * 8)
+		self.assertEqual(self.server.requests, 12)
+		self.assertEqual(rate_limiter.stats['throttled'], 4)
+
+
+	def test_token_bucket(self):
+		'''
+		Test that the bucket allows a burst up to its capacity and then spaces requests at its rate.
+		'''
+		bucket = TokenBucket(rate_per_minute=60, burst_seconds=10)
+		now = bucket.updated
+
+		self.assertEqual(bucket.reserve(10, now), 0.0)
+		self.assertAlmostEqual(bucket.reserve(1, now), 1.0)
+		self.assertAlmostEqual(bucket.reserve(1, now + 1.0), 1.0)
+		bucket.refund(2)
+		self.assertEqual(bucket.reserve(1, now + 1.0), 0.0)
+
+
+if __name__ == '__main__':
+	unittest.main()
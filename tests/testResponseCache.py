@@ -0,0 +1,144 @@
+"""
+Unit test class for the response cache.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock
+from src.ResponseCache import ResponseCache
+from src.AzureOpenAIClient import AzureOpenAIClient
+
+class TestResponseCache(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'responses.sqlite')
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def test_key_depends_on_every_field(self):
+		'''
+		Test that the cache key changes with any request field.
+		'''
+		key = ResponseCache.make_key('gpt-4o', 'system', 'user', 0.7, 400)
+		self.assertEqual(key, ResponseCache.make_key('gpt-4o', 'system', 'user', 0.7, 400))
+		self.assertNotEqual(key, ResponseCache.make_key('gpt-4o-mini', 'system', 'user', 0.7, 400))
+		self.assertNotEqual(key, ResponseCache.make_key('gpt-4o', 'other', 'user', 0.7, 400))
+		self.assertNotEqual(key, ResponseCache.make_key('gpt-4o', 'system', 'other', 0.7, 400))
+		self.assertNotEqual(key, ResponseCache.make_key('gpt-4o', 'system', 'user', 0.0, 400))
+		self.assertNotEqual(key, ResponseCache.make_key('gpt-4o', 'system', 'user', 0.7, 10))
+
+
+	def test_persistence_and_counters(self):
+		'''
+		Test that responses survive reopening the cache and that hits and misses are counted.
+		'''
+		cache = ResponseCache(path=self.path)
+		self.assertIsNone(cache.get('a'))
+		cache.put('a', 'response a')
+		cache.close()
+
+		cache = ResponseCache(path=self.path)
+		self.assertEqual(cache.get('a'), 'response a')
+		self.assertIsNone(cache.get('b'))
+		stats = cache.stats()
+		cache.close()
+
+		self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+		self.assertEqual(stats['hit_rate'], 0.5)
+
+
+	def test_lru_eviction_by_entries(self):
+		'''
+		Test that the least recently used entry is evicted when the entry limit is reached.
+		'''
+		cache = ResponseCache(path=self.path, max_entries=2)
+		cache.put('a', 'response a')
+		cache.put('b', 'response b')
+		cache.get('a')
+		cache.put('c', 'response c')
+
+		self.assertEqual(cache.get('a'), 'response a')
+		self.assertIsNone(cache.get('b'))
+		self.assertEqual(cache.get('c'), 'response c')
+		self.assertEqual(cache.stats()['evictions'], 1)
+		cache.close()
+
+
+	def test_limits_hold_across_processes(self):
+		'''
+		Test that caches sharing a file, as sharded workers do, count each other's entries when evicting.
+		'''
+		first = ResponseCache(path=self.path, max_entries=3)
+		second = ResponseCache(path=self.path, max_entries=3)
+		for i in range(3):
+			first.put(f'first {i}', 'response')
+			second.put(f'second {i}', 'response')
+
+		self.assertEqual(first.stats()['entries'], 3)
+		self.assertEqual(second.stats()['entries'], 3)
+		self.assertEqual(first.stats()['bytes'], 3 * len('response'))
+		self.assertEqual([second.get(f'second {i}') for i in range(3)], [None, 'response', 'response'])
+		self.assertEqual(first.get('first 2'), 'response')
+		first.close()
+		second.close()
+
+
+	def test_eviction_by_size(self):
+		'''
+		Test that the oldest entries are evicted when the size limit is exceeded.
+		'''
+		cache = ResponseCache(path=self.path, max_entries=0, max_bytes=25)
+		for key in 'abc':
+			cache.put(key, key * 10)
+
+		self.assertIsNone(cache.get('a'))
+		self.assertEqual(cache.get('b'), 'b' * 10)
+		self.assertEqual(cache.get('c'), 'c' * 10)
+		cache.close()
+
+
+	def test_read_only(self):
+		'''
+		Test that a read-only cache serves stored responses but does not store new ones.
+		'''
+		cache = ResponseCache(path=self.path)
+		cache.put('a', 'response a')
+		cache.close()
+
+		cache = ResponseCache(path=self.path, read_only=True)
+		cache.put('b', 'response b')
+		self.assertEqual(cache.get('a'), 'response a')
+		self.assertIsNone(cache.get('b'))
+		cache.close()
+
+
+	def test_client_serves_repeated_requests_from_cache(self):
+		'''
+		Test that the client only calls the model once for identical requests and does not cache errors.
+		'''
+		cache = ResponseCache(path=self.path)
+		client = AzureOpenAIClient(endpoint='https://example.openai.azure.com', api_key='key', model='gpt-4o', cache=cache)
+		client.client = Mock()
+		client.client.chat.completions.create.return_value.choices = [Mock(message=Mock(content="8.5"))]
+
+		self.assertEqual(client.generate_response(user_input="Evaluate", system_message="Score"), "8.5")
+		self.assertEqual(client.generate_response(user_input="Evaluate", system_message="Score"), "8.5")
+		self.assertEqual(client.client.chat.completions.create.call_count, 1)
+
+		client.client.chat.completions.create.side_effect = Exception("Service unavailable")
+		with self.assertRaises(RuntimeError):
+			client.generate_response(user_input="Other", system_message="Score")
+		self.assertEqual(cache.stats()['entries'], 1)
+		cache.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,244 @@
+"""
+Unit test class for sharded rounds.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from src.LineageStore import lineage
+from src.TokenBudget import GROWTH_PRIORS, budget
+from src.Metrics import metrics
+from scripts.rounds import run_round_sequential
+from scripts.sharding import run_round_sharded, run_worker, claim_shard, create_client
+from tests.fakes import FakeClient, make_problems
+
+
+class UsageClient(FakeClient):
+	'''
+	Deterministic client reporting the usage of each request, as the clients of a deployment do.
+	'''
+	model = 'shard-usage'
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format: dict=None) -> str:
+		metrics.inc('llm_prompt_tokens_total', 10, model=self.model)
+		metrics.inc('llm_completion_tokens_total', 5, model=self.model)
+
+		return super().generate_response(user_input=user_input, system_message=system_message, temperature=temperature, max_tokens=max_tokens, response_format=response_format)
+
+
+class FailingClient:
+	'''
+	Client failing every request.
+	'''
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400) -> str:
+		raise RuntimeError("Deployment unavailable")
+
+
+class TestShardedRound(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.prompt_templates = {'rephrase.txt': "Rephrase: {statement}", 'simplify.txt': "Simplify: {statement}"}
+		self.evaluation_template = "Evaluate: {original_statement} vs {mutated_statement}"
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def make_round(self, n: int) -> tuple:
+		problems = make_problems(n)
+		strategies = ['rephrase.txt' if i % 3 else 'simplify.txt' for i in range(n)]
+		return problems, strategies
+
+
+	def test_local_workers_match_sequential_round(self):
+		'''
+		Test that local worker processes produce the same results, merged in order, as a sequential round.
+		'''
+		budget.reset()
+		expected, strategies = self.make_round(10)
+		run_round_sequential(FakeClient(), FakeClient(), expected, strategies, self.prompt_templates, self.evaluation_template)
+
+		# Discarding the history of the expected round, whose problems share the ids of the sharded round
+		for problem in expected:
+			lineage.discard(problem.id)
+
+		# Starting from the growth the sequential round started from
+		budget.reset()
+		problems, strategies = self.make_round(10)
+		results = []
+		run_round_sharded(
+			problems=problems,
+			strategies=strategies,
+			prompt_templates=self.prompt_templates,
+			evaluation_template=self.evaluation_template,
+			n_round=0,
+			shard_dir=self.directory,
+			num_shards=3,
+			client_factory=FakeClient,
+			workers=2,
+			on_result=lambda index, problem: results.append((index, problem.id))
+		)
+
+		self.assertEqual(results, [(i, str(i)) for i in range(10)])
+		self.assertEqual([(p.mutated_description, p.score) for p in problems], [(p.mutated_description, p.score) for p in expected])
+		self.assertTrue(all(len(problem.mutation_log) == 1 for problem in problems))
+		self.assertEqual(os.listdir(self.directory), [])
+
+
+	def test_external_workers(self):
+		'''
+		Test that a coordinator without local workers waits for workers claiming shards from the shared directory.
+		'''
+		problems, strategies = self.make_round(7)
+		coordinator = threading.Thread(target=run_round_sharded, kwargs={
+			'problems': problems,
+			'strategies': strategies,
+			'prompt_templates': self.prompt_templates,
+			'evaluation_template': self.evaluation_template,
+			'n_round': 1,
+			'shard_dir': self.directory,
+			'num_shards': 4,
+			'poll_interval': 0.01
+		})
+		coordinator.start()
+
+		processed = 0
+		while coordinator.is_alive():
+			processed += run_worker(shard_dir=self.directory, client_factory=FakeClient)
+		coordinator.join()
+
+		self.assertEqual(processed, 4)
+		self.assertTrue(all(problem.mutated and problem.score is not None for problem in problems))
+
+
+	def test_stale_claims_are_given_back(self):
+		'''
+		Test that the shard of a worker that died after claiming it is given back to the other workers.
+		'''
+		problems, strategies = self.make_round(6)
+		coordinator = threading.Thread(target=run_round_sharded, kwargs={
+			'problems': problems,
+			'strategies': strategies,
+			'prompt_templates': self.prompt_templates,
+			'evaluation_template': self.evaluation_template,
+			'n_round': 2,
+			'shard_dir': self.directory,
+			'num_shards': 2,
+			'poll_interval': 0.01,
+			'shard_timeout': 0.2
+		})
+		reclaims = metrics.value('shard_reclaims_total')
+		coordinator.start()
+
+		# Claiming a shard as a worker dying before processing it would
+		dead = None
+		while dead is None:
+			dead = claim_shard(self.directory)
+			time.sleep(0.01)
+
+		processed = 0
+		while coordinator.is_alive():
+			processed += run_worker(shard_dir=self.directory, client_factory=FakeClient)
+		coordinator.join()
+
+		self.assertEqual(processed, 2)
+		self.assertEqual(metrics.value('shard_reclaims_total') - reclaims, 1)
+		self.assertTrue(all(problem.mutated and problem.score is not None for problem in problems))
+
+
+	def test_unfinished_round_times_out(self):
+		'''
+		Test that a round whose shards are not finished before its deadline fails instead of waiting forever.
+		'''
+		problems, strategies = self.make_round(4)
+
+		with self.assertRaises(ValueError) as context:
+			run_round_sharded(
+				problems=problems,
+				strategies=strategies,
+				prompt_templates=self.prompt_templates,
+				evaluation_template=self.evaluation_template,
+				n_round=3,
+				shard_dir=self.directory,
+				num_shards=2,
+				poll_interval=0.01,
+				round_timeout=0.1
+			)
+
+		self.assertIn("did not finish within 0.1 seconds", str(context.exception))
+		self.assertIn("round-3-shard-0", str(context.exception))
+
+
+	def test_worker_spend_is_counted(self):
+		'''
+		Test that the tokens and mutations of worker processes count towards the budget of the coordinator.
+		'''
+		problems, strategies = self.make_round(6)
+		budget.growth = dict(GROWTH_PRIORS)
+		budget.reset()
+		try:
+			run_round_sharded(
+				problems=problems,
+				strategies=strategies,
+				prompt_templates=self.prompt_templates,
+				evaluation_template=self.evaluation_template,
+				n_round=0,
+				shard_dir=self.directory,
+				num_shards=2,
+				client_factory=UsageClient,
+				workers=2
+			)
+			spent, growth = budget.spent(), dict(budget.growth)
+
+		finally:
+			budget.growth = dict(GROWTH_PRIORS)
+
+		self.assertEqual(metrics.value('llm_prompt_tokens_total', model='shard-usage'), 120)
+		self.assertEqual(metrics.value('llm_completion_tokens_total', model='shard-usage'), 60)
+		self.assertEqual(spent['tokens'], 180)
+		self.assertNotEqual(growth['rephrase.txt'], GROWTH_PRIORS['rephrase.txt'])
+
+
+	def test_failed_shard_raises(self):
+		'''
+		Test that a shard failing in a worker process fails the round.
+		'''
+		problems, strategies = self.make_round(4)
+
+		with self.assertRaises(ValueError) as context:
+			run_round_sharded(
+				problems=problems,
+				strategies=strategies,
+				prompt_templates=self.prompt_templates,
+				evaluation_template=self.evaluation_template,
+				n_round=0,
+				shard_dir=self.directory,
+				num_shards=2,
+				client_factory=FailingClient,
+				workers=2
+			)
+
+		self.assertIn("2 shards failed", str(context.exception))
+
+
+	def test_worker_client_opens_cache(self):
+		'''
+		Test that the client of a worker opens the shared response cache with its limits.
+		'''
+		path = os.path.join(self.directory, 'responses.sqlite')
+		client = create_client(endpoint='https://example.openai.azure.com', api_key='key', model='shard-cache', cache_path=path, cache_mode='read-only', cache_max_entries=2, cache_max_bytes=1024)
+
+		self.assertIsNotNone(client.cache)
+		self.assertEqual((client.cache.max_entries, client.cache.max_bytes, client.cache.read_only), (2, 1024, True))
+		self.assertIsNone(create_client(endpoint='https://example.openai.azure.com', api_key='key', model='shard-cache', cache_path=path).cache)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,134 @@
+"""
+Unit test class for the bandit strategy scheduler.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from src.StrategyScheduler import StrategyScheduler
+import scripts.main
+
+
+class TestStrategyScheduler(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.strategies = ['add_constraint', 'rephrase', 'simplify']
+
+
+	def tearDown(self):
+		shutil.rmtree(self.directory, ignore_errors=True)
+
+
+	def test_uniform_matches_random_choice(self):
+		'''
+		Test that uniform mode draws the same strategies as random.choice under the same seed.
+		'''
+		random.seed(11)
+		expected = [random.choice(self.strategies) for _ in range(20)]
+		random.seed(11)
+		selected = StrategyScheduler(strategies=self.strategies).select(20)
+
+		self.assertEqual(selected, expected)
+
+
+	def test_ucb_favours_rewarding_strategy(self):
+		'''
+		Test that UCB tries every strategy first, then gives most of a batch to the rewarding strategy without taking all of it.
+		'''
+		scheduler = StrategyScheduler(strategies=self.strategies, mode='ucb')
+		self.assertEqual(sorted(scheduler.select(3)), sorted(self.strategies))
+
+		for _ in range(20):
+			scheduler.update(strategy='rephrase', gain=6.0, tokens=100, seconds=1.0)
+			scheduler.update(strategy='simplify', gain=0.0, tokens=100, seconds=1.0)
+			scheduler.update(strategy='add_constraint', gain=3.0, tokens=100, seconds=1.0)
+
+		selected = scheduler.select(60)
+		self.assertGreater(selected.count('rephrase'), 40)
+		self.assertGreater(selected.count('add_constraint'), selected.count('simplify'))
+
+
+	def test_thompson_is_seeded(self):
+		'''
+		Test that Thompson sampling is deterministic under a seed and favours the rewarding strategy.
+		'''
+		scheduler = StrategyScheduler(strategies=self.strategies, mode='thompson')
+		for _ in range(30):
+			scheduler.update(strategy='simplify', gain=10.0, tokens=0, seconds=0.0)
+			scheduler.update(strategy='rephrase', gain=0.0, tokens=0, seconds=0.0)
+
+		random.seed(5)
+		first = scheduler.select(20)
+		random.seed(5)
+		second = scheduler.select(20)
+
+		self.assertEqual(first, second)
+		self.assertGreater(first.count('simplify'), 15)
+
+
+	def test_reward_penalises_cost(self):
+		'''
+		Test that the same gain is worth less when it costs more tokens or seconds, and that losses are not rewarded.
+		'''
+		scheduler = StrategyScheduler(strategies=self.strategies)
+
+		self.assertAlmostEqual(scheduler.reward(gain=5.0, tokens=0, seconds=0.0), 0.5)
+		self.assertLess(scheduler.reward(gain=5.0, tokens=2000, seconds=0.0), scheduler.reward(gain=5.0, tokens=100, seconds=0.0))
+		self.assertLess(scheduler.reward(gain=5.0, tokens=100, seconds=30.0), scheduler.reward(gain=5.0, tokens=100, seconds=1.0))
+		self.assertEqual(scheduler.reward(gain=-3.0, tokens=100, seconds=1.0), 0.0)
+		with self.assertRaises(ValueError):
+			StrategyScheduler(strategies=self.strategies, mode='greedy')
+
+
+	def test_state_persists(self):
+		'''
+		Test that the learned rewards are saved and restored for the strategies that still exist.
+		'''
+		state_path = os.path.join(self.directory, 'state', 'scheduler.json')
+		scheduler = StrategyScheduler(strategies=self.strategies, mode='ucb', state_path=state_path)
+		scheduler.update(strategy='rephrase', gain=4.0, tokens=200, seconds=2.0)
+		scheduler.save()
+
+		restored = StrategyScheduler(strategies=['rephrase', 'expand'], mode='thompson', state_path=state_path)
+
+		self.assertEqual(restored.stats()['rephrase'], scheduler.stats()['rephrase'])
+		self.assertEqual(restored.stats()['expand']['pulls'], 0)
+		self.assertNotIn('simplify', restored.arms)
+
+
+	def test_run_updates_scheduler(self):
+		'''
+		Test that a run allocates mutations with the scheduler and saves one update per evaluated mutation.
+		'''
+		state_path = os.path.join(self.directory, 'scheduler.json')
+		summary_path = os.path.join(self.directory, 'metrics.json')
+		argv = [
+			'main.py', '--backend', 'mock', '--num-rounds', '2', '--num-problems', '3', '--topk-problems', '1', '--scheduler', 'ucb',
+			'--checkpoint-dir', os.path.join(self.directory, 'checkpoints'),
+			'--leaderboard-path', os.path.join(self.directory, 'leaderboard.sqlite'),
+			'--metrics-summary', summary_path,
+			'--lineage-path', os.path.join(self.directory, 'lineage.sqlite'),
+			'--scheduler-state', state_path
+		]
+		with patch('sys.argv', argv), patch('scripts.main.Logger', Mock()), patch('scripts.main.save_mutated_problem', lambda problem: None):
+			scripts.main.main()
+
+		with open(state_path, 'r') as file:
+			state = json.load(file)
+		with open(summary_path, 'r') as file:
+			summary = json.load(file)
+
+		self.assertEqual(state['mode'], 'ucb')
+		self.assertEqual(sum(arm['pulls'] for arm in state['arms'].values()), 6)
+		self.assertEqual(sum(strategy['pulls'] for strategy in summary['strategies'].values()), 6)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,178 @@
+"""
+Unit test class for streamed mutations.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+from scripts.data_handling import Problem, load_prompt_templates, load_evaluation_template
+from scripts.mutation import configure_streaming, mutate_problem, mutation_stop
+from scripts.rounds import run_round_pipelined
+from src.MockLLMServer import MockLLMServer
+from src.ResponseCache import ResponseCache
+from src.AzureOpenAIClient import AzureOpenAIClient
+from src.AsyncAzureOpenAIClient import AsyncAzureOpenAIClient
+from src.LLMBackend import StreamingLLMBackend
+from src.TokenBudget import budget
+from src.Metrics import metrics
+
+
+STATEMENT = "Implement a BFS-based pathfinding algorithm to navigate a 2D grid with dynamic obstacles."
+
+
+class TestStreaming(unittest.TestCase):
+	def setUp(self):
+		self.prompt_template = load_prompt_templates()['rephrase.txt']
+		self.settings = dict(budget.settings)
+		# Reserving room for the commentary the mock backend answers with
+		budget.configure(min_completion_tokens=256)
+
+
+	def tearDown(self):
+		configure_streaming()
+		budget.configure(**self.settings)
+
+
+	def test_stop_conditions(self):
+		'''
+		Test that a stream stops before commentary, or at the last complete sentence once it grows too long.
+		'''
+		problem = Problem(original_description=STATEMENT)
+		stop_at = mutation_stop(problem)
+
+		self.assertIsNone(stop_at("Find the shortest path in a grid."))
+		self.assertIsNone(stop_at("Find the shortest path in a grid.\n\nThe grid has n rows."))
+		self.assertEqual(stop_at("Find the shortest path.\n\nNote: I kept"), len("Find the shortest path."))
+		self.assertEqual(stop_at("Find the shortest path.\n---\n"), len("Find the shortest path."))
+		self.assertIn("commentary", problem.warnings_log[-1])
+
+		# Keeping the notes and explanations belonging to the statement itself
+		stop_at = mutation_stop(problem)
+		self.assertIsNone(stop_at("Find the shortest path.\n\nNote: the grid may be empty."))
+		self.assertIsNone(stop_at("Find the shortest path.\n\nNote: the grid may be empty.\n\nExplanation: the first sample has two paths."))
+		self.assertIsNone(stop_at("Find the shortest path.\n\nNote: I/O is slow, read the grid at once."))
+		self.assertEqual(stop_at("Find the shortest path.\n\nExplanation of changes: shorter."), len("Find the shortest path."))
+
+		configure_streaming(max_growth=1.0)
+		stop_at = mutation_stop(problem)
+		sentence = "Obstacles move after every step of the agent. "
+		self.assertEqual(stop_at(sentence * 6 + "The agent"), len(sentence * 6) - 1)
+		self.assertIn("length", problem.warnings_log[-1])
+
+		# Feeding a stream chunk by chunk stops it where checking the whole text received so far would
+		stop_at = mutation_stop(problem)
+		text = sentence * 6 + "The agent"
+		ends = [stop_at(text[:position]) for position in range(8, len(text) + 1, 8)]
+		expected = [mutation_stop(problem)(text[:position]) for position in range(8, len(text) + 1, 8)]
+		self.assertEqual(ends, expected)
+		self.assertIsNotNone(ends[-1])
+
+		configure_streaming()
+		stop_at = mutation_stop(problem)
+		text = "Find the shortest path in a grid.\n\nNote: I kept the grid."
+		ends = [stop_at(text[:position]) for position in range(1, len(text) + 1)]
+		self.assertEqual([end for end in ends if end is not None][0], len("Find the shortest path in a grid."))
+
+		with self.assertRaises(ValueError):
+			configure_streaming(stop_pattern="(unclosed")
+
+
+	def test_stream_stops_generation(self):
+		'''
+		Test that a streamed response records its time to first token and closes the stream before the commentary is generated.
+		'''
+		with MockLLMServer(latency_ms=20, ms_per_token=5, commentary_rate=1) as server:
+			client = AzureOpenAIClient(endpoint=server.endpoint, api_key='mock', model='stream')
+			self.assertIsInstance(client, StreamingLLMBackend)
+
+			full = client.stream_response(user_input=f'Rephrase:\n\n"{STATEMENT}"', system_message="Mutate.")
+			stopped = client.stream_response(user_input=f'Rephrase:\n\n"{STATEMENT}"', system_message="Mutate.", stop_at=mutation_stop(Problem(original_description=STATEMENT)))
+			time.sleep(0.2)
+
+		self.assertIn("\n\nNote:", full)
+		self.assertEqual(stopped, full[:full.index("\n\nNote:")])
+		self.assertEqual(server.stats['cancelled'], 1)
+		self.assertEqual(metrics.value('llm_time_to_first_token_seconds', model='stream'), 2)
+		self.assertGreaterEqual(metrics.total('llm_time_to_first_token_seconds', model='stream'), 0.04)
+		self.assertEqual(metrics.value('llm_streams_stopped_total', model='stream'), 1)
+
+
+	def test_cached_stream_is_stopped(self):
+		'''
+		Test that a stream served from the cache is cut where the stream itself would have been stopped.
+		'''
+		directory = tempfile.mkdtemp()
+		try:
+			with MockLLMServer(commentary_rate=1) as server:
+				client = AzureOpenAIClient(endpoint=server.endpoint, api_key='mock', model='stream-cache', cache=ResponseCache(path=os.path.join(directory, 'responses.sqlite')))
+				full = client.stream_response(user_input=f'Rephrase:\n\n"{STATEMENT}"', system_message="Mutate.")
+				stopped = client.stream_response(user_input=f'Rephrase:\n\n"{STATEMENT}"', system_message="Mutate.", stop_at=mutation_stop(Problem(original_description=STATEMENT)))
+
+		finally:
+			shutil.rmtree(directory, ignore_errors=True)
+
+		self.assertEqual(server.stats['requests'], 1)
+		self.assertEqual(metrics.value('llm_requests_total', model='stream-cache', outcome='cache_hit'), 1)
+		self.assertEqual(stopped, full[:full.index("\n\nNote:")])
+
+
+	def test_streamed_mutation_is_faster(self):
+		'''
+		Test that streamed mutations keep only the statement and land before the commentary would have been generated.
+		'''
+		with MockLLMServer(ms_per_token=10, commentary_rate=1) as server:
+			client = AzureOpenAIClient(endpoint=server.endpoint, api_key='mock', model='stream-mutation')
+
+			start = time.perf_counter()
+			unstreamed = Problem(original_description=STATEMENT)
+			mutate_problem(client=client, problem=unstreamed, prompt_template=self.prompt_template, strategy='rephrase.txt')
+			unstreamed_seconds = time.perf_counter() - start
+
+			configure_streaming(enabled=True)
+			start = time.perf_counter()
+			streamed = Problem(original_description=STATEMENT)
+			mutate_problem(client=client, problem=streamed, prompt_template=self.prompt_template, strategy='rephrase.txt')
+			streamed_seconds = time.perf_counter() - start
+
+		self.assertIn("Note:", unstreamed.mutated_description)
+		self.assertNotIn("Note:", streamed.mutated_description)
+		self.assertTrue(unstreamed.mutated_description.startswith(streamed.mutated_description))
+		self.assertLess(streamed_seconds, unstreamed_seconds * 0.6)
+
+
+	def test_pipelined_round_with_streams(self):
+		'''
+		Test that a pipelined round streams its mutations and evaluates the statements they were stopped at.
+		'''
+		configure_streaming(enabled=True)
+		prompt_templates = load_prompt_templates()
+		problems = [Problem(original_description=f"{STATEMENT} Variant {i}.") for i in range(6)]
+		results = {}
+
+		async def run(endpoint: str) -> None:
+			client = AsyncAzureOpenAIClient(endpoint=endpoint, api_key='mock', model='stream-pipeline')
+			await run_round_pipelined(
+				mutation_client=client, evaluation_client=client, items=[(problem, 'rephrase.txt') for problem in problems],
+				prompt_templates=prompt_templates, evaluation_template=load_evaluation_template(),
+				on_result=lambda index, problem: results.setdefault(index, problem), concurrency=3
+			)
+			await client.close()
+
+		with MockLLMServer(commentary_rate=1) as server:
+			asyncio.run(run(server.endpoint))
+
+		self.assertEqual(len(results), 6)
+		for problem in results.values():
+			self.assertNotIn("Note:", problem.mutated_description)
+			self.assertIsNotNone(problem.score)
+		self.assertEqual(metrics.value('llm_streams_stopped_total', model='stream-pipeline'), 6)
+
+
+if __name__ == '__main__':
+	unittest.main()
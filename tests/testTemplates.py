@@ -0,0 +1,98 @@
+"""
+Unit test class for template compilation.
+"""
+
+import sys
+sys.path.append('.')
+
+import unittest
+from scripts.data_handling import Problem, load_prompt_templates, load_evaluation_template
+from scripts.mutation import MUTATION_SYSTEM_MESSAGE, EVALUATION_SYSTEM_MESSAGE, evaluate_problem, build_evaluation_prompt
+from scripts.templates import EVALUATION_PLACEHOLDERS, PACKING_PLACEHOLDERS, compile_template, static_prefix
+from src.MockLLMServer import MockLLMServer
+from src.AzureOpenAIClient import AzureOpenAIClient
+from src.Metrics import metrics
+
+
+RAW_EVALUATION_TEMPLATE = "Original:\n{original_statement}\n\nMutated:\n{mutated_statement}\n\nScore the quality of the mutation from 0 to 10, considering clarity, difficulty and fidelity to the original. Only provide the numerical score."
+
+
+class TestTemplates(unittest.TestCase):
+	def test_trailing_instructions_move_to_the_front(self):
+		'''
+		Test that instructions after the last placeholder lead the compiled template, while closing quotes stay in place.
+		'''
+		compiled = compile_template(RAW_EVALUATION_TEMPLATE, placeholders=EVALUATION_PLACEHOLDERS)
+
+		self.assertTrue(compiled.startswith("Score the quality of the mutation"))
+		self.assertTrue(compiled.endswith("Mutated:\n{mutated_statement}"))
+		self.assertEqual(compile_template('Rephrase this: "{statement}"  \n'), 'Rephrase this: "{statement}"')
+		self.assertGreater(len(static_prefix(compiled)), len(static_prefix(RAW_EVALUATION_TEMPLATE)))
+
+		# Loaded templates are compiled
+		self.assertTrue(load_evaluation_template().startswith("Score the quality"))
+		self.assertTrue(all(template.endswith('"{statement}"') for template in load_prompt_templates().values()))
+
+
+	def test_placeholders_are_validated_once(self):
+		'''
+		Test that missing, unknown and malformed placeholders fail when the template is compiled.
+		'''
+		with self.assertRaises(ValueError) as context:
+			compile_template("Rephrase: {statment}", placeholders=('statement',), name='rephrase.txt')
+		self.assertIn("'{statement}' not found in the template 'rephrase.txt'", str(context.exception))
+
+		with self.assertRaises(ValueError):
+			compile_template("{original_statement} {mutated_statement} {score}", placeholders=EVALUATION_PLACEHOLDERS)
+		with self.assertRaises(ValueError):
+			compile_template("Rephrase: {statement", placeholders=('statement',))
+
+		# A compiled template is trusted by the prompt builders
+		problem = Problem(original_description="A", mutated_description="B", mutated=True)
+		compiled = compile_template("{original_statement} -> {mutated_statement}. Score it.", placeholders=EVALUATION_PLACEHOLDERS)
+		self.assertEqual(build_evaluation_prompt(problem=problem, evaluation_template=compiled), "Score it.\n\nA -> B.")
+
+
+	def test_packing_templates_keep_their_layout(self):
+		'''
+		Test that packing templates are validated without moving their answer format, and still format escaped braces.
+		'''
+		packing_templates = load_prompt_templates(strategies_dir='prompts/packing/', placeholders=PACKING_PLACEHOLDERS)
+
+		self.assertTrue(packing_templates['evaluate.txt'].startswith("Apply the following"))
+		self.assertIn('[{"id": "...", "score": 7.5}]', packing_templates['evaluate.txt'].format(instruction="I", items="[]"))
+
+
+	def test_system_messages_are_normalised(self):
+		'''
+		Test that system messages are sent without the indentation of their triple-quoted definition.
+		'''
+		for message in (MUTATION_SYSTEM_MESSAGE, EVALUATION_SYSTEM_MESSAGE):
+			self.assertEqual(message, message.strip())
+			self.assertNotIn('\n', message)
+			self.assertNotIn('\t', message)
+
+
+	def test_compiled_template_increases_cached_tokens(self):
+		'''
+		Test that evaluations built from the compiled template get more prompt tokens served from the prompt cache.
+		'''
+		problems = [
+			Problem(original_description=f"Find the shortest path between nodes {i} and {i + 7} of a weighted graph.", mutated_description=f"Given a weighted graph, compute the cheapest route from node {i} to node {i + 7}.", mutated=True)
+			for i in range(10)
+		]
+
+		cached = {}
+		for name, template in (('raw', RAW_EVALUATION_TEMPLATE), ('compiled', compile_template(RAW_EVALUATION_TEMPLATE, placeholders=EVALUATION_PLACEHOLDERS))):
+			with MockLLMServer(cache_min_tokens=16, cache_block_tokens=8) as server:
+				client = AzureOpenAIClient(endpoint=server.endpoint, api_key='mock', model=f'cache-{name}')
+				for problem in problems:
+					evaluate_problem(client=client, problem=problem, evaluation_template=template)
+			cached[name] = metrics.value('llm_cached_prompt_tokens_total', model=f'cache-{name}')
+			self.assertEqual(cached[name], server.stats['cached_tokens'])
+
+		self.assertGreater(cached['compiled'], cached['raw'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,275 @@
+"""
+Unit test class for the token budget planner.
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from scripts.data_handling import Problem, load_prompt_templates, load_evaluation_template
+from scripts.mutation import MUTATION_SYSTEM_MESSAGE, mutate_problem, plan_mutation
+from scripts.rounds import run_round_sequential
+from src.TokenBudget import GROWTH_PRIORS, budget, count_tokens, trim_tokens
+from src.MockLLMServer import MockLLMServer
+from src.AzureOpenAIClient import AzureOpenAIClient
+from src.Metrics import metrics
+import scripts.main
+
+
+STATEMENT = "Implement a BFS-based pathfinding algorithm to navigate a 2D grid with dynamic obstacles."
+
+
+class RecordingClient:
+	'''
+	Client answering with the statement of the prompt and recording the completion tokens of each request.
+	'''
+	model = 'recording'
+
+	def __init__(self):
+		self.max_tokens = []
+
+
+	def generate_response(self, user_input: str, system_message: str, temperature: float=0.7, max_tokens: int=400, response_format=None) -> str:
+		self.max_tokens.append(max_tokens)
+
+		return user_input.split('\n\n')[-1]
+
+
+class TestTokenBudget(unittest.TestCase):
+	def setUp(self):
+		self.settings = dict(budget.settings)
+		budget.growth = dict(GROWTH_PRIORS)
+
+
+	def tearDown(self):
+		budget.configure(**self.settings)
+		budget.growth = dict(GROWTH_PRIORS)
+
+
+	def test_count_and_trim_tokens(self):
+		'''
+		Test that tokens are estimated from words, numbers and punctuation, and that trimmed texts are prefixes within the limit.
+		'''
+		self.assertEqual(count_tokens(""), 0)
+		self.assertEqual(count_tokens("Sort the list."), 4)
+		self.assertEqual(count_tokens("Sort 1234567 items"), 5)
+		self.assertGreater(count_tokens("internationalization"), count_tokens("graph"))
+		self.assertEqual(count_tokens("日本語"), 3)
+
+		for limit in (0, 3, 10, 100):
+			trimmed = trim_tokens(STATEMENT, limit)
+			self.assertTrue(STATEMENT.startswith(trimmed))
+			self.assertLessEqual(count_tokens(trimmed), limit)
+		self.assertEqual(trim_tokens(STATEMENT, 100), STATEMENT)
+		self.assertEqual(trim_tokens("日本語のテキスト", 2), "日本")
+
+
+	def test_completion_tokens_follow_strategy_growth(self):
+		'''
+		Test that completions are sized from the statement and the strategy, within the limits, and learn from mutations.
+		'''
+		expanded = budget.max_tokens(strategy='expand.txt', statement_tokens=200)
+		simplified = budget.max_tokens(strategy='simplify.txt', statement_tokens=200)
+
+		self.assertGreater(expanded, simplified)
+		self.assertEqual(budget.max_tokens(strategy='expand.txt', statement_tokens=5), budget.min_completion_tokens)
+		self.assertEqual(budget.max_tokens(strategy='expand.txt', statement_tokens=10 ** 6), budget.max_completion_tokens)
+
+		for _ in range(30):
+			budget.record(strategy='simplify.txt', statement_tokens=200, completion_tokens=600)
+		self.assertGreater(budget.max_tokens(strategy='simplify.txt', statement_tokens=200), expanded)
+
+		with self.assertRaises(ValueError):
+			budget.configure(overflow='ignore')
+
+
+	def test_round_is_planned_from_its_start(self):
+		'''
+		Test that the requests of a round are sized from the growth of its start, which learns its mutations in any order once it ends.
+		'''
+		planned = budget.max_tokens(strategy='simplify.txt', statement_tokens=200)
+		mutations = [(200, 600), (100, 90), (50, 400)]
+		learned = []
+		for order in (mutations, mutations[::-1]):
+			budget.growth = dict(GROWTH_PRIORS)
+			with budget.planned_round():
+				for statement_tokens, completion_tokens in order:
+					budget.record(strategy='simplify.txt', statement_tokens=statement_tokens, completion_tokens=completion_tokens)
+				self.assertEqual(budget.max_tokens(strategy='simplify.txt', statement_tokens=200), planned)
+			learned.append(budget.growth['simplify.txt'])
+
+		self.assertEqual(learned[0], learned[1])
+		self.assertGreater(learned[0], GROWTH_PRIORS['simplify.txt'])
+		self.assertIsNone(budget.round_growth)
+
+
+	def test_async_run_matches_sequential_run(self):
+		'''
+		Test that a run in 'async' round mode, whose responses arrive in any order, mutates and scores its problems as a sequential run.
+		'''
+		directory = tempfile.mkdtemp()
+		saved = {}
+		for mode in ('sequential', 'async'):
+			argv = [
+				'main.py', '--backend', 'mock', '--mock-latency-ms', '5', '--seed', '3', '--num-rounds', '2', '--num-problems', '8', '--topk-problems', '3',
+				'--round-mode', mode, '--concurrency', '8', '--mock-latency-jitter-ms', '5', '--mock-latency-distribution', 'uniform',
+				'--checkpoint-dir', os.path.join(directory, mode, 'checkpoints'),
+				'--leaderboard-path', os.path.join(directory, mode, 'leaderboard.sqlite'),
+				'--metrics-summary', os.path.join(directory, mode, 'metrics.json'),
+				'--lineage-path', os.path.join(directory, mode, 'lineage.sqlite'),
+				'--scheduler-state', os.path.join(directory, mode, 'scheduler.json')
+			]
+			saved[mode] = []
+			try:
+				with patch('sys.argv', argv), patch('scripts.main.Logger', Mock()), patch('scripts.main.save_mutated_problem', lambda problem: saved[mode].append((problem.mutated_description, problem.score))):
+					scripts.main.main()
+
+			finally:
+				shutil.rmtree(os.path.join(directory, mode), ignore_errors=True)
+		shutil.rmtree(directory, ignore_errors=True)
+
+		self.assertEqual(len(saved['async']), 6)
+		self.assertEqual(saved['async'], saved['sequential'])
+
+
+	def test_mutation_requests_are_sized(self):
+		'''
+		Test that mutation requests reserve completion tokens by strategy instead of the fixed default.
+		'''
+		prompt_templates = load_prompt_templates()
+		client = RecordingClient()
+		statement = " ".join([STATEMENT] * 8)
+
+		for strategy in ('expand.txt', 'simplify.txt'):
+			problem = Problem(original_description=statement)
+			mutate_problem(client=client, problem=problem, prompt_template=prompt_templates[strategy], strategy=strategy)
+
+		self.assertGreater(client.max_tokens[0], client.max_tokens[1])
+		self.assertNotIn(400, client.max_tokens)
+
+
+	def test_statements_beyond_the_context_window(self):
+		'''
+		Test that statements too long for the context window are trimmed with a warning, or rejected.
+		'''
+		prompt_template = load_prompt_templates()['rephrase.txt']
+		budget.configure(context_tokens=200, max_completion_tokens=64, min_completion_tokens=64)
+		problem = Problem(original_description=" ".join([STATEMENT] * 20))
+
+		prompt, max_tokens = plan_mutation(problem=problem, prompt_template=prompt_template, strategy='rephrase.txt')
+
+		self.assertLessEqual(count_tokens(MUTATION_SYSTEM_MESSAGE) + count_tokens(prompt) + 8 + max_tokens, 200)
+		self.assertIn(trim_tokens(problem.statement, 20), prompt)
+		self.assertIn("trimmed", problem.warnings_log[-1])
+
+		budget.configure(overflow='reject')
+		with self.assertRaises(ValueError):
+			plan_mutation(problem=problem, prompt_template=prompt_template, strategy='rephrase.txt')
+		self.assertIn("context window", problem.error_logs[-1])
+
+
+	def test_forecast_of_a_round(self):
+		'''
+		Test that the forecast of a round counts its requests and estimates its prompt tokens against the mock backend.
+		'''
+		prompt_templates = load_prompt_templates()
+		evaluation_template = load_evaluation_template()
+		with open('problems/problems.txt', 'r') as file:
+			problems = [Problem(original_description=line.strip()) for line in file if line.strip()][:8]
+		strategies = [list(prompt_templates)[position % len(prompt_templates)] for position in range(len(problems))]
+
+		forecast = budget.forecast(
+			statements=[problem.statement for problem in problems], strategies=strategies, prompt_templates=prompt_templates,
+			evaluation_template=evaluation_template, system_tokens=count_tokens(MUTATION_SYSTEM_MESSAGE)
+		)
+
+		with MockLLMServer() as server:
+			client = AzureOpenAIClient(endpoint=server.endpoint, api_key='mock', model='forecast')
+			run_round_sequential(mutation_client=client, evaluation_client=client, problems=problems, strategies=strategies, prompt_templates=prompt_templates, evaluation_template=evaluation_template)
+
+		self.assertEqual(forecast['requests'], server.stats['requests'])
+		self.assertAlmostEqual(forecast['prompt_tokens'], metrics.value('llm_prompt_tokens_total', model='forecast'), delta=0.15 * forecast['prompt_tokens'])
+		self.assertGreaterEqual(forecast['max_cost'], forecast['cost'])
+
+
+	def test_run_stops_on_budget(self):
+		'''
+		Test that a run stops before a round that would exceed its token budget, without marking its checkpoint completed.
+		'''
+		directory = tempfile.mkdtemp()
+		summaries = {}
+		for token_budget in ('0', '1', '2500'):
+			argv = [
+				'main.py', '--backend', 'mock', '--num-rounds', '3', '--num-problems', '6', '--topk-problems', '2', '--token-budget', token_budget,
+				'--checkpoint-dir', os.path.join(directory, token_budget, 'checkpoints'),
+				'--leaderboard-path', os.path.join(directory, token_budget, 'leaderboard.sqlite'),
+				'--metrics-summary', os.path.join(directory, token_budget, 'metrics.json'),
+				'--lineage-path', os.path.join(directory, token_budget, 'lineage.sqlite'),
+				'--scheduler-state', os.path.join(directory, token_budget, 'scheduler.json')
+			]
+			try:
+				with patch('sys.argv', argv), patch('scripts.main.Logger', Mock()), patch('scripts.main.save_mutated_problem', lambda problem: None):
+					scripts.main.main()
+				with open(os.path.join(directory, token_budget, 'metrics.json'), 'r') as file:
+					summaries[token_budget] = json.load(file)['budget']
+				with open(os.path.join(directory, token_budget, 'checkpoints', 'checkpoint.json'), 'r') as file:
+					summaries[token_budget]['completed'] = json.load(file)['completed']
+
+			finally:
+				shutil.rmtree(os.path.join(directory, token_budget), ignore_errors=True)
+		shutil.rmtree(directory, ignore_errors=True)
+
+		self.assertIsNone(summaries['0']['stopped'])
+		self.assertTrue(summaries['0']['completed'])
+		self.assertEqual(summaries['0']['forecast']['requests'], 36)
+
+		self.assertEqual(summaries['1']['tokens'], 0)
+		self.assertIn("budget of 1 tokens", summaries['1']['stopped'])
+		self.assertFalse(summaries['1']['completed'])
+
+		self.assertGreater(summaries['2500']['tokens'], 0)
+		self.assertLessEqual(summaries['2500']['tokens'], 2500)
+		self.assertLess(summaries['2500']['tokens'], summaries['0']['tokens'])
+		self.assertIsNotNone(summaries['2500']['stopped'])
+
+
+	def test_resumed_run_keeps_its_spend(self):
+		'''
+		Test that a run resumed after stopping on its budget counts the tokens spent before, instead of spending the budget again.
+		'''
+		directory = tempfile.mkdtemp()
+		argv = [
+			'main.py', '--backend', 'mock', '--num-rounds', '3', '--num-problems', '6', '--topk-problems', '2', '--token-budget', '2500',
+			'--checkpoint-dir', os.path.join(directory, 'checkpoints'),
+			'--leaderboard-path', os.path.join(directory, 'leaderboard.sqlite'),
+			'--metrics-summary', os.path.join(directory, 'metrics.json'),
+			'--lineage-path', os.path.join(directory, 'lineage.sqlite'),
+			'--scheduler-state', os.path.join(directory, 'scheduler.json')
+		]
+		summaries = []
+		try:
+			for resume in ('N', 'Y'):
+				with patch('sys.argv', argv + ['--resume', resume]), patch('scripts.main.Logger', Mock()), patch('scripts.main.save_mutated_problem', lambda problem: None):
+					scripts.main.main()
+				with open(os.path.join(directory, 'metrics.json'), 'r') as file:
+					summaries.append(json.load(file)['budget'])
+			with open(os.path.join(directory, 'checkpoints', 'checkpoint.json'), 'r') as file:
+				checkpoint = json.load(file)
+
+		finally:
+			shutil.rmtree(directory, ignore_errors=True)
+
+		self.assertIsNotNone(summaries[0]['stopped'])
+		self.assertEqual(summaries[1]['tokens'], summaries[0]['tokens'])
+		self.assertIsNotNone(summaries[1]['stopped'])
+		self.assertFalse(checkpoint['completed'])
+		self.assertEqual(checkpoint['spent']['tokens'], summaries[0]['tokens'])
+
+
+if __name__ == '__main__':
+	unittest.main()